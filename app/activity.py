@@ -0,0 +1,207 @@
+"""Per-user activity rollup: hikes, miles, elevation, minutes, points and new parks.
+
+Every hike, first visit to a park and points award adds to its user's row
+for that UTC day in `user_activity_days` (an upsert, in the caller's
+transaction), so charts and time-windowed leaderboards sum a bounded number
+of rows instead of scanning trail_hikes and visits.
+
+Daily rows are only needed while a window can start mid-month. Days older
+than ACTIVITY_DAILY_RETENTION_DAYS are compacted into one row per user and
+month, keyed by the month's first day, which keeps long histories to about
+twelve rows a year. Compaction runs at startup and then at most daily,
+triggered by the leaderboard routes; writes for an already compacted month
+simply add a new daily row that the next compaction folds in.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from app import models
+from app.database import dialect_insert
+from config import ACTIVITY_DAILY_RETENTION_DAYS
+
+COUNTERS = ("hikes", "miles", "elevation", "minutes", "points", "parks")
+COMPACT_INTERVAL_SECONDS = 24 * 3600
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def epoch_day(when) -> int:
+    """Day number (days since 1970-01-01) of a date or datetime."""
+    return when.toordinal() - EPOCH_ORDINAL
+
+
+def day_date(day: int) -> date:
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+
+def month_start_day(day: int) -> int:
+    return epoch_day(day_date(day).replace(day=1))
+
+
+def _month_length(day: int) -> int:
+    start = day_date(day)
+    following = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return (following - start).days
+
+
+def _add_totals(days: dict, user_id: int, when, **values):
+    totals = days[(user_id, epoch_day(when or datetime.utcnow()))]
+    for name, value in values.items():
+        totals[name] += value or 0
+
+
+def _new_days() -> dict:
+    return defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+
+class ActivityRollupService:
+    """Maintains and compacts the per-user activity rollup. Callers commit writes."""
+
+    _last_compacted = None
+    _compact_lock = threading.Lock()
+
+    @staticmethod
+    def _upsert(db: Session, days: dict):
+        """Add {(user_id, day): {counter: value}} to the rollup in one statement."""
+        if not days:
+            return
+        insert = dialect_insert(db)
+        table = models.UserActivityDay.__table__
+        stmt = insert(table)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "day"],
+            set_={name: table.c[name] + stmt.excluded[name] for name in COUNTERS},
+        ), [dict(totals, user_id=user_id, day=day) for (user_id, day), totals in days.items()])
+
+    @staticmethod
+    def record_hikes(hikes: list, db: Session):
+        days = _new_days()
+        for hike in hikes:
+            _add_totals(days, hike.user_id, hike.hike_date, hikes=1, miles=hike.distance_miles,
+                        elevation=hike.elevation_gain, minutes=hike.duration_minutes)
+        ActivityRollupService._upsert(db, days)
+
+    @staticmethod
+    def record_hike(hike: models.TrailHike, db: Session):
+        ActivityRollupService.record_hikes([hike], db)
+
+    @staticmethod
+    def record_visit(visit: models.Visit, db: Session) -> bool:
+        """Count the visit if it is the user's first to this park; returns whether it was."""
+        if not visit.visited or visit.park_id is None:
+            return False
+        with db.no_autoflush:  # The visit itself must not be found
+            seen = db.query(models.Visit.id).filter(
+                models.Visit.user_id == visit.user_id,
+                models.Visit.park_id == visit.park_id,
+                models.Visit.visited == True,
+            ).first()
+        if seen is None:
+            days = _new_days()
+            _add_totals(days, visit.user_id, visit.visit_date, parks=1)
+            ActivityRollupService._upsert(db, days)
+        return seen is None
+
+    @staticmethod
+    def record_points(user_id: int, points: int, db: Session, when: Optional[datetime] = None):
+        days = _new_days()
+        _add_totals(days, user_id, when, points=points)
+        ActivityRollupService._upsert(db, days)
+
+    # ---- compaction ----
+
+    @staticmethod
+    def compact(db: Session, today: Optional[date] = None) -> int:
+        """Fold daily rows of months entirely older than the retention into month rows.
+
+        Returns the number of daily rows folded.
+        """
+        cutoff = month_start_day(epoch_day((today or datetime.utcnow().date())
+                                           - timedelta(days=ACTIVITY_DAILY_RETENTION_DAYS)))
+        model = models.UserActivityDay
+        old = db.query(model).filter(model.span_days == 1, model.day < cutoff)
+        counters = [model.__table__.c[name] for name in COUNTERS]
+        months = _new_days()
+        folded = 0
+        for row in old.with_entities(model.user_id, model.day, *counters).yield_per(5000):
+            folded += 1
+            totals = months[(row[0], month_start_day(row[1]))]
+            for name, value in zip(COUNTERS, row[2:]):
+                totals[name] += value or 0
+        if not folded:
+            return 0
+
+        old.delete(synchronize_session=False)
+        insert = dialect_insert(db)
+        table = model.__table__
+        stmt = insert(table)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "day"],
+            set_=dict({name: table.c[name] + stmt.excluded[name] for name in COUNTERS},
+                      span_days=stmt.excluded.span_days),
+        ), [dict(totals, user_id=user_id, day=day, span_days=_month_length(day))
+            for (user_id, day), totals in months.items()])
+        db.commit()
+        return folded
+
+    @staticmethod
+    def compact_if_due(db: Session) -> int:
+        """Run `compact` if this process has not in the last COMPACT_INTERVAL_SECONDS."""
+        last = ActivityRollupService._last_compacted
+        if last is not None and time.monotonic() - last < COMPACT_INTERVAL_SECONDS:
+            return 0
+        if not ActivityRollupService._compact_lock.acquire(blocking=False):
+            return 0  # Another request is compacting
+        try:
+            ActivityRollupService._last_compacted = time.monotonic()
+            return ActivityRollupService.compact(db)
+        finally:
+            ActivityRollupService._compact_lock.release()
+
+    # ---- backfill ----
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """Recompute the rollup from hikes, visits, badges and challenges, then compact.
+
+        Returns the number of hikes counted.
+        """
+        days = _new_days()
+        hikes = 0
+        for user_id, hike_date, created_at, miles, elevation, minutes in db.query(
+            models.TrailHike.user_id, models.TrailHike.hike_date, models.TrailHike.created_at,
+            models.TrailHike.distance_miles, models.TrailHike.elevation_gain, models.TrailHike.duration_minutes
+        ).filter(models.TrailHike.duplicate_of.is_(None)).yield_per(5000):
+            hikes += 1
+            _add_totals(days, user_id, hike_date or created_at, hikes=1, miles=miles,
+                        elevation=elevation, minutes=minutes)
+
+        first_visits = {}
+        for user_id, park_id, visit_date in db.query(
+            models.Visit.user_id, models.Visit.park_id, models.Visit.visit_date
+        ).filter(models.Visit.visited == True, models.Visit.park_id.isnot(None)).yield_per(5000):
+            key = (user_id, park_id)
+            visit_date = visit_date or datetime.utcnow()
+            if key not in first_visits or visit_date < first_visits[key]:
+                first_visits[key] = visit_date
+        for (user_id, _), visit_date in first_visits.items():
+            _add_totals(days, user_id, visit_date, parks=1)
+
+        # Points are only awarded for badges (250 each) and completed challenges
+        for user_id, earned_date in db.query(models.UserAchievement.user_id, models.UserAchievement.earned_date):
+            _add_totals(days, user_id, earned_date, points=250)
+        for user_id, completed_date, points in db.query(
+            models.UserChallenge.user_id, models.UserChallenge.completed_date, models.UserChallenge.points_earned
+        ).filter(models.UserChallenge.completed == True):
+            _add_totals(days, user_id, completed_date, points=points)
+
+        db.query(models.UserActivityDay).delete()
+        if days:
+            db.execute(models.UserActivityDay.__table__.insert(), [
+                dict(totals, user_id=user_id, day=day, span_days=1) for (user_id, day), totals in days.items()
+            ])
+        db.commit()
+        ActivityRollupService.compact(db)
+        return hikes
@@ -0,0 +1,330 @@
+"""Detect campsites freeing up at wishlisted campgrounds.
+
+Wishlisted campsites are matched by name to a Recreation.gov campground
+once (`watched_campgrounds`); a failed search is retried by the next poll
+rather than stored as no match. The poller then fetches the coming
+AVAILABILITY_MONTHS of each watched campground and encodes every month as
+a sites x days uint8 array of status codes instead of the nested
+per-site, per-date dicts of `parse_availability`. Sites are sorted by id,
+so consecutive snapshots usually line up row for row and the diff is one
+array comparison; otherwise the previous rows are re-indexed first.
+
+Only the latest snapshot per campground month is kept, as raw bytes; the
+site-nights that changed are appended to `availability_changes`. A night
+turning "available" from anything but unknown is a newly available site,
+and these are grouped per wishlist entry and sent through the booking
+alert notifier (app/notifications.py) with `kind` "availability".
+
+The grouped events are queued as `availability_alerts` rows in the same
+commit as the snapshots, then sent at least once the way booking alerts
+are (app/leases.py): claimed under a lease, sent, marked sent. A failed
+send is retried by a later poll once the lease runs out, so openings are
+not lost when the snapshot they were diffed from has already moved on.
+Messages carry the row's `alert_id` to de-duplicate on.
+
+Encoded months are also kept in `availability_cache` for
+AVAILABILITY_CACHE_SECONDS, which the campsite search
+(app/availability_search.py) reads before fetching.
+"""
+import asyncio
+import calendar
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from app import models
+from app.leases import LeaseQueue
+from app.notifications import booking_alerts
+from app.recreation_service import recreation_gov
+from config import (AVAILABILITY_CACHE_SECONDS, AVAILABILITY_MONTHS, AVAILABILITY_POLL_SECONDS,
+                    NOTIFICATION_BATCH_SIZE, NOTIFICATION_LEASE_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+# Status codes, named as in RecreationGovService.parse_availability
+UNAVAILABLE, AVAILABLE, RESERVED, WALKUP = 0, 1, 2, 3
+UNKNOWN = 255  # No previous status (new site or first snapshot)
+STATUS_CODES = {"Available": AVAILABLE, "Reserved": RESERVED, "Walk-up Available": WALKUP}
+_status_code = defaultdict(int, STATUS_CODES).__getitem__  # UNAVAILABLE for anything else
+MAX_CONCURRENT_FETCHES = 8
+MAX_OPENINGS_PER_EVENT = 50
+
+
+def month_starts(today: date, months: int) -> list:
+    """First days of the `months` months starting with today's."""
+    starts, month = [], today.replace(day=1)
+    for _ in range(months):
+        starts.append(month)
+        month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return starts
+
+
+def encode_month(availability_data: dict, month: date) -> tuple:
+    """(sorted [(site_id, site_name)], uint8 array of sites x days) for one month's response."""
+    days = calendar.monthrange(month.year, month.month)[1]
+    prefix = month.strftime("%Y-%m")
+    # Responses list every night of the month in order, in this form
+    nights = [f"{prefix}-{day:02d}T00:00:00Z" for day in range(1, days + 1)]
+    campsites = availability_data.get("campsites") or {}
+    sites, rows = [], []
+    for site_id in sorted(campsites):
+        site = campsites[site_id]
+        availabilities = site.get("availabilities") or {}
+        if list(availabilities) == nights:
+            row = list(map(_status_code, availabilities.values()))
+        else:
+            row = [UNAVAILABLE] * days
+            for date_str, status in availabilities.items():
+                if date_str.startswith(prefix):
+                    row[int(date_str[8:10]) - 1] = STATUS_CODES.get(status, UNAVAILABLE)
+        sites.append((site_id, site.get("site_name", f"Site {site_id}")))
+        rows.append(row)
+    return sites, np.array(rows, dtype=np.uint8).reshape(len(rows), days)
+
+
+def align(previous_sites: list, previous: np.ndarray, sites: list) -> np.ndarray:
+    """The previous statuses in the row order of `sites`; UNKNOWN for sites not seen before."""
+    if [site_id for site_id, _ in previous_sites] == [site_id for site_id, _ in sites]:
+        return previous
+    position = {site_id: row for row, (site_id, _) in enumerate(previous_sites)}
+    index = np.array([position.get(site_id, -1) for site_id, _ in sites], dtype=np.int64)
+    aligned = np.full((len(sites), previous.shape[1]), UNKNOWN, dtype=np.uint8)
+    known = index >= 0
+    aligned[known] = previous[index[known]]
+    return aligned
+
+
+def diff(previous: np.ndarray, current: np.ndarray) -> tuple:
+    """(rows, days) of changed cells and a mask of those that became available."""
+    rows, days = np.nonzero(previous != current)
+    old = previous[rows, days]
+    opened = (current[rows, days] == AVAILABLE) & (old != UNKNOWN)
+    return rows, days, opened
+
+
+async def resolve_campgrounds(db: Session, campsites: list, resolve=None) -> dict:
+    """{campsite_id: facility_id or None} for (id, name) pairs, searching by name only for campsites
+    not matched before and storing those matches in `watched_campgrounds`.
+
+    `resolve(name)` returns the campground or None if none matched, and raises if the search failed.
+    Failed searches are not stored, so the campsite is searched for again next time.
+    """
+    resolve = resolve or recreation_gov.find_campground
+    ids = [campsite_id for campsite_id, _ in campsites]
+    matched = dict(db.query(models.WatchedCampground.campsite_id, models.WatchedCampground.facility_id).filter(
+        models.WatchedCampground.campsite_id.in_(ids))) if ids else {}
+    pending = [(campsite_id, name) for campsite_id, name in campsites if campsite_id not in matched]
+    if pending:
+        found = await asyncio.gather(*(resolve(name) for _, name in pending), return_exceptions=True)
+        for (campsite_id, name), campground in zip(pending, found):
+            if isinstance(campground, Exception):
+                logger.warning("Searching for campground %r failed: %r", name, campground)
+                matched[campsite_id] = None
+                continue
+            facility_id = campground.get("facility_id") if campground else None
+            matched[campsite_id] = int(facility_id) if facility_id else None
+            db.add(models.WatchedCampground(campsite_id=campsite_id, facility_id=matched[campsite_id]))
+        db.commit()
+    return matched
+
+
+class AvailabilityCache:
+    """Encoded campground months from recent fetches, shared by the poller and searches."""
+
+    def __init__(self, max_age: float = AVAILABILITY_CACHE_SECONDS, max_entries: int = 4096):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (facility_id, first day of month) -> (stored_at, sites, statuses)
+        self._lock = threading.Lock()
+
+    def get(self, facility_id: int, month: date) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get((facility_id, month))
+        if entry is None or time.monotonic() - entry[0] > self.max_age:
+            return None
+        return entry[1], entry[2]
+
+    def put(self, facility_id: int, month: date, sites: list, statuses: np.ndarray):
+        with self._lock:
+            self._entries[(facility_id, month)] = (time.monotonic(), sites, statuses)
+            self._entries.move_to_end((facility_id, month))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def months(self, keys: list, fetch=None) -> dict:
+        """{(facility_id, month): (sites, statuses) or None}, fetching uncached months concurrently."""
+        fetch = fetch or recreation_gov.get_campground_availability
+        found = {key: self.get(*key) for key in set(keys)}
+        missing = [key for key, value in found.items() if value is None]
+        limit = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+        async def load(facility_id: int, month: date):
+            async with limit:
+                data = await fetch(facility_id, month.isoformat())
+            if not data:
+                return None  # Failed fetches are not cached
+            sites, statuses = encode_month(data, month)
+            self.put(facility_id, month, sites, statuses)
+            return sites, statuses
+
+        for key, value in zip(missing, await asyncio.gather(*(load(*key) for key in missing))):
+            found[key] = value
+        return found
+
+
+class AvailabilityPoller:
+    """Fetches watched campgrounds, stores snapshot diffs and emits newly-available events."""
+
+    def __init__(self, fetch=None, resolve=None, notifier=None, months: int = AVAILABILITY_MONTHS,
+                 batch_size: int = NOTIFICATION_BATCH_SIZE, lease_seconds: float = NOTIFICATION_LEASE_SECONDS):
+        self.fetch = fetch or recreation_gov.get_campground_availability
+        self.resolve = resolve or recreation_gov.find_campground
+        self.notifier = notifier or booking_alerts.notifier
+        self.months = months
+        self.queue = LeaseQueue(models.AvailabilityAlert, lease_seconds, batch_size)
+
+    async def watch_new(self, db: Session) -> int:
+        """Match wishlisted campsites not yet watched to a campground; returns how many were looked up.
+
+        Campsites whose search failed stay unwatched and are looked up again by the next poll.
+        """
+        pending = db.query(models.Campsite.id, models.Campsite.name).join(
+            models.Wishlist, models.Wishlist.campsite_id == models.Campsite.id
+        ).outerjoin(
+            models.WatchedCampground, models.WatchedCampground.campsite_id == models.Campsite.id
+        ).filter(models.WatchedCampground.id.is_(None)).distinct().all()
+        await resolve_campgrounds(db, pending, self.resolve)
+        return len(pending)
+
+    def apply(self, db: Session, facility_id: int, month: date, data: dict, snapshot, today: date,
+              now: datetime) -> list:
+        """Diff one fetched month against its snapshot and store the changes; returns the openings."""
+        sites, current = encode_month(data, month)
+        availability_cache.put(facility_id, month, sites, current)
+        if snapshot is None:
+            db.add(models.AvailabilitySnapshot(facility_id=facility_id, month=month.strftime("%Y-%m"),
+                                               sites=json.dumps(sites), statuses=current.tobytes(),
+                                               fetched_at=now))
+            return []  # Nothing to compare the first snapshot with
+        previous_sites = [tuple(site) for site in json.loads(snapshot.sites)]
+        previous = np.frombuffer(snapshot.statuses, dtype=np.uint8).reshape(len(previous_sites), current.shape[1])
+        previous = align(previous_sites, previous, sites)
+        rows, days, opened = diff(previous, current)
+        snapshot.sites, snapshot.statuses, snapshot.fetched_at = json.dumps(sites), current.tobytes(), now
+        if not len(rows):
+            return []
+
+        db.execute(models.AvailabilityChange.__table__.insert(), [
+            {
+                "facility_id": facility_id,
+                "site_id": sites[row][0],
+                "night": month + timedelta(days=int(day)),
+                "old_status": None if old == UNKNOWN else int(old),
+                "new_status": int(current[row, day]),
+                "detected_at": now,
+            }
+            for row, day, old in zip(rows.tolist(), days.tolist(), previous[rows, days].tolist())
+        ])
+        first_day = (today - month).days  # Past nights cannot be booked
+        return [
+            {"site_id": sites[row][0], "site_name": sites[row][1], "night": (month + timedelta(days=day)).isoformat()}
+            for row, day in zip(rows[opened].tolist(), days[opened].tolist()) if day >= first_day
+        ]
+
+    def events(self, db: Session, openings: dict) -> list:
+        """One event per wishlist entry watching a campground with openings."""
+        if not openings:
+            return []
+        rows = db.query(
+            models.Wishlist.id, models.Wishlist.user_id, models.User.email, models.Campsite.id,
+            models.Campsite.name, models.WatchedCampground.facility_id,
+        ).join(models.User, models.User.id == models.Wishlist.user_id).join(
+            models.Campsite, models.Campsite.id == models.Wishlist.campsite_id
+        ).join(
+            models.WatchedCampground, models.WatchedCampground.campsite_id == models.Wishlist.campsite_id
+        ).filter(models.WatchedCampground.facility_id.in_(list(openings))).all()
+        return [
+            {
+                "kind": "availability",
+                "wishlist_id": wishlist_id,
+                "user_id": user_id,
+                "email": email,
+                "campsite_id": campsite_id,
+                "campsite_name": campsite_name,
+                "facility_id": facility_id,
+                "openings": openings[facility_id][:MAX_OPENINGS_PER_EVENT],
+                "more_openings": max(0, len(openings[facility_id]) - MAX_OPENINGS_PER_EVENT),
+            }
+            for wishlist_id, user_id, email, campsite_id, campsite_name, facility_id in rows
+        ]
+
+    def _messages(self, db: Session, token: str) -> list:
+        alert = models.AvailabilityAlert
+        return [
+            dict(json.loads(payload), alert_id=alert_id, attempt=attempts)
+            for alert_id, payload, attempts in db.query(alert.id, alert.payload, alert.attempts).filter(
+                alert.claim_token == token).order_by(alert.id)
+        ]
+
+    def dispatch_due(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Send every queued alert due at `now` in batches; returns the number sent."""
+        return self.queue.dispatch_due(db, now or datetime.utcnow(), self._messages, self.notifier,
+                                       "availability alerts")
+
+    async def poll(self, db: Session, today: Optional[date] = None) -> dict:
+        """Fetch every watched campground month, store the diffs, queue the events and send due ones."""
+        await self.watch_new(db)
+        today = today or datetime.utcnow().date()
+        facilities = sorted(facility_id for (facility_id,) in db.query(models.WatchedCampground.facility_id).join(
+            models.Wishlist, models.Wishlist.campsite_id == models.WatchedCampground.campsite_id
+        ).filter(models.WatchedCampground.facility_id.isnot(None)).distinct())
+        months = month_starts(today, self.months)
+        keys = [(facility_id, month) for facility_id in facilities for month in months]
+        limit = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+        async def fetch(facility_id: int, month: date):
+            async with limit:
+                return await self.fetch(facility_id, month.isoformat())
+
+        fetched = await asyncio.gather(*(fetch(*key) for key in keys))
+        snapshots = {
+            (snapshot.facility_id, snapshot.month): snapshot
+            for snapshot in db.query(models.AvailabilitySnapshot).filter(
+                models.AvailabilitySnapshot.facility_id.in_(facilities),
+                models.AvailabilitySnapshot.month.in_([month.strftime("%Y-%m") for month in months]))
+        } if facilities else {}
+        now = datetime.utcnow()
+        openings = defaultdict(list)
+        for (facility_id, month), data in zip(keys, fetched):
+            if data:
+                snapshot = snapshots.get((facility_id, month.strftime("%Y-%m")))
+                openings[facility_id].extend(self.apply(db, facility_id, month, data, snapshot, today, now))
+        events = self.events(db, {facility_id: found for facility_id, found in openings.items() if found})
+        db.add_all(models.AvailabilityAlert(wishlist_id=event["wishlist_id"], payload=json.dumps(event),
+                                            created_at=now, due_at=now, attempts=0) for event in events)
+        db.commit()  # Snapshots and their events together
+
+        sent = self.dispatch_due(db, now)
+        return {"campgrounds": len(facilities), "months": sum(1 for data in fetched if data),
+                "openings": sum(len(found) for found in openings.values()), "events": len(events), "sent": sent}
+
+    async def run(self, session_factory, interval: float = AVAILABILITY_POLL_SECONDS):
+        """Poll every `interval` seconds until cancelled."""
+        while True:
+            db = session_factory()
+            try:
+                await self.poll(db)
+            except Exception:
+                logger.exception("Availability poll failed")
+            finally:
+                db.close()
+            await asyncio.sleep(interval)
+
+
+availability_cache = AvailabilityCache()
+availability_poller = AvailabilityPoller()
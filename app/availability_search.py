@@ -0,0 +1,136 @@
+"""Consecutive-night availability search across all campgrounds of a park.
+
+Every campsite row of the park is matched to its Recreation.gov campground
+(app/availability.py), and all campground months the date range touches
+are loaded at once through `availability_cache`, fetching the missing
+ones concurrently. Each campground's months are stitched into one
+sites x nights array of bookable nights. A sliding window of `min_nights`
+over its cumulative sum gives every possible check-in date, and the
+edges of the mask give the runs those check-ins belong to.
+
+Sites are ranked by the number of check-in dates that fit the stay, then
+by their longest run, so the most flexible options come first.
+"""
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy.orm import Session
+from app import models
+from app.availability import AVAILABLE, align, availability_cache, month_starts, resolve_campgrounds
+
+MAX_SEARCH_NIGHTS = 186
+MAX_WINDOWS_PER_SITE = 10
+
+
+def stitch(months: list, encoded: dict, start: date, end: date) -> tuple:
+    """(sites, bool array of sites x nights) of available nights from `start` until `end`.
+
+    `encoded` maps each month's first day to its (sites, statuses), or None if it could not be fetched.
+    """
+    sites, seen = [], set()
+    for month in months:
+        for site in (encoded.get(month) or ((), None))[0]:
+            if site[0] not in seen:
+                seen.add(site[0])
+                sites.append(tuple(site))
+    columns = []
+    for month in months:
+        first = max(start, month)
+        following = month_starts(month, 2)[1]
+        last = min(end, following)  # Exclusive
+        if first >= last:
+            continue
+        if encoded.get(month) is None:
+            columns.append(np.zeros((len(sites), (last - first).days), dtype=bool))
+            continue
+        month_sites, statuses = encoded[month]
+        statuses = align([tuple(site) for site in month_sites], statuses, sites)
+        columns.append(statuses[:, (first - month).days:(last - month).days] == AVAILABLE)
+    return sites, np.concatenate(columns, axis=1) if columns else np.zeros((len(sites), 0), dtype=bool)
+
+
+def find_windows(available: np.ndarray, min_nights: int) -> tuple:
+    """Per site: how many check-in nights fit `min_nights`, and the runs of at least that length.
+
+    Returns (check-in counts, [(row, first night, nights), ...] ordered by row then night).
+    """
+    sites, nights = available.shape
+    if nights < min_nights:
+        return np.zeros(sites, dtype=np.int64), []
+    totals = np.zeros((sites, nights + 1), dtype=np.int32)
+    np.cumsum(available, axis=1, out=totals[:, 1:])
+    fits = (totals[:, min_nights:] - totals[:, :-min_nights]) == min_nights
+    counts = fits.sum(axis=1)
+
+    padded = np.zeros((sites, nights + 2), dtype=np.int8)
+    padded[:, 1:-1] = available
+    edges = np.diff(padded, axis=1)
+    starts = np.argwhere(edges == 1)  # Row-major, so pairs up with the ends below
+    ends = np.argwhere(edges == -1)
+    lengths = ends[:, 1] - starts[:, 1]
+    keep = lengths >= min_nights
+    runs = list(zip(starts[keep, 0].tolist(), starts[keep, 1].tolist(), lengths[keep].tolist()))
+    return counts, runs
+
+
+async def search_park(db: Session, park: models.Park, start: date, end: date, min_nights: int = 1,
+                      limit: int = 50, fetch=None, resolve=None) -> dict:
+    """Sites in the park's campgrounds with `min_nights` consecutive available nights in [start, end).
+
+    `months_fetched` and `months_failed` count the campground months that were (and could not be)
+    fetched; a failed month is searched as if nothing in it were available.
+    """
+    campsites = db.query(models.Campsite.id, models.Campsite.name).filter(
+        models.Campsite.park_id == park.id).order_by(models.Campsite.id).all()
+    facilities = await resolve_campgrounds(db, campsites, resolve)
+    months = month_starts(start, (end.year - start.year) * 12 + end.month - start.month + 1)
+    months = [month for month in months if month < end]
+    keys = [(facilities[campsite_id], month) for campsite_id, _ in campsites if facilities[campsite_id]
+            for month in months]
+    encoded = await availability_cache.months(keys, fetch)
+    failed = sum(1 for value in encoded.values() if value is None)
+
+    campgrounds, candidates = [], []
+    for campsite_id, name in campsites:
+        facility_id = facilities[campsite_id]
+        summary = {"campsite_id": campsite_id, "name": name, "facility_id": facility_id, "sites_available": 0}
+        campgrounds.append(summary)
+        if facility_id is None:
+            continue
+        sites, available = stitch(months, {month: encoded[(facility_id, month)] for month in months}, start, end)
+        counts, runs = find_windows(available, min_nights)
+        by_site = {}
+        for row, first, nights in runs:
+            by_site.setdefault(row, []).append((first, nights))
+        summary["sites_available"] = len(by_site)
+        for row, site_runs in by_site.items():
+            candidates.append({
+                "campsite_id": campsite_id,
+                "campground": name,
+                "facility_id": facility_id,
+                "site_id": sites[row][0],
+                "site_name": sites[row][1],
+                "check_in_options": int(counts[row]),
+                "longest_nights": max(nights for _, nights in site_runs),
+                "windows": [
+                    {"check_in": (start + timedelta(days=first)).isoformat(),
+                     "check_out": (start + timedelta(days=first + nights)).isoformat(), "nights": nights}
+                    for first, nights in site_runs[:MAX_WINDOWS_PER_SITE]
+                ],
+            })
+
+    candidates.sort(key=lambda c: (-c["check_in_options"], -c["longest_nights"], c["windows"][0]["check_in"],
+                                   c["campground"], c["site_name"]))
+    for rank, candidate in enumerate(candidates[:limit], 1):
+        candidate["rank"] = rank
+    return {
+        "park_id": park.id,
+        "park_name": park.name,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "min_nights": min_nights,
+        "months_fetched": len(encoded) - failed,
+        "months_failed": failed,
+        "campgrounds": campgrounds,
+        "total_sites": len(candidates),
+        "results": candidates[:limit],
+    }
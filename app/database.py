@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import sessionmaker, declarative_base
 from config import DATABASE_URL
 
@@ -13,5 +13,37 @@ def get_db():
     finally:
         db.close()
 
+def dialect_insert(db):
+    """The dialect's `insert` construct, which supports on_conflict_do_update upserts."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+
+def add_missing_columns(bind=None):
+    """Add model columns missing from tables created by an older version.
+
+    `create_all` only creates missing tables. New columns on existing tables
+    are nullable, so they are added with ALTER TABLE (without constraints,
+    which SQLite cannot add later) together with their indexes.
+    """
+    bind = bind or engine
+    existing = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not existing.has_table(table.name):
+                continue
+            present = {column["name"] for column in existing.get_columns(table.name)}
+            added = {column.name for column in table.columns if column.name not in present}
+            for column in table.columns:
+                if column.name in added:
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                                         f"{column.type.compile(dialect=bind.dialect)}")
+            for index in table.indexes:
+                if added & set(index.columns.keys()):
+                    index.create(conn, checkfirst=True)
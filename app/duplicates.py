@@ -0,0 +1,174 @@
+"""The same outing logged from more than one source.
+
+A hike logged by hand and imported from Garmin (or uploaded from another
+tracker) would otherwise count twice in miles, leaderboards and badges.
+Two hikes of one user are duplicates when they come from different
+sources (no source counts as "manual"), their time windows overlap, and
+the distance and elevation gain they both have agree within tolerances.
+A window runs from `hike_date` for `duration_minutes`, widened by
+DUPLICATE_SLACK_MINUTES on both sides; a hand-logged hike dated at
+midnight has no time of day and covers the whole day.
+
+Matching is a sweep over hikes sorted by window start that keeps the
+windows still open in a heap ordered by end, so each hike is compared
+only with hikes it overlaps: O(n log n) for n hikes instead of pairwise.
+Matches are joined into groups; the group's first hike (lowest id) stays
+counted and the others get `duplicate_of` set to it. Aggregates and
+totals skip hikes with `duplicate_of` set.
+
+New hikes are checked when they are logged or imported, before they are
+recorded in the aggregates; they are never made the counted hike of an
+existing group, so nothing already recorded has to be taken back. The
+backfill (scripts/mark_duplicate_hikes.py) re-detects every user's hikes
+and the aggregates are then rebuilt.
+"""
+import heapq
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import groupby
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app import models
+
+DUPLICATE_SLACK_MINUTES = 30
+DISTANCE_TOLERANCE = 0.15  # Relative difference in miles
+ELEVATION_TOLERANCE = 0.25  # Relative difference in elevation gain...
+ELEVATION_TOLERANCE_FT = 200  # ...or this many feet, whichever is larger
+DAY_MINUTES = 24 * 60
+NEARBY = timedelta(days=2)  # Start times of existing hikes checked against a new one
+_EPOCH = datetime(1970, 1, 1)
+
+Candidate = namedtuple("Candidate", "id start end source miles elevation")
+
+_COLUMNS = (models.TrailHike.id, models.TrailHike.user_id, models.TrailHike.hike_date,
+            models.TrailHike.duration_minutes, models.TrailHike.fitness_tracker_source,
+            models.TrailHike.distance_miles, models.TrailHike.elevation_gain, models.TrailHike.duplicate_of)
+
+
+def candidate(hike_id, hike_date, duration, source, miles, elevation) -> Candidate:
+    """A hike's matching window (minutes since the epoch, widened by the slack) and metrics."""
+    source = (source or "manual").lower()
+    start = (hike_date.replace(tzinfo=None) - _EPOCH).total_seconds() / 60
+    if source == "manual" and hike_date.hour == hike_date.minute == hike_date.second == 0:
+        length = DAY_MINUTES  # Only the day is known
+    else:
+        length = max(duration or 0, 0)
+    return Candidate(hike_id, start - DUPLICATE_SLACK_MINUTES, start + length + DUPLICATE_SLACK_MINUTES,
+                     source, miles, elevation)
+
+
+def similar(a: Candidate, b: Candidate) -> bool:
+    """Whether two overlapping hikes from different sources are the same outing."""
+    if a.source == b.source:
+        return False
+    compared = False
+    if a.miles and b.miles:
+        if abs(a.miles - b.miles) > DISTANCE_TOLERANCE * max(a.miles, b.miles):
+            return False
+        compared = True
+    if a.elevation is not None and b.elevation is not None:
+        if abs(a.elevation - b.elevation) > max(ELEVATION_TOLERANCE_FT,
+                                                ELEVATION_TOLERANCE * max(a.elevation, b.elevation)):
+            return False
+        compared = True
+    return compared
+
+
+def find_duplicates(hikes: list, links: dict = None) -> dict:
+    """{duplicate id: id of the counted hike} among one user's candidates.
+
+    `links` are already known {duplicate id: counted id} pairs to keep grouped.
+    """
+    parent = {}
+
+    def root(hike_id: int) -> int:
+        while parent.get(hike_id, hike_id) != hike_id:
+            parent[hike_id] = parent.get(parent[hike_id], parent[hike_id])  # Path halving
+            hike_id = parent[hike_id]
+        return hike_id
+
+    def join(a: int, b: int):
+        a, b = root(a), root(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    for duplicate, counted in (links or {}).items():
+        join(duplicate, counted)
+    open_ = []  # (end, id, candidate) of windows that may still overlap
+    for hike in sorted(hikes, key=lambda h: h.start):
+        while open_ and open_[0][0] < hike.start:
+            heapq.heappop(open_)
+        for _, _, other in open_:
+            if similar(hike, other):
+                join(hike.id, other.id)
+        heapq.heappush(open_, (hike.end, hike.id, hike))
+    return {hike_id: root(hike_id) for hike_id in parent if root(hike_id) != hike_id}
+
+
+class DuplicateHikeService:
+    """Marks hikes that repeat another source's hike so aggregates skip them."""
+
+    @staticmethod
+    def mark_new(db: Session, hikes: list) -> list:
+        """Set `duplicate_of` on new hikes (flushed, so they have ids); returns the ones that count.
+
+        Callers record only the returned hikes in the aggregates, then commit.
+        """
+        new_ids, marked = {hike.id for hike in hikes}, set()
+        for user_id, user_hikes in groupby(sorted(hikes, key=lambda h: h.user_id), key=lambda h: h.user_id):
+            dated = [hike for hike in user_hikes if hike.hike_date is not None]
+            if not dated:
+                continue
+            rows = db.query(*_COLUMNS).filter(
+                models.TrailHike.user_id == user_id,
+                models.TrailHike.hike_date >= min(h.hike_date for h in dated) - NEARBY,
+                models.TrailHike.hike_date <= max(h.hike_date for h in dated) + NEARBY,
+                models.TrailHike.id.notin_(new_ids),
+            ).all()
+            candidates = [candidate(r.id, r.hike_date, r.duration_minutes, r.fitness_tracker_source,
+                                    r.distance_miles, r.elevation_gain) for r in rows]
+            candidates += [candidate(h.id, h.hike_date, h.duration_minutes, h.fitness_tracker_source,
+                                     h.distance_miles, h.elevation_gain) for h in dated]
+            marks = find_duplicates(candidates, {r.id: r.duplicate_of for r in rows if r.duplicate_of})
+            marked.update(marks)
+            for hike in dated:
+                if hike.id in marks:  # Assigning None to the others would still issue an UPDATE
+                    hike.duplicate_of = marks[hike.id]
+        return [hike for hike in hikes if hike.id not in marked]
+
+    @staticmethod
+    def backfill(db: Session) -> dict:
+        """Re-detect duplicates over every user's hikes and commit; rebuild the aggregates if any changed.
+
+        Passport miles of the users whose marks changed are recomputed in the same commit.
+        """
+        updates, user_ids, counts = [], set(), {"hikes": 0, "duplicates": 0, "changed": 0, "users": 0}
+        rows = db.query(*_COLUMNS).filter(models.TrailHike.hike_date.isnot(None)).order_by(
+            models.TrailHike.user_id).yield_per(5000)
+        for user_id, user_rows in groupby(rows, key=lambda r: r.user_id):
+            user_rows = list(user_rows)
+            marks = find_duplicates([candidate(r.id, r.hike_date, r.duration_minutes, r.fitness_tracker_source,
+                                               r.distance_miles, r.elevation_gain) for r in user_rows])
+            counts["hikes"] += len(user_rows)
+            counts["duplicates"] += len(marks)
+            changed = [{"id": r.id, "duplicate_of": marks.get(r.id)} for r in user_rows
+                       if r.duplicate_of != marks.get(r.id)]
+            if changed:
+                updates += changed
+                user_ids.add(user_id)
+        if updates:
+            db.execute(update(models.TrailHike), updates)
+            DuplicateHikeService._passport_miles(db, user_ids)
+            counts["users"] = len(user_ids)
+        db.commit()
+        counts["changed"] = len(updates)
+        return counts
+
+    @staticmethod
+    def _passport_miles(db: Session, user_ids: set):
+        """Recompute `total_miles_hiked` of these users' passports from their counted hikes."""
+        hikes = models.TrailHike
+        miles = select(func.coalesce(func.sum(hikes.distance_miles), 0)).where(
+            hikes.user_id == models.ParkPassport.user_id, hikes.duplicate_of.is_(None)).scalar_subquery()
+        db.query(models.ParkPassport).filter(models.ParkPassport.user_id.in_(user_ids)).update(
+            {models.ParkPassport.total_miles_hiked: miles}, synchronize_session=False)
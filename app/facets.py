@@ -0,0 +1,220 @@
+"""In-memory faceted filtering of the park and campsite catalog.
+
+The catalog is small and read-mostly, so each index loads it once and keeps,
+per facet value, a bitmap (a Python int) of the rows carrying that value.
+A filter ORs the bitmaps of the selected values within a facet and ANDs
+across facets; facet counts are popcounts of each value's bitmap against
+the filter with that facet's own selection left out, so a client can show
+how many results each additional choice would give.
+
+Numeric facets with many distinct values are banded (area, elevation) so a
+range filter is an OR over a handful of bitmaps.
+
+Indexes rebuild lazily: `invalidate()` (called by the write routes) marks
+them stale, and FACET_MAX_AGE_SECONDS bounds staleness across worker
+processes, which do not see each other's invalidations.
+"""
+import threading
+import time
+from typing import Callable, Optional
+from sqlalchemy.orm import Session
+from app import models, schemas
+from app.serialization import RowSerializer
+from config import FACET_MAX_AGE_SECONDS
+
+# Bit positions set in each byte value, for decoding bitmaps into row positions
+_BYTE_BITS = [tuple(i for i in range(8) if b >> i & 1) for b in range(256)]
+
+AREA_BANDS = ((0, 100), (100, 500), (500, 1000), (1000, 5000), (5000, None))  # sq miles
+ELEVATION_BANDS = ((None, 2000), (2000, 5000), (5000, 8000), (8000, None))  # feet
+
+
+def band(value, bands) -> Optional[str]:
+    """Label such as "500-1000", "8000+" or "<2000" for the band containing value."""
+    if value is None:
+        return None
+    for low, high in bands:
+        if (low is None or value >= low) and (high is None or value < high):
+            if low is None:
+                return f"<{high}"
+            return f"{low}+" if high is None else f"{low}-{high}"
+    return None
+
+
+def decade(established) -> Optional[str]:
+    try:
+        return f"{int(str(established)[:4]) // 10 * 10}s"
+    except (TypeError, ValueError):
+        return None
+
+
+def positions(bitmap: int, skip: int = 0, limit: Optional[int] = None) -> list:
+    """Row positions set in `bitmap`, ascending, after skipping `skip` of them."""
+    found = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for index, byte in enumerate(data):
+        if not byte:
+            continue
+        bits = _BYTE_BITS[byte]
+        if skip >= len(bits):
+            skip -= len(bits)
+            continue
+        base = index * 8
+        found.extend(base + bit for bit in bits[skip:])
+        skip = 0
+        if limit is not None and len(found) >= limit:
+            return found[:limit]
+    return found
+
+
+class FacetSnapshot:
+    """Rows plus per-facet value bitmaps, immutable once built."""
+
+    def __init__(self, rows: list, records: list, facets: dict):
+        self.rows = rows
+        self.all = (1 << len(rows)) - 1
+        self.bitmaps = {name: {} for name in facets}
+        for position, record in enumerate(records):
+            bit = 1 << position
+            for name, extract in facets.items():
+                value = extract(record)
+                if value is None:
+                    continue
+                by_value = self.bitmaps[name]
+                by_value[value] = by_value.get(value, 0) | bit
+        self.totals = {
+            name: {value: bitmap.bit_count() for value, bitmap in by_value.items()}
+            for name, by_value in self.bitmaps.items()
+        }
+        self.built_at = time.monotonic()
+
+
+class FacetIndex:
+    """Lazily built faceted index over one catalog table."""
+
+    def __init__(self, loader: Callable[[Session], tuple], facets: dict,
+                 max_age: float = FACET_MAX_AGE_SECONDS):
+        self.loader = loader
+        self.facets = facets
+        self.max_age = max_age
+        self._snapshot = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._generation += 1
+        self._snapshot = None
+
+    def snapshot(self, db: Session) -> FacetSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.built_at > self.max_age:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or time.monotonic() - snapshot.built_at > self.max_age:
+                    generation = self._generation
+                    rows, records = self.loader(db)
+                    snapshot = FacetSnapshot(rows, records, self.facets)
+                    # A write that invalidated mid-load may be missing from these rows
+                    if generation == self._generation:
+                        self._snapshot = snapshot
+        return snapshot
+
+    def query(self, db: Session, selections: dict, ranges: Optional[dict] = None,
+              limit: int = 50, offset: int = 0) -> dict:
+        """Filter by `selections` ({facet: [values]}) and count every facet value.
+
+        Values within a facet are ORed, facets are ANDed; unknown values match
+        nothing and empty selections are ignored. `ranges` ({facet: (low,
+        high)}, inclusive, either end None) selects every value of a numeric
+        facet in the range.
+        """
+        snapshot = self.snapshot(db)
+        masks = {}
+        for name, values in selections.items():
+            if name not in snapshot.bitmaps or not values:
+                continue
+            by_value = snapshot.bitmaps[name]
+            mask = 0
+            for value in values:
+                mask |= by_value.get(value, 0)
+            masks[name] = mask
+        for name, (low, high) in (ranges or {}).items():
+            if name not in snapshot.bitmaps or (low is None and high is None):
+                continue
+            mask = 0
+            for value, bitmap in snapshot.bitmaps[name].items():
+                if (low is None or value >= low) and (high is None or value <= high):
+                    mask |= bitmap
+            masks[name] = masks.get(name, snapshot.all) & mask
+
+        match = snapshot.all
+        for mask in masks.values():
+            match &= mask
+
+        counts = {}
+        for name, by_value in snapshot.bitmaps.items():
+            base = match
+            if name in masks:
+                # Disjunctive count: apply every selection except this facet's own
+                base = snapshot.all
+                for other, mask in masks.items():
+                    if other != name:
+                        base &= mask
+            if base == snapshot.all:
+                counts[name] = dict(snapshot.totals[name])
+            else:
+                counts[name] = {value: (base & bitmap).bit_count() for value, bitmap in by_value.items()}
+
+        return {
+            "total": match.bit_count(),
+            "results": [snapshot.rows[p] for p in positions(match, offset, limit)],
+            "facets": counts,
+            "limit": limit,
+            "offset": offset,
+        }
+
+
+# ---- catalog indexes ----
+
+_park_rows = RowSerializer(models.Park, schemas.ParkOut)
+_campsite_rows = RowSerializer(models.Campsite, schemas.CampsiteOut)
+
+
+def _load_parks(db: Session) -> tuple:
+    parks = _park_rows.dicts(_park_rows.query(db).order_by(models.Park.name).all())
+    return parks, parks
+
+
+def _load_campsites(db: Session) -> tuple:
+    rows = _campsite_rows.query(db).add_columns(models.Park.region, models.Park.state).outerjoin(
+        models.Park, models.Park.id == models.Campsite.park_id
+    ).order_by(models.Campsite.name).all()
+    width = len(_campsite_rows.fields)
+    campsites = _campsite_rows.dicts(row[:width] for row in rows)
+    # The park's region and state are facets but not part of CampsiteOut
+    records = [dict(campsite, region=row[width], state=row[width + 1]) for campsite, row in zip(campsites, rows)]
+    return campsites, records
+
+
+park_facets = FacetIndex(_load_parks, {
+    "region": lambda p: p["region"],
+    "state": lambda p: p["state"],
+    "decade": lambda p: decade(p["established"]),
+    "area": lambda p: band(p["area_sq_miles"], AREA_BANDS),
+})
+
+campsite_facets = FacetIndex(_load_campsites, {
+    "park_id": lambda c: c["park_id"],
+    "region": lambda c: c["region"],
+    "state": lambda c: c["state"],
+    "has_water": lambda c: c["has_water"],
+    "has_toilets": lambda c: c["has_toilets"],
+    "elevation": lambda c: band(c["elevation"], ELEVATION_BANDS),
+    "max_occupancy": lambda c: c["max_occupancy"],
+})
+
+
+def invalidate_catalog():
+    """Drop both indexes after a park or campsite write."""
+    park_facets.invalidate()
+    campsite_facets.invalidate()
@@ -0,0 +1,112 @@
+"""Featured-campsites feed, precomputed in the background.
+
+The feed lists the best upcoming stays (see app/availability_search.py)
+at a handful of parks: the ones named in FEATURED_PARKS, or else the
+FEATURED_PARK_COUNT parks with campsites that are most visited and camped
+according to `park_stats`. A background task rebuilds it every
+FEATURED_REFRESH_SECONDS, searching all parks concurrently with a
+per-park timeout, and keeps the result ready to serve; a park that fails,
+times out or has no campground month fetched (e.g. during a Recreation.gov
+outage) keeps its previous entry. Requests only read the snapshot.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app import models
+from app.availability_search import search_park
+from config import FEATURED_PARK_COUNT, FEATURED_PARKS, FEATURED_REFRESH_SECONDS, FEATURED_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SITES_PER_PARK = 3
+WINDOW_DAYS = 14  # Stays searched from today
+MIN_NIGHTS = 2
+
+
+def featured_parks(db: Session, names: list = FEATURED_PARKS, count: int = FEATURED_PARK_COUNT) -> list:
+    """(id, name) of the configured parks, or the most popular parks that have campsites."""
+    if names:
+        found = dict(db.query(models.Park.name, models.Park.id).filter(models.Park.name.in_(names)))
+        return [(found[name], name) for name in names if name in found]
+    popularity = func.coalesce(models.ParkStats.visit_count, 0) + func.coalesce(models.ParkStats.camping_trip_count, 0)
+    has_campsites = db.query(models.Campsite.id).filter(models.Campsite.park_id == models.Park.id).exists()
+    return db.query(models.Park.id, models.Park.name).outerjoin(
+        models.ParkStats, models.ParkStats.park_id == models.Park.id
+    ).filter(has_campsites).order_by(popularity.desc(), models.Park.id).limit(count).all()
+
+
+class FeaturedCampsites:
+    """Holds the current feed snapshot and rebuilds it."""
+
+    def __init__(self, names: list = FEATURED_PARKS, count: int = FEATURED_PARK_COUNT,
+                 timeout: float = FEATURED_TIMEOUT_SECONDS):
+        self.names = names
+        self.count = count
+        self.timeout = timeout
+        self._snapshot = None  # (built_at monotonic, generated_at, [park entries])
+
+    async def _park_entry(self, session_factory, park_id: int, fetch, resolve) -> dict:
+        db = session_factory()
+        try:
+            park = db.get(models.Park, park_id)
+            today = datetime.utcnow().date()
+            found = await search_park(db, park, today, today + timedelta(days=WINDOW_DAYS),
+                                      min_nights=MIN_NIGHTS, limit=SITES_PER_PARK, fetch=fetch, resolve=resolve)
+            if not found["months_fetched"]:
+                # Nothing was fetched, so "no campsites" would only mean the lookups failed
+                raise RuntimeError(f"no availability fetched ({found['months_failed']} months failed)")
+            return {
+                "park_id": park.id,
+                "park_name": park.name,
+                "updated_at": datetime.utcnow().isoformat(),
+                "campsites": found["results"],
+            }
+        finally:
+            db.close()
+
+    async def refresh(self, session_factory, fetch=None, resolve=None) -> dict:
+        """Rebuild the feed; returns how many parks were refreshed, failed, and kept their previous entry."""
+        db = session_factory()
+        try:
+            parks = featured_parks(db, self.names, self.count)
+        finally:
+            db.close()
+        results = await asyncio.gather(*(
+            asyncio.wait_for(self._park_entry(session_factory, park_id, fetch, resolve), self.timeout)
+            for park_id, _ in parks
+        ), return_exceptions=True)
+
+        previous = {entry["park_id"]: entry for entry in (self._snapshot[2] if self._snapshot else [])}
+        entries, kept = [], 0
+        for (park_id, name), result in zip(parks, results):
+            if isinstance(result, BaseException):
+                logger.warning("Featured campsites for %s failed: %r", name, result)
+                if park_id in previous:
+                    entries.append(previous[park_id])
+                    kept += 1
+                continue
+            entries.append(result)
+        self._snapshot = (time.monotonic(), datetime.utcnow().isoformat(), entries)
+        return {"refreshed": len(entries) - kept, "failed": len(parks) - len(entries) + kept, "kept": kept}
+
+    def snapshot(self) -> dict:
+        """The current feed and its age in seconds (None before the first build)."""
+        if self._snapshot is None:
+            return {"generated_at": None, "age_seconds": None, "parks": []}
+        built_at, generated_at, entries = self._snapshot
+        return {"generated_at": generated_at, "age_seconds": round(time.monotonic() - built_at, 1), "parks": entries}
+
+    async def run(self, session_factory, interval: float = FEATURED_REFRESH_SECONDS):
+        """Rebuild every `interval` seconds until cancelled."""
+        while True:
+            try:
+                await self.refresh(session_factory)
+            except Exception:
+                logger.exception("Featured campsites refresh failed")
+            await asyncio.sleep(interval)
+
+
+featured_campsites = FeaturedCampsites()
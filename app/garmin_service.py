@@ -1,21 +1,31 @@
 """Garmin Connect API integration for importing fitness data."""
 import os
+import re
 import json
-import requests
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
 import httpx
+from app.resilience import OutboundGuard
+from config import GARMIN_BURST, GARMIN_RATE_PER_SECOND, GARMIN_TIMEOUT_SECONDS
 
-# Garmin OAuth endpoints
-GARMIN_AUTH_URL = "https://connect.garmin.com/oauthserver/oauth/authorize"
-GARMIN_TOKEN_URL = "https://connect.garmin.com/oauthserver/oauth/token"
-GARMIN_API_BASE = "https://connect.garmin.com/api/v1"
+# Garmin OAuth endpoints (overridable to point at a local stand-in)
+GARMIN_AUTH_URL = os.getenv("GARMIN_AUTH_URL", "https://connect.garmin.com/oauthserver/oauth/authorize")
+GARMIN_TOKEN_URL = os.getenv("GARMIN_TOKEN_URL", "https://connect.garmin.com/oauthserver/oauth/token")
+GARMIN_API_BASE = os.getenv("GARMIN_API_BASE", "https://connect.garmin.com/api/v1")
+
+# Rate limit and circuit breaker for all Garmin calls in this process
+garmin_guard = OutboundGuard("garmin", GARMIN_RATE_PER_SECOND, GARMIN_BURST)
+
+# Imported hikes carry the source activity id in their notes, e.g. "[garmin:123]"
+ACTIVITY_MARKER = re.compile(r"\[garmin:([^\]]+)\]")
 
 class GarminConnectService:
     """Service for integrating with Garmin Connect."""
     
-    def __init__(self, client_id: str = None, client_secret: str = None, redirect_uri: str = None):
+    def __init__(self, client_id: str = None, client_secret: str = None, redirect_uri: str = None,
+                 guard: OutboundGuard = None):
         """Initialize Garmin service with OAuth credentials."""
+        self.guard = guard or garmin_guard
         self.client_id = client_id or os.getenv("GARMIN_CLIENT_ID")
         self.client_secret = client_secret or os.getenv("GARMIN_CLIENT_SECRET")
         self.redirect_uri = redirect_uri or os.getenv("GARMIN_REDIRECT_URI", "http://localhost:3001/fitness")
@@ -44,8 +54,10 @@ class GarminConnectService:
         }
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(GARMIN_TOKEN_URL, data=payload)
+            async with httpx.AsyncClient(timeout=GARMIN_TIMEOUT_SECONDS) as client:
+                async with self.guard.call("token") as call:
+                    response = await client.post(GARMIN_TOKEN_URL, data=payload)
+                    call.status = response.status_code
                 if response.status_code == 200:
                     return response.json()
                 else:
@@ -55,6 +67,29 @@ class GarminConnectService:
             print(f"Error exchanging code for token: {e}")
             return None
     
+    async def refresh_access_token(self, refresh_token: str) -> Optional[Dict]:
+        """Exchange a refresh token for a new access token (and possibly a new refresh token)."""
+        payload = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "refresh_token": refresh_token,
+            "grant_type": "refresh_token"
+        }
+
+        try:
+            async with httpx.AsyncClient(timeout=GARMIN_TIMEOUT_SECONDS) as client:
+                async with self.guard.call("token_refresh") as call:
+                    response = await client.post(GARMIN_TOKEN_URL, data=payload)
+                    call.status = response.status_code
+                if response.status_code == 200:
+                    return response.json()
+                else:
+                    print(f"Garmin token refresh failed: {response.status_code} {response.text}")
+                    return None
+        except Exception as e:
+            print(f"Error refreshing Garmin token: {e}")
+            return None
+
     async def get_activities(self, access_token: str, limit: int = 50, start: int = 0) -> List[Dict]:
         """Fetch activities from Garmin Connect."""
         headers = {
@@ -68,8 +103,10 @@ class GarminConnectService:
         }
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=headers, params=params)
+            async with httpx.AsyncClient(timeout=GARMIN_TIMEOUT_SECONDS) as client:
+                async with self.guard.call("activities") as call:
+                    response = await client.get(url, headers=headers, params=params)
+                    call.status = response.status_code
                 if response.status_code == 200:
                     return response.json().get("activities", [])
                 else:
@@ -88,8 +125,10 @@ class GarminConnectService:
         url = f"{GARMIN_API_BASE}/activities/{activity_id}/details"
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=headers)
+            async with httpx.AsyncClient(timeout=GARMIN_TIMEOUT_SECONDS) as client:
+                async with self.guard.call("activity_details") as call:
+                    response = await client.get(url, headers=headers)
+                    call.status = response.status_code
                 if response.status_code == 200:
                     return response.json()
                 else:
@@ -123,13 +162,22 @@ class GarminConnectService:
             "elevation_gain": int(elevation_gain) if elevation_gain else None,
             "calories": int(calories) if calories else None,
             "avg_pace": activity.get("avgPace"),  # min/mi
-            "notes": f"Imported from Garmin: {activity.get('activityName', 'Activity')}",
+            "notes": f"Imported from Garmin: {activity.get('activityName', 'Activity')} [garmin:{activity.get('id')}]",
             "difficulty_experienced": "moderate",  # Default; user can adjust
             "fitness_tracker_source": "garmin"
         }
         
         return hike
     
+    @staticmethod
+    def imported_activity_ids(notes: List[Optional[str]]) -> set:
+        """Extract the Garmin activity ids recorded in imported hikes' notes."""
+        ids = set()
+        for note in notes:
+            if note:
+                ids.update(ACTIVITY_MARKER.findall(note))
+        return ids
+    
     @staticmethod
     def filter_hiking_activities(activities: List[Dict]) -> List[Dict]:
         """Filter activities to only include hiking/running activities."""
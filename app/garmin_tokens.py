@@ -0,0 +1,239 @@
+"""Garmin access tokens, refreshed before they expire.
+
+`garmin_tokens.access_token(db, user_id)` is what callers use instead of
+reading `GarminAuth.access_token`. Valid tokens are cached in memory with
+their expiry, so the hot path reads nothing from the database. A token
+that expires within GARMIN_TOKEN_MIN_VALIDITY_SECONDS is refreshed on
+demand, under a per-user lock: concurrent imports for one user wait for
+the single refresh in flight and then find the new token in the cache.
+
+Refresh tokens may rotate, so only one worker process may exchange a
+given one. Every exchange first claims the row by stamping
+`refresh_claimed_at` with a conditional UPDATE and committing; only rows
+not claimed within GARMIN_REFRESH_RETRY_SECONDS can be claimed. A
+successful refresh clears the stamp, and a failed one keeps it so the
+retry waits. An on-demand refresh that finds the row claimed waits
+briefly for the other worker's token.
+
+The background pass started by app/main.py claims, in batches, the rows
+of connected users whose tokens expire within
+GARMIN_REFRESH_AHEAD_SECONDS, each at most once per pass (a token that
+lives shorter than the look-ahead is due again as soon as it is
+refreshed). Every failed refresh is recorded in `sync_logs`.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from app import models
+from app.garmin_service import garmin_service
+from config import (GARMIN_REFRESH_AHEAD_SECONDS, GARMIN_REFRESH_BATCH_SIZE, GARMIN_REFRESH_CONCURRENCY,
+                    GARMIN_REFRESH_INTERVAL_SECONDS, GARMIN_REFRESH_RETRY_SECONDS,
+                    GARMIN_TOKEN_MIN_VALIDITY_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+CLAIM_WAIT_SECONDS = 3.0  # How long an on-demand refresh waits for another worker's
+CLAIM_WAIT_STEP_SECONDS = 0.25
+
+
+class GarminTokenManager:
+    """Hands out valid Garmin access tokens and refreshes them ahead of expiry."""
+
+    def __init__(self, service=None, ahead_seconds: float = GARMIN_REFRESH_AHEAD_SECONDS,
+                 min_validity_seconds: float = GARMIN_TOKEN_MIN_VALIDITY_SECONDS,
+                 retry_seconds: float = GARMIN_REFRESH_RETRY_SECONDS, batch_size: int = GARMIN_REFRESH_BATCH_SIZE,
+                 concurrency: int = GARMIN_REFRESH_CONCURRENCY, claim_wait: float = CLAIM_WAIT_SECONDS):
+        self.service = service or garmin_service
+        self.ahead = timedelta(seconds=ahead_seconds)
+        self.min_validity = timedelta(seconds=min_validity_seconds)
+        self.retry = timedelta(seconds=retry_seconds)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.claim_wait = claim_wait
+        self._tokens = {}  # user_id -> (access_token, expires_at)
+        self._locks = {}  # user_id -> [asyncio.Lock, holders and waiters]
+
+    # ---- cache ----
+
+    def _cached(self, user_id: int, now: datetime) -> Optional[str]:
+        entry = self._tokens.get(user_id)
+        if entry is not None and entry[1] - now > self.min_validity:
+            return entry[0]
+        return None
+
+    def remember(self, auth: models.GarminAuth):
+        """Cache a connected user's current token (callers save it first)."""
+        if auth.connected and auth.access_token and auth.token_expires_at:
+            self._tokens[auth.user_id] = (auth.access_token, auth.token_expires_at)
+        else:
+            self.forget(auth.user_id)
+
+    def forget(self, user_id: int):
+        self._tokens.pop(user_id, None)
+
+    @asynccontextmanager
+    async def _user_lock(self, user_id: int):
+        # Locks are dropped once nobody holds or waits on them, so idle users cost nothing
+        entry = self._locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user_id]
+
+    # ---- refresh ----
+
+    async def _exchange(self, auth: models.GarminAuth, now: datetime) -> tuple:
+        """(token data, None) or (None, error message); caches a new token, callers save the row."""
+        if not auth.refresh_token:
+            return None, "No refresh token stored; reconnect Garmin"
+        try:
+            data = await self.service.refresh_access_token(auth.refresh_token)
+        except Exception as e:
+            data, error = None, f"Token refresh failed: {e!r}"
+        else:
+            error = None if data and data.get("access_token") else "Token refresh was rejected by Garmin"
+        if error:
+            return None, error
+        expires_at = now + timedelta(seconds=data.get("expires_in", 3600))
+        self._tokens[auth.user_id] = (data["access_token"], expires_at)
+        return dict(data, expires_at=expires_at), None
+
+    @staticmethod
+    def _apply(db: Session, auth: models.GarminAuth, data: Optional[dict], error: Optional[str], now: datetime):
+        if data:
+            auth.access_token = data["access_token"]
+            auth.refresh_token = data.get("refresh_token") or auth.refresh_token
+            auth.token_expires_at = data["expires_at"]
+            auth.refresh_claimed_at = None
+        else:
+            db.add(models.SyncLog(user_id=auth.user_id, tracker_type="garmin", activities_synced=0,
+                                  success=False, error_message=error, sync_date=now))
+
+    async def access_token(self, db: Session, user_id: int, now: Optional[datetime] = None) -> Optional[str]:
+        """A valid access token for a connected user, refreshing it if needed; None if there is none."""
+        now = now or datetime.utcnow()
+        token = self._cached(user_id, now)
+        if token is not None:
+            return token
+        async with self._user_lock(user_id):
+            token = self._cached(user_id, now)  # Refreshed while this call waited
+            if token is not None:
+                return token
+            auth = db.query(models.GarminAuth).filter(
+                models.GarminAuth.user_id == user_id, models.GarminAuth.connected.is_(True)).first()
+            if auth is None:
+                self.forget(user_id)
+                return None
+            if auth.token_expires_at and auth.token_expires_at - now > self.min_validity:
+                self.remember(auth)
+                return auth.access_token
+            if not self._claim_one(db, auth, now):
+                return await self._await_other_refresh(db, auth, now)
+            db.refresh(auth)  # Another worker may have refreshed it just before the claim
+            if auth.token_expires_at and auth.token_expires_at - now > self.min_validity:
+                auth.refresh_claimed_at = None
+                db.commit()
+                self.remember(auth)
+                return auth.access_token
+            data, error = await self._exchange(auth, now)
+            self._apply(db, auth, data, error, now)
+            db.commit()
+            if data:
+                return data["access_token"]
+            logger.warning("Garmin token refresh for user %s failed: %s", user_id, error)
+            # A token that has not quite expired is still better than none
+            return auth.access_token if auth.token_expires_at and auth.token_expires_at > now else None
+
+    def _claimable(self, now: datetime):
+        claimed_at = models.GarminAuth.refresh_claimed_at
+        return claimed_at.is_(None) | (claimed_at <= now - self.retry)
+
+    def _claim_one(self, db: Session, auth: models.GarminAuth, now: datetime) -> bool:
+        """Claim one row for an on-demand refresh and commit; False if another worker holds it."""
+        claimed = db.query(models.GarminAuth).filter(models.GarminAuth.id == auth.id, self._claimable(now)).update(
+            {models.GarminAuth.refresh_claimed_at: now}, synchronize_session=False)
+        db.commit()
+        return bool(claimed)
+
+    async def _await_other_refresh(self, db: Session, auth: models.GarminAuth, now: datetime) -> Optional[str]:
+        waited = 0.0
+        while True:
+            db.refresh(auth)
+            if auth.token_expires_at and auth.token_expires_at - now > self.min_validity:
+                self.remember(auth)
+                return auth.access_token
+            if waited >= self.claim_wait:
+                break
+            await asyncio.sleep(CLAIM_WAIT_STEP_SECONDS)
+            waited += CLAIM_WAIT_STEP_SECONDS
+        # Still refreshing elsewhere, or its last refresh failed; a token not quite expired beats none
+        return auth.access_token if auth.token_expires_at and auth.token_expires_at > now else None
+
+    def _claim(self, db: Session, now: datetime, handled: set) -> list:
+        auth = models.GarminAuth
+        due = auth.connected.is_(True), auth.token_expires_at <= now + self.ahead, self._claimable(now)
+        if handled:
+            # A token living no longer than the look-ahead is due again right after its refresh
+            due += (auth.id.notin_(handled),)
+        ids = [auth_id for (auth_id,) in db.query(auth.id).filter(*due).order_by(
+            auth.token_expires_at).limit(self.batch_size)]
+        if not ids:
+            return []
+        # Re-checking the claim skips rows another worker claimed in the meantime
+        db.query(auth).filter(auth.id.in_(ids), self._claimable(now)).update(
+            {auth.refresh_claimed_at: now}, synchronize_session=False)
+        db.commit()
+        return db.query(auth).filter(auth.id.in_(ids), auth.refresh_claimed_at == now).all()
+
+    async def refresh_due(self, db: Session, now: Optional[datetime] = None) -> dict:
+        """Refresh every token expiring within the look-ahead window, in batches."""
+        now = now or datetime.utcnow()
+        limit = asyncio.Semaphore(self.concurrency)
+        counts = {"refreshed": 0, "failed": 0}
+        handled = set()
+
+        async def refresh(auth: models.GarminAuth) -> Optional[tuple]:
+            # No per-user lock: the claim already keeps on-demand refreshes, which wait for this one, away
+            async with limit:
+                entry = self._tokens.get(auth.user_id)
+                if entry is not None and entry[1] - now > self.ahead:
+                    return None  # Refreshed on demand just before the claim, and saved by that request
+                return await self._exchange(auth, now)
+
+        while True:
+            batch = self._claim(db, now, handled)
+            if not batch:
+                break
+            handled.update(auth.id for auth in batch)
+            for auth, result in zip(batch, await asyncio.gather(*(refresh(auth) for auth in batch))):
+                if result is None:
+                    auth.refresh_claimed_at = None
+                else:
+                    self._apply(db, auth, *result, now)
+                    counts["refreshed" if result[0] else "failed"] += 1
+            db.commit()
+        if counts["failed"]:
+            logger.warning("Garmin token refresh failed for %d users", counts["failed"])
+        return counts
+
+    async def run(self, session_factory, interval: float = GARMIN_REFRESH_INTERVAL_SECONDS):
+        """Refresh expiring tokens every `interval` seconds until cancelled."""
+        while True:
+            db = session_factory()
+            try:
+                await self.refresh_due(db)
+            except Exception:
+                logger.exception("Garmin token refresh pass failed")
+            finally:
+                db.close()
+            await asyncio.sleep(interval)
+
+
+garmin_tokens = GarminTokenManager()
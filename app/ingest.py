@@ -0,0 +1,241 @@
+"""Push ingest of fitness provider activities.
+
+Garmin pushes a ping to POST /webhooks/garmin/activities when a user's
+activity is ready. The receiver only maps the provider's user ids to ours
+and inserts one `activity_notifications` row per (user, activity), then
+answers; repeated pings for an activity hit the unique constraint and
+are dropped. Pings for users nobody connected are acknowledged and
+ignored.
+
+New rows are due INGEST_COALESCE_SECONDS after they arrive, so a burst
+of pushes for one user is imported together. The worker started by
+app/main.py claims users with due notifications, together with every
+other pending notification of those users, by pushing `due_at` out by
+INGEST_LEASE_SECONDS under a fresh claim token and committing
+(app/leases.py). For each user it fetches only the referenced
+activities, whose details carry both the summary and the GPS track, and
+imports the hikes and tracks in one commit. An activity whose fetch
+failed stays claimed and is retried when the lease runs out, up to
+INGEST_MAX_ATTEMPTS; so is the whole claim when no access token can be
+had for a still connected user, or when the import raises. The webhook
+wakes the worker, which then sleeps until the next notification is due.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app import models
+from app.activity import ActivityRollupService
+from app.database import dialect_insert
+from app.duplicates import DuplicateHikeService
+from app.garmin_service import garmin_service
+from app.garmin_tokens import garmin_tokens
+from app.leases import LeaseQueue
+from app.ranking import user_rankings
+from app.scoped_leaderboards import ScopeStatsService, scoped_leaderboards
+from app.tracks import FETCH_CONCURRENCY, TrackService
+from config import (INGEST_BATCH_USERS, INGEST_COALESCE_SECONDS, INGEST_LEASE_SECONDS, INGEST_MAX_ATTEMPTS,
+                    INGEST_POLL_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityIngest:
+    """Queues pushed activity notifications and imports them per user."""
+
+    def __init__(self, service=None, tokens=None, coalesce_seconds: float = INGEST_COALESCE_SECONDS,
+                 lease_seconds: float = INGEST_LEASE_SECONDS, batch_users: int = INGEST_BATCH_USERS,
+                 max_attempts: int = INGEST_MAX_ATTEMPTS):
+        self.service = service or garmin_service
+        self.tokens = tokens or garmin_tokens
+        self.coalesce = timedelta(seconds=coalesce_seconds)
+        self.queue = LeaseQueue(models.ActivityNotification, lease_seconds, batch_users)
+        self.batch_users = batch_users
+        self.max_attempts = max_attempts
+        self._wake = asyncio.Event()
+
+    # ---- receiving ----
+
+    @staticmethod
+    def garmin_pings(payload: dict) -> list:
+        """(Garmin user id, activity id) pairs of a push payload."""
+        pings = []
+        for item in payload.get("activities") or []:
+            user, activity = item.get("userId"), item.get("activityId") or item.get("summaryId")
+            if user is not None and activity is not None:
+                pings.append((str(user), str(activity)))
+        return pings
+
+    def enqueue(self, db: Session, provider: str, pings: list, now: Optional[datetime] = None) -> dict:
+        """Queue (provider user id, activity id) pings and commit; returns counts for the response."""
+        now = now or datetime.utcnow()
+        users = dict(db.query(models.GarminAuth.garmin_user_id, models.GarminAuth.user_id).filter(
+            models.GarminAuth.garmin_user_id.in_({user for user, _ in pings}),
+            models.GarminAuth.connected.is_(True)))
+        rows = [
+            {"provider": provider, "user_id": users[user], "activity_id": activity, "received_at": now,
+             "due_at": now + self.coalesce, "attempts": 0, "status": "pending"}
+            for user, activity in dict.fromkeys(pings) if user in users
+        ]
+        accepted = 0
+        if rows:
+            insert = dialect_insert(db)
+            accepted = len(db.execute(insert(models.ActivityNotification).on_conflict_do_nothing(
+                index_elements=["provider", "user_id", "activity_id"]
+            ).returning(models.ActivityNotification.id), rows).all())
+            db.commit()
+        if accepted:
+            self.wake()
+        return {"accepted": accepted, "duplicates": len(rows) - accepted, "ignored": len(pings) - len(rows)}
+
+    def wake(self):
+        self._wake.set()
+
+    # ---- importing ----
+
+    def _claim(self, db: Session, now: datetime) -> tuple:
+        notification = models.ActivityNotification
+        user_ids = [user_id for (user_id,) in db.query(notification.user_id).filter(
+            notification.due_at <= now).group_by(notification.user_id).order_by(
+            func.min(notification.due_at)).limit(self.batch_users)]
+        if not user_ids:
+            return None, {}
+        # All of each user's pending notifications, due or not, so a burst is imported at once
+        token = self.queue.claim(db, now, notification.user_id.in_(user_ids), notification.due_at.isnot(None),
+                                 notification.claim_token.is_(None) | self.queue.due(now))
+        claimed = {}
+        for row in db.query(notification.id, notification.user_id, notification.activity_id,
+                            notification.attempts).filter(notification.claim_token == token):
+            claimed.setdefault(row.user_id, []).append(row)
+        return token, claimed
+
+    def _finish(self, db: Session, ids: list, status: str, now: datetime, error: Optional[str] = None):
+        if ids:
+            self.queue.finish(db, models.ActivityNotification.id.in_(ids), status=status, error=error,
+                              processed_at=now)
+
+    def _exhausted(self, notifications: list) -> list:
+        return [n.id for n in notifications if n.attempts >= self.max_attempts]
+
+    async def _import_user(self, db: Session, user_id: int, notifications: list, now: datetime) -> dict:
+        counts = {"imported": 0, "skipped": 0, "retrying": 0, "failed": 0}
+        access_token = await self.tokens.access_token(db, user_id)
+        if access_token is None:
+            connected = db.query(models.GarminAuth.id).filter(
+                models.GarminAuth.user_id == user_id, models.GarminAuth.connected.is_(True)).first()
+            if connected is None:
+                failed, error = [n.id for n in notifications], "Garmin not connected"
+            else:  # The token refresh failed for now; retried when the lease runs out
+                failed, error = self._exhausted(notifications), "No valid Garmin token"
+            self._finish(db, failed, "failed", now, error)
+            db.commit()
+            counts.update(failed=len(failed), retrying=len(notifications) - len(failed))
+            return counts
+
+        limit = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def fetch(activity_id: str):
+            async with limit:
+                return await self.service.get_activity_details(activity_id, access_token)
+
+        found = await asyncio.gather(*(fetch(n.activity_id) for n in notifications))
+        imported_ids = self.service.imported_activity_ids(
+            notes for (notes,) in db.query(models.TrailHike.notes).filter(
+                models.TrailHike.user_id == user_id, models.TrailHike.fitness_tracker_source == "garmin"))
+        new_hikes, new_details, done, skipped, failed = [], [], [], [], []
+        for notification, details in zip(notifications, found):
+            if details is None:
+                if notification.attempts >= self.max_attempts:
+                    failed.append(notification.id)
+                else:
+                    counts["retrying"] += 1  # Stays claimed; retried when the lease runs out
+                continue
+            hike_data = self.service.parse_activity_to_hike(details, user_id)
+            if hike_data is None or notification.activity_id in imported_ids:
+                skipped.append(notification.id)  # Not a hike, or already imported
+                continue
+            hike = models.TrailHike(**hike_data)
+            db.add(hike)
+            new_hikes.append(hike)
+            new_details.append((notification.activity_id, details))
+            imported_ids.add(notification.activity_id)
+            done.append(notification.id)
+
+        # Built off the event loop before this transaction writes anything; hike_id holds the index
+        # into new_hikes until the flush assigns ids
+        tracks = await TrackService.garmin_rows(
+            [(index, user_id, activity_id, details) for index, (activity_id, details) in enumerate(new_details)])
+        db.flush()  # Assigns hike ids
+        counted = DuplicateHikeService.mark_new(db, new_hikes)
+        ActivityRollupService.record_hikes(counted, db)
+        scope_totals = ScopeStatsService.record_hikes(counted, db)
+        for track in tracks:
+            track["hike_id"] = new_hikes[track["hike_id"]].id
+        TrackService.store(db, tracks)
+        miles = sum(hike.distance_miles or 0 for hike in counted)
+        self._finish(db, done, "imported", now)
+        self._finish(db, skipped, "skipped", now)
+        self._finish(db, failed, "failed", now, "Activity details unavailable")
+        if new_hikes:
+            db.query(models.GarminAuth).filter(models.GarminAuth.user_id == user_id).update(
+                {models.GarminAuth.last_sync: now}, synchronize_session=False)
+        db.commit()
+        user_rankings.add(user_id, "miles", miles)
+        scoped_leaderboards.offer(scope_totals)
+        counts.update(imported=len(done), skipped=len(skipped), failed=len(failed))
+        return counts
+
+    async def process_due(self, db: Session, now: Optional[datetime] = None) -> dict:
+        """Import the notifications of every user with some due at `now`; returns counts."""
+        now = now or datetime.utcnow()
+        totals = {"users": 0, "imported": 0, "skipped": 0, "retrying": 0, "failed": 0}
+        while True:
+            token, claimed = self._claim(db, now)
+            if token is None:
+                return totals
+            for user_id, notifications in claimed.items():
+                try:
+                    counts = await self._import_user(db, user_id, notifications, now)
+                except Exception as e:
+                    db.rollback()
+                    logger.exception("Importing pushed activities for user %d failed; retrying after the lease",
+                                     user_id)
+                    # Give up on the notifications out of attempts, so one bad activity does not hold
+                    # back the user's others forever
+                    failed = self._exhausted(notifications)
+                    self._finish(db, failed, "failed", now, f"Import failed: {e!r}"[:500])
+                    db.commit()
+                    totals["failed"] += len(failed)
+                    totals["retrying"] += len(notifications) - len(failed)
+                    continue
+                totals["users"] += 1
+                for key, value in counts.items():
+                    totals[key] += value
+
+    def next_due(self, db: Session) -> Optional[datetime]:
+        return self.queue.next_due(db)
+
+    async def run(self, session_factory, max_sleep: float = INGEST_POLL_SECONDS):
+        """Import due notifications until cancelled; pushes wake the loop early."""
+        while True:
+            self._wake.clear()
+            delay = max_sleep
+            db = session_factory()
+            try:
+                await self.process_due(db)
+                next_due = self.next_due(db)
+                if next_due is not None:
+                    delay = min(max_sleep, max(0.5, (next_due - datetime.utcnow()).total_seconds()))
+            except Exception:
+                logger.exception("Activity ingest pass failed")
+            finally:
+                db.close()
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+activity_ingest = ActivityIngest()
@@ -0,0 +1,87 @@
+"""Time-windowed leaderboards over the per-user activity rollup.
+
+The all-time leaderboard ranks stored totals. Weekly, monthly, seasonal and
+custom-window boards instead sum each public user's rows of
+`user_activity_days` inside the window (see app/activity.py), so a query
+touches at most one row per user and day, never trail_hikes or visits.
+
+In a window, `parks` counts parks visited for the first time and `points`
+the points awarded. Windows reaching further back than the daily retention
+are resolved to whole months.
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app import models
+from app.activity import ActivityRollupService, epoch_day
+
+WINDOWS = ("all", "week", "month", "season")
+SORTS = ("points", "parks", "miles", "elevation")
+# Meteorological seasons, named as in Trail.best_season
+SEASON_STARTS = ((3, "Spring"), (6, "Summer"), (9, "Fall"), (12, "Winter"))
+
+
+def season_bounds(today: date) -> tuple:
+    """(first day, day after last, name) of the season containing `today`."""
+    month = today.month if today.month >= 3 else today.month + 12  # Jan/Feb belong to last December's winter
+    start_month, name = [(m, n) for m, n in SEASON_STARTS if m <= month][-1]
+    year = today.year if today.month >= 3 else today.year - 1
+    start = date(year, start_month, 1)
+    end_month = start_month + 3
+    end = date(year + (end_month - 1) // 12, (end_month - 1) % 12 + 1, 1)
+    return start, end, name
+
+
+def window_bounds(window: str, today: Optional[date] = None) -> tuple:
+    """(first day, day after last) of the current week (from Monday), month or season."""
+    today = today or datetime.utcnow().date()
+    if window == "week":
+        start = today - timedelta(days=today.weekday())
+        return start, start + timedelta(days=7)
+    if window == "month":
+        start = today.replace(day=1)
+        return start, (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if window == "season":
+        return season_bounds(today)[:2]
+    raise ValueError(f"Unknown window: {window}")
+
+
+def window_leaderboard(db: Session, start: Optional[date], end: Optional[date], sort_by: str = "points",
+                       limit: int = 100) -> list:
+    """Public users ranked by their activity between `start` and `end` (exclusive).
+
+    Either bound may be None for an open window.
+    """
+    ActivityRollupService.compact_if_due(db)
+    day = models.UserActivityDay
+    totals = {
+        "points": func.sum(day.points),
+        "parks": func.sum(day.parks),
+        "miles": func.sum(day.miles),
+        "elevation": func.sum(day.elevation),
+    }
+    query = db.query(
+        models.User.id, models.User.name, models.User.profile_pic_url, *totals.values()
+    ).join(day, day.user_id == models.User.id).filter(models.User.is_public == True)
+    if start is not None:
+        query = query.filter(day.day >= epoch_day(start))
+    if end is not None:
+        query = query.filter(day.day < epoch_day(end))
+    rows = query.group_by(models.User.id).order_by(
+        totals.get(sort_by, totals["points"]).desc(), models.User.id
+    ).limit(limit).all()
+
+    return [
+        {
+            "rank": rank,
+            "user_id": user_id,
+            "user_name": name,
+            "profile_pic_url": picture,
+            "total_points": int(points or 0),
+            "parks_visited": int(parks or 0),
+            "miles_hiked": round(float(miles or 0), 2),
+            "elevation_gain": int(elevation or 0),
+        }
+        for rank, (user_id, name, picture, points, parks, miles, elevation) in enumerate(rows, 1)
+    ]
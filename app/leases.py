@@ -0,0 +1,90 @@
+"""Leased work queues on database tables.
+
+Booking alerts, availability alerts and pushed activity notifications are
+rows with `due_at`, `claim_token` and `attempts` columns, worked on at
+least once by any number of worker processes:
+
+1. `claim` pushes the `due_at` of matching rows out by the lease under a
+   fresh claim token, counts the attempt and commits. Rows another worker
+   claimed in the meantime no longer match, because their `due_at` has
+   moved past `now`.
+2. The worker reads its rows by token and does the work.
+3. `finish` clears `due_at` and the token (and sets whatever else the
+   caller passes) and the caller commits. If the worker fails or dies
+   before that, the lease runs out and the rows are claimed again.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseQueue:
+    """Claims, finishes and dispatches the rows of one leased model."""
+
+    def __init__(self, model, lease_seconds: float, batch_size: int):
+        self.model = model
+        self.lease = timedelta(seconds=lease_seconds)
+        self.batch_size = batch_size
+
+    def due(self, now: datetime):
+        return self.model.due_at <= now
+
+    def claim(self, db: Session, now: datetime, *criteria) -> str:
+        """Lease the rows matching `criteria` and commit; returns the claim token they now carry."""
+        model = self.model
+        token = uuid.uuid4().hex
+        db.query(model).filter(*criteria).update(
+            {model.due_at: now + self.lease, model.claim_token: token, model.attempts: model.attempts + 1},
+            synchronize_session=False)
+        db.commit()
+        return token
+
+    def claim_due(self, db: Session, now: datetime) -> Optional[str]:
+        """Lease the next batch of due rows, oldest first; None once nothing is due.
+
+        The batch may come out empty if other workers claimed its rows first.
+        """
+        model = self.model
+        ids = [row_id for (row_id,) in db.query(model.id).filter(self.due(now)).order_by(
+            model.due_at).limit(self.batch_size)]
+        if not ids:
+            return None
+        # Re-checking due_at skips rows another worker claimed in the meantime
+        return self.claim(db, now, model.id.in_(ids), self.due(now))
+
+    def finish(self, db: Session, *criteria, **values):
+        """Take matching rows off the queue, setting `values` too (callers commit)."""
+        model = self.model
+        changes = {model.due_at: None, model.claim_token: None}
+        changes.update({getattr(model, name): value for name, value in values.items()})
+        db.query(model).filter(*criteria).update(changes, synchronize_session=False)
+
+    def next_due(self, db: Session) -> Optional[datetime]:
+        return db.query(func.min(self.model.due_at)).scalar()
+
+    def dispatch_due(self, db: Session, now: datetime, messages: Callable, notifier, what: str) -> int:
+        """Send every due row in batches and mark it sent; returns the number of messages sent.
+
+        `messages(db, token)` builds the messages of a claimed batch. A failed send leaves the batch
+        leased, to be sent again once the lease runs out.
+        """
+        sent = 0
+        while True:
+            token = self.claim_due(db, now)
+            if token is None:
+                return sent
+            batch = messages(db, token)
+            if batch:
+                try:
+                    notifier.send(batch)
+                except Exception:
+                    logger.exception("Sending %d %s failed; retrying after the lease", len(batch), what)
+                    return sent
+            self.finish(db, self.model.claim_token == token, sent_at=now)
+            db.commit()
+            sent += len(batch)
@@ -1,7 +1,26 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import init_db, SessionLocal
+from fastapi.responses import PlainTextResponse
+from app.database import init_db, SessionLocal, engine
+from app.metrics import MetricsMiddleware, instrument_engine, registry as metrics_registry
+from app.profiling import QueryProfilerMiddleware, profiler
 from app.routes import router
+from app.search import search_index
+from app.wildlife import WildlifeRollupService
+from app.popularity import PopularityService
+from app.activity import ActivityRollupService
+from app.ranking import user_rankings
+from app.scoped_leaderboards import ScopeStatsService
+from app.notifications import booking_alerts
+from app.availability import availability_poller
+from app.featured import featured_campsites
+from app.recreation_service import recreation_gov
+from app.garmin_tokens import garmin_tokens
+from app.track_files import upload_parser
+from app.ingest import activity_ingest
+from config import (AVAILABILITY_POLL_SECONDS, FEATURED_REFRESH_SECONDS, GARMIN_REFRESH_INTERVAL_SECONDS,
+                    INGEST_POLL_SECONDS, NOTIFICATION_POLL_SECONDS)
+import asyncio
 from app import models
 import json
 from pathlib import Path
@@ -21,6 +40,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Slow-query log and N+1 detection
+app.add_middleware(QueryProfilerMiddleware)
+profiler.instrument(engine)
+
+# Per-route latency, status, response size and DB time
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+
 # Initialize database
 init_db()
 
@@ -109,11 +136,80 @@ async def startup_event():
         db.commit()
         print(f"✅ Seeded {len(badges_data)} badges")
     
+    # Databases created before search existed have an empty index
+    if parks_count > 0 and search_index.is_empty(db):
+        counts = search_index.rebuild(db)
+        print(f"✅ Built search index ({sum(counts.values())} documents)")
+    
+    # Databases with sightings logged before the wildlife rollups existed
+    if db.query(models.WildlifeSpeciesMonthly.id).first() is None and db.query(models.Sighting.id).first():
+        counted = WildlifeRollupService.rebuild(db)
+        print(f"✅ Built wildlife rollups from {counted} sightings")
+    
+    # Databases with activity logged before park/trail aggregates existed
+    if db.query(models.ParkStats.park_id).first() is None and (
+            db.query(models.Visit.id).first() or db.query(models.TrailHike.id).first()):
+        built = PopularityService.rebuild(db)
+        print(f"✅ Built aggregates for {built['parks']} parks and {built['trails']} trails")
+    
+    # Databases with activity logged before the daily activity rollup existed
+    if db.query(models.UserActivityDay.id).first() is None and (
+            db.query(models.TrailHike.id).first() or db.query(models.Visit.id).first()):
+        counted = ActivityRollupService.rebuild(db)
+        print(f"✅ Built daily activity rollup from {counted} hikes")
+    folded = ActivityRollupService.compact_if_due(db)
+    if folded:
+        print(f"✅ Compacted {folded} daily activity rows into months")
+    
+    # Databases with activity logged before scoped leaderboards existed
+    if db.query(models.UserScopeStats.id).first() is None and (
+            db.query(models.TrailHike.id).first() or db.query(models.Visit.id).first()):
+        rows = ScopeStatsService.rebuild(db)
+        print(f"✅ Built {rows} scoped leaderboard rows")
+    
+    ranked = user_rankings.rebuild(db)
+    print(f"✅ Built rank index for {ranked} public users")
+    
+    # Databases with wishlists added before booking alerts existed
+    if db.query(models.BookingAlert.id).first() is None and db.query(models.Wishlist.id).first():
+        pending = booking_alerts.rebuild(db)
+        print(f"✅ Scheduled {pending} booking alerts")
+    
     db.close()
+    
+    recreation_gov.open()
+    if NOTIFICATION_POLL_SECONDS > 0:
+        app.state.alert_dispatcher = asyncio.create_task(booking_alerts.run(SessionLocal))
+    if AVAILABILITY_POLL_SECONDS > 0:
+        app.state.availability_poller = asyncio.create_task(availability_poller.run(SessionLocal))
+    if FEATURED_REFRESH_SECONDS > 0:
+        app.state.featured_refresher = asyncio.create_task(featured_campsites.run(SessionLocal))
+    if GARMIN_REFRESH_INTERVAL_SECONDS > 0:
+        app.state.garmin_refresher = asyncio.create_task(garmin_tokens.run(SessionLocal))
+    if INGEST_POLL_SECONDS > 0:
+        app.state.activity_ingest = asyncio.create_task(activity_ingest.run(SessionLocal))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background tasks and close outbound connections."""
+    for name in ("alert_dispatcher", "availability_poller", "featured_refresher", "garmin_refresher",
+                 "activity_ingest"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    await recreation_gov.aclose()
+    upload_parser.close()
 
 # Include API routes
 app.include_router(router)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+metrics_registry.register_routes(app)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="127.0.0.1", port=8001, reload=True)
@@ -0,0 +1,317 @@
+"""Request, database and outbound HTTP metrics in Prometheus text format.
+
+Series are created once per (method, route template) with their histogram
+buckets preallocated, so recording a request is a handful of list-index
+increments with no locks. Requests are served on the event loop thread, so
+in practice updates never race; a sync handler running in the threadpool
+could at worst drop a single increment, which is an acceptable trade for
+monitoring data.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+OUTBOUND_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+BACKGROUND_ROUTE = "(background)"
+UNMATCHED_ROUTE = "(unmatched)"
+
+
+class Histogram:
+    """Cumulative-on-render histogram over fixed, preallocated buckets."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class RouteSeries:
+    """Everything recorded for one (method, route) pair."""
+
+    __slots__ = ("latency", "size", "statuses", "db_statements", "db_seconds")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.statuses = {}
+        self.db_statements = 0
+        self.db_seconds = 0.0
+
+
+class OutboundSeries:
+    """Timing and outcomes for one (provider, operation) pair."""
+
+    __slots__ = ("latency", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram(OUTBOUND_BUCKETS)
+        self.statuses = {}
+
+
+class RequestSample:
+    """Per-request accumulator the database hooks write into."""
+
+    __slots__ = ("db_statements", "db_seconds")
+
+    def __init__(self):
+        self.db_statements = 0
+        self.db_seconds = 0.0
+
+
+_current_request: ContextVar[Optional[RequestSample]] = ContextVar("npt_metrics_request", default=None)
+
+
+class OutboundCall:
+    """Handle yielded by `observe_outbound`; set `status` once known."""
+
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = "error"
+
+
+class MetricsRegistry:
+    """Holds all series and renders them in Prometheus exposition format."""
+
+    def __init__(self):
+        self.routes = {}
+        self.outbound = {}
+        self.guards = {}  # provider -> OutboundGuard (app/resilience.py)
+        self.in_flight = 0
+
+    def register_routes(self, app):
+        """Preallocate series for every route the app declares."""
+        for route in app.routes:
+            for method in getattr(route, "methods", None) or ():
+                self.routes.setdefault((method, route.path), RouteSeries())
+
+    def route_series(self, method: str, route: str) -> RouteSeries:
+        series = self.routes.get((method, route))
+        if series is None:
+            series = self.routes.setdefault((method, route), RouteSeries())
+        return series
+
+    def outbound_series(self, provider: str, operation: str) -> OutboundSeries:
+        series = self.outbound.get((provider, operation))
+        if series is None:
+            series = self.outbound.setdefault((provider, operation), OutboundSeries())
+        return series
+
+    def record_request(self, method: str, route: str, status: int, seconds: float,
+                       size: int, sample: RequestSample):
+        series = self.route_series(method, route)
+        series.latency.observe(seconds)
+        series.size.observe(size)
+        series.statuses[status] = series.statuses.get(status, 0) + 1
+        series.db_statements += sample.db_statements
+        series.db_seconds += sample.db_seconds
+
+    def record_statement(self, seconds: float):
+        sample = _current_request.get()
+        if sample is not None:
+            sample.db_statements += 1
+            sample.db_seconds += seconds
+        else:
+            series = self.route_series("", BACKGROUND_ROUTE)
+            series.db_statements += 1
+            series.db_seconds += seconds
+
+    def render(self) -> str:
+        lines = []
+        routes = sorted(self.routes.items())
+        outbound = sorted(self.outbound.items())
+
+        lines += ["# HELP npt_http_requests_in_flight Requests currently being served.",
+                  "# TYPE npt_http_requests_in_flight gauge",
+                  f"npt_http_requests_in_flight {self.in_flight}"]
+
+        lines += ["# HELP npt_http_requests_total Requests served by route and status.",
+                  "# TYPE npt_http_requests_total counter"]
+        for (method, route), series in routes:
+            for status, count in sorted(series.statuses.items()):
+                lines.append(f"npt_http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+        lines += ["# HELP npt_http_request_duration_seconds Request latency by route.",
+                  "# TYPE npt_http_request_duration_seconds histogram"]
+        for (method, route), series in routes:
+            if series.statuses:
+                lines += _histogram_lines("npt_http_request_duration_seconds", series.latency,
+                                          method=method, route=route)
+
+        lines += ["# HELP npt_http_response_size_bytes Response body size by route.",
+                  "# TYPE npt_http_response_size_bytes histogram"]
+        for (method, route), series in routes:
+            if series.statuses:
+                lines += _histogram_lines("npt_http_response_size_bytes", series.size,
+                                          method=method, route=route)
+
+        lines += ["# HELP npt_db_statements_total SQL statements executed, attributed to the route.",
+                  "# TYPE npt_db_statements_total counter"]
+        for (method, route), series in routes:
+            if series.db_statements:
+                lines.append(f"npt_db_statements_total{_labels(method=method, route=route)} {series.db_statements}")
+
+        lines += ["# HELP npt_db_duration_seconds_total Time spent in SQL statements, attributed to the route.",
+                  "# TYPE npt_db_duration_seconds_total counter"]
+        for (method, route), series in routes:
+            if series.db_statements:
+                lines.append(f"npt_db_duration_seconds_total{_labels(method=method, route=route)} "
+                             f"{series.db_seconds:.6f}")
+
+        lines += ["# HELP npt_outbound_requests_total Calls to external providers by outcome.",
+                  "# TYPE npt_outbound_requests_total counter"]
+        for (provider, operation), series in outbound:
+            for status, count in sorted(series.statuses.items(), key=lambda kv: str(kv[0])):
+                lines.append(f"npt_outbound_requests_total"
+                             f"{_labels(provider=provider, operation=operation, status=status)} {count}")
+
+        lines += ["# HELP npt_outbound_request_duration_seconds Latency of calls to external providers.",
+                  "# TYPE npt_outbound_request_duration_seconds histogram"]
+        for (provider, operation), series in outbound:
+            lines += _histogram_lines("npt_outbound_request_duration_seconds", series.latency,
+                                      provider=provider, operation=operation)
+
+        guards = sorted(self.guards.items())
+        lines += ["# HELP npt_outbound_circuit_state Provider circuit breaker state (0 closed, 1 half-open, 2 open).",
+                  "# TYPE npt_outbound_circuit_state gauge"]
+        for provider, guard in guards:
+            state = CIRCUIT_STATES.get(guard.breaker.state, 0)
+            lines.append(f"npt_outbound_circuit_state{_labels(provider=provider)} {state}")
+
+        lines += ["# HELP npt_outbound_circuit_opened_total Times a provider's circuit opened.",
+                  "# TYPE npt_outbound_circuit_opened_total counter"]
+        for provider, guard in guards:
+            lines.append(f"npt_outbound_circuit_opened_total{_labels(provider=provider)} {guard.breaker.times_opened}")
+
+        lines += ["# HELP npt_outbound_rejected_total Calls refused without reaching the provider.",
+                  "# TYPE npt_outbound_rejected_total counter"]
+        for provider, guard in guards:
+            for reason, count in sorted(guard.rejected.items()):
+                lines.append(f"npt_outbound_rejected_total{_labels(provider=provider, reason=reason)} {count}")
+
+        lines += ["# HELP npt_outbound_throttled_seconds_total Time calls waited for rate-limit tokens.",
+                  "# TYPE npt_outbound_throttled_seconds_total counter"]
+        for provider, guard in guards:
+            lines.append(f"npt_outbound_throttled_seconds_total{_labels(provider=provider)} "
+                         f"{guard.throttled_seconds:.6f}")
+
+        lines += ["# HELP npt_outbound_rate_limit_tokens Tokens available in each rate-limit bucket.",
+                  "# TYPE npt_outbound_rate_limit_tokens gauge"]
+        buckets = {bucket.key: bucket for _, guard in guards for bucket in guard.buckets if bucket.rate > 0}
+        for key, bucket in sorted(buckets.items()):
+            lines.append(f"npt_outbound_rate_limit_tokens{_labels(bucket=key)} {bucket.available():.2f}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, histogram: Histogram, **labels) -> list:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=repr(float(bound)))} {cumulative}")
+    cumulative += histogram.counts[-1]
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {cumulative}")
+    return lines
+
+
+# Default registry
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, size, status and DB time per route."""
+
+    def __init__(self, app, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        sample = RequestSample()
+        token = _current_request.set(sample)
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            registry.in_flight -= 1
+            _current_request.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            registry.record_request(scope["method"], path, status, elapsed, size, sample)
+
+
+def instrument_engine(engine, registry: MetricsRegistry = registry):
+    """Attribute statement counts and DB time on `engine` to the current route."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("npt_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("npt_query_start")
+        if starts:
+            registry.record_statement(time.perf_counter() - starts.pop())
+
+
+@contextmanager
+def observe_outbound(provider: str, operation: str, registry: MetricsRegistry = registry):
+    """Time a call to an external provider.
+
+    Set `call.status` to the response status; calls that raise are recorded
+    with status "error".
+    """
+    call = OutboundCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        series = registry.outbound_series(provider, operation)
+        series.latency.observe(time.perf_counter() - start)
+        series.statuses[call.status] = series.statuses.get(call.status, 0) + 1
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, Numeric
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, Numeric, UniqueConstraint, Index, LargeBinary, Date
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -73,6 +73,27 @@ class TrailHike(Base):
     notes = Column(Text, nullable=True)  # User notes about the hike
     difficulty_experienced = Column(String)  # How hard they found it
     fitness_tracker_source = Column(String, nullable=True)  # garmin/strava/apple_health/manual
+    duplicate_of = Column(Integer, ForeignKey("trail_hikes.id"), nullable=True, index=True)  # Not counted if set
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class HikeTrack(Base):
+    """GPS track of a hike, stored compactly (see app/tracks.py), with stats computed from it."""
+    __tablename__ = "hike_tracks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    hike_id = Column(Integer, ForeignKey("trail_hikes.id"), unique=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    source = Column(String)  # garmin, or the fitness_tracker_source of an uploaded file
+    activity_id = Column(String, nullable=True)  # Provider's activity id; "sha1:<hex>" of an uploaded file
+    started_at = Column(DateTime, nullable=True)
+    points = Column(Integer)
+    has_elevation = Column(Boolean, default=True)
+    data = Column(LargeBinary)  # Compressed int32 deltas of lat/lon (1e-7 deg), elevation (dm), seconds
+    lod = Column(LargeBinary, nullable=True)  # Compressed level of detail of each point (uint8)
+    distance_miles = Column(Float)
+    elevation_gain_ft = Column(Integer, nullable=True)  # Smoothed
+    moving_minutes = Column(Float)
+    elapsed_minutes = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Campsite(Base):
@@ -101,6 +122,67 @@ class Wishlist(Base):
     # Relationships
     campsite = relationship("Campsite")
 
+class BookingAlert(Base):
+    """Pending or sent booking-window alert for one wishlist item (see app/notifications.py)."""
+    __tablename__ = "booking_alerts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    wishlist_id = Column(Integer, ForeignKey("wishlist.id"), unique=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    campsite_id = Column(Integer, ForeignKey("campsites.id"), index=True)
+    booking_opens = Column(DateTime)  # The opening this alert is for
+    notify_at = Column(DateTime)  # booking_opens - notification_hours_before
+    due_at = Column(DateTime, nullable=True, index=True)  # Next dispatch attempt; NULL once sent or moot
+    claim_token = Column(String, nullable=True)  # Set while a dispatcher holds the alert
+    attempts = Column(Integer, default=0)
+    sent_at = Column(DateTime, nullable=True)
+
+class WatchedCampground(Base):
+    """Recreation.gov campground polled for availability on behalf of a wishlisted campsite."""
+    __tablename__ = "watched_campgrounds"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    campsite_id = Column(Integer, ForeignKey("campsites.id"), unique=True)
+    facility_id = Column(Integer, nullable=True, index=True)  # NULL when no campground matched the name
+    resolved_at = Column(DateTime, default=datetime.utcnow)
+
+class AvailabilitySnapshot(Base):
+    """Latest availability of one campground month, as a sites x days status array."""
+    __tablename__ = "availability_snapshots"
+    __table_args__ = (UniqueConstraint("facility_id", "month", name="uq_availability_snapshot"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    facility_id = Column(Integer)
+    month = Column(String)  # YYYY-MM
+    sites = Column(Text)  # JSON [[site_id, site_name], ...] in row order
+    statuses = Column(LargeBinary)  # uint8 status codes, row-major (see app/availability.py)
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+
+class AvailabilityChange(Base):
+    """A site-night whose status differed from the previous snapshot."""
+    __tablename__ = "availability_changes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    facility_id = Column(Integer, index=True)
+    site_id = Column(String)
+    night = Column(Date)
+    old_status = Column(Integer, nullable=True)  # NULL for a site new to the campground
+    new_status = Column(Integer)
+    detected_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class AvailabilityAlert(Base):
+    """Newly-available sites to send for one wishlist item, queued with the snapshot (see app/availability.py)."""
+    __tablename__ = "availability_alerts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    wishlist_id = Column(Integer, ForeignKey("wishlist.id"), index=True)
+    payload = Column(Text)  # JSON message, without alert_id and attempt
+    created_at = Column(DateTime, default=datetime.utcnow)
+    due_at = Column(DateTime, nullable=True, index=True)  # Next send attempt; NULL once sent
+    claim_token = Column(String, nullable=True)  # Set while a poller holds the alert
+    attempts = Column(Integer, default=0)
+    sent_at = Column(DateTime, nullable=True)
+
 class CampingTrip(Base):
     __tablename__ = "camping_trips"
     
@@ -128,6 +210,104 @@ class Sighting(Base):
     photo_url = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class ParkStats(Base):
+    """Incrementally maintained popularity and rating aggregates for a park."""
+    __tablename__ = "park_stats"
+    
+    park_id = Column(Integer, ForeignKey("parks.id"), primary_key=True)
+    visit_count = Column(Integer, default=0)
+    camping_trip_count = Column(Integer, default=0)
+    hike_count = Column(Integer, default=0)  # Hikes logged on the park's trails
+    rating_count = Column(Integer, default=0)  # Visit and camping trip ratings
+    rating_sum = Column(Integer, default=0)
+    rating_histogram = Column(Text, default="[0,0,0,0,0]")  # JSON counts of 1..5 stars
+    visits_by_month = Column(Text, default="[0,0,0,0,0,0,0,0,0,0,0,0]")  # JSON, Jan..Dec
+    duration_sketch = Column(Text, nullable=True)  # JSON QuantileSketch of hike minutes
+    median_duration_minutes = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class TrailStats(Base):
+    """Incrementally maintained hike aggregates for a trail."""
+    __tablename__ = "trail_stats"
+    
+    trail_id = Column(Integer, ForeignKey("trails.id"), primary_key=True)
+    park_id = Column(Integer, ForeignKey("parks.id"), index=True)
+    hike_count = Column(Integer, default=0)
+    hikes_by_month = Column(Text, default="[0,0,0,0,0,0,0,0,0,0,0,0]")  # JSON, Jan..Dec
+    duration_sketch = Column(Text, nullable=True)  # JSON QuantileSketch of hike minutes
+    median_duration_minutes = Column(Float, nullable=True)
+    p90_duration_minutes = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class WildlifeSpeciesMonthly(Base):
+    """Sighting counts per park, normalized species and month (maintained on log_sighting)."""
+    __tablename__ = "wildlife_species_monthly"
+    __table_args__ = (UniqueConstraint("park_id", "month", "species", name="uq_wildlife_species_monthly"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    park_id = Column(Integer, ForeignKey("parks.id"), index=True)
+    month = Column(String(7))  # "YYYY-MM"
+    species = Column(String)  # Canonical name, see app/wildlife.py
+    count = Column(Integer, default=0)
+
+class WildlifeLocationMonthly(Base):
+    """Sighting counts per park, normalized location and month, for hotspots."""
+    __tablename__ = "wildlife_location_monthly"
+    __table_args__ = (UniqueConstraint("park_id", "month", "location", name="uq_wildlife_location_monthly"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    park_id = Column(Integer, ForeignKey("parks.id"), index=True)
+    month = Column(String(7))  # "YYYY-MM"
+    location = Column(String)
+    count = Column(Integer, default=0)
+
+class UserActivityDay(Base):
+    """Per-user activity totals per UTC day (see app/timeseries.py).
+
+    Days older than ACTIVITY_DAILY_RETENTION_DAYS are compacted into one row
+    per month, keyed by the month's first day.
+    """
+    __tablename__ = "user_activity_days"
+    __table_args__ = (UniqueConstraint("user_id", "day", name="uq_user_activity_day"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    day = Column(Integer, index=True)  # Days since 1970-01-01 (first day covered)
+    span_days = Column(Integer, default=1)  # 1 for a day, 28-31 once compacted into a month
+    hikes = Column(Integer, default=0)
+    miles = Column(Float, default=0)
+    elevation = Column(Integer, default=0)  # Feet gained
+    minutes = Column(Integer, default=0)
+    points = Column(Integer, default=0)  # Points awarded
+    parks = Column(Integer, default=0)  # Parks visited for the first time
+
+class UserScopeStats(Base):
+    """A user's totals within a leaderboard scope: "all", "park:<id>", "region:<name>" or "state:<code>"."""
+    __tablename__ = "user_scope_stats"
+    __table_args__ = (
+        UniqueConstraint("scope", "user_id", name="uq_user_scope_stats"),
+        Index("ix_user_scope_stats_miles", "scope", "miles"),
+        Index("ix_user_scope_stats_hikes", "scope", "hikes"),
+        Index("ix_user_scope_stats_parks", "scope", "parks"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    miles = Column(Float, default=0)
+    hikes = Column(Integer, default=0)
+    parks = Column(Integer, default=0)  # Distinct parks visited in the scope
+
+class Friendship(Base):
+    """One direction of a mutual friendship; both directions are stored."""
+    __tablename__ = "friendships"
+    __table_args__ = (UniqueConstraint("user_id", "friend_id", name="uq_friendship"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    friend_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class ParkPassport(Base):
     __tablename__ = "park_passports"
     
@@ -234,5 +414,31 @@ class GarminAuth(Base):
     garmin_user_id = Column(String, nullable=True)
     connected = Column(Boolean, default=True)
     last_sync = Column(DateTime, nullable=True)
+    refresh_claimed_at = Column(DateTime, nullable=True)  # Set while a worker refreshes, kept after a failure
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ActivityNotification(Base):
+    """A provider's push that a user's activity is ready, queued for import (see app/ingest.py)."""
+    __tablename__ = "activity_notifications"
+    __table_args__ = (UniqueConstraint("provider", "user_id", "activity_id", name="uq_activity_notification"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String)  # garmin
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    activity_id = Column(String)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    due_at = Column(DateTime, nullable=True, index=True)  # Next import attempt; NULL once handled
+    claim_token = Column(String, nullable=True)  # Set while a worker holds the notification
+    attempts = Column(Integer, default=0)
+    status = Column(String, default="pending")  # pending/imported/skipped/failed
+    error = Column(Text, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+
+class RateLimitBucket(Base):
+    """Outbound rate-limit token balance shared by all workers (RATE_LIMIT_BACKEND=database)."""
+    __tablename__ = "rate_limit_buckets"
+    
+    key = Column(String, primary_key=True)  # Provider name
+    tokens = Column(Float, nullable=False)  # Negative while callers wait on reserved tokens
+    updated_at = Column(Float, nullable=False)  # Unix time of the last refill
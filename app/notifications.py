@@ -0,0 +1,171 @@
+"""Booking-window alerts for wishlisted campsites.
+
+Each wishlist item has a `booking_alerts` row whose `notify_at` is the
+campsite's `booking_opens` minus the item's `notification_hours_before`.
+The row is (re)computed whenever the item is added or changed, or the
+campsite's `booking_opens` moves, so the dispatcher never scans the
+wishlist: it reads alerts with `due_at <= now` from an index, oldest first.
+
+Dispatch is at-least-once (app/leases.py). A batch is claimed by pushing
+its `due_at` out by NOTIFICATION_LEASE_SECONDS under a fresh claim token
+and committing, then handed to the notifier, then marked sent. If the
+notifier fails or the process dies in between, the lease runs out and the
+batch is sent again, so messages carry an `alert_id` and `booking_opens`
+that receivers can de-duplicate on. A reschedule while a batch is in flight clears the
+claim, and the alert is sent again for its new time.
+
+The background loop started by app/main.py sleeps until the next
+`due_at`, but never longer than NOTIFICATION_POLL_SECONDS, which also
+bounds how late an alert scheduled by another worker can be picked up.
+"""
+import asyncio
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from app import models
+from app.leases import LeaseQueue
+from config import (NOTIFICATION_BATCH_SIZE, NOTIFICATION_LEASE_SECONDS, NOTIFICATION_LOG_PATH,
+                    NOTIFICATION_POLL_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+
+class LogNotifier:
+    """Writes each alert to the application log."""
+
+    def send(self, messages: list):
+        for message in messages:
+            logger.info("Booking alert: %s", json.dumps(message))
+
+
+class FileNotifier:
+    """Appends each alert to a file as one JSON line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, messages: list):
+        lines = "".join(json.dumps(message) + "\n" for message in messages)
+        with self._lock, open(self.path, "a", encoding="utf-8") as sink:
+            sink.write(lines)
+
+
+def _plan(alert: models.BookingAlert, booking_opens: Optional[datetime], hours: Optional[int], now: datetime):
+    """Point an alert at the item's current opening; keeps it sent if that opening was already notified."""
+    already_sent = alert.sent_at is not None and alert.booking_opens == booking_opens
+    if not already_sent:
+        alert.sent_at = None
+    alert.booking_opens = booking_opens
+    alert.notify_at = booking_opens - timedelta(hours=hours or 0) if booking_opens else None
+    alert.claim_token = None
+    if already_sent or booking_opens is None or booking_opens <= now:
+        alert.due_at = None
+    else:
+        alert.due_at = alert.notify_at  # An already-passed notify_at fires on the next dispatch
+
+
+class BookingAlertScheduler:
+    """Schedules booking alerts and dispatches due ones in batches."""
+
+    def __init__(self, notifier=None, batch_size: int = NOTIFICATION_BATCH_SIZE,
+                 lease_seconds: float = NOTIFICATION_LEASE_SECONDS):
+        self.notifier = notifier or (FileNotifier(NOTIFICATION_LOG_PATH) if NOTIFICATION_LOG_PATH else LogNotifier())
+        self.queue = LeaseQueue(models.BookingAlert, lease_seconds, batch_size)
+
+    # ---- scheduling (callers commit) ----
+
+    def schedule(self, db: Session, items: list, now: Optional[datetime] = None):
+        """Create or recompute the alerts of wishlist items, after flushing pending changes."""
+        if not items:
+            return
+        db.flush()  # Sessions do not autoflush; new items need ids and the campsite query current rows
+        now = now or datetime.utcnow()
+        opens = dict(db.query(models.Campsite.id, models.Campsite.booking_opens).filter(
+            models.Campsite.id.in_({item.campsite_id for item in items})))
+        alerts = {alert.wishlist_id: alert for alert in db.query(models.BookingAlert).filter(
+            models.BookingAlert.wishlist_id.in_([item.id for item in items]))}
+        for item in items:
+            alert = alerts.get(item.id)
+            if alert is None:
+                alert = models.BookingAlert(wishlist_id=item.id, attempts=0)
+                db.add(alert)
+            alert.user_id, alert.campsite_id = item.user_id, item.campsite_id
+            _plan(alert, opens.get(item.campsite_id), item.notification_hours_before, now)
+
+    def schedule_campsite(self, db: Session, campsite_id: int, now: Optional[datetime] = None):
+        """Recompute every alert for a campsite after its booking_opens changed."""
+        self.schedule(db, db.query(models.Wishlist).filter(models.Wishlist.campsite_id == campsite_id).all(), now)
+
+    def cancel(self, db: Session, wishlist_id: int):
+        db.query(models.BookingAlert).filter(models.BookingAlert.wishlist_id == wishlist_id).delete(
+            synchronize_session=False)
+
+    def rebuild(self, db: Session) -> int:
+        """Schedule every wishlist item; returns the number of alerts pending."""
+        self.schedule(db, db.query(models.Wishlist).all())
+        db.commit()
+        return db.query(models.BookingAlert).filter(models.BookingAlert.due_at.isnot(None)).count()
+
+    # ---- dispatch ----
+
+    def _messages(self, db: Session, token: str) -> list:
+        alert = models.BookingAlert
+        rows = db.query(
+            alert.id, alert.user_id, models.User.email, models.Campsite.id, models.Campsite.name,
+            models.Park.name, alert.booking_opens, alert.notify_at, alert.attempts,
+        ).join(models.User, models.User.id == alert.user_id).join(
+            models.Campsite, models.Campsite.id == alert.campsite_id
+        ).outerjoin(models.Park, models.Park.id == models.Campsite.park_id).filter(
+            alert.claim_token == token).all()
+        return [
+            {
+                "kind": "booking_window",
+                "alert_id": alert_id,
+                "user_id": user_id,
+                "email": email,
+                "campsite_id": campsite_id,
+                "campsite_name": campsite_name,
+                "park_name": park_name,
+                "booking_opens": booking_opens.isoformat(),
+                "notify_at": notify_at.isoformat(),
+                "attempt": attempts,
+            }
+            for alert_id, user_id, email, campsite_id, campsite_name, park_name, booking_opens, notify_at, attempts
+            in rows
+        ]
+
+    def dispatch_due(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Send every alert due at `now` in batches; returns the number sent."""
+        return self.queue.dispatch_due(db, now or datetime.utcnow(), self._messages, self.notifier,
+                                       "booking alerts")
+
+    def next_due(self, db: Session) -> Optional[datetime]:
+        return self.queue.next_due(db)
+
+    def _tick(self, session_factory, max_sleep: float) -> float:
+        db = session_factory()
+        try:
+            self.dispatch_due(db)
+            next_due = self.next_due(db)
+        finally:
+            db.close()
+        if next_due is None:
+            return max_sleep
+        return min(max_sleep, max(1.0, (next_due - datetime.utcnow()).total_seconds()))
+
+    async def run(self, session_factory, max_sleep: float = NOTIFICATION_POLL_SECONDS):
+        """Dispatch due alerts until cancelled, sleeping until the next one is due."""
+        while True:
+            delay = max_sleep
+            try:
+                delay = await asyncio.to_thread(self._tick, session_factory, max_sleep)
+            except Exception:
+                logger.exception("Booking alert dispatch failed")
+            await asyncio.sleep(delay)
+
+
+booking_alerts = BookingAlertScheduler()
@@ -0,0 +1,237 @@
+"""Per-park and per-trail popularity, rating and duration aggregates.
+
+`park_stats` and `trail_stats` rows are updated in the same transaction as
+the visit, camping trip or hike that changes them, so park and trail pages
+read them with a single outer join instead of scanning the activity tables.
+Median hike durations come from a QuantileSketch stored on the row; the
+sketch is decoded only on writes, and the current median is kept in its own
+column for readers.
+"""
+import json
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import DateTime, literal, select, update
+from sqlalchemy.orm import Session
+from app import models
+from app.database import dialect_insert
+from app.sketch import QuantileSketch
+
+MONTHS = 12
+STARS = 5
+PARK_COUNTERS = ("visit_count", "camping_trip_count", "hike_count", "rating_count", "rating_sum")
+
+
+def _bump(counts_json: Optional[str], index: int, size: int) -> str:
+    counts = json.loads(counts_json) if counts_json else [0] * size
+    counts[index] += 1
+    return json.dumps(counts, separators=(",", ":"))
+
+
+def _valid_rating(rating) -> bool:
+    return isinstance(rating, int) and 1 <= rating <= STARS
+
+
+class PopularityService:
+    """Maintains and formats park/trail aggregates. Callers commit."""
+
+    @staticmethod
+    def _park_stats(db: Session, park_id: int, columns: tuple, **increments):
+        """Add `increments` to the park's counters, creating the row if needed; returns `columns` after.
+
+        The upsert creates a missing row and adds to the counters in SQL, so concurrent writers neither
+        collide on the insert nor lose counts; it also keeps the row locked (on PostgreSQL; SQLite
+        writers hold the database lock) for the caller's read-modify-write of the JSON columns.
+        """
+        table = models.ParkStats.__table__
+        stmt = dialect_insert(db)(table).values(dict(
+            {name: 0 for name in PARK_COUNTERS}, park_id=park_id, updated_at=datetime.utcnow(), **increments))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["park_id"],
+            set_=dict({name: table.c[name] + stmt.excluded[name] for name in increments},
+                      updated_at=stmt.excluded.updated_at),
+        ).returning(*(table.c[name] for name in columns))
+        return db.execute(stmt).one()
+
+    @staticmethod
+    def _update_park(db: Session, park_id: int, values: dict):
+        db.execute(update(models.ParkStats).where(models.ParkStats.park_id == park_id).values(**values))
+
+    @staticmethod
+    def _rating(rating) -> dict:
+        return {"rating_count": 1, "rating_sum": rating} if _valid_rating(rating) else {}
+
+    @staticmethod
+    def record_visit(visit: models.Visit, db: Session):
+        if not visit.visited:
+            return  # Wishlist entry, not a visit
+        rating = PopularityService._rating(visit.rating)
+        stats = PopularityService._park_stats(db, visit.park_id, ("visits_by_month", "rating_histogram"),
+                                              visit_count=1, **rating)
+        values = {"visits_by_month": _bump(stats.visits_by_month,
+                                           (visit.visit_date or datetime.utcnow()).month - 1, MONTHS)}
+        if rating:
+            values["rating_histogram"] = _bump(stats.rating_histogram, visit.rating - 1, STARS)
+        PopularityService._update_park(db, visit.park_id, values)
+
+    @staticmethod
+    def record_camping_trip(trip: models.CampingTrip, db: Session):
+        park_id = db.query(models.Campsite.park_id).filter(models.Campsite.id == trip.campsite_id).scalar()
+        if park_id is None:
+            return
+        rating = PopularityService._rating(trip.rating)
+        stats = PopularityService._park_stats(db, park_id, ("rating_histogram",), camping_trip_count=1, **rating)
+        if rating:
+            PopularityService._update_park(db, park_id, {
+                "rating_histogram": _bump(stats.rating_histogram, trip.rating - 1, STARS)})
+
+    @staticmethod
+    def record_hike(hike: models.TrailHike, db: Session):
+        if hike.trail_id is None:
+            return  # Imported activities without a known trail
+        # Same upsert as _park_stats; the park comes from the trail, and an unknown trail inserts nothing
+        table = models.TrailStats.__table__
+        stmt = dialect_insert(db)(table).from_select(
+            ["trail_id", "park_id", "hike_count", "updated_at"],
+            select(models.Trail.id, models.Trail.park_id, literal(1), literal(datetime.utcnow(), DateTime))
+            .where(models.Trail.id == hike.trail_id),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["trail_id"],
+            set_={"hike_count": table.c.hike_count + 1, "updated_at": stmt.excluded.updated_at},
+        ).returning(table.c.park_id, table.c.hikes_by_month, table.c.duration_sketch)
+        trail_stats = db.execute(stmt).one_or_none()
+        if trail_stats is None:
+            return
+        park_stats = PopularityService._park_stats(db, trail_stats.park_id, ("duration_sketch",), hike_count=1)
+
+        month = (hike.hike_date or datetime.utcnow()).month - 1
+        trail_values = {"hikes_by_month": _bump(trail_stats.hikes_by_month, month, MONTHS)}
+        park_values = {}
+        if hike.duration_minutes is not None and hike.duration_minutes >= 0:
+            sketch = QuantileSketch.from_json(trail_stats.duration_sketch)
+            sketch.add(hike.duration_minutes)
+            trail_values.update(duration_sketch=sketch.to_json(), median_duration_minutes=sketch.quantile(0.5),
+                                p90_duration_minutes=sketch.quantile(0.9))
+
+            sketch = QuantileSketch.from_json(park_stats.duration_sketch)
+            sketch.add(hike.duration_minutes)
+            park_values.update(duration_sketch=sketch.to_json(), median_duration_minutes=sketch.quantile(0.5))
+        db.execute(update(models.TrailStats).where(models.TrailStats.trail_id == hike.trail_id).values(
+            **trail_values))
+        if park_values:
+            PopularityService._update_park(db, trail_stats.park_id, park_values)
+
+    # ---- read-side formatting ----
+
+    @staticmethod
+    def park_stats_out(stats: Optional[models.ParkStats]) -> dict:
+        if stats is None:
+            return {
+                "visit_count": 0, "camping_trip_count": 0, "hike_count": 0, "rating_count": 0,
+                "average_rating": None, "rating_histogram": {str(s): 0 for s in range(1, STARS + 1)},
+                "visits_by_month": [0] * MONTHS, "median_hike_minutes": None,
+            }
+        histogram = json.loads(stats.rating_histogram or "[0,0,0,0,0]")
+        return {
+            "visit_count": stats.visit_count or 0,
+            "camping_trip_count": stats.camping_trip_count or 0,
+            "hike_count": stats.hike_count or 0,
+            "rating_count": stats.rating_count or 0,
+            "average_rating": round(stats.rating_sum / stats.rating_count, 2) if stats.rating_count else None,
+            "rating_histogram": {str(star): n for star, n in enumerate(histogram, 1)},
+            "visits_by_month": json.loads(stats.visits_by_month) if stats.visits_by_month else [0] * MONTHS,
+            "median_hike_minutes": stats.median_duration_minutes,
+        }
+
+    @staticmethod
+    def trail_stats_out(hike_count, hikes_by_month, median, p90) -> dict:
+        return {
+            "hike_count": hike_count or 0,
+            "hikes_by_month": json.loads(hikes_by_month) if hikes_by_month else [0] * MONTHS,
+            "median_duration_minutes": median,
+            "p90_duration_minutes": p90,
+        }
+
+    # ---- backfill ----
+
+    @staticmethod
+    def rebuild(db: Session) -> dict:
+        """Recompute every park and trail aggregate from the activity tables."""
+        parks, trails = {}, {}
+
+        def park(park_id):
+            if park_id not in parks:
+                parks[park_id] = {"visits": 0, "camping": 0, "hikes": 0, "ratings": [0] * STARS,
+                                  "months": [0] * MONTHS, "sketch": QuantileSketch()}
+            return parks[park_id]
+
+        for park_id, visited, rating, visit_date in db.query(
+            models.Visit.park_id, models.Visit.visited, models.Visit.rating, models.Visit.visit_date
+        ).yield_per(5000):
+            if not visited or park_id is None:
+                continue
+            p = park(park_id)
+            p["visits"] += 1
+            p["months"][(visit_date or datetime.utcnow()).month - 1] += 1
+            if _valid_rating(rating):
+                p["ratings"][rating - 1] += 1
+
+        for park_id, rating in db.query(models.Campsite.park_id, models.CampingTrip.rating).join(
+            models.Campsite, models.Campsite.id == models.CampingTrip.campsite_id
+        ).yield_per(5000):
+            p = park(park_id)
+            p["camping"] += 1
+            if _valid_rating(rating):
+                p["ratings"][rating - 1] += 1
+
+        for trail_id, park_id, hike_date, duration in db.query(
+            models.TrailHike.trail_id, models.Trail.park_id, models.TrailHike.hike_date,
+            models.TrailHike.duration_minutes
+        ).join(models.Trail, models.Trail.id == models.TrailHike.trail_id).filter(
+            models.TrailHike.duplicate_of.is_(None)).yield_per(5000):
+            t = trails.setdefault(trail_id, {"park_id": park_id, "hikes": 0, "months": [0] * MONTHS,
+                                             "sketch": QuantileSketch()})
+            p = park(park_id)
+            t["hikes"] += 1
+            p["hikes"] += 1
+            t["months"][(hike_date or datetime.utcnow()).month - 1] += 1
+            if duration is not None:
+                t["sketch"].add(duration)
+                p["sketch"].add(duration)
+
+        db.query(models.ParkStats).delete()
+        db.query(models.TrailStats).delete()
+        now = datetime.utcnow()
+        if parks:
+            db.execute(models.ParkStats.__table__.insert(), [
+                {
+                    "park_id": park_id,
+                    "visit_count": p["visits"],
+                    "camping_trip_count": p["camping"],
+                    "hike_count": p["hikes"],
+                    "rating_count": sum(p["ratings"]),
+                    "rating_sum": sum(star * n for star, n in enumerate(p["ratings"], 1)),
+                    "rating_histogram": json.dumps(p["ratings"], separators=(",", ":")),
+                    "visits_by_month": json.dumps(p["months"], separators=(",", ":")),
+                    "duration_sketch": p["sketch"].to_json() if p["sketch"].count else None,
+                    "median_duration_minutes": p["sketch"].quantile(0.5),
+                    "updated_at": now,
+                }
+                for park_id, p in parks.items()
+            ])
+        if trails:
+            db.execute(models.TrailStats.__table__.insert(), [
+                {
+                    "trail_id": trail_id,
+                    "park_id": t["park_id"],
+                    "hike_count": t["hikes"],
+                    "hikes_by_month": json.dumps(t["months"], separators=(",", ":")),
+                    "duration_sketch": t["sketch"].to_json() if t["sketch"].count else None,
+                    "median_duration_minutes": t["sketch"].quantile(0.5),
+                    "p90_duration_minutes": t["sketch"].quantile(0.9),
+                    "updated_at": now,
+                }
+                for trail_id, t in trails.items()
+            ])
+        db.commit()
+        return {"parks": len(parks), "trails": len(trails)}
@@ -0,0 +1,167 @@
+"""Request-scoped SQL profiling: slow-query log, N+1 detection and budgets.
+
+Every statement executed while a request is being served is attributed to
+that request. When the request finishes the profiler
+
+- logs statements slower than SLOW_QUERY_MS together with their EXPLAIN
+  output (captured at execution time, on the same connection),
+- flags SELECT shapes that ran N_PLUS_ONE_THRESHOLD or more times, which is
+  the signature of a per-row lookup inside a loop,
+- optionally enforces per-route statement budgets. Tests switch this on so a
+  route that starts issuing more statements than its budget fails loudly.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from config import SLOW_QUERY_MS, N_PLUS_ONE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\((\s*\?\s*,)+\s*\?\s*\)|\((\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A route issued more SQL statements than its budget allows."""
+
+
+def statement_shape(statement: str) -> str:
+    """Normalize a statement so repeats with different parameters compare equal."""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _IN_LIST.sub("(?...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class SlowStatement:
+    """A statement that crossed the slow-query threshold."""
+
+    __slots__ = ("statement", "duration_ms", "plan")
+
+    def __init__(self, statement: str, duration_ms: float, plan: Optional[str]):
+        self.statement = statement
+        self.duration_ms = duration_ms
+        self.plan = plan
+
+
+class QueryProfile:
+    """Statements observed while serving one request."""
+
+    def __init__(self):
+        self.route = None
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.slow = []
+
+    def repeated(self, threshold: int) -> list:
+        """SELECT shapes executed at least `threshold` times, most frequent first."""
+        return [
+            (shape, n) for shape, n in self.shapes.most_common()
+            if n >= threshold and shape.upper().startswith(("SELECT", "WITH"))
+        ]
+
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("npt_query_profile", default=None)
+
+
+class QueryProfiler:
+    """Collects per-request statement profiles and reports on them."""
+
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS,
+                 repeat_threshold: int = N_PLUS_ONE_THRESHOLD):
+        self.slow_query_ms = slow_query_ms
+        self.repeat_threshold = repeat_threshold
+        self.budgets = {}
+        self.enforce_budgets = False
+        self.last_profiles = {}
+
+    def instrument(self, engine):
+        """Install cursor hooks on `engine`."""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if _current_profile.get() is not None:
+            conn.info.setdefault("npt_profile_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        starts = conn.info.get("npt_profile_start")
+        if profile is None or not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        profile.count += 1
+        profile.seconds += elapsed
+        profile.shapes[statement_shape(statement)] += 1
+        if elapsed * 1000 >= self.slow_query_ms:
+            plan = None if executemany else self._explain(conn, statement, parameters)
+            profile.slow.append(SlowStatement(statement, elapsed * 1000, plan))
+
+    @staticmethod
+    def _explain(conn, statement: str, parameters) -> Optional[str]:
+        """EXPLAIN a statement on a fresh cursor so the caller's results are untouched."""
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")):
+            return None
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            cursor = conn.connection.dbapi_connection.cursor()
+            try:
+                cursor.execute(prefix + statement, parameters)
+                return "\n".join(" | ".join(str(col) for col in row) for row in cursor.fetchall())
+            finally:
+                cursor.close()
+        except Exception as e:
+            return f"EXPLAIN failed: {e}"
+
+    def start(self) -> tuple:
+        profile = QueryProfile()
+        return profile, _current_profile.set(profile)
+
+    def finish(self, profile: QueryProfile, token, route: str):
+        _current_profile.reset(token)
+        profile.route = route
+        self.last_profiles[route] = profile
+
+        for slow in profile.slow:
+            logger.warning("Slow query on %s (%.1f ms): %s\nPlan:\n%s",
+                           route, slow.duration_ms, slow.statement, slow.plan)
+        for shape, n in profile.repeated(self.repeat_threshold):
+            logger.warning("Possible N+1 on %s: %d identical statements: %s", route, n, shape)
+
+        budget = self.budgets.get(route)
+        if self.enforce_budgets and budget is not None and profile.count > budget:
+            raise QueryBudgetExceeded(
+                f"{route} executed {profile.count} statements (budget {budget}); "
+                f"most repeated: {profile.shapes.most_common(3)}"
+            )
+
+
+# Default profiler
+profiler = QueryProfiler()
+
+
+class QueryProfilerMiddleware:
+    """ASGI middleware scoping a QueryProfile to each HTTP request."""
+
+    def __init__(self, app, profiler: QueryProfiler = profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile, token = self.profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or scope["path"]
+            self.profiler.finish(profile, token, f"{scope['method']} {route}")
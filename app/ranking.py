@@ -0,0 +1,191 @@
+"""In-memory rank and percentile lookup for every public user.
+
+The leaderboard only returns the top rows; "where do I stand" needs the
+number of users ahead of a score. Each metric keeps a Fenwick (binary
+indexed) tree of user counts per score bucket, so counting the users above
+a score and moving a user between buckets are both O(log buckets) however
+many users there are. Points and parks are bucketed exactly, miles per
+tenth of a mile; users in the same bucket share a rank. The number of
+buckets is capped at MAX_BUCKETS, so an absurd score cannot allocate an
+absurd tree; scores past the cap share the top bucket.
+
+The trees are built from the database at startup and kept current by the
+write routes (`add` after each commit). Each worker process holds its own
+copy, which misses other workers' writes, so it is also rebuilt after
+RANKING_MAX_AGE_SECONDS.
+"""
+import threading
+import time
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app import models
+from config import RANKING_MAX_AGE_SECONDS
+
+# Score units per bucket
+RESOLUTION = {"points": 1, "parks": 1, "miles": 0.1}
+MAX_BUCKETS = 1 << 20  # 104,857 miles; a few MB of counts per metric at most
+
+
+class FenwickTree:
+    """Prefix sums over counts[0..size) with O(log n) point updates."""
+
+    def __init__(self, counts: list):
+        self.size = len(counts)
+        tree = [0] + list(counts)
+        for i in range(1, self.size + 1):  # O(n) construction
+            parent = i + (i & -i)
+            if parent <= self.size:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def add(self, index: int, delta: int):
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index: int) -> int:
+        """Sum of counts[0..index]."""
+        i, total = min(index + 1, self.size), 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+class ScoreRanking:
+    """Order statistics of one metric's scores across users."""
+
+    def __init__(self, scores: dict, resolution: float = 1):
+        self.resolution = resolution
+        self.scores = dict(scores)
+        buckets = [self._bucket(score) for score in self.scores.values()]
+        counts = [0] * (max(buckets, default=0) + 1)
+        for bucket in buckets:
+            counts[bucket] += 1
+        self.counts = counts
+        self.tree = FenwickTree(counts)
+
+    def _bucket(self, score: float) -> int:
+        return min(max(0, int(round(score / self.resolution))), MAX_BUCKETS - 1)
+
+    def _grow(self, bucket: int):
+        # Rebuilding at double the size keeps growth amortized O(1) per bucket
+        self.counts.extend([0] * (min(max(bucket + 1, 2 * len(self.counts)), MAX_BUCKETS) - len(self.counts)))
+        self.tree = FenwickTree(self.counts)
+
+    def _move(self, bucket: int, delta: int):
+        if bucket >= len(self.counts):
+            self._grow(bucket)
+        self.counts[bucket] += delta
+        self.tree.add(bucket, delta)
+
+    def set(self, user_id: int, score: float):
+        old = self.scores.get(user_id)
+        if old is not None:
+            self._move(self._bucket(old), -1)
+        self.scores[user_id] = score
+        self._move(self._bucket(score), 1)
+
+    def add(self, user_id: int, delta: float):
+        self.set(user_id, self.scores.get(user_id, 0) + delta)
+
+    def remove(self, user_id: int):
+        old = self.scores.pop(user_id, None)
+        if old is not None:
+            self._move(self._bucket(old), -1)
+
+    def rank(self, user_id: int) -> Optional[dict]:
+        """1-based rank (ties share the best rank) and percentile, or None if unranked."""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        total = len(self.scores)
+        at_or_below = self.tree.prefix(self._bucket(score))
+        rank = total - at_or_below + 1
+        return {
+            "score": round(score, 2),
+            "rank": rank,
+            "total": total,
+            # Share of the other users this one is ahead of or tied with
+            "percentile": round(100.0 * (total - rank) / (total - 1), 2) if total > 1 else 100.0,
+        }
+
+
+def _load_scores(db: Session, user_ids: Optional[list] = None) -> dict:
+    """{metric: {user_id: score}} for public users (optionally just `user_ids`)."""
+    users = db.query(models.User.id, models.User.total_points).filter(models.User.is_public == True)
+    miles = db.query(models.TrailHike.user_id, func.sum(models.TrailHike.distance_miles)).filter(
+        models.TrailHike.duplicate_of.is_(None)).group_by(models.TrailHike.user_id)
+    parks = db.query(models.Visit.user_id, func.count(func.distinct(models.Visit.park_id))).filter(
+        models.Visit.visited == True).group_by(models.Visit.user_id)
+    if user_ids is not None:
+        users = users.filter(models.User.id.in_(user_ids))
+        miles = miles.filter(models.TrailHike.user_id.in_(user_ids))
+        parks = parks.filter(models.Visit.user_id.in_(user_ids))
+
+    points = {user_id: total or 0 for user_id, total in users}
+    scores = {"points": points, "miles": dict.fromkeys(points, 0.0), "parks": dict.fromkeys(points, 0)}
+    for user_id, total in miles:
+        if user_id in points:
+            scores["miles"][user_id] = float(total or 0)
+    for user_id, count in parks:
+        if user_id in points:
+            scores["parks"][user_id] = count
+    return scores
+
+
+class UserRankings:
+    """Per-metric ScoreRankings over public users, lazily (re)built."""
+
+    def __init__(self, max_age: float = RANKING_MAX_AGE_SECONDS):
+        self.max_age = max_age
+        self._rankings = None
+        self._built_at = 0.0
+        self._lock = threading.RLock()
+
+    def rebuild(self, db: Session) -> int:
+        """Reload every public user's scores; returns the number of users."""
+        scores = _load_scores(db)
+        rankings = {metric: ScoreRanking(scores[metric], RESOLUTION[metric]) for metric in RESOLUTION}
+        with self._lock:
+            self._rankings = rankings
+            self._built_at = time.monotonic()
+        return len(scores["points"])
+
+    def _current(self, db: Session) -> dict:
+        if self._rankings is None or time.monotonic() - self._built_at > self.max_age:
+            with self._lock:
+                if self._rankings is None or time.monotonic() - self._built_at > self.max_age:
+                    self.rebuild(db)
+        return self._rankings
+
+    def rank(self, db: Session, user_id: int, metric: str) -> Optional[dict]:
+        rankings = self._current(db)
+        with self._lock:
+            return rankings[metric].rank(user_id)
+
+    def add(self, user_id: int, metric: str, delta: float):
+        """Apply a committed score change; ignored until the trees are built or for private users."""
+        if self._rankings is None or not delta:
+            return
+        with self._lock:
+            ranking = self._rankings[metric]
+            if user_id in ranking.scores:
+                ranking.add(user_id, delta)
+
+    def refresh_user(self, db: Session, user_id: int):
+        """Reload one user's scores, e.g. after signup or a privacy change."""
+        if self._rankings is None:
+            return
+        scores = _load_scores(db, [user_id])
+        with self._lock:
+            for metric, ranking in self._rankings.items():
+                if user_id in scores[metric]:
+                    ranking.set(user_id, scores[metric][user_id])
+                else:
+                    ranking.remove(user_id)
+
+
+user_rankings = UserRankings()
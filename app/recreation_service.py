@@ -1,40 +1,102 @@
-"""Service for integrating with Recreation.gov API."""
+"""Service for integrating with Recreation.gov API.
+
+`recreation_gov` holds one pooled `httpx.AsyncClient` (keep-alive, HTTP/2
+when the `h2` package is installed) that every call shares, and sends
+calls through `recreation_gov_guard` (app/resilience.py). The app opens
+it on startup and closes it on shutdown; code running outside the app
+gets a client created on first use. `recreation_gov_sync` is the blocking
+facade: its calls run on one event loop in a background thread, with its
+own pooled client, instead of a new loop and connection per call.
+"""
 
 import httpx
 import asyncio
+import os
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import json
+from app.resilience import OutboundGuard
+from config import (RECREATION_GOV_BURST, RECREATION_GOV_KEEPALIVE_CONNECTIONS, RECREATION_GOV_KEEPALIVE_SECONDS,
+                    RECREATION_GOV_MAX_CONNECTIONS, RECREATION_GOV_RATE_PER_SECOND, RECREATION_GOV_TIMEOUT_SECONDS)
+
+try:
+    import h2  # noqa: F401  (installed by httpx[http2])
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# Recreation.gov camps API (overridable to point at a local stand-in)
+RECREATION_GOV_API = os.getenv("RECREATION_GOV_API", "https://www.recreation.gov/api/camps")
+
+# Rate limit and circuit breaker shared by every client of the API in this process
+recreation_gov_guard = OutboundGuard("recreation_gov", RECREATION_GOV_RATE_PER_SECOND, RECREATION_GOV_BURST)
 
 class RecreationGovService:
     """Handle Recreation.gov API interactions."""
     
-    BASE_URL = "https://www.recreation.gov/api/camps/availability/campgrounds"
+    BASE_URL = f"{RECREATION_GOV_API}/availability/campgrounds"
+    SEARCH_URL = f"{RECREATION_GOV_API}/search"
     
-    @staticmethod
-    async def get_campground_by_name(campground_name: str) -> Optional[Dict]:
+    def __init__(self, max_connections: int = RECREATION_GOV_MAX_CONNECTIONS,
+                 keepalive_connections: int = RECREATION_GOV_KEEPALIVE_CONNECTIONS,
+                 keepalive_seconds: float = RECREATION_GOV_KEEPALIVE_SECONDS,
+                 timeout: float = RECREATION_GOV_TIMEOUT_SECONDS, http2: bool = HTTP2,
+                 guard: OutboundGuard = None):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=keepalive_connections,
+                                   keepalive_expiry=keepalive_seconds)
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 5.0))
+        self.http2 = http2
+        self.guard = guard or recreation_gov_guard
+        self.client: Optional[httpx.AsyncClient] = None
+        self._loop = None  # Loop the client's connections belong to
+    
+    def open(self) -> httpx.AsyncClient:
+        """The shared client, created on first use in the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self.client is None or self.client.is_closed or self._loop is not loop:
+            # A client is bound to the loop it was created in; a new loop (e.g. a script
+            # calling asyncio.run twice) gets a new one
+            self.client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+            self._loop = loop
+        return self.client
+    
+    async def aclose(self):
+        """Close the shared client and its pooled connections."""
+        if self.client is not None:
+            client, self.client, self._loop = self.client, None, None
+            await client.aclose()
+    
+    async def find_campground(self, campground_name: str) -> Optional[Dict]:
+        """
+        Search for a campground by name on Recreation.gov.
+        Returns the first match, or None if nothing matched; raises if the
+        search itself failed (errors, non-200 responses, guard rejections).
+        """
+        # Recreation.gov search endpoint
+        async with self.guard.call("search") as call:
+            response = await self.open().get(self.SEARCH_URL, params={"query": campground_name})
+            call.status = response.status_code
+        response.raise_for_status()
+        data = response.json()
+        if data.get("data") and len(data["data"]) > 0:
+            return data["data"][0]
+        return None
+
+    async def get_campground_by_name(self, campground_name: str) -> Optional[Dict]:
         """
         Search for a campground by name on Recreation.gov.
         Returns campground data including ID if found.
         """
         try:
-            async with httpx.AsyncClient() as client:
-                # Recreation.gov search endpoint
-                response = await client.get(
-                    "https://www.recreation.gov/api/camps/search",
-                    params={"query": campground_name},
-                    timeout=10.0
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get("data") and len(data["data"]) > 0:
-                        return data["data"][0]
+            return await self.find_campground(campground_name)
         except Exception as e:
             print(f"Error searching Recreation.gov: {e}")
         return None
     
-    @staticmethod
     async def get_campground_availability(
+        self,
         campground_id: int,
         month: Optional[str] = None
     ) -> Optional[Dict]:
@@ -48,12 +110,13 @@ class RecreationGovService:
             month = today.strftime("%Y-%m-01")
         
         try:
-            async with httpx.AsyncClient() as client:
-                url = f"{RecreationGovService.BASE_URL}/{campground_id}/month/{month}"
-                response = await client.get(url, timeout=10.0)
-                
-                if response.status_code == 200:
-                    return response.json()
+            url = f"{self.BASE_URL}/{campground_id}/month/{month}"
+            async with self.guard.call("availability") as call:
+                response = await self.open().get(url)
+                call.status = response.status_code
+            
+            if response.status_code == 200:
+                return response.json()
         except Exception as e:
             print(f"Error fetching Recreation.gov availability: {e}")
         
@@ -98,8 +161,8 @@ class RecreationGovService:
         
         return campsites
     
-    @staticmethod
     async def get_available_dates(
+        self,
         campground_id: int,
         num_months: int = 3
     ) -> Dict[str, List[str]]:
@@ -116,12 +179,12 @@ class RecreationGovService:
                 target_date = today + timedelta(days=30*i)
                 month_str = target_date.strftime("%Y-%m-01")
                 
-                availability_data = await RecreationGovService.get_campground_availability(
+                availability_data = await self.get_campground_availability(
                     campground_id, month_str
                 )
                 
                 if availability_data:
-                    campsites = await RecreationGovService.parse_availability(
+                    campsites = await self.parse_availability(
                         availability_data, campground_id
                     )
                     
@@ -139,8 +202,8 @@ class RecreationGovService:
         
         return available_dates
     
-    @staticmethod
     async def search_and_get_availability(
+        self,
         park_name: str,
         campground_name: str
     ) -> Optional[Dict]:
@@ -151,16 +214,16 @@ class RecreationGovService:
         """
         try:
             # Try to find the campground
-            campground = await RecreationGovService.get_campground_by_name(campground_name)
+            campground = await self.get_campground_by_name(campground_name)
             
             if campground:
                 campground_id = campground.get("facility_id")
-                availability = await RecreationGovService.get_campground_availability(
+                availability = await self.get_campground_availability(
                     campground_id
                 )
                 
                 if availability:
-                    campsites = await RecreationGovService.parse_availability(
+                    campsites = await self.parse_availability(
                         availability, campground_id
                     )
                     
@@ -178,30 +241,48 @@ class RecreationGovService:
         return None
 
 
-# For synchronous usage, we can create a wrapper
 class RecreationGovSync:
-    """Synchronous wrapper for Recreation.gov service."""
+    """Synchronous wrapper for Recreation.gov service.
     
-    @staticmethod
-    def get_availability(campground_id: int, month: Optional[str] = None) -> Optional[Dict]:
+    Calls are handed to one event loop running in a daemon thread, started on
+    first use, so connections are reused across calls and threads.
+    """
+    
+    def __init__(self, service: RecreationGovService = None):
+        self.service = service or RecreationGovService()
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def _run(self, coro):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="recreation-gov-sync",
+                                                daemon=True)
+                self._thread.start()
+            loop = self._loop
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+    
+    def get_availability(self, campground_id: int, month: Optional[str] = None) -> Optional[Dict]:
         """Synchronous wrapper for getting campground availability."""
-        loop = asyncio.new_event_loop()
-        try:
-            result = loop.run_until_complete(
-                RecreationGovService.get_campground_availability(campground_id, month)
-            )
-            return result
-        finally:
-            loop.close()
+        return self._run(self.service.get_campground_availability(campground_id, month))
     
-    @staticmethod
-    def search_campground(campground_name: str) -> Optional[Dict]:
+    def search_campground(self, campground_name: str) -> Optional[Dict]:
         """Synchronous wrapper for searching campgrounds."""
-        loop = asyncio.new_event_loop()
-        try:
-            result = loop.run_until_complete(
-                RecreationGovService.get_campground_by_name(campground_name)
-            )
-            return result
-        finally:
-            loop.close()
+        return self._run(self.service.get_campground_by_name(campground_name))
+    
+    def close(self):
+        """Close the client and stop the loop thread; a later call starts them again."""
+        with self._lock:
+            loop, thread, self._loop, self._thread = self._loop, self._thread, None, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.service.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+recreation_gov = RecreationGovService()
+recreation_gov_sync = RecreationGovSync()
@@ -0,0 +1,266 @@
+"""Rate limiting and circuit breaking for calls to external providers.
+
+Every Garmin and Recreation.gov request goes through its provider's
+`OutboundGuard`, which also times it like `observe_outbound`:
+
+    async with guard.call("search") as call:
+        response = await client.get(...)
+        call.status = response.status_code
+
+The guard first asks the provider's `CircuitBreaker`. After
+CIRCUIT_FAILURE_THRESHOLD consecutive failures (errors, timeouts, 5xx or
+429 responses) the circuit opens and calls fail at once with
+`CircuitOpenError` for CIRCUIT_RESET_SECONDS; then a single trial call
+is let through, and its outcome closes or reopens the circuit.
+
+It then takes a token from the provider's `TokenBucket` and from the
+process-wide bucket all providers share, sleeping until both have one.
+Buckets reserve tokens by going into debt, so waiting callers are served
+in arrival order; a caller that would wait longer than
+OUTBOUND_MAX_WAIT_SECONDS gets `RateLimitedError` instead. Provider
+buckets live in this process by default; RATE_LIMIT_BACKEND=database
+keeps them in `rate_limit_buckets` so all workers share one budget per
+provider.
+
+Guards register with the metrics registry, which exports circuit state,
+tokens available, time spent throttled and rejected calls.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from sqlalchemy import case, update
+from app import models
+from app.database import SessionLocal, dialect_insert
+from app.metrics import observe_outbound, registry as metrics_registry
+from config import (CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, OUTBOUND_BURST, OUTBOUND_MAX_WAIT_SECONDS,
+                    OUTBOUND_RATE_PER_SECOND, RATE_LIMIT_BACKEND)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitOpenError(Exception):
+    """The provider's circuit is open; the call was not made."""
+
+
+class RateLimitedError(Exception):
+    """The call would have waited longer than allowed for a rate-limit token."""
+
+
+# ============ Token buckets ============
+
+class MemoryBucketStore:
+    """Token balances kept in this process."""
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        """Refill, take one token and return the balance left (negative when in debt)."""
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate) - 1
+            self._buckets[key] = (tokens, now)
+            return tokens
+
+    def give_back(self, key: str):
+        with self._lock:
+            tokens, updated_at = self._buckets[key]
+            self._buckets[key] = (tokens + 1, updated_at)
+
+    def level(self, key: str, rate: float, burst: float, now: float) -> float:
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+        return min(burst, tokens + (now - updated_at) * rate)
+
+
+class DatabaseBucketStore:
+    """Token balances in `rate_limit_buckets`, shared by every process using the database.
+
+    Each take is one atomic UPDATE ... RETURNING, so concurrent workers never hand out the same token.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    @staticmethod
+    def _refilled(rate: float, burst: float, now: float):
+        bucket = models.RateLimitBucket
+        refilled = bucket.tokens + (now - bucket.updated_at) * rate
+        return case((refilled > burst, burst), else_=refilled)
+
+    def _add(self, db, key: str, delta, now: float):
+        bucket = models.RateLimitBucket
+        return db.execute(update(bucket).where(bucket.key == key).values(
+            tokens=delta, updated_at=now).returning(bucket.tokens)).scalar()
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        with self.session_factory() as db:
+            tokens = self._add(db, key, self._refilled(rate, burst, now) - 1, now)
+            if tokens is None:
+                insert = dialect_insert(db)
+                db.execute(insert(models.RateLimitBucket).values(key=key, tokens=burst, updated_at=now)
+                           .on_conflict_do_nothing(index_elements=["key"]))
+                tokens = self._add(db, key, self._refilled(rate, burst, now) - 1, now)
+            db.commit()
+            return tokens
+
+    def give_back(self, key: str):
+        bucket = models.RateLimitBucket
+        with self.session_factory() as db:
+            db.execute(update(bucket).where(bucket.key == key).values(tokens=bucket.tokens + 1))
+            db.commit()
+
+    def level(self, key: str, rate: float, burst: float, now: float) -> float:
+        bucket = models.RateLimitBucket
+        with self.session_factory() as db:
+            row = db.query(bucket.tokens, bucket.updated_at).filter(bucket.key == key).first()
+        return burst if row is None else min(burst, row.tokens + (now - row.updated_at) * rate)
+
+
+local_buckets = MemoryBucketStore()
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average and bursts of up to `burst`; a rate of 0 disables it."""
+
+    def __init__(self, key: str, rate: float, burst: float = None, store=None,
+                 max_wait: float = OUTBOUND_MAX_WAIT_SECONDS, clock=time.time):
+        self.key = key
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.store = store or local_buckets
+        self.max_wait = max_wait
+        self.clock = clock
+        self.waited_seconds = 0.0
+
+    def reserve(self) -> float:
+        """Take a token now; returns the seconds until it is due, or raises RateLimitedError."""
+        if self.rate <= 0:
+            return 0.0
+        tokens = self.store.take(self.key, self.rate, self.burst, self.clock())
+        wait = -tokens / self.rate if tokens < 0 else 0.0
+        if wait > self.max_wait:
+            self.store.give_back(self.key)
+            raise RateLimitedError(f"{self.key}: next token in {wait:.1f}s")
+        return wait
+
+    def cancel(self):
+        """Return a reserved token that will not be used."""
+        if self.rate > 0:
+            self.store.give_back(self.key)
+
+    def available(self) -> float:
+        if self.rate <= 0:
+            return float("inf")
+        return self.store.level(self.key, self.rate, self.burst, self.clock())
+
+
+process_bucket = TokenBucket("outbound", OUTBOUND_RATE_PER_SECOND, OUTBOUND_BURST)
+
+
+# ============ Circuit breaker ============
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets one trial call through once `reset_seconds` have passed."""
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self.opened_at < self.reset_seconds:
+                    return False
+                self.state, self._trial = HALF_OPEN, False
+            if self.state == HALF_OPEN:
+                if self._trial:
+                    return False
+                self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state, self.failures, self._trial = CLOSED, 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state, self.opened_at, self._trial = OPEN, self.clock(), False
+                self.times_opened += 1
+
+    def cancel(self):
+        """An allowed call was not made; a half-open circuit lets the next caller try."""
+        with self._lock:
+            self._trial = False
+
+
+# ============ Guard ============
+
+class OutboundGuard:
+    """Circuit breaker, provider and process rate limits and timing for one provider's calls."""
+
+    def __init__(self, provider: str, rate: float, burst: float = None, store=None, breaker: CircuitBreaker = None,
+                 shared: TokenBucket = process_bucket, registry=metrics_registry):
+        if store is None and RATE_LIMIT_BACKEND == "database":
+            store = DatabaseBucketStore()
+        self.provider = provider
+        self.bucket = TokenBucket(provider, rate, burst, store)
+        self.buckets = [self.bucket] + ([shared] if shared is not None else [])
+        self.breaker = breaker or CircuitBreaker()
+        self.registry = registry
+        self.rejected = {"circuit_open": 0, "rate_limited": 0}
+        self.throttled_seconds = 0.0
+        registry.guards[provider] = self
+
+    async def _throttle(self):
+        waits = []
+        try:
+            for bucket in self.buckets:
+                waits.append(bucket.reserve())
+        except RateLimitedError:
+            for bucket in self.buckets[:len(waits)]:
+                bucket.cancel()
+            raise
+        wait = max(waits)
+        if wait > 0:
+            self.throttled_seconds += wait
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def call(self, operation: str):
+        """Wait for capacity, then time the call made in the block and feed its outcome to the breaker."""
+        if not self.breaker.allow():
+            self.rejected["circuit_open"] += 1
+            raise CircuitOpenError(f"{self.provider} circuit is open")
+        try:
+            await self._throttle()
+        except BaseException as e:
+            self.breaker.cancel()
+            if isinstance(e, RateLimitedError):
+                self.rejected["rate_limited"] += 1
+            raise
+        with observe_outbound(self.provider, operation, registry=self.registry) as call:
+            try:
+                yield call
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                self.breaker.cancel()
+                raise
+        if isinstance(call.status, int) and (call.status >= 500 or call.status == 429):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
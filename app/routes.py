@@ -1,15 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, Query, Response, UploadFile
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from typing import Optional
 from app.database import get_db
 from app import models, schemas
 from app.services import AchievementService, FitnessSyncService
-from app.recreation_service import RecreationGovService
+from app.wildlife import WildlifeRollupService
+from app.popularity import PopularityService
+from app import availability_search, leaderboards, timeseries
+from app.activity import ActivityRollupService
+from app.ranking import RESOLUTION as RANK_METRICS, user_rankings
+from app.scoped_leaderboards import ScopeStatsService, scoped_leaderboards
+from app import scoped_leaderboards as scoped
+from app.facets import park_facets, campsite_facets, invalidate_catalog
+from app.search import search_index
+from app.notifications import booking_alerts
+from app.featured import featured_campsites
+from app.garmin_tokens import garmin_tokens
+from app.ingest import activity_ingest
+from app.duplicates import DuplicateHikeService
+from app.tracks import MAX_ZOOM, TrackService
+from app.track_files import UPLOAD_SOURCES, save_upload, upload_hike, upload_parser
+from app.serialization import FastJSONResponse, RowSerializer
+from config import GARMIN_WEBHOOK_SECRET, MAP_MAX_BYTES, MAP_MAX_BYTES_LIMIT, UPLOAD_MAX_FILES, UPLOAD_MAX_MB
 import asyncio
+import hmac
+import os
 
 router = APIRouter(prefix="/api/v1", tags=["parks"])
 
+# Column-only serializers for list endpoints (see app/serialization.py)
+park_rows = RowSerializer(models.Park, schemas.ParkOut)
+visit_rows = RowSerializer(models.Visit, schemas.VisitOut)
+trail_rows = RowSerializer(models.Trail, schemas.TrailOut)
+hike_rows = RowSerializer(models.TrailHike, schemas.TrailHikeOut)
+campsite_rows = RowSerializer(models.Campsite, schemas.CampsiteOut)
+camping_trip_rows = RowSerializer(models.CampingTrip, schemas.CampingTripOut)
+sighting_rows = RowSerializer(models.Sighting, schemas.SightingOut)
+
 # ============ Users ============
 
 @router.post("/users", response_model=schemas.UserOut, status_code=201)
@@ -19,6 +49,7 @@ async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    user_rankings.refresh_user(db, db_user.id)
     return db_user
 
 @router.get("/users/{user_id}", response_model=schemas.UserOut)
@@ -45,26 +76,76 @@ async def create_park(park: schemas.ParkCreate, db: Session = Depends(get_db)):
     db_park = models.Park(**park.model_dump())
     db.add(db_park)
     db.commit()
+    invalidate_catalog()
     db.refresh(db_park)
     return db_park
 
 @router.get("/parks", response_model=list[schemas.ParkOut])
 async def list_parks(region: str = None, state: str = None, db: Session = Depends(get_db)):
     """List parks with optional filters."""
-    query = db.query(models.Park)
+    query = park_rows.query(db)
     if region:
         query = query.filter(models.Park.region == region)
     if state:
         query = query.filter(models.Park.state == state)
-    return query.all()
+    return park_rows.response(query.all())
 
-@router.get("/parks/{park_id}", response_model=schemas.ParkOut)
+@router.get("/parks/{park_id}", response_model=schemas.ParkDetail)
 async def get_park(park_id: int, db: Session = Depends(get_db)):
-    """Get park by ID."""
-    park = db.query(models.Park).filter(models.Park.id == park_id).first()
-    if not park:
+    """Get park by ID, with its popularity and rating aggregates."""
+    row = park_rows.query(db).add_entity(models.ParkStats).outerjoin(
+        models.ParkStats, models.ParkStats.park_id == models.Park.id
+    ).filter(models.Park.id == park_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Park not found")
-    return park
+    park = park_rows.dicts([row[:-1]])[0]
+    park["stats"] = PopularityService.park_stats_out(row[-1])
+    return FastJSONResponse(park)
+
+# ============ Faceted Catalog ============
+
+@router.get("/facets/parks")
+async def filter_parks(region: list[str] = Query(None), state: list[str] = Query(None),
+                       decade: list[str] = Query(None), area: list[str] = Query(None),
+                       limit: int = 50, offset: int = 0, db: Session = Depends(get_db)):
+    """Filter parks by any combination of facets, with counts for every facet value.
+
+    Repeat a parameter to OR values (`region=Pacific&region=Southwest`); different
+    parameters are ANDed. `decade` looks like `1910s`, `area` is a band such as `500-1000`.
+    """
+    selections = {"region": region, "state": state, "decade": decade, "area": area}
+    return FastJSONResponse(park_facets.query(db, selections, limit=limit, offset=offset))
+
+@router.get("/facets/campsites")
+async def filter_campsites(park_id: list[int] = Query(None), region: list[str] = Query(None),
+                           state: list[str] = Query(None), has_water: bool = None, has_toilets: bool = None,
+                           elevation: list[str] = Query(None), min_occupancy: int = None,
+                           max_occupancy: int = None, limit: int = 50, offset: int = 0,
+                           db: Session = Depends(get_db)):
+    """Filter campsites by park, region, amenities, elevation band and occupancy, with facet counts."""
+    selections = {
+        "park_id": park_id,
+        "region": region,
+        "state": state,
+        "has_water": None if has_water is None else [has_water],
+        "has_toilets": None if has_toilets is None else [has_toilets],
+        "elevation": elevation,
+    }
+    ranges = {"max_occupancy": (min_occupancy, max_occupancy)}
+    return FastJSONResponse(campsite_facets.query(db, selections, ranges, limit=limit, offset=offset))
+
+# ============ Search ============
+
+@router.get("/search", response_model=schemas.SearchResults)
+async def search(q: str, user_id: int = None, types: str = None, limit: int = 20, offset: int = 0,
+                 db: Session = Depends(get_db)):
+    """Full-text search over parks, trails and campsites, plus the user's own notes when user_id is given.
+
+    `types` is a comma-separated subset of park,trail,campsite,visit,hike,sighting.
+    """
+    type_list = [t.strip() for t in types.split(",")] if types else None
+    return FastJSONResponse(search_index.search(db, q, user_id=user_id, types=type_list,
+                                                limit=limit, offset=offset))
 
 # ============ Visits ============
 
@@ -73,8 +154,14 @@ async def log_visit(user_id: int, visit: schemas.VisitCreate, db: Session = Depe
     """Log a park visit."""
     db_visit = models.Visit(user_id=user_id, **visit.model_dump())
     db.add(db_visit)
+    first_visit = ActivityRollupService.record_visit(db_visit, db)
+    PopularityService.record_visit(db_visit, db)
+    scope_totals = ScopeStatsService.record_first_visit(db_visit, db) if first_visit else []
     db.commit()
     db.refresh(db_visit)
+    if first_visit:
+        user_rankings.add(user_id, "parks", 1)
+        scoped_leaderboards.offer(scope_totals)
     
     # Update passport stats
     update_passport(user_id, db)
@@ -83,11 +170,11 @@ async def log_visit(user_id: int, visit: schemas.VisitCreate, db: Session = Depe
 @router.get("/users/{user_id}/visits", response_model=list[schemas.VisitOut])
 async def get_visits(user_id: int, visited_only: bool = True, db: Session = Depends(get_db)):
     """Get user's park visits or wishlists."""
-    visits = db.query(models.Visit).filter(
+    visits = visit_rows.query(db).filter(
         models.Visit.user_id == user_id,
         models.Visit.visited == visited_only
     ).order_by(models.Visit.visit_date.desc()).all()
-    return visits
+    return visit_rows.response(visits)
 
 # ============ Trails ============
 
@@ -100,11 +187,22 @@ async def add_trail(park_id: int, trail: schemas.TrailCreate, db: Session = Depe
     db.refresh(db_trail)
     return db_trail
 
-@router.get("/parks/{park_id}/trails", response_model=list[schemas.TrailOut])
+@router.get("/parks/{park_id}/trails", response_model=list[schemas.TrailWithStats])
 async def get_trails(park_id: int, db: Session = Depends(get_db)):
-    """Get trails in a park."""
-    trails = db.query(models.Trail).filter(models.Trail.park_id == park_id).all()
-    return trails
+    """Get trails in a park, each with its hike aggregates."""
+    rows = trail_rows.query(db).add_columns(
+        models.TrailStats.hike_count,
+        models.TrailStats.hikes_by_month,
+        models.TrailStats.median_duration_minutes,
+        models.TrailStats.p90_duration_minutes
+    ).outerjoin(
+        models.TrailStats, models.TrailStats.trail_id == models.Trail.id
+    ).filter(models.Trail.park_id == park_id).all()
+    width = len(trail_rows.fields)
+    trails = trail_rows.dicts(row[:width] for row in rows)
+    for trail, row in zip(trails, rows):
+        trail["stats"] = PopularityService.trail_stats_out(*row[width:])
+    return FastJSONResponse(trails)
 
 # ============ Trail Hikes ============
 
@@ -113,8 +211,18 @@ async def log_hike(user_id: int, hike: schemas.TrailHikeCreate, db: Session = De
     """Log a trail hike."""
     db_hike = models.TrailHike(user_id=user_id, **hike.model_dump())
     db.add(db_hike)
+    db.flush()
+    scope_totals = []
+    counted = bool(DuplicateHikeService.mark_new(db, [db_hike]))  # Not if also imported from a tracker
+    if counted:
+        PopularityService.record_hike(db_hike, db)
+        ActivityRollupService.record_hike(db_hike, db)
+        scope_totals = ScopeStatsService.record_hike(db_hike, db)
     db.commit()
     db.refresh(db_hike)
+    if counted:
+        user_rankings.add(user_id, "miles", db_hike.distance_miles or 0)
+        scoped_leaderboards.offer(scope_totals)
     
     # Update passport
     update_passport(user_id, db)
@@ -124,11 +232,110 @@ async def log_hike(user_id: int, hike: schemas.TrailHikeCreate, db: Session = De
 async def get_hikes(user_id: int, days: int = 90, db: Session = Depends(get_db)):
     """Get user's recent hikes."""
     cutoff = datetime.utcnow() - timedelta(days=days)
-    hikes = db.query(models.TrailHike).filter(
+    hikes = hike_rows.query(db).filter(
         models.TrailHike.user_id == user_id,
         models.TrailHike.hike_date >= cutoff
     ).order_by(models.TrailHike.hike_date.desc()).all()
-    return hikes
+    return hike_rows.response(hikes)
+
+@router.get("/users/{user_id}/hikes/{hike_id}/track")
+async def get_hike_track(user_id: int, hike_id: int, include_points: bool = True,
+                         zoom: Optional[float] = Query(None, ge=0, le=MAX_ZOOM), db: Session = Depends(get_db)):
+    """GPS track of a hike with distance, elevation gain, moving time and mile splits computed from it.
+
+    With a map `zoom`, the points are simplified to the precomputed level of detail for it.
+    """
+    row = db.query(models.HikeTrack, models.TrailHike).join(
+        models.TrailHike, models.TrailHike.id == models.HikeTrack.hike_id
+    ).filter(models.HikeTrack.hike_id == hike_id, models.TrailHike.user_id == user_id).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="No track stored for this hike")
+    return FastJSONResponse(TrackService.response(*row, include_points=include_points, zoom=zoom))
+
+@router.get("/users/{user_id}/map")
+async def get_user_map(user_id: int, zoom: Optional[float] = Query(None, ge=0, le=MAX_ZOOM),
+                       max_bytes: int = Query(MAP_MAX_BYTES, ge=1024, le=MAP_MAX_BYTES_LIMIT),
+                       db: Session = Depends(get_db)):
+    """All of a user's tracks as simplified lines for an overview map, in at most max_bytes of JSON.
+
+    Decoding and simplifying every track takes long enough to stall other requests, so it runs in a thread.
+    """
+    body = await asyncio.to_thread(TrackService.user_map, db, user_id, max_bytes, zoom)
+    return Response(body, media_type="application/json")
+
+@router.post("/users/{user_id}/hikes/upload", status_code=201)
+async def upload_hikes(user_id: int, files: list[UploadFile] = File(...), source: str = Form("upload"),
+                       trail_id: Optional[int] = Form(None), db: Session = Depends(get_db)):
+    """Create hikes, with their GPS tracks, from uploaded GPX or FIT files."""
+    if not db.query(models.User.id).filter(models.User.id == user_id).first():
+        raise HTTPException(status_code=404, detail="User not found")
+    source = source.lower()
+    if source not in UPLOAD_SOURCES:
+        raise HTTPException(status_code=400, detail="Invalid source")
+    if len(files) > UPLOAD_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {UPLOAD_MAX_FILES} files per upload")
+    if trail_id is not None and not db.query(models.Trail.id).filter(models.Trail.id == trail_id).first():
+        raise HTTPException(status_code=404, detail="Trail not found")
+
+    saved = []  # (path, filename, sha1)
+    try:
+        for upload in files:
+            result = await save_upload(upload)
+            if result is None:
+                raise HTTPException(status_code=413, detail=f"{upload.filename} is larger than {UPLOAD_MAX_MB:g} MB")
+            saved.append((result[0], upload.filename, result[1]))
+
+        # Files already uploaded by this user (same content), loaded once for the batch
+        seen = {activity_id for (activity_id,) in db.query(models.HikeTrack.activity_id).filter(
+            models.HikeTrack.user_id == user_id,
+            models.HikeTrack.activity_id.in_([f"sha1:{digest}" for _, _, digest in saved])
+        )}
+        pending, duplicates = [], []
+        for path, filename, digest in saved:
+            if f"sha1:{digest}" in seen:
+                duplicates.append(filename)
+            else:
+                seen.add(f"sha1:{digest}")
+                pending.append((path, filename, digest))
+        results = await upload_parser.parse([(path, filename) for path, filename, _ in pending], source)
+    finally:
+        for path, _, _ in saved:
+            os.remove(path)
+
+    errors = [r for r in results if "error" in r]
+    tracks = [(r, f"sha1:{digest}") for r, (_, _, digest) in zip(results, pending) if "error" not in r]
+    new_hikes = []
+    for parsed, _ in tracks:
+        hike = models.TrailHike(**upload_hike(parsed, user_id, trail_id, source))
+        db.add(hike)
+        new_hikes.append(hike)
+    db.flush()  # Assigns hike ids
+    counted = DuplicateHikeService.mark_new(db, new_hikes)
+    for hike in counted if trail_id is not None else ():
+        PopularityService.record_hike(hike, db)
+        db.flush()  # The trail's stats row is created by the first hike
+    ActivityRollupService.record_hikes(counted, db)
+    scope_totals = ScopeStatsService.record_hikes(counted, db)
+    TrackService.store(db, [
+        dict(parsed["track"], hike_id=hike.id, user_id=user_id, activity_id=activity_id)
+        for hike, (parsed, activity_id) in zip(new_hikes, tracks)
+    ])
+    hikes_out = [schemas.TrailHikeOut.model_validate(hike) for hike in new_hikes]
+    db.commit()
+    user_rankings.add(user_id, "miles", sum(hike.distance_miles or 0 for hike in hikes_out
+                                            if hike.duplicate_of is None))
+    scoped_leaderboards.offer(scope_totals)
+    if new_hikes:
+        update_passport(user_id, db)
+
+    return {
+        "uploaded_files": len(files),
+        "imported_hikes": len(hikes_out),
+        "duplicate_hikes": len(new_hikes) - len(counted),
+        "skipped_duplicates": duplicates,
+        "errors": errors,
+        "hikes": hikes_out,
+    }
 
 # ============ Campsites ============
 
@@ -138,51 +345,56 @@ async def add_campsite(park_id: int, campsite: schemas.CampsiteCreate, db: Sessi
     db_campsite = models.Campsite(park_id=park_id, **{k: v for k, v in campsite.model_dump().items() if k != 'park_id'})
     db.add(db_campsite)
     db.commit()
+    invalidate_catalog()
     db.refresh(db_campsite)
     return db_campsite
 
+@router.put("/campsites/{campsite_id}/booking-opens", response_model=schemas.CampsiteOut)
+async def update_booking_opens(campsite_id: int, booking_opens: datetime = None, db: Session = Depends(get_db)):
+    """Move (or clear) when a campsite's bookings open; wishlist alerts follow."""
+    campsite = db.query(models.Campsite).filter(models.Campsite.id == campsite_id).first()
+    if not campsite:
+        raise HTTPException(status_code=404, detail="Campsite not found")
+    campsite.booking_opens = booking_opens
+    booking_alerts.schedule_campsite(db, campsite_id)
+    db.commit()
+    invalidate_catalog()
+    db.refresh(campsite)
+    return campsite
+
 @router.get("/parks/{park_id}/campsites", response_model=list[schemas.CampsiteOut])
 async def get_campsites(park_id: int, db: Session = Depends(get_db)):
     """Get campsites in a park."""
-    campsites = db.query(models.Campsite).filter(models.Campsite.park_id == park_id).all()
-    return campsites
+    campsites = campsite_rows.query(db).filter(models.Campsite.park_id == park_id).all()
+    return campsite_rows.response(campsites)
 
 @router.get("/parks/{park_id}/campsites/search")
-async def search_availability(park_id: int, start_date: str, end_date: str):
-    """Search campsite availability on Recreation.gov for a park and date range."""
-    try:
-        service = RecreationGovService()
-        # Search by park name
-        park_db = db.query(models.Park).filter(models.Park.id == park_id).first()
-        if not park_db:
-            return {"error": "Park not found"}
-        
-        availability = await service.search_and_get_availability(park_db.name, start_date, end_date)
-        return availability
-    except Exception as e:
-        return {"error": str(e), "message": "Could not fetch Recreation.gov data"}
+async def search_availability(park_id: int, start_date: date, end_date: date,
+                              min_nights: int = Query(1, ge=1), limit: int = Query(50, ge=1, le=500),
+                              db: Session = Depends(get_db)):
+    """Search every campground of a park on Recreation.gov for stays of at least `min_nights`
+    consecutive nights between `start_date` and `end_date` (the last check-out), best options first."""
+    if end_date <= start_date:
+        raise HTTPException(status_code=400, detail="end_date must be after start_date")
+    nights = (end_date - start_date).days
+    if nights > availability_search.MAX_SEARCH_NIGHTS:
+        raise HTTPException(status_code=400,
+                            detail=f"Search at most {availability_search.MAX_SEARCH_NIGHTS} nights at a time")
+    if min_nights > nights:
+        raise HTTPException(status_code=400, detail="min_nights is longer than the date range")
+    park = db.query(models.Park).filter(models.Park.id == park_id).first()
+    if not park:
+        raise HTTPException(status_code=404, detail="Park not found")
+    return FastJSONResponse(await availability_search.search_park(
+        db, park, start_date, end_date, min_nights=min_nights, limit=limit))
 
 @router.get("/campsites/featured")
 async def get_featured_campsites():
-    """Get featured campsites across parks."""
-    try:
-        service = RecreationGovService()
-        # Get popular parks and their availability
-        featured_parks = ["Yellowstone", "Grand Canyon", "Yosemite", "Zion"]
-        results = []
-        for park in featured_parks:
-            try:
-                availability = await service.search_and_get_availability(park, None, None)
-                if availability.get("campsites"):
-                    results.append({
-                        "park": park,
-                        "campsites": availability.get("campsites", [])[:3]  # Top 3
-                    })
-            except:
-                continue
-        return results
-    except Exception as e:
-        return {"error": str(e), "message": "Could not fetch featured campsites"}
+    """Best upcoming stays at featured parks, from the snapshot rebuilt in the background.
+
+    `age_seconds` is how old the snapshot is; it is null (with no parks) until the first build.
+    """
+    return FastJSONResponse(featured_campsites.snapshot())
 
 # ============ Wishlist ============
 
@@ -197,12 +409,14 @@ async def add_to_wishlist(user_id: int, wishlist: schemas.WishlistCreate, db: Se
     if existing:
         # Update notification hours
         existing.notification_hours_before = wishlist.notification_hours_before
+        booking_alerts.schedule(db, [existing])
         db.commit()
         db.refresh(existing)
         return {"id": existing.id, "campsite_id": existing.campsite_id, "notification_hours_before": existing.notification_hours_before}
     
     db_wishlist = models.Wishlist(user_id=user_id, **wishlist.model_dump())
     db.add(db_wishlist)
+    booking_alerts.schedule(db, [db_wishlist])
     db.commit()
     db.refresh(db_wishlist)
     return {"id": db_wishlist.id, "campsite_id": db_wishlist.campsite_id, "notification_hours_before": db_wishlist.notification_hours_before}
@@ -210,21 +424,23 @@ async def add_to_wishlist(user_id: int, wishlist: schemas.WishlistCreate, db: Se
 @router.get("/users/{user_id}/wishlist")
 async def get_wishlist(user_id: int, db: Session = Depends(get_db)):
     """Get user's campsite wishlist with availability windows."""
-    wishlist_items = db.query(models.Wishlist).filter(models.Wishlist.user_id == user_id).all()
+    # One joined query instead of a campsite and park lookup per wishlist item
+    rows = db.query(models.Wishlist, models.Campsite, models.Park).join(
+        models.Campsite, models.Campsite.id == models.Wishlist.campsite_id
+    ).outerjoin(
+        models.Park, models.Park.id == models.Campsite.park_id
+    ).filter(models.Wishlist.user_id == user_id).all()
     result = []
-    for item in wishlist_items:
-        campsite = db.query(models.Campsite).filter(models.Campsite.id == item.campsite_id).first()
-        if campsite:
-            park = db.query(models.Park).filter(models.Park.id == campsite.park_id).first()
-            result.append({
-                "wishlist_id": item.id,
-                "campsite": schemas.CampsiteOut.model_validate(campsite),
-                "park": schemas.ParkOut.model_validate(park) if park else None,
-                "notification_hours_before": item.notification_hours_before,
-                "days_until_booking": (item.campsite.booking_opens - datetime.utcnow()).days if item.campsite.booking_opens else None,
-                "booking_opens": item.campsite.booking_opens,
-                "added_date": item.created_at
-            })
+    for item, campsite, park in rows:
+        result.append({
+            "wishlist_id": item.id,
+            "campsite": schemas.CampsiteOut.model_validate(campsite),
+            "park": schemas.ParkOut.model_validate(park) if park else None,
+            "notification_hours_before": item.notification_hours_before,
+            "days_until_booking": (campsite.booking_opens - datetime.utcnow()).days if campsite.booking_opens else None,
+            "booking_opens": campsite.booking_opens,
+            "added_date": item.created_at
+        })
     return sorted(result, key=lambda x: x['booking_opens'] if x['booking_opens'] else datetime.max)
 
 @router.put("/users/{user_id}/wishlist/{campsite_id}")
@@ -238,6 +454,7 @@ async def update_wishlist_preferences(user_id: int, campsite_id: int, notificati
         raise HTTPException(status_code=404, detail="Wishlist item not found")
     
     wishlist.notification_hours_before = notification_hours
+    booking_alerts.schedule(db, [wishlist])
     db.commit()
     db.refresh(wishlist)
     return {"message": "Notification preferences updated", "campsite_id": campsite_id, "notification_hours": notification_hours}
@@ -252,6 +469,7 @@ async def remove_from_wishlist(user_id: int, campsite_id: int, db: Session = Dep
     if not wishlist:
         raise HTTPException(status_code=404, detail="Wishlist item not found")
     
+    booking_alerts.cancel(db, wishlist.id)
     db.delete(wishlist)
     db.commit()
     return {"message": "Removed from wishlist"}
@@ -263,6 +481,7 @@ async def log_camping_trip(user_id: int, trip: schemas.CampingTripCreate, db: Se
     """Log a camping trip."""
     db_trip = models.CampingTrip(user_id=user_id, **trip.model_dump())
     db.add(db_trip)
+    PopularityService.record_camping_trip(db_trip, db)
     db.commit()
     db.refresh(db_trip)
     
@@ -273,10 +492,10 @@ async def log_camping_trip(user_id: int, trip: schemas.CampingTripCreate, db: Se
 @router.get("/users/{user_id}/camping", response_model=list[schemas.CampingTripOut])
 async def get_camping_trips(user_id: int, db: Session = Depends(get_db)):
     """Get user's camping trips."""
-    trips = db.query(models.CampingTrip).filter(
+    trips = camping_trip_rows.query(db).filter(
         models.CampingTrip.user_id == user_id
     ).order_by(models.CampingTrip.visit_date.desc()).all()
-    return trips
+    return camping_trip_rows.response(trips)
 
 # ============ Wildlife Sightings ============
 
@@ -285,6 +504,7 @@ async def log_sighting(user_id: int, sighting: schemas.SightingCreate, db: Sessi
     """Log a wildlife sighting."""
     db_sighting = models.Sighting(user_id=user_id, **sighting.model_dump())
     db.add(db_sighting)
+    WildlifeRollupService.record_sighting(db_sighting, db)
     db.commit()
     db.refresh(db_sighting)
     return db_sighting
@@ -292,10 +512,18 @@ async def log_sighting(user_id: int, sighting: schemas.SightingCreate, db: Sessi
 @router.get("/users/{user_id}/sightings", response_model=list[schemas.SightingOut])
 async def get_sightings(user_id: int, db: Session = Depends(get_db)):
     """Get user's wildlife sightings."""
-    sightings = db.query(models.Sighting).filter(
+    sightings = sighting_rows.query(db).filter(
         models.Sighting.user_id == user_id
     ).order_by(models.Sighting.sighting_date.desc()).all()
-    return sightings
+    return sighting_rows.response(sightings)
+
+@router.get("/parks/{park_id}/wildlife", response_model=schemas.ParkWildlife)
+async def get_park_wildlife(park_id: int, months: int = 3, limit: int = 10, db: Session = Depends(get_db)):
+    """What's being seen in a park lately: top species overall and per month, and hotspots.
+
+    Reads only the rollup tables maintained by log_sighting.
+    """
+    return WildlifeRollupService.park_wildlife(park_id, db, months=min(max(months, 1), 24), limit=limit)
 
 # ============ Park Passport ============
 
@@ -315,6 +543,22 @@ async def get_passport(user_id: int, db: Session = Depends(get_db)):
 
 # ============ User Stats ============
 
+@router.get("/users/{user_id}/timeseries", response_model=schemas.UserTimeseries)
+async def get_user_timeseries(user_id: int, bucket: str = "month", periods: int = 12, metrics: str = None,
+                              end: date = None, db: Session = Depends(get_db)):
+    """Per-week/month/year activity totals for charts, ending with the bucket containing `end` (default today).
+
+    `metrics` is a comma-separated subset of hikes,miles,elevation,minutes,parks.
+    """
+    if bucket not in timeseries.BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(timeseries.BUCKETS)}")
+    metric_list = list(dict.fromkeys(m.strip() for m in metrics.split(","))) if metrics else timeseries.DEFAULT_METRICS
+    unknown = [m for m in metric_list if m not in timeseries.METRICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics: {', '.join(unknown)}")
+    periods = min(max(periods, 1), timeseries.MAX_PERIODS)
+    return FastJSONResponse(timeseries.user_timeseries(user_id, db, bucket, periods, tuple(metric_list), end))
+
 @router.get("/users/{user_id}/stats", response_model=schemas.UserStats)
 async def get_user_stats(user_id: int, db: Session = Depends(get_db)):
     """Get comprehensive user stats."""
@@ -385,7 +629,9 @@ def update_passport(user_id: int, db: Session):
     states = db.query(models.Park.state).filter(models.Park.id.in_([p[0] for p in park_ids])).distinct().count()
     
     # Sum miles hiked
-    miles_hiked = db.query(models.TrailHike).filter(models.TrailHike.user_id == user_id).with_entities(
+    miles_hiked = db.query(models.TrailHike).filter(
+        models.TrailHike.user_id == user_id, models.TrailHike.duplicate_of.is_(None)
+    ).with_entities(
         func.sum(models.TrailHike.distance_miles)
     ).scalar() or 0
     
@@ -452,10 +698,109 @@ async def get_user_challenges(user_id: int, db: Session = Depends(get_db)):
     return challenges
 
 @router.get("/leaderboard", response_model=list[schemas.LeaderboardEntry])
-async def get_leaderboard(sort_by: str = "points", limit: int = 100, db: Session = Depends(get_db)):
-    """Get global leaderboard. sort_by: 'points', 'parks', or 'miles'."""
-    leaderboard = AchievementService.get_leaderboard(limit=limit, sort_by=sort_by, db=db)
-    return [schemas.LeaderboardEntry(**entry) for entry in leaderboard]
+async def get_leaderboard(sort_by: str = "points", limit: int = 100, window: str = "all",
+                          start: date = None, end: date = None, db: Session = Depends(get_db)):
+    """Get global leaderboard. sort_by: 'points', 'parks', 'miles' or 'elevation'.
+
+    `window` ranks activity in the current 'week', 'month' or 'season' instead of
+    all time; `start`/`end` (inclusive dates) give a custom window. In a window,
+    parks_visited counts first visits and total_points the points earned.
+    """
+    if window not in leaderboards.WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(leaderboards.WINDOWS)}")
+    if start or end:
+        leaderboard = leaderboards.window_leaderboard(
+            db, start, end + timedelta(days=1) if end else None, sort_by=sort_by, limit=limit)
+    elif window != "all":
+        leaderboard = leaderboards.window_leaderboard(
+            db, *leaderboards.window_bounds(window), sort_by=sort_by, limit=limit)
+    elif sort_by == "elevation":
+        leaderboard = leaderboards.window_leaderboard(db, None, None, sort_by=sort_by, limit=limit)
+    else:
+        leaderboard = AchievementService.get_leaderboard(limit=limit, sort_by=sort_by, db=db)
+    # Entries are already plain dicts of the response fields; skip re-validation
+    return FastJSONResponse(leaderboard)
+
+@router.get("/users/{user_id}/rank", response_model=schemas.UserRank)
+async def get_user_rank(user_id: int, sort_by: str = "points", db: Session = Depends(get_db)):
+    """A public user's all-time rank and percentile by 'points', 'parks' or 'miles'."""
+    if sort_by not in RANK_METRICS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {', '.join(RANK_METRICS)}")
+    rank = user_rankings.rank(db, user_id, sort_by)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="User not found or profile is private")
+    return FastJSONResponse(dict(rank, user_id=user_id, sort_by=sort_by))
+
+@router.get("/leaderboards/{scope_type}/{value}", response_model=list[schemas.ScopedLeaderboardEntry])
+async def get_scoped_leaderboard(scope_type: str, value: str, sort_by: str = "miles",
+                                 limit: int = Query(100, ge=1, le=scoped.SCOPED_TOP_K),
+                                 db: Session = Depends(get_db)):
+    """Top public users within a park (by id), region or state, by 'miles', 'hikes' or 'parks'.
+
+    Parks count first visits and are not ranked within a single park.
+    """
+    if scope_type not in scoped.SCOPE_TYPES:
+        raise HTTPException(status_code=400, detail=f"scope must be one of {', '.join(scoped.SCOPE_TYPES)}")
+    if sort_by not in scoped.METRICS or (scope_type == "park" and sort_by == "parks"):
+        raise HTTPException(status_code=400, detail="sort_by must be 'miles' or 'hikes'"
+                            + ("" if scope_type == "park" else " or 'parks'"))
+    return FastJSONResponse(scoped_leaderboards.board(
+        db, scoped.scope_key(scope_type, value), sort_by, limit))
+
+# ============ Friends ============
+
+@router.post("/users/{user_id}/friends/{friend_id}", response_model=schemas.FriendOut, status_code=201)
+async def add_friend(user_id: int, friend_id: int, db: Session = Depends(get_db)):
+    """Befriend another user; friendships are mutual."""
+    if user_id == friend_id:
+        raise HTTPException(status_code=400, detail="Users cannot befriend themselves")
+    users = {user.id: user for user in db.query(models.User).filter(models.User.id.in_([user_id, friend_id]))}
+    if len(users) < 2:
+        raise HTTPException(status_code=404, detail="User not found")
+    existing = db.query(models.Friendship).filter(
+        models.Friendship.user_id == user_id, models.Friendship.friend_id == friend_id
+    ).first()
+    if existing is None:
+        existing = models.Friendship(user_id=user_id, friend_id=friend_id)
+        db.add_all([existing, models.Friendship(user_id=friend_id, friend_id=user_id)])
+        db.commit()
+        db.refresh(existing)
+    friend = users[friend_id]
+    return {"user_id": friend.id, "user_name": friend.name, "profile_pic_url": friend.profile_pic_url,
+            "since": existing.created_at}
+
+@router.delete("/users/{user_id}/friends/{friend_id}")
+async def remove_friend(user_id: int, friend_id: int, db: Session = Depends(get_db)):
+    """End a friendship in both directions."""
+    removed = db.query(models.Friendship).filter(
+        ((models.Friendship.user_id == user_id) & (models.Friendship.friend_id == friend_id))
+        | ((models.Friendship.user_id == friend_id) & (models.Friendship.friend_id == user_id))
+    ).delete(synchronize_session=False)
+    if not removed:
+        raise HTTPException(status_code=404, detail="Friendship not found")
+    db.commit()
+    return {"message": "Friend removed"}
+
+@router.get("/users/{user_id}/friends", response_model=list[schemas.FriendOut])
+async def get_friends(user_id: int, db: Session = Depends(get_db)):
+    """A user's friends, most recent first."""
+    rows = db.query(
+        models.User.id, models.User.name, models.User.profile_pic_url, models.Friendship.created_at
+    ).join(models.Friendship, models.Friendship.friend_id == models.User.id).filter(
+        models.Friendship.user_id == user_id
+    ).order_by(models.Friendship.created_at.desc()).all()
+    return [{"user_id": friend_id, "user_name": name, "profile_pic_url": picture, "since": since}
+            for friend_id, name, picture, since in rows]
+
+@router.get("/users/{user_id}/friends/leaderboard", response_model=list[schemas.ScopedLeaderboardEntry])
+async def get_friends_leaderboard(user_id: int, sort_by: str = "miles", db: Session = Depends(get_db)):
+    """The user and their public friends ranked by 'points', 'miles', 'hikes' or 'parks'."""
+    if sort_by not in scoped.FRIEND_METRICS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {', '.join(scoped.FRIEND_METRICS)}")
+    board = scoped_leaderboards.friends(db, user_id, sort_by)
+    if not board:
+        raise HTTPException(status_code=404, detail="User not found")
+    return FastJSONResponse(board)
 
 # ============ Fitness Tracker Integration ============
 
@@ -549,19 +894,18 @@ async def get_public_profile(user_id: int, db: Session = Depends(get_db)):
     ).distinct().count()
     
     miles_hiked = db.query(models.TrailHike).filter(
-        models.TrailHike.user_id == user_id
+        models.TrailHike.user_id == user_id,
+        models.TrailHike.duplicate_of.is_(None)
     ).with_entities(
         func.sum(models.TrailHike.distance_miles)
     ).scalar() or 0
     
-    user_achievements = db.query(models.UserAchievement).filter(
+    badges = db.query(models.Badge).join(
+        models.UserAchievement, models.UserAchievement.badge_id == models.Badge.id
+    ).filter(
         models.UserAchievement.user_id == user_id
     ).all()
     
-    badges = db.query(models.Badge).filter(
-        models.Badge.id.in_([a.badge_id for a in user_achievements])
-    ).all()
-    
     badges_out = [schemas.BadgeOut.model_validate(b) for b in badges]
     
     return schemas.UserProfilePublic(
@@ -595,6 +939,9 @@ async def update_user_profile(user_id: int, name: str = None, bio: str = None,
     
     db.commit()
     db.refresh(user)
+    if is_public is not None:
+        user_rankings.refresh_user(db, user_id)
+        scoped_leaderboards.invalidate()
     return schemas.UserOut.model_validate(user)
 
 # ============ Garmin Integration ============
@@ -636,6 +983,7 @@ async def save_garmin_token(user_id: int, auth_code: str, db: Session = Depends(
     
     access_token = token_data.get("access_token")
     refresh_token = token_data.get("refresh_token")
+    garmin_user_id = token_data.get("user_id") or token_data.get("userId")  # Matches pushed activities
     expires_in = token_data.get("expires_in", 3600)
     token_expires_at = datetime.utcnow() + timedelta(seconds=expires_in)
     
@@ -644,6 +992,7 @@ async def save_garmin_token(user_id: int, auth_code: str, db: Session = Depends(
         garmin_auth.access_token = access_token
         garmin_auth.refresh_token = refresh_token
         garmin_auth.token_expires_at = token_expires_at
+        garmin_auth.garmin_user_id = garmin_user_id or garmin_auth.garmin_user_id
         garmin_auth.connected = True
         garmin_auth.updated_at = datetime.utcnow()
     else:
@@ -652,12 +1001,14 @@ async def save_garmin_token(user_id: int, auth_code: str, db: Session = Depends(
             user_id=user_id,
             access_token=access_token,
             refresh_token=refresh_token,
-            token_expires_at=token_expires_at
+            token_expires_at=token_expires_at,
+            garmin_user_id=garmin_user_id
         )
         db.add(garmin_auth)
     
     db.commit()
     db.refresh(garmin_auth)
+    garmin_tokens.remember(garmin_auth)
     return schemas.GarminAuthOut.model_validate(garmin_auth)
 
 @router.get("/users/{user_id}/garmin/status")
@@ -677,34 +1028,37 @@ async def import_garmin_hikes(user_id: int, limit: int = 50, db: Session = Depen
     """Import hikes from Garmin Connect."""
     from app.garmin_service import garmin_service
     
-    # Get user's Garmin auth
-    garmin_auth = db.query(models.GarminAuth).filter(
-        models.GarminAuth.user_id == user_id
-    ).first()
-    
-    if not garmin_auth or not garmin_auth.connected:
+    # Valid token from the cache, refreshed first if it is about to expire
+    access_token = await garmin_tokens.access_token(db, user_id)
+    if access_token is None:
+        if db.query(models.GarminAuth.id).filter(
+                models.GarminAuth.user_id == user_id, models.GarminAuth.connected.is_(True)).first():
+            raise HTTPException(status_code=401, detail="Garmin authorization expired. Please reconnect.")
         raise HTTPException(status_code=404, detail="Garmin not connected. Please authorize first.")
     
     # Fetch activities from Garmin
-    activities = await garmin_service.get_activities(garmin_auth.access_token, limit=limit)
+    activities = await garmin_service.get_activities(access_token, limit=limit)
     
     # Filter to hiking/running activities
     hiking_activities = garmin_service.filter_hiking_activities(activities)
     
+    # Activity ids already imported for this user, loaded once for the batch
+    imported_ids = garmin_service.imported_activity_ids(
+        notes for (notes,) in db.query(models.TrailHike.notes).filter(
+            models.TrailHike.user_id == user_id,
+            models.TrailHike.fitness_tracker_source == "garmin"
+        )
+    )
+    
     # Import hikes
     imported_count = 0
+    new_hikes = []
+    new_activity_ids = []
     total_distance = 0
     total_elevation = 0
     
     for activity in hiking_activities:
-        # Check if already imported
-        existing = db.query(models.TrailHike).filter(
-            models.TrailHike.user_id == user_id,
-            models.TrailHike.fitness_tracker_source == "garmin",
-            models.TrailHike.notes.contains(activity.get("id"))
-        ).first()
-        
-        if existing:
+        if str(activity.get("id")) in imported_ids:
             continue  # Skip already imported activities
         
         # Convert to hike record
@@ -713,26 +1067,51 @@ async def import_garmin_hikes(user_id: int, limit: int = 50, db: Session = Depen
         if hike_data:
             hike = models.TrailHike(**hike_data)
             db.add(hike)
+            new_hikes.append(hike)
+            new_activity_ids.append(str(activity.get("id")))
+            imported_ids.add(str(activity.get("id")))
             imported_count += 1
             if hike_data.get("distance_miles"):
                 total_distance += hike_data["distance_miles"]
             if hike_data.get("elevation_gain"):
                 total_elevation += hike_data["elevation_gain"]
     
+    db.flush()  # Assigns hike ids; read before the commit expires the hikes
+    counted = DuplicateHikeService.mark_new(db, new_hikes)  # Already logged by hand or from another source
+    ActivityRollupService.record_hikes(counted, db)
+    scope_totals = ScopeStatsService.record_hikes(counted, db)
+    # Update last sync time
+    db.query(models.GarminAuth).filter(models.GarminAuth.user_id == user_id).update(
+        {models.GarminAuth.last_sync: datetime.utcnow()}, synchronize_session=False)
+    imported = [(hike.id, activity_id) for hike, activity_id in zip(new_hikes, new_activity_ids)]
+    counted_miles = sum(hike.distance_miles or 0 for hike in counted)
     db.commit()
+    user_rankings.add(user_id, "miles", counted_miles)
+    scoped_leaderboards.offer(scope_totals)
     
-    # Update last sync time
-    garmin_auth.last_sync = datetime.utcnow()
+    # GPS tracks, fetched after the hikes are committed so no transaction stays open meanwhile
+    tracks = await TrackService.fetch_garmin(imported, user_id, access_token, garmin_service)
+    TrackService.store(db, tracks)
     db.commit()
     
     return {
         "total_activities": len(activities),
         "hiking_activities": len(hiking_activities),
         "imported_hikes": imported_count,
+        "duplicate_hikes": imported_count - len(counted),
+        "tracks_stored": len(tracks),
         "total_distance_miles": round(total_distance, 2),
         "total_elevation_ft": int(total_elevation)
     }
 
+@router.post("/webhooks/garmin/activities")
+async def garmin_activity_push(payload: dict, x_webhook_secret: Optional[str] = Header(None),
+                               db: Session = Depends(get_db)):
+    """Receive Garmin's push that activities are ready; they are queued and imported in the background."""
+    if GARMIN_WEBHOOK_SECRET and not hmac.compare_digest(x_webhook_secret or "", GARMIN_WEBHOOK_SECRET):
+        raise HTTPException(status_code=401, detail="Invalid webhook secret")
+    return activity_ingest.enqueue(db, "garmin", activity_ingest.garmin_pings(payload))
+
 @router.delete("/users/{user_id}/garmin/disconnect")
 async def disconnect_garmin(user_id: int, db: Session = Depends(get_db)):
     """Disconnect Garmin account from user profile."""
@@ -745,6 +1124,7 @@ async def disconnect_garmin(user_id: int, db: Session = Depends(get_db)):
     
     garmin_auth.connected = False
     db.commit()
+    garmin_tokens.forget(user_id)
     
     return {"message": "Garmin account disconnected"}
 
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 class UserBase(BaseModel):
     name: str
@@ -53,6 +53,19 @@ class VisitOut(VisitCreate):
     photos_count: int
     created_at: datetime
 
+class ParkStatsOut(BaseModel):
+    visit_count: int
+    camping_trip_count: int
+    hike_count: int
+    rating_count: int
+    average_rating: Optional[float] = None
+    rating_histogram: dict[str, int]  # "1".."5" stars -> count
+    visits_by_month: List[int]  # Jan..Dec
+    median_hike_minutes: Optional[float] = None
+
+class ParkDetail(ParkOut):
+    stats: ParkStatsOut
+
 class TrailBase(BaseModel):
     park_id: int
     name: str
@@ -70,11 +83,22 @@ class TrailOut(TrailBase):
     id: int
     created_at: datetime
 
+class TrailStatsOut(BaseModel):
+    hike_count: int
+    hikes_by_month: List[int]  # Jan..Dec
+    median_duration_minutes: Optional[float] = None  # Approximate (quantile sketch)
+    p90_duration_minutes: Optional[float] = None
+
+class TrailWithStats(TrailOut):
+    stats: TrailStatsOut
+
+MAX_HIKE_MILES = 5000  # Longer than any thru-hike logged in one go
+
 class TrailHikeCreate(BaseModel):
     trail_id: int
     hike_date: datetime
     duration_minutes: int
-    distance_miles: Optional[float] = None
+    distance_miles: Optional[float] = Field(None, ge=0, le=MAX_HIKE_MILES)
     elevation_gain: Optional[int] = None
     calories: Optional[int] = None
     avg_pace: Optional[str] = None
@@ -84,6 +108,9 @@ class TrailHikeCreate(BaseModel):
 
 class TrailHikeOut(TrailHikeCreate):
     model_config = ConfigDict(from_attributes=True)
+    trail_id: Optional[int] = None  # Imported activities aren't matched to a trail
+    distance_miles: Optional[float] = None  # Stored hikes are returned as they are
+    duplicate_of: Optional[int] = None  # Same outing as that hike from another source; not counted
     id: int
     user_id: int
     created_at: datetime
@@ -243,6 +270,31 @@ class LeaderboardEntry(BaseModel):
     miles_hiked: float
     total_points: int
     rank: int
+    elevation_gain: Optional[int] = None  # Time-windowed leaderboards only
+
+class ScopedLeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    user_name: str
+    profile_pic_url: Optional[str] = None
+    total_points: int
+    miles_hiked: float
+    hikes: int
+    parks_visited: int
+
+class FriendOut(BaseModel):
+    user_id: int
+    user_name: str
+    profile_pic_url: Optional[str] = None
+    since: datetime
+
+class UserRank(BaseModel):
+    user_id: int
+    sort_by: str
+    score: float
+    rank: int  # 1-based; users with the same score share a rank
+    total: int  # Public users ranked
+    percentile: float  # Share of other users ranked at or below this one
 # Garmin Integration
 class GarminAuthOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -268,4 +320,47 @@ class GarminImportStats(BaseModel):
     imported_hikes: int
     skipped_activities: int
     total_distance: float
-    total_elevation: int
\ No newline at end of file
+    total_elevation: int
+# Search
+class SearchResult(BaseModel):
+    type: str  # park/trail/campsite/visit/hike/sighting
+    id: int
+    park_id: Optional[int] = None
+    title: str
+    snippet: str  # body excerpt with matches wrapped in <mark>
+    score: float
+
+class SearchResults(BaseModel):
+    query: str
+    results: List[SearchResult]
+    limit: int
+    offset: int
+    has_more: bool
+
+# Wildlife rollups
+class SpeciesCount(BaseModel):
+    species: str
+    count: int
+
+class MonthlySpecies(BaseModel):
+    month: str  # "YYYY-MM"
+    species: List[SpeciesCount]
+
+class WildlifeHotspot(BaseModel):
+    location: str
+    count: int
+
+class ParkWildlife(BaseModel):
+    park_id: int
+    months: List[str]
+    total_sightings: int
+    top_species: List[SpeciesCount]
+    by_month: List[MonthlySpecies]
+    hotspots: List[WildlifeHotspot]
+
+# Activity time series
+class UserTimeseries(BaseModel):
+    user_id: int
+    bucket: str  # "week", "month" or "year"
+    buckets: List[str]  # ISO start date of each bucket, oldest first
+    series: Dict[str, List[float]]  # metric -> one value per bucket
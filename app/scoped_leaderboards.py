@@ -0,0 +1,292 @@
+"""Leaderboards scoped to a park, region or state, and among friends.
+
+Every hike adds its miles to the hiker's row in `user_scope_stats` for each
+scope it counts in: "all", "park:<id>", "region:<name>" and "state:<code>"
+(names lower-cased). A first visit to a park adds one to `parks` in the
+all, region and state scopes. Both are upserts in the caller's transaction,
+so ranking a scope reads one indexed row per user instead of grouping
+trail_hikes and visits.
+
+On top of that, each process keeps the best SCOPED_TOP_K users of every
+(scope, metric) it has served in a `TopK` list and feeds it the totals the
+upserts return. Scores only grow, so a user outside a full list can only
+enter it by passing its last entry, and the list stays exact without
+re-reading the table; serving a board is a slice. Like the rank trees in
+app/ranking.py, the lists miss other workers' writes and are reloaded after
+RANKING_MAX_AGE_SECONDS.
+
+Friend leaderboards merge the friends' "all" rows, which needs no grouping
+either.
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy.orm import Session
+from app import models
+from app.database import dialect_insert
+from config import RANKING_MAX_AGE_SECONDS
+
+SCOPE_TYPES = ("park", "region", "state")
+METRICS = ("miles", "hikes", "parks")
+FRIEND_METRICS = ("points",) + METRICS
+SCOPED_TOP_K = 200
+
+
+def scope_key(scope_type: str, value) -> str:
+    return f"{scope_type}:{str(value).strip().lower()}"
+
+
+def park_scopes(park_id: Optional[int], region: Optional[str], state: Optional[str]) -> list:
+    """The scopes activity in a park counts in, always starting with "all"."""
+    scopes = ["all"]
+    if park_id is not None:
+        scopes.append(scope_key("park", park_id))
+    if region:
+        scopes.append(scope_key("region", region))
+    if state:
+        scopes.append(scope_key("state", state))
+    return scopes
+
+
+class ScopeStatsService:
+    """Maintains `user_scope_stats`. Callers commit writes and pass the returned totals to
+    `scoped_leaderboards.offer` afterwards."""
+
+    @staticmethod
+    def _upsert(db: Session, deltas: dict) -> list:
+        """Add {(scope, user_id): {metric: value}}; returns the new (scope, user_id, miles, hikes, parks)."""
+        if not deltas:
+            return []
+        insert = dialect_insert(db)
+        table = models.UserScopeStats.__table__
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["scope", "user_id"],
+            set_={name: table.c[name] + stmt.excluded[name] for name in METRICS},
+        ).returning(table.c.scope, table.c.user_id, table.c.miles, table.c.hikes, table.c.parks)
+        return [tuple(row) for row in db.execute(stmt, [
+            dict(dict.fromkeys(METRICS, 0), scope=scope, user_id=user_id, **values)
+            for (scope, user_id), values in deltas.items()
+        ])]
+
+    @staticmethod
+    def _park_scopes(db: Session, park_ids: set) -> dict:
+        rows = db.query(models.Park.id, models.Park.region, models.Park.state).filter(
+            models.Park.id.in_(park_ids)) if park_ids else []
+        return {park_id: park_scopes(park_id, region, state) for park_id, region, state in rows}
+
+    @staticmethod
+    def record_hikes(hikes: list, db: Session) -> list:
+        """Count hikes in "all" and in their trail's park, region and state."""
+        trail_ids = {hike.trail_id for hike in hikes if hike.trail_id is not None}
+        rows = db.query(models.Trail.id, models.Park.id, models.Park.region, models.Park.state).join(
+            models.Park, models.Park.id == models.Trail.park_id
+        ).filter(models.Trail.id.in_(trail_ids)) if trail_ids else []
+        scopes_by_trail = {trail_id: park_scopes(park_id, region, state) for trail_id, park_id, region, state in rows}
+        deltas = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+        for hike in hikes:
+            for scope in scopes_by_trail.get(hike.trail_id, ["all"]):
+                totals = deltas[(scope, hike.user_id)]
+                totals["hikes"] += 1
+                totals["miles"] += hike.distance_miles or 0
+        return ScopeStatsService._upsert(db, deltas)
+
+    @staticmethod
+    def record_hike(hike: models.TrailHike, db: Session) -> list:
+        return ScopeStatsService.record_hikes([hike], db)
+
+    @staticmethod
+    def record_first_visit(visit: models.Visit, db: Session) -> list:
+        """Count a user's first visit to a park in "all" and the park's region and state."""
+        scopes = ScopeStatsService._park_scopes(db, {visit.park_id}).get(visit.park_id, ["all"])
+        return ScopeStatsService._upsert(db, {
+            (scope, visit.user_id): {"parks": 1} for scope in scopes if not scope.startswith("park:")
+        })
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """Recompute every scope from hikes and visits; returns the number of rows written."""
+        scopes_by_park = ScopeStatsService._park_scopes(
+            db, {park_id for (park_id,) in db.query(models.Park.id)})
+        trail_parks = dict(db.query(models.Trail.id, models.Trail.park_id))
+        deltas = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+        for user_id, trail_id, miles in db.query(
+            models.TrailHike.user_id, models.TrailHike.trail_id, models.TrailHike.distance_miles
+        ).filter(models.TrailHike.duplicate_of.is_(None)).yield_per(5000):
+            for scope in scopes_by_park.get(trail_parks.get(trail_id), ["all"]):
+                totals = deltas[(scope, user_id)]
+                totals["hikes"] += 1
+                totals["miles"] += miles or 0
+        for user_id, park_id in db.query(models.Visit.user_id, models.Visit.park_id).filter(
+            models.Visit.visited == True, models.Visit.park_id.isnot(None)
+        ).distinct():
+            for scope in scopes_by_park.get(park_id, ["all"]):
+                if not scope.startswith("park:"):
+                    deltas[(scope, user_id)]["parks"] += 1
+
+        db.query(models.UserScopeStats).delete()
+        if deltas:
+            db.execute(models.UserScopeStats.__table__.insert(), [
+                dict(values, scope=scope, user_id=user_id) for (scope, user_id), values in deltas.items()
+            ])
+        db.commit()
+        return len(deltas)
+
+
+class TopK:
+    """The best `k` (user_id, score) pairs of one scope and metric, for scores that only grow.
+
+    `complete` means no other user has a row in the scope, so a short list is the whole board.
+    """
+
+    def __init__(self, k: int, rows: list, complete: bool):
+        self.k = k
+        self.complete = complete
+        self.scores = {}
+        self.entries = []  # (-score, user_id), best first; ties by user id
+        for user_id, score in rows:
+            self.scores[user_id] = score
+            self.entries.append((-score, user_id))
+        self.entries.sort()
+
+    def offer(self, user_id: int, score: float):
+        old = self.scores.get(user_id)
+        if old is not None:
+            del self.entries[bisect.bisect_left(self.entries, (-old, user_id))]
+        elif len(self.entries) >= self.k:
+            if (-score, user_id) >= self.entries[-1]:
+                return
+            _, dropped = self.entries.pop()
+            del self.scores[dropped]
+            self.complete = False
+        elif not self.complete and (not self.entries or (-score, user_id) >= self.entries[-1]):
+            return  # Users below the list may be ahead of this one
+        self.scores[user_id] = score
+        bisect.insort(self.entries, (-score, user_id))
+
+    def discard(self, user_id: int):
+        score = self.scores.pop(user_id, None)
+        if score is not None:
+            del self.entries[bisect.bisect_left(self.entries, (-score, user_id))]
+
+    def top(self, limit: int) -> list:
+        return [(user_id, -negated) for negated, user_id in self.entries[:limit]]
+
+
+class ScopedLeaderboards:
+    """Lazily loaded TopK lists per (scope, metric), over public users."""
+
+    def __init__(self, k: int = SCOPED_TOP_K, max_age: float = RANKING_MAX_AGE_SECONDS):
+        self.k = k
+        self.max_age = max_age
+        self._lists = {}  # (scope, metric) -> (TopK, loaded_at)
+        self._lock = threading.RLock()
+
+    def _load(self, db: Session, scope: str, metric: str) -> TopK:
+        stats = models.UserScopeStats
+        column = stats.__table__.c[metric]
+        rows = db.query(stats.user_id, column).join(
+            models.User, models.User.id == stats.user_id
+        ).filter(
+            stats.scope == scope, models.User.is_public == True, column > 0
+        ).order_by(column.desc(), stats.user_id).limit(self.k + 1).all()
+        top = TopK(self.k, [(user_id, score) for user_id, score in rows[:self.k]], len(rows) <= self.k)
+        with self._lock:
+            self._lists[(scope, metric)] = (top, time.monotonic())
+        return top
+
+    def _current(self, db: Session, scope: str, metric: str, limit: int) -> TopK:
+        cached = self._lists.get((scope, metric))
+        if cached is not None:
+            top, loaded_at = cached
+            fresh = time.monotonic() - loaded_at <= self.max_age
+            if fresh and (top.complete or len(top.entries) >= limit):
+                return top
+        return self._load(db, scope, metric)
+
+    def board(self, db: Session, scope: str, metric: str = "miles", limit: int = 100) -> list:
+        """The top `limit` (at most k) public users of a scope, as leaderboard entries."""
+        limit = min(limit, self.k)
+        top = self._current(db, scope, metric, limit)
+        with self._lock:
+            ranked = top.top(limit)
+        if not ranked:
+            return []
+        stats = models.UserScopeStats
+        rows = db.query(
+            models.User.id, models.User.name, models.User.profile_pic_url, models.User.total_points,
+            models.User.is_public, stats.miles, stats.hikes, stats.parks,
+        ).join(stats, stats.user_id == models.User.id).filter(
+            stats.scope == scope, models.User.id.in_([user_id for user_id, _ in ranked])
+        )
+        by_user = {row[0]: row for row in rows}
+        hidden = [user_id for user_id, _ in ranked if user_id not in by_user or not by_user[user_id][4]]
+        if hidden:  # Went private since the list was loaded
+            with self._lock:
+                for user_id in hidden:
+                    top.discard(user_id)
+            return self.board(db, scope, metric, limit)
+        return [
+            {
+                "rank": rank,
+                "user_id": user_id,
+                "user_name": by_user[user_id][1],
+                "profile_pic_url": by_user[user_id][2],
+                "total_points": by_user[user_id][3] or 0,
+                "miles_hiked": round(float(by_user[user_id][5] or 0), 2),
+                "hikes": by_user[user_id][6] or 0,
+                "parks_visited": by_user[user_id][7] or 0,
+            }
+            for rank, (user_id, _) in enumerate(ranked, 1)
+        ]
+
+    def offer(self, rows: list):
+        """Feed committed totals, as returned by ScopeStatsService, to the loaded lists."""
+        if not rows or not self._lists:
+            return
+        with self._lock:
+            for scope, user_id, miles, hikes, parks in rows:
+                for metric, score in (("miles", miles), ("hikes", hikes), ("parks", parks)):
+                    cached = self._lists.get((scope, metric))
+                    if cached is not None and score:
+                        cached[0].offer(user_id, score)
+
+    def invalidate(self):
+        """Drop every list, e.g. after a user becomes public again."""
+        with self._lock:
+            self._lists.clear()
+
+    @staticmethod
+    def friends(db: Session, user_id: int, metric: str = "miles") -> list:
+        """The user and their public friends ranked by their all-time totals."""
+        members = [user_id] + [friend_id for (friend_id,) in db.query(models.Friendship.friend_id).filter(
+            models.Friendship.user_id == user_id)]
+        stats = models.UserScopeStats
+        rows = db.query(
+            models.User.id, models.User.name, models.User.profile_pic_url, models.User.total_points,
+            stats.miles, stats.hikes, stats.parks,
+        ).outerjoin(stats, (stats.user_id == models.User.id) & (stats.scope == "all")).filter(
+            models.User.id.in_(members), (models.User.id == user_id) | (models.User.is_public == True)
+        ).all()
+        entries = [
+            {
+                "user_id": member_id,
+                "user_name": name,
+                "profile_pic_url": picture,
+                "total_points": points or 0,
+                "miles_hiked": round(float(miles or 0), 2),
+                "hikes": hikes or 0,
+                "parks_visited": parks or 0,
+            }
+            for member_id, name, picture, points, miles, hikes, parks in rows
+        ]
+        key = {"points": "total_points", "miles": "miles_hiked", "hikes": "hikes", "parks": "parks_visited"}[metric]
+        entries.sort(key=lambda entry: (-entry[key], entry["user_id"]))
+        for rank, entry in enumerate(entries, 1):
+            entry["rank"] = rank
+        return entries
+
+
+scoped_leaderboards = ScopedLeaderboards()
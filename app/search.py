@@ -0,0 +1,330 @@
+"""Full-text search over parks, trails, campsites and users' own notes.
+
+Documents live in one index table that is kept in sync with the source rows
+by a session `after_flush` hook, so every ORM insert, update or delete of an
+indexed model updates the index in the same transaction (one statement per
+flush). Rows written with bulk Core inserts bypass the hook; run `scripts/rebuild_search_index.py` after a
+bulk load.
+
+SQLite uses an FTS5 virtual table. Each document carries a `scope` column
+holding owner and owner+type tokens (`pub pubpark` for a park, `u42 u42hike`
+for user 42's hike notes), so filtering by owner and type is part of the
+MATCH and is answered from the inverted index rather than by scanning
+matches. FTS5's built-in bm25() is not used for ranking: it computes IDF by
+walking every matching term's full doclist, which makes a common word cost
+tens of milliseconds over millions of notes even when only a handful of the
+caller's documents match. Instead the newest MAX_CANDIDATES matches are
+fetched with highlight markers and scored in Python with BM25's length-
+normalized term frequency (title weighted above body). PostgreSQL uses a
+regular table with a weighted tsvector, a GIN index and ts_rank_cd.
+"""
+import re
+from typing import Optional
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+from app import models
+from app.database import Base
+
+SQLITE_TABLE = "search_index"
+POSTGRES_TABLE = "search_documents"
+MAX_LIMIT = 100
+MAX_CANDIDATES = 1000  # SQLite: matches ranked per query, newest first
+REBUILD_BATCH = 5000
+
+_TERM = re.compile(r"\w+\*?", re.UNICODE)
+
+# BM25 term-frequency saturation and length normalization; column weights
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 4.0
+BODY_WEIGHT = 1.0
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+
+def _join(*parts) -> str:
+    return " ".join(p for p in parts if p)
+
+
+# doc_type -> (model, rowid type code, indexed attributes, extractor)
+# The extractor maps a row to (title, body, park_id, user_id); user_id is None
+# for public documents.
+DOCUMENT_TYPES = {
+    "park": (models.Park, 1, ("name", "description", "state", "region"),
+             lambda r: (r.name, _join(r.description, r.state, r.region), r.id, None)),
+    "trail": (models.Trail, 2, ("name", "description", "park_id"),
+              lambda r: (r.name, r.description, r.park_id, None)),
+    "campsite": (models.Campsite, 3, ("name", "description", "park_id"),
+                 lambda r: (r.name, r.description, r.park_id, None)),
+    "visit": (models.Visit, 4, ("highlights", "notes", "park_id", "user_id"),
+              lambda r: ("", _join(r.highlights, r.notes), r.park_id, r.user_id)),
+    "hike": (models.TrailHike, 5, ("notes", "user_id"),
+             lambda r: ("", r.notes, None, r.user_id)),
+    "sighting": (models.Sighting, 6, ("wildlife", "location", "notes", "park_id", "user_id"),
+                 lambda r: (r.wildlife, _join(r.location, r.notes), r.park_id, r.user_id)),
+}
+TYPE_BITS = 3  # rowid = doc_id << TYPE_BITS | code
+_TYPES_BY_MODEL = {spec[0]: (doc_type, spec) for doc_type, spec in DOCUMENT_TYPES.items()}
+_TYPES_BY_CODE = {spec[1]: doc_type for doc_type, spec in DOCUMENT_TYPES.items()}
+
+
+def parse_terms(query: str) -> list:
+    """Split user input into search terms; a trailing `*` marks a prefix term."""
+    return _TERM.findall(query or "")[:16]
+
+
+def _snippet(marked: str, words: int = 16) -> str:
+    """Excerpt of a highlight()-marked body around its first match, with <mark> tags."""
+    tokens = marked.split()
+    first = next((i for i, tok in enumerate(tokens) if _MARK_START in tok), 0)
+    start = max(0, min(first - 3, len(tokens) - words))
+    excerpt = " ".join(tokens[start:start + words])
+    if start > 0:
+        excerpt = "…" + excerpt
+    if start + words < len(tokens):
+        excerpt += "…"
+    return excerpt.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+class SearchIndex:
+    """Dialect-aware full-text index with ranked, paginated queries."""
+
+    # ---- schema ----
+
+    def create(self, connection):
+        """Create the index table if it does not exist."""
+        if connection.dialect.name == "postgresql":
+            connection.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} (
+                    id BIGINT PRIMARY KEY,
+                    doc_type VARCHAR(16) NOT NULL,
+                    doc_id INTEGER NOT NULL,
+                    park_id INTEGER,
+                    user_id INTEGER,
+                    title TEXT NOT NULL DEFAULT '',
+                    body TEXT NOT NULL DEFAULT '',
+                    tsv tsvector GENERATED ALWAYS AS (
+                        setweight(to_tsvector('english', title), 'A') ||
+                        setweight(to_tsvector('english', body), 'B')
+                    ) STORED
+                )"""))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{POSTGRES_TABLE}_tsv ON {POSTGRES_TABLE} USING GIN (tsv)"))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{POSTGRES_TABLE}_user ON {POSTGRES_TABLE} (user_id, doc_type)"))
+        else:
+            exists = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": SQLITE_TABLE}).first()
+            if exists:
+                return
+            connection.execute(text(f"""
+                CREATE VIRTUAL TABLE {SQLITE_TABLE} USING fts5(
+                    scope, title, body, park_id UNINDEXED,
+                    tokenize = 'porter unicode61'
+                )"""))
+
+    # ---- writes ----
+
+    def index(self, connection, targets: list):
+        """Insert or replace the documents for ORM instances."""
+        rows = []
+        for target in targets:
+            doc_type, (_, code, _, extract) = _TYPES_BY_MODEL[type(target)]
+            rows.append(self._row(doc_type, code, target.id, *extract(target)))
+        self._write(connection, rows)
+
+    def remove(self, connection, targets: list):
+        if not targets:
+            return
+        table = POSTGRES_TABLE if connection.dialect.name == "postgresql" else SQLITE_TABLE
+        pk = "id" if connection.dialect.name == "postgresql" else "rowid"
+        connection.execute(text(f"DELETE FROM {table} WHERE {pk} = :id"), [
+            {"id": target.id << TYPE_BITS | _TYPES_BY_MODEL[type(target)][1][1]} for target in targets
+        ])
+
+    @staticmethod
+    def _row(doc_type, code, doc_id, title, body, park_id, user_id) -> dict:
+        owner = "pub" if user_id is None else f"u{user_id}"
+        return {
+            "id": doc_id << TYPE_BITS | code,
+            "doc_type": doc_type,
+            "doc_id": doc_id,
+            "park_id": park_id,
+            "user_id": user_id,
+            "scope": f"{owner} {owner}{doc_type}",
+            "title": title or "",
+            "body": body or "",
+        }
+
+    def _write(self, connection, rows: list):
+        if not rows:
+            return
+        if connection.dialect.name == "postgresql":
+            connection.execute(text(f"""
+                INSERT INTO {POSTGRES_TABLE} (id, doc_type, doc_id, park_id, user_id, title, body)
+                VALUES (:id, :doc_type, :doc_id, :park_id, :user_id, :title, :body)
+                ON CONFLICT (id) DO UPDATE SET park_id = EXCLUDED.park_id, user_id = EXCLUDED.user_id,
+                    title = EXCLUDED.title, body = EXCLUDED.body"""), rows)
+        else:
+            connection.execute(text(f"""
+                INSERT OR REPLACE INTO {SQLITE_TABLE} (rowid, scope, title, body, park_id)
+                VALUES (:id, :scope, :title, :body, :park_id)"""), rows)
+
+    def rebuild(self, db: Session) -> dict:
+        """Re-index every document from the source tables. Returns counts per type."""
+        connection = db.connection()
+        self.create(connection)
+        postgres = connection.dialect.name == "postgresql"
+        connection.execute(text(f"DELETE FROM {POSTGRES_TABLE if postgres else SQLITE_TABLE}"))
+
+        counts = {}
+        for doc_type, (model, code, attrs, extract) in DOCUMENT_TYPES.items():
+            columns = [model.id] + [getattr(model, a) for a in set(attrs) | {"user_id", "park_id"}
+                                    if hasattr(model, a)]
+            counts[doc_type] = 0
+            batch = []
+            for row in db.query(*columns).yield_per(REBUILD_BATCH):
+                batch.append(self._row(doc_type, code, row.id, *extract(row)))
+                if len(batch) >= REBUILD_BATCH:
+                    self._write(connection, batch)
+                    counts[doc_type] += len(batch)
+                    batch = []
+            self._write(connection, batch)
+            counts[doc_type] += len(batch)
+
+        if not postgres:
+            connection.execute(text(f"INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}) VALUES ('optimize')"))
+        db.commit()
+        return counts
+
+    def is_empty(self, db: Session) -> bool:
+        table = POSTGRES_TABLE if db.get_bind().dialect.name == "postgresql" else SQLITE_TABLE
+        return db.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first() is None
+
+    # ---- queries ----
+
+    def search(self, db: Session, query: str, user_id: Optional[int] = None,
+               types: Optional[list] = None, limit: int = 20, offset: int = 0) -> dict:
+        """Ranked search over public documents plus `user_id`'s own notes.
+
+        Terms are ANDed; a trailing `*` makes a prefix term. Fetches one row
+        beyond `limit` to report `has_more` without counting every match.
+        """
+        terms = parse_terms(query)
+        limit = max(1, min(limit, MAX_LIMIT))
+        offset = max(0, offset)
+        types = [t for t in (types or []) if t in DOCUMENT_TYPES]
+        page = {"query": query, "results": [], "limit": limit, "offset": offset, "has_more": False}
+        if not terms:
+            return page
+
+        if db.get_bind().dialect.name == "postgresql":
+            results = self._search_postgres(db, terms, user_id, types, limit + 1, offset)
+        else:
+            results = self._search_sqlite(db, terms, user_id, types, limit + 1, offset)
+        page["has_more"] = len(results) > limit
+        page["results"] = results[:limit]
+        return page
+
+    @staticmethod
+    def _search_sqlite(db, terms, user_id, types, limit, offset) -> list:
+        owners = ["pub"] if user_id is None else ["pub", f"u{int(user_id)}"]
+        scopes = [owner + t for owner in owners for t in types] if types else owners
+        phrases = " AND ".join(f'"{t[:-1]}"*' if t.endswith("*") else f'"{t}"' for t in terms)
+        match = f"scope : ({' OR '.join(scopes)}) AND {{title body}} : ({phrases})"
+        rows = db.execute(text(f"""
+            SELECT rowid, park_id, title,
+                   highlight({SQLITE_TABLE}, 1, :start, :end),
+                   highlight({SQLITE_TABLE}, 2, :start, :end)
+            FROM {SQLITE_TABLE}
+            WHERE {SQLITE_TABLE} MATCH :match
+            ORDER BY rowid DESC
+            LIMIT :cap"""),
+            {"match": match, "start": _MARK_START, "end": _MARK_END, "cap": MAX_CANDIDATES}).all()
+        if not rows:
+            return []
+
+        # Word counts approximated by spaces; good enough for length normalization
+        title_lengths = [r[2].count(" ") + 1 for r in rows]
+        body_lengths = [r[4].count(" ") + 1 for r in rows]
+        avg_title = sum(title_lengths) / len(rows)
+        avg_body = sum(body_lengths) / len(rows)
+        k1, b = BM25_K1, BM25_B
+
+        scored = []
+        for r, title_len, body_len in zip(rows, title_lengths, body_lengths):
+            score = 0.0
+            tf = r[3].count(_MARK_START)
+            if tf:
+                score += TITLE_WEIGHT * tf * (k1 + 1) / (tf + k1 * (1 - b + b * title_len / avg_title))
+            tf = r[4].count(_MARK_START)
+            if tf:
+                score += BODY_WEIGHT * tf * (k1 + 1) / (tf + k1 * (1 - b + b * body_len / avg_body))
+            scored.append((score, r))
+        scored.sort(key=lambda item: item[0], reverse=True)  # stable: ties stay newest first
+
+        type_mask = (1 << TYPE_BITS) - 1
+        return [
+            {
+                "type": _TYPES_BY_CODE[r[0] & type_mask],
+                "id": r[0] >> TYPE_BITS,
+                "park_id": r[1],
+                "title": r[2],
+                "snippet": _snippet(r[4]),
+                "score": round(score, 4),
+            }
+            for score, r in scored[offset:offset + limit]
+        ]
+
+    @staticmethod
+    def _search_postgres(db, terms, user_id, types, limit, offset) -> list:
+        tsquery = " & ".join(f"{t[:-1]}:*" if t.endswith("*") else t for t in terms)
+        filters = "user_id IS NULL" if user_id is None else "(user_id IS NULL OR user_id = :user_id)"
+        if types:
+            filters += " AND doc_type = ANY(:types)"
+        rows = db.execute(text(f"""
+            SELECT doc_type, doc_id, park_id, title,
+                   ts_headline('english', body, q,
+                               'StartSel=<mark>, StopSel=</mark>, MaxWords=24, MinWords=8') AS snippet,
+                   ts_rank_cd(tsv, q) AS score
+            FROM {POSTGRES_TABLE}, to_tsquery('english', :tsquery) AS q
+            WHERE tsv @@ q AND {filters}
+            ORDER BY score DESC, id
+            LIMIT :limit OFFSET :offset"""),
+            {"tsquery": tsquery, "user_id": user_id, "types": types, "limit": limit, "offset": offset})
+        return [
+            {"type": r.doc_type, "id": r.doc_id, "park_id": r.park_id, "title": r.title,
+             "snippet": r.snippet, "score": round(float(r.score), 4)}
+            for r in rows
+        ]
+
+
+# Default index
+search_index = SearchIndex()
+
+
+# ---- keep the index in sync ----
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_search_index(target, connection, **kw):
+    search_index.create(connection)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_search_index(session, flush_context):
+    """Write index changes for the flushed rows in one statement per kind."""
+    upserts, deletes = [], []
+    for target in session.new:
+        if type(target) in _TYPES_BY_MODEL:
+            upserts.append(target)
+    for target in session.dirty:
+        spec = _TYPES_BY_MODEL.get(type(target))
+        if spec and any(
+                inspect(target).attrs[a].history.has_changes() for a in spec[1][2]):
+            upserts.append(target)
+    for target in session.deleted:
+        if type(target) in _TYPES_BY_MODEL:
+            deletes.append(target)
+    if upserts or deletes:
+        connection = session.connection()
+        search_index.index(connection, upserts)
+        search_index.remove(connection, deletes)
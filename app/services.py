@@ -3,6 +3,8 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import func, distinct
 from app import models
+from app.activity import ActivityRollupService
+from app.ranking import user_rankings
 
 class AchievementService:
     """Service for managing badges, points, and achievements."""
@@ -13,7 +15,9 @@ class AchievementService:
         user = db.query(models.User).filter(models.User.id == user_id).first()
         if user:
             user.total_points += value
+            ActivityRollupService.record_points(user_id, value, db)
             db.commit()
+            user_rankings.add(user_id, "points", value)
             return user.total_points
 
     @staticmethod
@@ -56,7 +60,8 @@ class AchievementService:
             
             elif badge.criteria == "hike_100_miles":
                 total_miles = db.query(models.TrailHike).filter(
-                    models.TrailHike.user_id == user_id
+                    models.TrailHike.user_id == user_id,
+                    models.TrailHike.duplicate_of.is_(None)
                 ).with_entities(
                     func.sum(models.TrailHike.distance_miles)
                 ).scalar() or 0
@@ -66,7 +71,8 @@ class AchievementService:
             
             elif badge.criteria == "hike_50k_elevation":
                 total_elevation = db.query(models.TrailHike).filter(
-                    models.TrailHike.user_id == user_id
+                    models.TrailHike.user_id == user_id,
+                    models.TrailHike.duplicate_of.is_(None)
                 ).with_entities(
                     func.sum(models.TrailHike.elevation_gain)
                 ).scalar() or 0
@@ -151,21 +157,19 @@ class AchievementService:
     @staticmethod
     def get_user_achievements(user_id: int, db: Session) -> dict:
         """Get all achievements for a user."""
-        achievements = db.query(models.UserAchievement).filter(
+        badges = db.query(models.Badge).join(
+            models.UserAchievement, models.UserAchievement.badge_id == models.Badge.id
+        ).filter(
             models.UserAchievement.user_id == user_id
         ).all()
         
-        badges = db.query(models.Badge).filter(
-            models.Badge.id.in_([a.badge_id for a in achievements])
-        ).all()
-        
         streaks = db.query(models.Streak).filter(
             models.Streak.user_id == user_id
         ).all()
         
         return {
             "badges": badges,
-            "badge_count": len(achievements),
+            "badge_count": len(badges),
             "streaks": streaks
         }
 
@@ -181,11 +185,16 @@ class AchievementService:
             models.Challenge.end_date >= now
         ).all()
         
-        for challenge in active_challenges:
-            user_challenge = db.query(models.UserChallenge).filter(
+        # Load the user's rows for all active challenges in one query
+        user_challenges = {
+            uc.challenge_id: uc for uc in db.query(models.UserChallenge).filter(
                 models.UserChallenge.user_id == user_id,
-                models.UserChallenge.challenge_id == challenge.id
-            ).first()
+                models.UserChallenge.challenge_id.in_([c.id for c in active_challenges])
+            )
+        }
+        
+        for challenge in active_challenges:
+            user_challenge = user_challenges.get(challenge.id)
             
             if not user_challenge:
                 user_challenge = models.UserChallenge(
@@ -207,7 +216,8 @@ class AchievementService:
             elif challenge.challenge_type == "hike_miles":
                 progress = int(db.query(models.TrailHike).filter(
                     models.TrailHike.user_id == user_id,
-                    models.TrailHike.hike_date >= challenge.start_date
+                    models.TrailHike.hike_date >= challenge.start_date,
+                    models.TrailHike.duplicate_of.is_(None)
                 ).with_entities(
                     func.sum(models.TrailHike.distance_miles)
                 ).scalar() or 0)
@@ -215,7 +225,8 @@ class AchievementService:
             elif challenge.challenge_type == "elevation":
                 progress = int(db.query(models.TrailHike).filter(
                     models.TrailHike.user_id == user_id,
-                    models.TrailHike.hike_date >= challenge.start_date
+                    models.TrailHike.hike_date >= challenge.start_date,
+                    models.TrailHike.duplicate_of.is_(None)
                 ).with_entities(
                     func.sum(models.TrailHike.elevation_gain)
                 ).scalar() or 0)
@@ -257,7 +268,8 @@ class AchievementService:
         ).outerjoin(
             models.Visit, models.Visit.user_id == models.User.id
         ).outerjoin(
-            models.TrailHike, models.TrailHike.user_id == models.User.id
+            models.TrailHike,
+            (models.TrailHike.user_id == models.User.id) & models.TrailHike.duplicate_of.is_(None)
         ).filter(
             models.User.is_public == True
         ).group_by(
@@ -0,0 +1,69 @@
+"""Mergeable quantile sketch with bounded relative error.
+
+Values are counted in logarithmic buckets whose width is set by the target
+relative accuracy (the DDSketch scheme), so any quantile estimate is within
+`relative_accuracy` of the true value while the sketch stays a few hundred
+bytes. Sketches are stored as JSON in aggregate rows and updated in place.
+"""
+import json
+import math
+from typing import Optional
+
+DEFAULT_RELATIVE_ACCURACY = 0.02
+
+
+class QuantileSketch:
+    """Log-bucketed counts of positive values plus a count of zeros."""
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        if value is None or value < 0:
+            return
+        if value == 0:
+            self.zeros += count
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += count
+
+    def merge(self, other: "QuantileSketch"):
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated value at quantile q (0..1), or None when empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_json(self) -> str:
+        return json.dumps({"a": self.relative_accuracy, "z": self.zeros,
+                           "b": {str(k): n for k, n in self.buckets.items()}}, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data: Optional[str]) -> "QuantileSketch":
+        if not data:
+            return cls()
+        raw = json.loads(data)
+        sketch = cls(raw.get("a", DEFAULT_RELATIVE_ACCURACY))
+        sketch.zeros = raw.get("z", 0)
+        sketch.buckets = {int(k): n for k, n in raw.get("b", {}).items()}
+        sketch.count = sketch.zeros + sum(sketch.buckets.values())
+        return sketch
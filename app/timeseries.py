@@ -0,0 +1,103 @@
+"""Per-user activity time series for charts.
+
+A chart needs a handful of numbers per week or month, not every hike, and
+loading a heavy user's raw hikes costs more than the whole request budget.
+Charts read the per-user daily rollup in app/activity.py instead: a request
+loads the rows in its window with `with_entities` straight into NumPy
+arrays, turns day numbers into bucket indexes arithmetically and computes
+each metric with one `bincount`. Parks visited come from the user's visits,
+which are few. Buckets are contiguous (empty ones are 0) so the arrays can
+be plotted as-is.
+
+Rows older than the daily retention cover a whole month; weekly charts that
+reach that far back show each such month in the week of its first day.
+"""
+from datetime import date, datetime
+from typing import Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from app import models
+from app.activity import EPOCH_ORDINAL, epoch_day
+
+BUCKETS = ("week", "month", "year")
+METRICS = ("hikes", "miles", "elevation", "minutes", "points", "parks")
+DEFAULT_METRICS = ("hikes", "miles", "elevation", "parks")
+MAX_PERIODS = 520
+
+_EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday; weeks start on Monday
+_DAY_COLUMNS = {
+    "hikes": models.UserActivityDay.hikes,
+    "miles": models.UserActivityDay.miles,
+    "elevation": models.UserActivityDay.elevation,
+    "minutes": models.UserActivityDay.minutes,
+    "points": models.UserActivityDay.points,
+}
+
+
+def bucket_index(days, bucket: str) -> np.ndarray:
+    """Ordinal of the week/month/year containing each day number."""
+    days = np.asarray(days, dtype=np.int64)
+    if bucket == "week":
+        return (days + _EPOCH_WEEKDAY) // 7
+    unit = "datetime64[M]" if bucket == "month" else "datetime64[Y]"
+    return days.astype("datetime64[D]").astype(unit).astype(np.int64)
+
+
+def bucket_start_days(ordinals, bucket: str) -> np.ndarray:
+    """Day number on which each bucket ordinal starts."""
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    if bucket == "week":
+        return ordinals * 7 - _EPOCH_WEEKDAY
+    unit = "datetime64[M]" if bucket == "month" else "datetime64[Y]"
+    return ordinals.astype(unit).astype("datetime64[D]").astype(np.int64)
+
+
+def user_timeseries(user_id: int, db: Session, bucket: str = "month", periods: int = 12,
+                    metrics: tuple = DEFAULT_METRICS, end: Optional[date] = None) -> dict:
+    """Metric totals for the `periods` buckets ending with the one containing `end`.
+
+    `parks` counts distinct parks visited in each bucket, `points` the
+    points awarded; the other metrics are hike counts and sums.
+    """
+    last = int(bucket_index([epoch_day(end or datetime.utcnow())], bucket)[0])
+    first = last - periods + 1
+    starts = bucket_start_days(np.arange(first, last + 2), bucket)
+    since, until = int(starts[0]), int(starts[-1])
+    series = {}
+
+    hike_metrics = [m for m in metrics if m in _DAY_COLUMNS]
+    if hike_metrics:
+        rows = db.query(models.UserActivityDay).with_entities(
+            models.UserActivityDay.day, *(_DAY_COLUMNS[m] for m in hike_metrics)
+        ).filter(
+            models.UserActivityDay.user_id == user_id,
+            models.UserActivityDay.day >= since,
+            models.UserActivityDay.day < until,
+        ).all()
+        # Plain tuples: NumPy probes Row objects as mappings, which is ~20x slower
+        columns = np.array([tuple(row) for row in rows], dtype=np.float64).reshape(len(rows), len(hike_metrics) + 1)
+        index = bucket_index(columns[:, 0], bucket) - first
+        for position, metric in enumerate(hike_metrics, 1):
+            totals = np.bincount(index, weights=columns[:, position], minlength=periods)
+            series[metric] = np.round(totals, 2).tolist() if metric == "miles" else totals.astype(np.int64).tolist()
+
+    if "parks" in metrics:
+        rows = db.query(models.Visit).with_entities(models.Visit.visit_date, models.Visit.park_id).filter(
+            models.Visit.user_id == user_id,
+            models.Visit.visited == True,
+            models.Visit.park_id.isnot(None),
+            models.Visit.visit_date >= datetime.fromordinal(since + EPOCH_ORDINAL),
+            models.Visit.visit_date < datetime.fromordinal(until + EPOCH_ORDINAL),
+        ).all()
+        days = np.fromiter((epoch_day(visit_date) for visit_date, _ in rows), dtype=np.int64, count=len(rows))
+        park_ids = np.fromiter((park_id for _, park_id in rows), dtype=np.int64, count=len(rows))
+        # Count each (bucket, park) pair once
+        pairs = np.unique(np.stack([bucket_index(days, bucket) - first, park_ids]), axis=1)
+        series["parks"] = np.bincount(pairs[0], minlength=periods).tolist()
+
+    return {
+        "user_id": user_id,
+        "bucket": bucket,
+        "buckets": starts[:-1].astype("datetime64[D]").astype(str).tolist(),
+        "series": {metric: series[metric] for metric in metrics},
+    }
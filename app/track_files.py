@@ -0,0 +1,321 @@
+"""GPX and FIT activity files: streaming parsers and the upload worker pool.
+
+Both parsers read the file incrementally and keep only four growing
+arrays of doubles (lat, lon, elevation, time), so memory stays around 32
+bytes per point whatever the file size:
+
+- GPX is read with `iterparse`; each finished `<trkpt>` is removed from
+  its segment, so the element tree never holds more than one point.
+- FIT is read record by record. Only `record` messages (global number 20)
+  are decoded, through a struct built once per definition message; other
+  messages are skipped by size.
+
+`parse_upload` turns one file into a `hike_tracks` row (see
+app/tracks.py) with its stats, so the stats are computed where the file
+is parsed. Uploads with several files are parsed in a process pool, so
+large files neither block the event loop nor hold the GIL; a single file
+is parsed in a thread.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import xml.etree.ElementTree as ET
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Optional
+import numpy as np
+from app.tracks import TrackService, fill_gaps
+from config import UPLOAD_MAX_MB, UPLOAD_PARSE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+FIT_EPOCH = 631065600  # 1989-12-31T00:00:00Z as a Unix timestamp
+UPLOAD_CHUNK_BYTES = 1 << 20
+# Accepted `fitness_tracker_source` values for uploaded files
+UPLOAD_SOURCES = ("upload", "garmin", "strava", "apple_health", "fitbit", "suunto", "coros", "polar")
+SEMICIRCLE_DEGREES = 180 / 2 ** 31
+FIT_RECORD = 20
+# Record fields read: number -> (name, struct code, invalid value)
+FIT_FIELDS = {
+    253: ("timestamp", "I", 0xFFFFFFFF),
+    0: ("lat", "i", 0x7FFFFFFF),
+    1: ("lon", "i", 0x7FFFFFFF),
+    2: ("altitude", "H", 0xFFFF),
+    78: ("enhanced_altitude", "I", 0xFFFFFFFF),
+}
+
+
+class TrackFileError(ValueError):
+    """The file is not a readable GPX or FIT track."""
+
+
+class _Columns:
+    __slots__ = ("lat", "lon", "elevation", "time")
+
+    def __init__(self):
+        self.lat, self.lon, self.elevation, self.time = array("d"), array("d"), array("d"), array("d")
+
+    def add(self, lat: float, lon: float, elevation: float, time: float):
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.elevation.append(elevation)
+        self.time.append(time)
+
+    def arrays(self) -> tuple:
+        """(lat, lon, elevation or None, seconds from start, started_at)."""
+        if len(self.lat) < 2:
+            raise TrackFileError("Track has fewer than two points")
+        times = fill_gaps(np.frombuffer(self.time, dtype=np.float64))
+        if times is None:
+            raise TrackFileError("Track points have no timestamps")
+        started_at = datetime.fromtimestamp(times[0], tz=timezone.utc).replace(tzinfo=None)
+        return (np.frombuffer(self.lat, dtype=np.float64), np.frombuffer(self.lon, dtype=np.float64),
+                fill_gaps(np.frombuffer(self.elevation, dtype=np.float64)), times - times[0], started_at)
+
+
+def _timestamp(text: Optional[str], days: dict) -> float:
+    """Unix seconds of an ISO 8601 time; `days` caches the midnight of each date seen."""
+    if not text:
+        return np.nan
+    text = text.strip()
+    # Fast path for the usual "YYYY-MM-DDTHH:MM:SS[.fff]Z"
+    if len(text) >= 20 and text[-1] == "Z" and text[10] == "T" and text[13] == ":" and text[16] == ":":
+        day = days.get(text[:10])
+        if day is None:
+            try:
+                day = days[text[:10]] = datetime.fromisoformat(text[:10]).replace(tzinfo=timezone.utc).timestamp()
+            except ValueError:
+                return np.nan
+        try:
+            return day + int(text[11:13]) * 3600 + int(text[14:16]) * 60 + float(text[17:-1])
+        except ValueError:
+            return np.nan
+    try:
+        moment = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        return np.nan
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def parse_gpx(source) -> tuple:
+    """Columns and track name of a GPX file (path or binary file object)."""
+    columns = _Columns()
+    name = None
+    segment = None
+    local = {}  # Qualified tag -> local name
+    days = {}
+    try:
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            tag = local.get(elem.tag)
+            if tag is None:
+                tag = local[elem.tag] = elem.tag.rpartition("}")[2]
+            if event == "start":
+                if tag == "trkseg":
+                    segment = elem
+            elif tag == "trkpt":
+                elevation = time = None
+                for child in elem:
+                    child_tag = local[child.tag]
+                    if child_tag == "ele":
+                        elevation = child.text
+                    elif child_tag == "time":
+                        time = child.text
+                try:
+                    columns.add(float(elem.get("lat")), float(elem.get("lon")),
+                                float(elevation) if elevation else np.nan, _timestamp(time, days))
+                except (TypeError, ValueError):
+                    pass  # Point without usable coordinates
+                if segment is not None:
+                    del segment[:]  # Only the finished point is in the segment; keeps memory flat
+            elif tag == "name" and name is None and elem.text:
+                name = elem.text.strip()
+    except ET.ParseError as e:
+        raise TrackFileError(f"Invalid GPX: {e}") from None
+    return columns.arrays(), name
+
+
+def _read(stream, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise TrackFileError("FIT file is truncated")
+    return data
+
+
+def parse_fit(stream) -> tuple:
+    """Columns of the `record` messages of a FIT file (binary file object); FIT files carry no track name."""
+    header = stream.read(12)
+    if len(header) < 12 or header[8:12] != b".FIT":
+        raise TrackFileError("Not a FIT file")
+    header_size, data_size = header[0], struct.unpack("<I", header[4:8])[0]
+    _read(stream, header_size - 12)
+    columns = _Columns()
+    definitions = {}  # local type -> (global number, size, struct or None, field names)
+    last_timestamp = None
+    remaining = data_size
+    while remaining > 0:
+        record_header = _read(stream, 1)[0]
+        remaining -= 1
+        if record_header & 0x80:  # Compressed timestamp header: a data message with a 5-bit time offset
+            local, offset = (record_header >> 5) & 0x3, record_header & 0x1F
+            if last_timestamp is not None:
+                last_timestamp = (last_timestamp & ~0x1F) + offset + (0x20 if offset < (last_timestamp & 0x1F) else 0)
+        elif record_header & 0x40:  # Definition message
+            local = record_header & 0x0F
+            fixed = _read(stream, 5)
+            endian = ">" if fixed[1] else "<"
+            number, count = struct.unpack(endian + "H", fixed[2:4])[0], fixed[4]
+            fields = _read(stream, 3 * count)
+            remaining -= 5 + 3 * count
+            size = sum(fields[i + 1] for i in range(0, len(fields), 3))
+            if record_header & 0x20:  # Developer fields
+                dev_count = _read(stream, 1)[0]
+                dev_fields = _read(stream, 3 * dev_count)
+                remaining -= 1 + 3 * dev_count
+                dev_size = sum(dev_fields[i + 1] for i in range(0, len(dev_fields), 3))
+            else:
+                dev_size = 0
+            size += dev_size
+            layout, names = endian, []
+            for i in range(0, len(fields), 3):
+                field, field_size = fields[i], fields[i + 1]
+                known = FIT_FIELDS.get(field)
+                if known and struct.calcsize("<" + known[1]) == field_size and (number == FIT_RECORD or field == 253):
+                    layout += known[1]
+                    names.append(known)
+                else:
+                    layout += f"{field_size}x"
+            if dev_size:
+                layout += f"{dev_size}x"  # Developer data follows the regular fields
+            definitions[local] = (number, size, struct.Struct(layout) if names else None, names)
+            continue
+        else:
+            local = record_header & 0x0F
+        if local not in definitions:
+            raise TrackFileError("FIT data message without a definition")
+        number, size, layout, names = definitions[local]
+        data = _read(stream, size)
+        remaining -= size
+        if layout is None:
+            continue
+        values = {}
+        for (name, _, invalid), value in zip(names, layout.unpack(data)):
+            if value != invalid:
+                values[name] = value
+        if "timestamp" in values:
+            last_timestamp = values["timestamp"]
+        if number != FIT_RECORD or "lat" not in values or "lon" not in values:
+            continue
+        altitude = values.get("enhanced_altitude", values.get("altitude"))
+        columns.add(values["lat"] * SEMICIRCLE_DEGREES, values["lon"] * SEMICIRCLE_DEGREES,
+                    altitude / 5 - 500 if altitude is not None else np.nan,
+                    last_timestamp + FIT_EPOCH if last_timestamp is not None else np.nan)
+    return columns.arrays(), None
+
+
+def parse_upload(path: str, filename: str, source: str) -> dict:
+    """Parse one uploaded file into {"filename", "name", "format", "track"}, or {"filename", "error"}.
+
+    The track is a `hike_tracks` row without its ids.
+    Runs in the upload worker processes, so it takes a path and returns plain data.
+    """
+    is_fit = False
+    try:
+        with open(path, "rb") as stream:
+            is_fit = stream.read(12)[8:12] == b".FIT"
+            stream.seek(0)
+            (lat, lon, elevation, seconds, started_at), name = parse_fit(stream) if is_fit else parse_gpx(stream)
+        track = TrackService.row(None, None, source, None, lat, lon, elevation, seconds, started_at)
+    except TrackFileError as e:
+        return {"filename": filename, "error": str(e)}
+    except (struct.error, ValueError, OverflowError, OSError) as e:  # Malformed beyond what the parsers check
+        return {"filename": filename, "error": f"Unreadable {'FIT' if is_fit else 'GPX'} file: {e}"}
+    return {"filename": filename, "name": name, "format": "fit" if is_fit else "gpx", "track": track}
+
+
+async def save_upload(upload, max_bytes: int = int(UPLOAD_MAX_MB * 1024 * 1024)) -> tuple:
+    """Copy an upload to a temporary file in chunks: (path, sha1 hex), or None if it exceeds max_bytes.
+
+    The caller removes the file.
+    """
+    digest = hashlib.sha1()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(upload.filename or "")[1])
+    with os.fdopen(fd, "wb") as out:
+        while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    if size > max_bytes:
+        os.remove(path)
+        return None
+    return path, digest.hexdigest()
+
+
+def upload_hike(parsed: dict, user_id: int, trail_id: Optional[int], source: str) -> dict:
+    """`trail_hikes` fields of a parsed upload, taken from the track's stats."""
+    track = parsed["track"]
+    moving, miles = track["moving_minutes"], track["distance_miles"]
+    return {
+        "user_id": user_id,
+        "trail_id": trail_id,
+        "hike_date": track["started_at"],
+        "duration_minutes": int(round(track["elapsed_minutes"])),
+        "distance_miles": miles,
+        "elevation_gain": track["elevation_gain_ft"],
+        "avg_pace": f"{moving / miles:.1f} min/mi" if miles else None,
+        "notes": f"Uploaded {parsed['format'].upper()}: {parsed['name'] or parsed['filename']}",
+        "difficulty_experienced": "moderate",  # Default; user can adjust
+        "fitness_tracker_source": source,
+    }
+
+
+class UploadParser:
+    """Parses uploaded files off the event loop: several in a process pool, a single one in a thread."""
+
+    def __init__(self, workers: int = UPLOAD_PARSE_WORKERS):
+        self.workers = workers
+        self._pool = None
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            # Spawned workers do not inherit the server's threads, sockets or database connections
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+        return self._pool
+
+    async def parse(self, files: list, source: str) -> list:
+        """Parse (path, filename) pairs; results are in the same order.
+
+        A file whose parse fails unexpectedly gets an error result, so the other files still import.
+        """
+        if len(files) == 1 or self._executor() is None:
+            results = await asyncio.gather(*(asyncio.to_thread(parse_upload, path, filename, source)
+                                             for path, filename in files), return_exceptions=True)
+        else:
+            loop = asyncio.get_running_loop()
+            results = await asyncio.gather(*(loop.run_in_executor(self._executor(), parse_upload, path, filename,
+                                                                  source)
+                                             for path, filename in files), return_exceptions=True)
+        for i, ((_, filename), result) in enumerate(zip(files, results)):
+            if isinstance(result, Exception):
+                logger.warning("Parsing upload %s failed", filename, exc_info=result)
+                results[i] = {"filename": filename, "error": "Could not read the file"}
+        return results
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+upload_parser = UploadParser()
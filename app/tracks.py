@@ -0,0 +1,412 @@
+"""GPS tracks of hikes: compact storage and NumPy analytics.
+
+A track is four parallel columns: latitude and longitude in 1e-7 degrees,
+elevation in decimeters and seconds since the start. They are stored in
+`hike_tracks.data` as int32 deltas between consecutive points, split
+into byte planes and zlib compressed. Consecutive points differ little,
+so this is exact to ~1 cm and takes a few bytes per point; decoding is
+one cumulative sum.
+
+All statistics are computed over whole arrays:
+
+- distance: haversine over every consecutive pair of points
+- elevation gain: rises of the elevation smoothed over ELEVATION_WINDOW
+  points, so GPS altitude jitter does not add up to phantom climbing
+- moving time: segments covered at MIN_MOVING_SPEED or faster, skipping
+  gaps longer than MAX_SEGMENT_SECONDS (the device was paused)
+- splits: moving time and elevation change per mile, with the mile
+  boundaries located by interpolating cumulative distance
+
+For maps, every point also gets a level of detail: the coarsest Douglas-
+Peucker tolerance in LOD_TOLERANCES_M that still keeps it. The levels are
+computed once when the track is stored, so a map view picks the level for
+its zoom (under a pixel of error) and filters, instead of simplifying on
+every request.
+
+Garmin imports store the track from the activity's details alongside the
+hike; the summary numbers stay on the hike so the two can be compared.
+"""
+import asyncio
+import math
+import zlib
+from datetime import datetime
+from typing import Optional
+import numpy as np
+import orjson
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app import models
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_MILE = 1609.344
+FEET_PER_METER = 3.28084
+ELEVATION_WINDOW = 5  # Points averaged when smoothing elevation
+MIN_MOVING_SPEED = 0.3  # m/s; slower segments count as stopped
+MAX_SEGMENT_SECONDS = 300  # Longer gaps between points are pauses
+MAP_POINT_BYTES = 22  # Typical size of one [lat, lon] pair in the map overview JSON
+MAP_LINE_BYTES = 64  # And of each line's other fields
+FETCH_CONCURRENCY = 4  # Activity details fetched at once per import
+# Douglas-Peucker tolerance (m) of each level of detail; level 0 is the full track
+LOD_TOLERANCES_M = (2.0, 8.0, 30.0, 120.0, 500.0)
+WEB_MERCATOR_M_PER_PX = 156543.034  # Meters per 256 px tile pixel at zoom 0 on the equator
+MAX_ZOOM = 24  # Deepest web map zoom level
+
+
+def encode(lat: np.ndarray, lon: np.ndarray, elevation: np.ndarray, seconds: np.ndarray) -> bytes:
+    """Pack the columns (degrees, meters, seconds from start) into a compressed blob."""
+    columns = np.stack([np.round(lat * 1e7), np.round(lon * 1e7), np.round(elevation * 10),
+                        np.round(seconds)]).astype(np.int64)
+    deltas = np.diff(columns, axis=1, prepend=0).astype("<i4")
+    # Byte planes (all low bytes, then the next...) compress better and faster than interleaved ints
+    planes = deltas.view(np.uint8).reshape(-1, 4).T
+    return zlib.compress(planes.tobytes(), 1)
+
+
+def decode(data: bytes, points: int) -> tuple:
+    """(lat, lon, elevation, seconds) as float64 arrays."""
+    planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(4, -1)
+    deltas = np.ascontiguousarray(planes.T).view("<i4").reshape(4, points)
+    columns = np.cumsum(deltas, axis=1, dtype=np.int64)
+    return columns[0] / 1e7, columns[1] / 1e7, columns[2] / 10, columns[3].astype(np.float64)
+
+
+def encode_levels(levels: np.ndarray) -> bytes:
+    return zlib.compress(levels.astype(np.uint8).tobytes(), 1)
+
+
+def decode_levels(data: Optional[bytes], lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Stored levels of detail, or computed for tracks stored without them."""
+    if data is None:
+        return detail_levels(lat, lon)
+    return np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+
+
+def fill_gaps(values: np.ndarray) -> Optional[np.ndarray]:
+    """Interpolate NaNs from their neighbours; None if every value is missing."""
+    missing = np.isnan(values)
+    if missing.all():
+        return None
+    if missing.any():
+        index = np.arange(len(values))
+        values = values.copy()
+        values[missing] = np.interp(index[missing], index[~missing], values[~missing])
+    return values
+
+
+def segment_distances(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Haversine meters between consecutive points."""
+    phi, lam = np.radians(lat), np.radians(lon)
+    a = np.sin(np.diff(phi) / 2) ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(np.diff(lam) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def smoothed(elevation: np.ndarray, window: int = ELEVATION_WINDOW) -> np.ndarray:
+    if len(elevation) <= window:
+        return elevation
+    kernel = np.full(window, 1 / window)
+    padded = np.pad(elevation, (window // 2, window - 1 - window // 2), mode="edge")
+    return np.convolve(padded, kernel, mode="valid")
+
+
+def track_stats(lat: np.ndarray, lon: np.ndarray, elevation: np.ndarray, seconds: np.ndarray,
+                splits: bool = True) -> dict:
+    """Distance, smoothed elevation gain, moving time, pace and per-mile splits of a track."""
+    if len(lat) < 2:
+        return {"points": len(lat), "distance_miles": 0.0, "elevation_gain_ft": 0, "moving_minutes": 0.0,
+                "elapsed_minutes": 0.0, "avg_pace_min_per_mile": None, "splits": []}
+    meters = segment_distances(lat, lon)
+    dt = np.diff(seconds)
+    speed = np.divide(meters, dt, out=np.zeros_like(meters), where=dt > 0)
+    moving = (speed >= MIN_MOVING_SPEED) & (dt <= MAX_SEGMENT_SECONDS)
+    moving_seconds = np.where(moving, dt, 0.0)
+
+    level = smoothed(elevation)
+    gain_m = np.clip(np.diff(level), 0, None).sum()
+    total_m = meters.sum()
+    moving_total = moving_seconds.sum()
+    stats = {
+        "points": len(lat),
+        "distance_miles": round(float(total_m / METERS_PER_MILE), 2),
+        "elevation_gain_ft": int(round(gain_m * FEET_PER_METER)),
+        "moving_minutes": round(float(moving_total / 60), 1),
+        "elapsed_minutes": round(float((seconds[-1] - seconds[0]) / 60), 1),
+        "avg_pace_min_per_mile": round(float(moving_total / 60 / (total_m / METERS_PER_MILE)), 2)
+                                 if total_m > 0 else None,
+    }
+    if splits:
+        stats["splits"] = mile_splits(np.concatenate([[0.0], np.cumsum(meters)]),
+                                      np.concatenate([[0.0], np.cumsum(moving_seconds)]), level)
+    return stats
+
+
+def mile_splits(distance: np.ndarray, moving: np.ndarray, elevation: np.ndarray) -> list:
+    """Per-mile moving time, pace and elevation change from cumulative distance and moving time."""
+    total = distance[-1]
+    if total <= 0:
+        return []
+    marks = np.append(np.arange(METERS_PER_MILE, total, METERS_PER_MILE), total)
+    if len(marks) > 1 and total - marks[-2] < 1:
+        marks = marks[:-1]  # Track ends on a mile boundary
+    ends = np.interp(marks, distance, moving)
+    heights = np.interp(marks, distance, elevation)
+    minutes = np.diff(ends, prepend=0.0) / 60
+    miles = np.diff(marks, prepend=0.0) / METERS_PER_MILE
+    change = np.diff(heights, prepend=elevation[0]) * FEET_PER_METER
+    return [
+        {"mile": i + 1, "miles": round(float(m), 2), "minutes": round(float(t), 1),
+         "pace_min_per_mile": round(float(t / m), 2) if m > 0 else None, "elevation_change_ft": int(round(c))}
+        for i, (m, t, c) in enumerate(zip(miles, minutes, change))
+    ]
+
+
+def significance(lat: np.ndarray, lon: np.ndarray, floor: float = LOD_TOLERANCES_M[0]) -> np.ndarray:
+    """Largest Douglas-Peucker tolerance (m) at which each point is still kept.
+
+    Simplifying at tolerance t keeps exactly the points whose significance
+    exceeds t: a split point counts the smaller of its own offset and its
+    parent's, since it is only reached when the parent was kept. Endpoints
+    are infinite; points dropped at `floor` are 0.
+
+    The recursion runs breadth first: every open segment of a round is
+    measured in one set of array operations (offsets from the segment, on a
+    local equirectangular projection), so a round costs O(points) and the
+    number of rounds is the depth of the split tree.
+    """
+    n = len(lat)
+    result = np.zeros(n)
+    if n == 0:
+        return result
+    result[0] = result[-1] = np.inf
+    y = np.radians(lat) * EARTH_RADIUS_M
+    x = np.radians(lon) * EARTH_RADIUS_M * math.cos(math.radians(float(np.mean(lat))))
+    first, last, cap = np.array([0]), np.array([n - 1]), np.array([np.inf])
+    while len(first):
+        inner = last - first - 1
+        open_ = inner > 0
+        first, last, cap, inner = first[open_], last[open_], cap[open_], inner[open_]
+        if not len(first):
+            break
+        # Point indices of every segment's interior, concatenated, and the segment each belongs to
+        segment = np.repeat(np.arange(len(first)), inner)
+        starts = np.concatenate([[0], np.cumsum(inner)[:-1]])
+        index = np.arange(len(segment)) - starts[segment] + first[segment] + 1
+        ax, ay = x[first][segment], y[first][segment]
+        dx, dy = (x[last] - x[first])[segment], (y[last] - y[first])[segment]
+        px, py = x[index] - ax, y[index] - ay
+        length = dx * dx + dy * dy
+        # Distance to the segment rather than the line, so tracks that double back are handled
+        t = np.clip(np.divide(px * dx + py * dy, length, out=np.zeros_like(px), where=length > 0), 0.0, 1.0)
+        offsets = (px - t * dx) ** 2 + (py - t * dy) ** 2
+        peaks = np.maximum.reduceat(offsets, starts)
+        hits = np.flatnonzero(offsets == peaks[segment])
+        _, firsts = np.unique(segment[hits], return_index=True)
+        far = index[hits[firsts]]  # First farthest point of each segment
+        split = peaks > floor * floor
+        far, parent = far[split], cap[split]
+        result[far] = np.minimum(np.sqrt(peaks[split]), parent)
+        first = np.concatenate([first[split], far])
+        last = np.concatenate([far, last[split]])
+        cap = np.concatenate([result[far], result[far]])
+    return result
+
+
+def detail_levels(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Per point, the coarsest level of detail that keeps it (uint8); level L keeps points >= L."""
+    return np.searchsorted(LOD_TOLERANCES_M, significance(lat, lon), side="left").astype(np.uint8)
+
+
+def level_for_zoom(zoom: float, lat: float) -> int:
+    """Coarsest level whose tolerance stays under one pixel at a web map zoom level."""
+    zoom = min(max(zoom, 0), MAX_ZOOM)
+    meters_per_px = WEB_MERCATOR_M_PER_PX * math.cos(math.radians(lat)) / 2 ** zoom
+    return int(np.searchsorted(LOD_TOLERANCES_M, meters_per_px, side="right"))
+
+
+def garmin_points(details: Optional[dict]) -> Optional[tuple]:
+    """(lat, lon, elevation, seconds, started_at) from Garmin activity details, or None without a track."""
+    polyline = ((details or {}).get("geoPolylineDTO") or {}).get("polyline") or []
+    points = [p for p in polyline if p.get("lat") is not None and p.get("lon") is not None]
+    if len(points) < 2:
+        return None
+    lat = np.fromiter((p["lat"] for p in points), dtype=np.float64, count=len(points))
+    lon = np.fromiter((p["lon"] for p in points), dtype=np.float64, count=len(points))
+    elevation = np.fromiter((np.nan if p.get("altitude") is None else p["altitude"] for p in points),
+                            dtype=np.float64, count=len(points))
+    times = np.fromiter((np.nan if p.get("time") is None else p["time"] for p in points),
+                        dtype=np.float64, count=len(points))
+    times = fill_gaps(times)
+    if times is None:
+        return None
+    started_at = datetime.utcfromtimestamp(times[0] / 1000)
+    return lat, lon, fill_gaps(elevation), (times - times[0]) / 1000, started_at
+
+
+class TrackService:
+    """Builds, stores and reads hike tracks."""
+
+    @staticmethod
+    def row(hike_id: int, user_id: int, source: str, activity_id: Optional[str], lat: np.ndarray,
+            lon: np.ndarray, elevation: Optional[np.ndarray], seconds: np.ndarray, started_at: datetime) -> dict:
+        """A `hike_tracks` row with its summary stats; a missing elevation column is stored as zeros."""
+        has_elevation = elevation is not None
+        elevation = elevation if has_elevation else np.zeros_like(lat)
+        stats = track_stats(lat, lon, elevation, seconds, splits=False)
+        return {
+            "hike_id": hike_id,
+            "user_id": user_id,
+            "source": source,
+            "activity_id": activity_id,
+            "started_at": started_at,
+            "points": len(lat),
+            "has_elevation": has_elevation,
+            "data": encode(lat, lon, elevation, seconds),
+            "lod": encode_levels(detail_levels(lat, lon)),
+            "distance_miles": stats["distance_miles"],
+            "elevation_gain_ft": stats["elevation_gain_ft"] if has_elevation else None,
+            "moving_minutes": stats["moving_minutes"],
+            "elapsed_minutes": stats["elapsed_minutes"],
+            "created_at": datetime.utcnow(),
+        }
+
+    @staticmethod
+    def store(db: Session, rows: list):
+        """Insert track rows in one statement (callers commit)."""
+        if rows:
+            db.execute(insert(models.HikeTrack), rows)
+
+    @staticmethod
+    async def fetch_garmin(imported: list, user_id: int, access_token: str, service) -> list:
+        """Track rows for (hike_id, activity_id) pairs, fetching activity details concurrently.
+
+        Activities without a track, or whose details could not be fetched, are skipped.
+        """
+        limit = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def fetch(activity_id: str):
+            async with limit:
+                return await service.get_activity_details(activity_id, access_token)
+
+        found = await asyncio.gather(*(fetch(activity_id) for _, activity_id in imported))
+        return await TrackService.garmin_rows(
+            [(hike_id, user_id, activity_id, details) for (hike_id, activity_id), details in zip(imported, found)])
+
+    @staticmethod
+    async def garmin_rows(activities: list) -> list:
+        """Track rows for (hike_id, user_id, activity_id, details), skipping activities without a track.
+
+        Encoding and the level-of-detail pass take tens of milliseconds per long track, so the rows are
+        built in a thread instead of on the event loop.
+        """
+        def build() -> list:
+            rows = []
+            for hike_id, user_id, activity_id, details in activities:
+                points = garmin_points(details)
+                if points is not None:
+                    rows.append(TrackService.row(hike_id, user_id, "garmin", activity_id, *points))
+            return rows
+
+        return await asyncio.to_thread(build) if activities else []
+
+    @staticmethod
+    def user_map(db: Session, user_id: int, max_bytes: int, zoom: Optional[float] = None) -> bytes:
+        """JSON overview of all of a user's tracks, simplified to fit in max_bytes.
+
+        Picks the finest level of detail (no finer than the zoom needs) whose
+        points fit the budget, estimated from the stored per-point levels
+        before any JSON is built. If even the coarsest level is too large,
+        the oldest tracks are left out and `truncated` is set.
+        """
+        rows = db.query(models.HikeTrack.hike_id, models.HikeTrack.points, models.HikeTrack.data,
+                        models.HikeTrack.lod, models.TrailHike.hike_date).join(
+            models.TrailHike, models.TrailHike.id == models.HikeTrack.hike_id
+        ).filter(models.HikeTrack.user_id == user_id).order_by(models.TrailHike.hike_date.desc()).all()
+        tracks = []
+        for hike_id, points, data, lod, hike_date in rows:
+            lat, lon, _, _ = decode(data, points)
+            tracks.append((hike_id, hike_date, lat, lon, decode_levels(lod, lat, lon)))
+        coarsest = len(LOD_TOLERANCES_M)
+        level = 0
+        if zoom is not None and tracks:
+            level = level_for_zoom(zoom, float(np.mean([t[2][0] for t in tracks])))
+        counts = np.zeros(coarsest + 1, dtype=np.int64)
+        for *_, levels in tracks:
+            counts += np.bincount(levels, minlength=coarsest + 1)[::-1].cumsum()[::-1]  # Points kept per level
+        overhead = 128 + MAP_LINE_BYTES * len(tracks)
+        while level < coarsest and overhead + counts[level] * MAP_POINT_BYTES > max_bytes:
+            level += 1
+
+        while True:
+            lines = [
+                {"hike_id": hike_id, "hike_date": hike_date,
+                 "points": np.column_stack([np.round(lat[levels >= level], 5),
+                                            np.round(lon[levels >= level], 5)]).tolist()}
+                for hike_id, hike_date, lat, lon, levels in tracks
+            ]
+            body = TrackService._map_body(user_id, level, lines, tracks, len(rows))
+            if len(body) <= max_bytes or not tracks:
+                return body
+            if level < coarsest:
+                level += 1  # The estimate was short
+                continue
+            # Newest tracks that fit, leaving room for the rest of the body
+            sizes = np.cumsum([len(orjson.dumps(line)) + 1 for line in lines])
+            keep = max(0, int(np.searchsorted(sizes, max_bytes - (len(body) - sizes[-1]) - 64, side="right")))
+            lines, tracks = lines[:keep], tracks[:keep]
+            return TrackService._map_body(user_id, level, lines, tracks, len(rows))
+
+    @staticmethod
+    def _map_body(user_id: int, level: int, lines: list, tracks: list, total: int) -> bytes:
+        lat = [t[2] for t in tracks]
+        lon = [t[3] for t in tracks]
+        return orjson.dumps({
+            "user_id": user_id,
+            "level": level,
+            "tolerance_m": LOD_TOLERANCES_M[level - 1] if level else 0.0,
+            "tracks": len(lines),
+            "total_tracks": total,
+            "truncated": len(lines) < total,
+            "points": sum(len(line["points"]) for line in lines),
+            # [south, west, north, east]
+            "bounds": [min(float(a.min()) for a in lat), min(float(a.min()) for a in lon),
+                       max(float(a.max()) for a in lat), max(float(a.max()) for a in lon)] if lines else None,
+            "lines": lines,
+        })
+
+    @staticmethod
+    def response(track: models.HikeTrack, hike: models.TrailHike, include_points: bool = True,
+                 zoom: Optional[float] = None) -> dict:
+        """Track with stats from every point; with a zoom, the points are simplified for that map zoom."""
+        lat, lon, elevation, seconds = decode(track.data, track.points)
+        stats = track_stats(lat, lon, elevation, seconds)
+        if not track.has_elevation:
+            stats["elevation_gain_ft"] = None
+            for split in stats["splits"]:
+                split["elevation_change_ft"] = None
+        body = {
+            "hike_id": hike.id,
+            "source": track.source,
+            "activity_id": track.activity_id,
+            "started_at": track.started_at.isoformat() if track.started_at else None,
+            "stats": stats,
+            "summary": {
+                "distance_miles": hike.distance_miles,
+                "elevation_gain": hike.elevation_gain,
+                "duration_minutes": hike.duration_minutes,
+            },
+        }
+        if include_points and zoom is not None:
+            level = level_for_zoom(zoom, float(lat[0]))
+            keep = decode_levels(track.lod, lat, lon) >= level
+            lat, lon, elevation, seconds = lat[keep], lon[keep], elevation[keep], seconds[keep]
+            body["level"] = level
+        if include_points:
+            # [lat, lon, elevation ft, seconds from start] per point
+            body["points"] = np.column_stack([
+                np.round(lat, 6), np.round(lon, 6),
+                np.round(elevation * FEET_PER_METER, 1) if track.has_elevation else np.full(len(lat), np.nan),
+                seconds,
+            ]).tolist()
+            if not track.has_elevation:
+                for point in body["points"]:
+                    point[2] = None
+        return body
@@ -0,0 +1,203 @@
+"""Wildlife sighting rollups per park, species, location and month.
+
+Park pages show what is being seen right now without touching the sightings
+table: `log_sighting` increments a count per (park, species, month) and per
+(park, location, month) in the same transaction, with an upsert so
+concurrent requests cannot lose increments. Species names are free text, so
+they are normalized through SPECIES_ALIASES first ("buffalo", "Bison " and
+"bisons" all count as "Bison").
+"""
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app import models
+from app.database import dialect_insert
+
+# Lower-cased variants -> canonical species name. Names not listed are kept,
+# title-cased, so new species still roll up consistently.
+SPECIES_ALIASES = {
+    "bison": "Bison", "buffalo": "Bison", "american bison": "Bison", "american buffalo": "Bison",
+    "elk": "Elk", "wapiti": "Elk", "roosevelt elk": "Elk", "rocky mountain elk": "Elk",
+    "moose": "Moose",
+    "mule deer": "Mule Deer", "muley": "Mule Deer", "black-tailed deer": "Mule Deer",
+    "white-tailed deer": "White-tailed Deer", "whitetail": "White-tailed Deer",
+    "whitetail deer": "White-tailed Deer", "white tailed deer": "White-tailed Deer",
+    "deer": "Deer",
+    "black bear": "Black Bear", "american black bear": "Black Bear", "cinnamon bear": "Black Bear",
+    "grizzly": "Grizzly Bear", "grizzly bear": "Grizzly Bear", "brown bear": "Grizzly Bear",
+    "bear": "Bear",
+    "gray wolf": "Gray Wolf", "grey wolf": "Gray Wolf", "wolf": "Gray Wolf", "timber wolf": "Gray Wolf",
+    "coyote": "Coyote",
+    "red fox": "Red Fox", "fox": "Fox",
+    "mountain lion": "Mountain Lion", "cougar": "Mountain Lion", "puma": "Mountain Lion",
+    "panther": "Mountain Lion", "florida panther": "Mountain Lion",
+    "bobcat": "Bobcat", "lynx": "Canada Lynx", "canada lynx": "Canada Lynx",
+    "bighorn": "Bighorn Sheep", "bighorn sheep": "Bighorn Sheep", "desert bighorn": "Bighorn Sheep",
+    "mountain goat": "Mountain Goat", "pronghorn": "Pronghorn", "antelope": "Pronghorn",
+    "marmot": "Marmot", "yellow-bellied marmot": "Marmot", "hoary marmot": "Marmot",
+    "pika": "Pika", "american pika": "Pika",
+    "prairie dog": "Prairie Dog", "black-tailed prairie dog": "Prairie Dog",
+    "river otter": "River Otter", "otter": "River Otter", "sea otter": "Sea Otter",
+    "beaver": "Beaver", "raccoon": "Raccoon", "javelina": "Javelina", "peccary": "Javelina",
+    "bald eagle": "Bald Eagle", "golden eagle": "Golden Eagle", "eagle": "Eagle",
+    "osprey": "Osprey", "peregrine": "Peregrine Falcon", "peregrine falcon": "Peregrine Falcon",
+    "california condor": "California Condor", "condor": "California Condor",
+    "wild turkey": "Wild Turkey", "turkey": "Wild Turkey", "roadrunner": "Greater Roadrunner",
+    "greater roadrunner": "Greater Roadrunner",
+    "alligator": "American Alligator", "american alligator": "American Alligator", "gator": "American Alligator",
+    "crocodile": "American Crocodile", "american crocodile": "American Crocodile",
+    "manatee": "Manatee", "west indian manatee": "Manatee",
+    "humpback": "Humpback Whale", "humpback whale": "Humpback Whale",
+    "orca": "Orca", "killer whale": "Orca", "gray whale": "Gray Whale", "grey whale": "Gray Whale",
+    "sea lion": "Sea Lion", "steller sea lion": "Sea Lion", "harbor seal": "Harbor Seal",
+    "rattlesnake": "Rattlesnake", "rattler": "Rattlesnake",
+}
+# Irregular plurals; regular ones are handled by stripping a trailing "s"
+_PLURALS = {"wolves": "wolf", "grey wolves": "grey wolf", "gray wolves": "gray wolf", "foxes": "fox",
+            "red foxes": "red fox", "lynxes": "lynx", "mountain goats": "mountain goat"}
+_NON_WORD = re.compile(r"[^\w\s'-]")
+_SPACES = re.compile(r"\s+")
+MAX_NAME_LENGTH = 64
+
+
+def _clean(text: Optional[str]) -> str:
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", text or "")).strip()
+
+
+def normalize_species(name: Optional[str]) -> Optional[str]:
+    """Canonical species name for a free-text sighting, or None if empty."""
+    key = _clean(name).lower()
+    if not key:
+        return None
+    key = _PLURALS.get(key, key)
+    if key not in SPECIES_ALIASES and key.endswith("s") and key[:-1] in SPECIES_ALIASES:
+        key = key[:-1]
+    canonical = SPECIES_ALIASES.get(key)
+    if canonical:
+        return canonical
+    return " ".join(w[:1].upper() + w[1:] for w in key.split(" "))[:MAX_NAME_LENGTH]
+
+
+def normalize_location(location: Optional[str]) -> Optional[str]:
+    """Collapse spacing and case so "lamar valley" and "Lamar Valley " match."""
+    cleaned = _clean(location)
+    if not cleaned:
+        return None
+    return " ".join(w[:1].upper() + w[1:].lower() for w in cleaned.split(" "))[:MAX_NAME_LENGTH]
+
+
+def month_key(when: Optional[datetime]) -> str:
+    return (when or datetime.utcnow()).strftime("%Y-%m")
+
+
+def recent_months(count: int, today: Optional[datetime] = None) -> list:
+    """The `count` month keys ending with the current month, newest first."""
+    today = today or datetime.utcnow()
+    year, month = today.year, today.month
+    keys = []
+    for _ in range(max(1, count)):
+        keys.append(f"{year:04d}-{month:02d}")
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return keys
+
+
+class WildlifeRollupService:
+    """Maintains and reads the per-park wildlife rollups."""
+
+    @staticmethod
+    def record_sighting(sighting: models.Sighting, db: Session, delta: int = 1):
+        """Add a sighting to the rollups; the caller commits."""
+        insert = dialect_insert(db)
+        month = month_key(sighting.sighting_date)
+        species = normalize_species(sighting.wildlife)
+        location = normalize_location(sighting.location)
+        if species:
+            table = models.WildlifeSpeciesMonthly.__table__
+            stmt = insert(table).values(park_id=sighting.park_id, month=month, species=species, count=delta)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["park_id", "month", "species"],
+                set_={"count": table.c.count + stmt.excluded.count},
+            ))
+        if location:
+            table = models.WildlifeLocationMonthly.__table__
+            stmt = insert(table).values(park_id=sighting.park_id, month=month, location=location, count=delta)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["park_id", "month", "location"],
+                set_={"count": table.c.count + stmt.excluded.count},
+            ))
+
+    @staticmethod
+    def park_wildlife(park_id: int, db: Session, months: int = 3, limit: int = 10,
+                      today: Optional[datetime] = None) -> dict:
+        """Top species, per-month top species and hotspots over the recent months."""
+        keys = recent_months(months, today)
+        species_model = models.WildlifeSpeciesMonthly
+        location_model = models.WildlifeLocationMonthly
+
+        monthly = db.query(species_model.month, species_model.species, species_model.count).filter(
+            species_model.park_id == park_id,
+            species_model.month.in_(keys)
+        ).all()
+        hotspots = db.query(
+            location_model.location, func.sum(location_model.count).label("count")
+        ).filter(
+            location_model.park_id == park_id,
+            location_model.month.in_(keys)
+        ).group_by(location_model.location).order_by(
+            func.sum(location_model.count).desc(), location_model.location
+        ).limit(limit).all()
+
+        totals = Counter()
+        by_month = {key: [] for key in keys}
+        for month, species, count in monthly:
+            totals[species] += count
+            by_month[month].append((species, count))
+
+        def ranked(pairs):
+            return [{"species": s, "count": c} for s, c in sorted(pairs, key=lambda p: (-p[1], p[0]))[:limit]]
+
+        return {
+            "park_id": park_id,
+            "months": keys,
+            "total_sightings": sum(totals.values()),
+            "top_species": ranked(totals.items()),
+            "by_month": [{"month": key, "species": ranked(by_month[key])} for key in keys],
+            "hotspots": [{"location": location, "count": count} for location, count in hotspots],
+        }
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """Recompute both rollups from the sightings table. Returns sightings counted."""
+        species_counts, location_counts = Counter(), Counter()
+        seen = 0
+        rows = db.query(
+            models.Sighting.park_id, models.Sighting.wildlife, models.Sighting.location,
+            models.Sighting.sighting_date, models.Sighting.created_at
+        ).yield_per(5000)
+        for park_id, wildlife, location, sighting_date, created_at in rows:
+            seen += 1
+            month = month_key(sighting_date or created_at)
+            species = normalize_species(wildlife)
+            if species:
+                species_counts[(park_id, month, species)] += 1
+            location = normalize_location(location)
+            if location:
+                location_counts[(park_id, month, location)] += 1
+
+        db.query(models.WildlifeSpeciesMonthly).delete()
+        db.query(models.WildlifeLocationMonthly).delete()
+        if species_counts:
+            db.execute(models.WildlifeSpeciesMonthly.__table__.insert(), [
+                {"park_id": p, "month": m, "species": s, "count": n} for (p, m, s), n in species_counts.items()
+            ])
+        if location_counts:
+            db.execute(models.WildlifeLocationMonthly.__table__.insert(), [
+                {"park_id": p, "month": m, "location": loc, "count": n} for (p, m, loc), n in location_counts.items()
+            ])
+        db.commit()
+        return seen
@@ -0,0 +1,109 @@
+"""Availability snapshot diffing: encoded status arrays vs parsed dicts.
+
+Generates campground months shaped like the Recreation.gov stub's responses
+and times one poll's work per campground month: load the stored previous
+snapshot, turn the new fetch into the stored form, find the site-nights
+that changed and serialize the new snapshot. "dicts" stores
+`parse_availability` output as JSON; "arrays" stores the encoded status
+array as the poller does. Also reports the stored size of each.
+
+Usage:
+    python -m benchmarks.availability --campgrounds 200 --sites 120
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import date
+import numpy as np
+from app.availability import diff, encode_month
+from app.recreation_service import RecreationGovService
+from benchmarks.stubs import STATUSES
+
+MONTH = date(2024, 7, 1)
+
+
+def synthetic_month(campground_id: int, sites: int, churn: float, rng: random.Random) -> tuple:
+    """Two fetches of one campground month, the second with `churn` of the nights changed."""
+    before, after = {}, {}
+    for n in range(sites):
+        site_id = str(campground_id * 1000 + n)
+        nights = {f"2024-07-{day:02d}T00:00:00Z": rng.choice(STATUSES) for day in range(1, 32)}
+        changed = {night: rng.choice(STATUSES) if rng.random() < churn else status for night, status in nights.items()}
+        site = {"site_name": f"{n + 1:03d}", "loop": "Loop A", "site_type": "STANDARD NONELECTRIC"}
+        before[site_id] = dict(site, availabilities=nights)
+        after[site_id] = dict(site, availabilities=changed)
+    return {"campsites": before}, {"campsites": after}
+
+
+def dict_poll(stored: str, current: dict, campground_id: int, loop) -> tuple:
+    old = {site["site_id"]: site["availability"] for site in json.loads(stored)}
+    parsed = loop.run_until_complete(RecreationGovService.parse_availability(current, campground_id))
+    changed = 0
+    for site in parsed:
+        before = old.get(site["site_id"], {})
+        changed += sum(1 for night, status in site["availability"].items() if before.get(night) != status)
+    return changed, json.dumps(parsed)
+
+
+def array_poll(stored: tuple, current: dict) -> tuple:
+    sites, blob = stored
+    old = np.frombuffer(blob, dtype=np.uint8).reshape(len(json.loads(sites)), -1)
+    new_sites, new = encode_month(current, MONTH)
+    rows, _, _ = diff(old, new)
+    return len(rows), (json.dumps(new_sites), new.tobytes())
+
+
+def run(campgrounds: int = 200, sites: int = 120, churn: float = 0.02) -> dict:
+    rng = random.Random(4)
+    loop = asyncio.new_event_loop()
+    timings = {"dicts": [], "arrays": []}
+    sizes = {"dicts": 0, "arrays": 0}
+    try:
+        for campground_id in range(1, campgrounds + 1):
+            previous, current = synthetic_month(campground_id, sites, churn, rng)
+            stored_dicts = json.dumps(loop.run_until_complete(
+                RecreationGovService.parse_availability(previous, campground_id)))
+            previous_sites, previous_statuses = encode_month(previous, MONTH)
+            stored_arrays = (json.dumps(previous_sites), previous_statuses.tobytes())
+
+            start = time.perf_counter()
+            by_dict, new_dicts = dict_poll(stored_dicts, current, campground_id, loop)
+            timings["dicts"].append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            by_array, new_arrays = array_poll(stored_arrays, current)
+            timings["arrays"].append((time.perf_counter() - start) * 1000)
+            assert by_dict == by_array
+            sizes["dicts"] += len(new_dicts)
+            sizes["arrays"] += len(new_arrays[0]) + len(new_arrays[1])
+    finally:
+        loop.close()
+    return {
+        "campgrounds": campgrounds,
+        "sites": sites,
+        "modes": {mode: {"p50_ms": statistics.median(samples), "total_ms": sum(samples),
+                         "stored_kb": sizes[mode] / 1024}
+                  for mode, samples in timings.items()},
+    }
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--campgrounds", type=int, default=200)
+    parser.add_argument("--sites", type=int, default=120)
+    parser.add_argument("--churn", type=float, default=0.02, help="Share of nights changed between fetches")
+    args = parser.parse_args(argv)
+
+    r = run(args.campgrounds, args.sites, args.churn)
+    print(f"{r['campgrounds']} campground months of {r['sites']} sites")
+    for mode, m in r["modes"].items():
+        print(f"  {mode:<7} poll p50 {m['p50_ms']:.2f} ms  total {m['total_ms']:.0f} ms   "
+              f"snapshot {m['stored_kb']:.0f} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
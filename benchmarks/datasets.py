@@ -0,0 +1,236 @@
+"""Synthetic datasets for benchmarking the API at different scales."""
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app import models
+from app.popularity import PopularityService
+from app.activity import ActivityRollupService
+from app.scoped_leaderboards import ScopeStatsService
+from app.notifications import booking_alerts
+from app.wildlife import WildlifeRollupService
+
+PARKS_FILE = Path(__file__).parent.parent / "scripts" / "parks_data.json"
+
+# Row counts per dataset size. The "hot" user is the one the benchmarks
+# query; it gets a heavier history than everyone else.
+SIZES = {
+    "small": {
+        "users": 50,
+        "hikes_per_user": 10,
+        "visits_per_user": 3,
+        "trails_per_park": 3,
+        "campsites_per_park": 2,
+        "hot_hikes": 100,
+        "hot_visits": 20,
+        "hot_wishlist": 10,
+        "hot_sightings": 25,
+    },
+    "medium": {
+        "users": 500,
+        "hikes_per_user": 30,
+        "visits_per_user": 6,
+        "trails_per_park": 6,
+        "campsites_per_park": 4,
+        "hot_hikes": 1000,
+        "hot_visits": 60,
+        "hot_wishlist": 40,
+        "hot_sightings": 100,
+    },
+    "large": {
+        "users": 2000,
+        "hikes_per_user": 50,
+        "visits_per_user": 10,
+        "trails_per_park": 10,
+        "campsites_per_park": 6,
+        "hot_hikes": 5000,
+        "hot_visits": 67,
+        "hot_wishlist": 100,
+        "hot_sightings": 500,
+    },
+}
+
+BADGES = [
+    ("Park Explorer", "visit_5_parks"),
+    ("State Master", "visit_10_states"),
+    ("Elevation Conqueror", "hike_50k_elevation"),
+    ("Marathon Hiker", "hike_100_miles"),
+    ("Camper's Spirit", "camp_10_nights"),
+    ("Wildlife Watcher", "sight_20_animals"),
+]
+
+DIFFICULTIES = ["Easy", "Moderate", "Hard"]
+WILDLIFE = ["Bison", "Elk", "Black Bear", "Bald Eagle", "Mule Deer", "Moose", "Coyote", "buffalo", "elks"]
+LOCATIONS = ["North Meadow", "north meadow", "River Bend", "Summit Ridge", "Visitor Center"]
+
+
+def _hike_row(rng: random.Random, user_id: int, trail_ids: list, now: datetime) -> dict:
+    return {
+        "user_id": user_id,
+        "trail_id": rng.choice(trail_ids),
+        "hike_date": now - timedelta(days=rng.randint(0, 730), minutes=rng.randint(0, 1440)),
+        "duration_minutes": rng.randint(30, 480),
+        "distance_miles": round(rng.uniform(0.5, 15.0), 2),
+        "elevation_gain": rng.randint(0, 4000),
+        "calories": rng.randint(100, 2000),
+        "notes": "Synthetic hike",
+        "difficulty_experienced": rng.choice(DIFFICULTIES),
+        "fitness_tracker_source": rng.choice(["manual", "garmin"]),
+        "created_at": now,
+    }
+
+
+def build_dataset(db: Session, size: str = "small", seed: int = 42) -> dict:
+    """Populate an empty database with a synthetic dataset.
+
+    Returns the ids the benchmarks need (the hot user, a trail, a campsite).
+    """
+    spec = SIZES[size]
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    with open(PARKS_FILE, "r") as f:
+        parks_data = json.load(f)
+    db.execute(insert(models.Park), [dict(p, created_at=now) for p in parks_data])
+    park_ids = [p[0] for p in db.query(models.Park.id).all()]
+
+    db.execute(insert(models.Trail), [
+        {
+            "park_id": park_id,
+            "name": f"Trail {park_id}-{i}",
+            "difficulty": rng.choice(DIFFICULTIES),
+            "distance_miles": round(rng.uniform(0.5, 20.0), 1),
+            "elevation_gain_ft": rng.randint(0, 5000),
+            "description": "Synthetic trail",
+            "best_season": "Summer",
+            "created_at": now,
+        }
+        for park_id in park_ids
+        for i in range(spec["trails_per_park"])
+    ])
+    trail_ids = [t[0] for t in db.query(models.Trail.id).all()]
+
+    db.execute(insert(models.Campsite), [
+        {
+            "park_id": park_id,
+            "name": f"Campground {park_id}-{i}",
+            "elevation": rng.randint(500, 9000),
+            "has_water": rng.random() < 0.6,
+            "has_toilets": rng.random() < 0.7,
+            "max_occupancy": rng.choice([4, 6, 8, 12]),
+            "description": "Synthetic campground",
+            "booking_opens": now + timedelta(days=rng.randint(-30, 180)),
+            "created_at": now,
+        }
+        for park_id in park_ids
+        for i in range(spec["campsites_per_park"])
+    ])
+    campsite_ids = [c[0] for c in db.query(models.Campsite.id).all()]
+
+    db.execute(insert(models.Badge), [
+        {"name": name, "description": name, "icon_url": "", "criteria": criteria, "created_at": now}
+        for name, criteria in BADGES
+    ])
+    badge_ids = [b[0] for b in db.query(models.Badge.id).all()]
+
+    db.execute(insert(models.User), [
+        {
+            "name": f"Hiker {i}",
+            "email": f"hiker{i}@bench.test",
+            "is_public": rng.random() < 0.9,
+            "total_points": rng.randint(0, 20000),
+            "created_at": now,
+        }
+        for i in range(spec["users"])
+    ])
+    user_ids = [u[0] for u in db.query(models.User.id).order_by(models.User.id).all()]
+    hot_user_id = user_ids[0]
+    db.query(models.User).filter(models.User.id == hot_user_id).update({"is_public": True})
+
+    hikes = []
+    visits = []
+    for user_id in user_ids:
+        n_hikes = spec["hot_hikes"] if user_id == hot_user_id else spec["hikes_per_user"]
+        n_visits = spec["hot_visits"] if user_id == hot_user_id else spec["visits_per_user"]
+        hikes.extend(_hike_row(rng, user_id, trail_ids, now) for _ in range(n_hikes))
+        for park_id in rng.sample(park_ids, min(n_visits, len(park_ids))):
+            visits.append({
+                "user_id": user_id,
+                "park_id": park_id,
+                "visit_date": now - timedelta(days=rng.randint(0, 1500)),
+                "duration_days": rng.randint(1, 7),
+                "rating": rng.randint(1, 5),
+                "highlights": "Synthetic visit",
+                "photos_count": rng.randint(0, 30),
+                "visited": rng.random() < 0.85,
+                "created_at": now,
+            })
+    db.execute(insert(models.TrailHike), hikes)
+    db.execute(insert(models.Visit), visits)
+
+    db.execute(insert(models.Wishlist), [
+        {
+            "user_id": hot_user_id,
+            "campsite_id": campsite_id,
+            "notification_hours_before": rng.choice([1, 6, 24]),
+            "created_at": now,
+        }
+        for campsite_id in rng.sample(campsite_ids, min(spec["hot_wishlist"], len(campsite_ids)))
+    ])
+    db.execute(insert(models.Sighting), [
+        {
+            "user_id": hot_user_id,
+            "park_id": rng.choice(park_ids),
+            "wildlife": rng.choice(WILDLIFE),
+            "sighting_date": now - timedelta(days=rng.randint(0, 365)),
+            "location": rng.choice(LOCATIONS),
+            "notes": "Synthetic sighting",
+            "created_at": now,
+        }
+        for _ in range(spec["hot_sightings"])
+    ])
+    db.execute(insert(models.UserAchievement), [
+        {"user_id": hot_user_id, "badge_id": badge_id, "earned_date": now, "created_at": now}
+        for badge_id in badge_ids
+    ])
+    db.execute(insert(models.Challenge), [
+        {
+            "title": f"Challenge {kind}",
+            "description": "Synthetic challenge",
+            "challenge_type": kind,
+            "target_value": 1000000,
+            "start_date": now - timedelta(days=15),
+            "end_date": now + timedelta(days=15),
+            "reward_points": 100,
+            "created_at": now,
+        }
+        for kind in ("visit_parks", "hike_miles", "elevation")
+    ])
+    db.execute(insert(models.GarminAuth), [{
+        "user_id": hot_user_id,
+        "access_token": "bench-token",
+        "refresh_token": "bench-refresh",
+        "token_expires_at": now + timedelta(days=30),
+        "garmin_user_id": "bench-garmin-user",
+        "connected": True,
+        "created_at": now,
+        "updated_at": now,
+    }])
+    db.commit()
+    # Core inserts skip the write routes, so derive the aggregates they would have kept
+    WildlifeRollupService.rebuild(db)
+    PopularityService.rebuild(db)
+    ActivityRollupService.rebuild(db)
+    ScopeStatsService.rebuild(db)
+    booking_alerts.rebuild(db)
+
+    return {
+        "hot_user_id": hot_user_id,
+        "park_id": park_ids[0],
+        "trail_id": trail_ids[0],
+        "campsite_id": campsite_ids[0],
+        "users": len(user_ids),
+        "hikes": len(hikes),
+    }
@@ -0,0 +1,91 @@
+"""Faceted filter latency over a synthetic campsite catalog.
+
+Builds the campsite facet index over N generated campsites (no database) and
+times random AND/OR filter combinations including full facet counts.
+
+Usage:
+    python -m benchmarks.facets --campsites 20000
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from app.facets import FacetIndex, campsite_facets
+
+REGIONS = ["Pacific", "Southwest", "Rockies", "Midwest", "Southeast", "Northeast", "Alaska"]
+STATES = ["CA", "AZ", "UT", "CO", "WY", "MT", "WA", "OR", "AK", "FL", "ME", "TN", "NC", "TX"]
+ELEVATIONS = ["<2000", "2000-5000", "5000-8000", "8000+"]
+
+
+def synthetic_catalog(n: int, seed: int = 5) -> tuple:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        rows.append({
+            "id": i + 1,
+            "park_id": rng.randint(1, 63),
+            "name": f"Site {i}",
+            "elevation": rng.randint(0, 11000),
+            "has_water": rng.random() < 0.6,
+            "has_toilets": rng.random() < 0.7,
+            "max_occupancy": rng.choice([2, 4, 6, 8, 10, 12, 20]),
+            "description": "",
+            "booking_opens": None,
+            "created_at": None,
+            "region": rng.choice(REGIONS),
+            "state": rng.choice(STATES),
+        })
+    return rows, rows
+
+
+def random_filter(rng: random.Random) -> tuple:
+    selections = {
+        "region": rng.sample(REGIONS, rng.randint(0, 2)),
+        "state": rng.sample(STATES, rng.randint(0, 3)),
+        "has_water": rng.choice([None, [True]]),
+        "has_toilets": rng.choice([None, [True], [False]]),
+        "elevation": rng.sample(ELEVATIONS, rng.randint(0, 2)),
+    }
+    ranges = {"max_occupancy": (rng.choice([None, 4, 6]), rng.choice([None, 12]))}
+    return selections, ranges
+
+
+def run(campsites: int = 20000, queries: int = 2000) -> dict:
+    catalog = synthetic_catalog(campsites)
+    index = FacetIndex(lambda db: catalog, campsite_facets.facets, max_age=float("inf"))
+
+    start = time.perf_counter()
+    index.snapshot(None)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    rng = random.Random(9)
+    filters = [random_filter(rng) for _ in range(queries)]
+    samples = []
+    for selections, ranges in filters:
+        t0 = time.perf_counter()
+        index.query(None, selections, ranges, limit=50)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return {
+        "campsites": campsites,
+        "build_ms": build_ms,
+        "p50_us": statistics.median(samples),
+        "p95_us": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--campsites", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    r = run(args.campsites, args.queries)
+    print(f"{r['campsites']} campsites; index built in {r['build_ms']:.1f} ms")
+    print(f"  filter + facet counts  p50 {r['p50_us']:.0f} us   p95 {r['p95_us']:.0f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Log-linear latency histogram with HdrHistogram-style output.
+
+Values are recorded as integer microseconds. Values below 2048us are kept
+exactly; above that each power-of-two range is split into 1024 linear
+sub-buckets, which bounds the relative error to about 0.1%. That is the
+same layout HdrHistogram uses with three significant digits, and the
+`.hgrm` text written by `write_hgrm` can be loaded by the usual HDR plotting
+tools to compare configurations.
+"""
+import math
+
+SUB_BUCKET_BITS = 11
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT // 2
+
+
+def _index_for(value: int) -> int:
+    if value < SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    top = value >> shift
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + (top - SUB_BUCKET_HALF)
+
+
+def _highest_equivalent(index: int) -> int:
+    if index < SUB_BUCKET_COUNT:
+        return index
+    offset = index - SUB_BUCKET_COUNT
+    shift = offset // SUB_BUCKET_HALF + 1
+    top = offset % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    return ((top + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Records latencies in microseconds and answers percentile queries."""
+
+    def __init__(self):
+        self.counts = [0] * SUB_BUCKET_COUNT
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self._sum = 0
+        self._sum_sq = 0
+
+    def record(self, value_us: int, count: int = 1):
+        """Record a latency value (microseconds)."""
+        value_us = max(0, int(value_us))
+        index = _index_for(value_us)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += count
+        self.total += count
+        self._sum += value_us * count
+        self._sum_sq += value_us * value_us * count
+        self.max = max(self.max, value_us)
+        self.min = value_us if self.min is None else min(self.min, value_us)
+
+    def record_seconds(self, seconds: float):
+        self.record(round(seconds * 1_000_000))
+
+    def merge(self, other: "LatencyHistogram"):
+        """Add another histogram's samples into this one."""
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self._sum += other._sum
+        self._sum_sq += other._sum_sq
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    @property
+    def mean(self) -> float:
+        return self._sum / self.total if self.total else 0.0
+
+    @property
+    def stddev(self) -> float:
+        if not self.total:
+            return 0.0
+        variance = self._sum_sq / self.total - self.mean ** 2
+        return math.sqrt(max(variance, 0.0))
+
+    def percentile(self, pct: float) -> int:
+        """Value (microseconds) at or below which `pct` percent of samples fall."""
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(pct / 100 * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(_highest_equivalent(index), self.max)
+        return self.max
+
+    def count_at_or_below(self, value_us: int) -> int:
+        """Number of recorded samples in buckets up to and including `value_us`."""
+        last = min(_index_for(max(0, int(value_us))), len(self.counts) - 1)
+        return sum(self.counts[:last + 1])
+
+    def _percentile_ticks(self, ticks_per_half_distance: int = 5):
+        pct = 0.0
+        while pct < 100.0:
+            yield pct
+            halvings = math.floor(math.log2(100.0 / (100.0 - pct))) + 1
+            pct += 100.0 / (ticks_per_half_distance * 2 ** halvings)
+            if 100.0 - pct < 1e-9:
+                break
+        yield 100.0
+
+    def write_hgrm(self, stream, scale: float = 1000.0):
+        """Write the percentile distribution in HdrHistogram's .hgrm format.
+
+        `scale` divides recorded values; the default reports milliseconds.
+        """
+        stream.write(f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}\n\n")
+        for pct in self._percentile_ticks():
+            value_us = self.percentile(pct)
+            value = value_us / scale
+            fraction = pct / 100.0
+            below = self.count_at_or_below(value_us) if self.total else 0
+            inverse = f"{1 / (1 - fraction):14.2f}" if fraction < 1.0 else ""
+            stream.write(f"{value:12.3f} {fraction:14.12f} {below:10d} {inverse}\n")
+            if below >= self.total:
+                break
+        stream.write(f"#[Mean    = {self.mean / scale:12.3f}, StdDeviation   = {self.stddev / scale:12.3f}]\n")
+        stream.write(f"#[Max     = {self.max / scale:12.3f}, Total count    = {self.total:12d}]\n")
+        buckets = max(1, (len(self.counts) - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF + 1)
+        stream.write(f"#[Buckets = {buckets:12d}, SubBuckets     = {SUB_BUCKET_COUNT:12d}]\n")
@@ -0,0 +1,434 @@
+"""Asyncio load generator for a running National Park Tracker API.
+
+Replays a weighted mix of reads and writes (leaderboard polls, user stats,
+hike logging, wishlist edits, Garmin imports, featured campsites) either at
+a target request rate (open loop) or with a fixed number of concurrent
+workers (closed loop), then reports throughput, error rate and latency
+percentiles per route.
+
+In open-loop mode latency is measured from each request's scheduled start,
+so a stalled server shows up as queueing delay instead of silently lowering
+the offered load.
+
+Usage:
+    # Spawn uvicorn plus the provider stubs, 50 requests/s for 30s
+    python -m benchmarks.loadgen --spawn --rps 50 --duration 30
+
+    # Against an already-running server with 16 concurrent workers
+    python -m benchmarks.loadgen --base-url http://127.0.0.1:8001 --concurrency 16
+
+    # Save per-route .hgrm files to compare configurations
+    python -m benchmarks.loadgen --spawn --rps 100 --hgrm-dir results/workers-4 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+import httpx
+from benchmarks.histogram import LatencyHistogram
+
+DEFAULT_MIX = {
+    "leaderboard": 30,
+    "user_stats": 20,
+    "log_hike": 15,
+    "wishlist_get": 10,
+    "wishlist_add": 8,
+    "wishlist_update": 5,
+    "wishlist_remove": 4,
+    "garmin_import": 4,
+    "featured_campsites": 4,
+}
+
+
+class Fixtures:
+    """Users, trails and campsites created through the API before the run."""
+
+    def __init__(self, user_ids: list, trail_id: int, campsite_ids: list, garmin_user_ids: list):
+        self.user_ids = user_ids
+        self.trail_id = trail_id
+        self.campsite_ids = campsite_ids
+        self.garmin_user_ids = garmin_user_ids
+        self.wishlisted = {user_id: set() for user_id in user_ids}
+
+
+async def prepare_fixtures(client: httpx.AsyncClient, users: int = 20, campsites: int = 12) -> Fixtures:
+    """Create the records the traffic mix operates on."""
+    tag = uuid.uuid4().hex[:8]
+    r = await client.post("/api/v1/parks", json={
+        "name": f"Load Test Park {tag}", "state": "CA", "region": "Pacific",
+        "established": "1890", "area_sq_miles": 1000.0, "description": "Load test park",
+        "latitude": 37.8, "longitude": -119.5,
+    })
+    r.raise_for_status()
+    park_id = r.json()["id"]
+
+    r = await client.post(f"/api/v1/parks/{park_id}/trails", json={
+        "park_id": park_id, "name": f"Load Test Trail {tag}", "difficulty": "Moderate",
+        "distance_miles": 6.2, "elevation_gain_ft": 1200, "description": "Load test trail",
+        "best_season": "Summer",
+    })
+    r.raise_for_status()
+    trail_id = r.json()["id"]
+
+    campsite_ids = []
+    for n in range(campsites):
+        r = await client.post(f"/api/v1/parks/{park_id}/campsites", json={
+            "park_id": park_id, "name": f"Load Test Campground {tag}-{n}", "elevation": 4000,
+            "has_water": True, "has_toilets": n % 2 == 0, "max_occupancy": 6,
+            "description": "Load test campground",
+        })
+        r.raise_for_status()
+        campsite_ids.append(r.json()["id"])
+
+    user_ids = []
+    garmin_user_ids = []
+    for n in range(users):
+        r = await client.post("/api/v1/users", json={"name": f"Load Hiker {n}", "email": f"load-{tag}-{n}@test.local"})
+        r.raise_for_status()
+        user_id = r.json()["id"]
+        user_ids.append(user_id)
+        # Only succeeds when the API's Garmin endpoints point at a stub.
+        r = await client.post(f"/api/v1/users/{user_id}/garmin/token", params={"auth_code": "load-test"})
+        if r.status_code == 200:
+            garmin_user_ids.append(user_id)
+
+    return Fixtures(user_ids, trail_id, campsite_ids, garmin_user_ids)
+
+
+# ============ Traffic mix ============
+# Each operation returns (route label, response).
+
+async def op_leaderboard(client, fx, rng):
+    sort_by = rng.choice(["points", "points", "miles", "parks"])
+    return "GET /leaderboard", await client.get("/api/v1/leaderboard", params={"sort_by": sort_by})
+
+
+async def op_user_stats(client, fx, rng):
+    user_id = rng.choice(fx.user_ids)
+    return "GET /users/{id}/stats", await client.get(f"/api/v1/users/{user_id}/stats")
+
+
+async def op_log_hike(client, fx, rng):
+    user_id = rng.choice(fx.user_ids)
+    return "POST /users/{id}/hikes", await client.post(f"/api/v1/users/{user_id}/hikes", json={
+        "trail_id": fx.trail_id,
+        "hike_date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T08:00:00",
+        "duration_minutes": rng.randint(30, 300),
+        "distance_miles": round(rng.uniform(1, 12), 2),
+        "elevation_gain": rng.randint(0, 3000),
+        "difficulty_experienced": "Moderate",
+        "fitness_tracker_source": "manual",
+    })
+
+
+async def op_wishlist_get(client, fx, rng):
+    user_id = rng.choice(fx.user_ids)
+    return "GET /users/{id}/wishlist", await client.get(f"/api/v1/users/{user_id}/wishlist")
+
+
+async def op_wishlist_add(client, fx, rng):
+    user_id = rng.choice(fx.user_ids)
+    campsite_id = rng.choice(fx.campsite_ids)
+    response = await client.post(f"/api/v1/users/{user_id}/wishlist", json={
+        "campsite_id": campsite_id, "notification_hours_before": rng.choice([1, 6, 24]),
+    })
+    if response.status_code < 400:
+        fx.wishlisted[user_id].add(campsite_id)
+    return "POST /users/{id}/wishlist", response
+
+
+async def op_wishlist_update(client, fx, rng):
+    candidates = [u for u in fx.user_ids if fx.wishlisted[u]]
+    if not candidates:
+        return await op_wishlist_add(client, fx, rng)
+    user_id = rng.choice(candidates)
+    campsite_id = rng.choice(sorted(fx.wishlisted[user_id]))
+    return "PUT /users/{id}/wishlist/{campsite_id}", await client.put(
+        f"/api/v1/users/{user_id}/wishlist/{campsite_id}",
+        params={"notification_hours": rng.choice([1, 12, 48])},
+    )
+
+
+async def op_wishlist_remove(client, fx, rng):
+    candidates = [u for u in fx.user_ids if fx.wishlisted[u]]
+    if not candidates:
+        return await op_wishlist_add(client, fx, rng)
+    user_id = rng.choice(candidates)
+    campsite_id = fx.wishlisted[user_id].pop()
+    return "DELETE /users/{id}/wishlist/{campsite_id}", await client.delete(
+        f"/api/v1/users/{user_id}/wishlist/{campsite_id}"
+    )
+
+
+async def op_garmin_import(client, fx, rng):
+    if not fx.garmin_user_ids:
+        return await op_user_stats(client, fx, rng)
+    user_id = rng.choice(fx.garmin_user_ids)
+    return "POST /users/{id}/garmin/import", await client.post(
+        f"/api/v1/users/{user_id}/garmin/import", params={"limit": 10}
+    )
+
+
+async def op_featured_campsites(client, fx, rng):
+    return "GET /campsites/featured", await client.get("/api/v1/campsites/featured")
+
+
+OPERATIONS = {
+    "leaderboard": op_leaderboard,
+    "user_stats": op_user_stats,
+    "log_hike": op_log_hike,
+    "wishlist_get": op_wishlist_get,
+    "wishlist_add": op_wishlist_add,
+    "wishlist_update": op_wishlist_update,
+    "wishlist_remove": op_wishlist_remove,
+    "garmin_import": op_garmin_import,
+    "featured_campsites": op_featured_campsites,
+}
+
+
+# ============ Runner ============
+
+class RouteStats:
+    """Latency histogram and outcome counters for one route."""
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.count = 0
+        self.errors = 0
+        self.statuses = {}
+
+    def record(self, seconds: float, status: int):
+        self.histogram.record_seconds(seconds)
+        self.count += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status >= 400 or status == 0:
+            self.errors += 1
+
+
+class LoadReport:
+    """Per-route results of a load run."""
+
+    def __init__(self, routes: dict, elapsed: float, mode: str):
+        self.routes = routes
+        self.elapsed = elapsed
+        self.mode = mode
+
+    def overall(self) -> RouteStats:
+        total = RouteStats()
+        for stats in self.routes.values():
+            total.histogram.merge(stats.histogram)
+            total.count += stats.count
+            total.errors += stats.errors
+        return total
+
+    def summary(self) -> dict:
+        def row(stats: RouteStats) -> dict:
+            h = stats.histogram
+            return {
+                "requests": stats.count,
+                "throughput_rps": round(stats.count / self.elapsed, 2) if self.elapsed else 0.0,
+                "error_rate": round(stats.errors / stats.count, 4) if stats.count else 0.0,
+                "p50_ms": h.percentile(50) / 1000,
+                "p95_ms": h.percentile(95) / 1000,
+                "p99_ms": h.percentile(99) / 1000,
+                "max_ms": h.max / 1000,
+                "statuses": {str(k): v for k, v in sorted(stats.statuses.items())},
+            }
+        return {
+            "mode": self.mode,
+            "elapsed_s": round(self.elapsed, 3),
+            "routes": {label: row(stats) for label, stats in sorted(self.routes.items())},
+            "overall": row(self.overall()),
+        }
+
+    def print_table(self):
+        summary = self.summary()
+        print(f"\n{summary['mode']} run, {summary['elapsed_s']}s")
+        print(f"{'route':<42}{'reqs':>7}{'rps':>9}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        rows = list(summary["routes"].items()) + [("TOTAL", summary["overall"])]
+        for label, r in rows:
+            print(f"{label:<42}{r['requests']:>7}{r['throughput_rps']:>9.1f}{r['error_rate'] * 100:>7.2f}"
+                  f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['max_ms']:>9.2f}")
+
+    def write_hgrm(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        histograms = dict((label, stats.histogram) for label, stats in self.routes.items())
+        histograms["TOTAL"] = self.overall().histogram
+        for label, histogram in histograms.items():
+            name = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_").lower()
+            with open(directory / f"{name}.hgrm", "w") as f:
+                histogram.write_hgrm(f)
+
+
+async def run_load(client: httpx.AsyncClient, fixtures: Fixtures, mix: dict = None,
+                   duration: float = 10.0, rps: float = None, concurrency: int = 16,
+                   seed: int = 0) -> LoadReport:
+    """Drive traffic against `client` and collect per-route statistics.
+
+    With `rps` set the run is open-loop (requests are issued on schedule, at
+    most `concurrency` in flight); otherwise `concurrency` workers issue
+    requests back to back.
+    """
+    mix = mix or DEFAULT_MIX
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    rng = random.Random(seed)
+    routes = {}
+
+    async def issue(scheduled: float):
+        op = OPERATIONS[rng.choices(names, weights)[0]]
+        try:
+            label, response = await op(client, fixtures, rng)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            label, status = f"{op.__name__[3:]} (transport error: {type(e).__name__})", 0
+        routes.setdefault(label, RouteStats()).record(time.perf_counter() - scheduled, status)
+
+    started = time.perf_counter()
+    deadline = started + duration
+
+    if rps:
+        in_flight = asyncio.Semaphore(concurrency)
+        interval = 1.0 / rps
+        pending = set()
+
+        async def scheduled_request(scheduled: float):
+            async with in_flight:
+                await issue(scheduled)
+
+        n = 0
+        while True:
+            scheduled = started + n * interval
+            if scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(scheduled_request(scheduled))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            n += 1
+        if pending:
+            await asyncio.gather(*pending)
+        mode = f"open-loop {rps} rps"
+    else:
+        async def worker():
+            while time.perf_counter() < deadline:
+                await issue(time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        mode = f"closed-loop {concurrency} workers"
+
+    return LoadReport(routes, time.perf_counter() - started, mode)
+
+
+# ============ Local servers ============
+
+def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+
+@contextmanager
+def spawn_servers(port: int = 8011, stub_port: int = 8090, workers: int = 1, stub_latency_ms: float = 20.0):
+    """Run uvicorn for the API and the provider stubs against a temp database."""
+    tmpdir = tempfile.mkdtemp(prefix="npt-load-")
+    stub_base = f"http://127.0.0.1:{stub_port}"
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmpdir}/load.db",
+        GARMIN_API_BASE=f"{stub_base}/garmin",
+        GARMIN_TOKEN_URL=f"{stub_base}/garmin/oauth/token",
+        RECREATION_GOV_API=f"{stub_base}/recreation",
+        STUB_LATENCY_MS=str(stub_latency_ms),
+    )
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning"]
+    stub = subprocess.Popen(uvicorn + ["--port", str(stub_port), "benchmarks.stubs:app"], env=env)
+    api = subprocess.Popen(uvicorn + ["--port", str(port), "--workers", str(workers), "app.main:app"], env=env)
+    try:
+        _wait_ready(f"{stub_base}/docs")
+        _wait_ready(f"http://127.0.0.1:{port}/api/v1/health")
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        for proc in (api, stub):
+            proc.terminate()
+        for proc in (api, stub):
+            proc.wait(timeout=10)
+
+
+def _parse_mix(text: str) -> dict:
+    mix = dict(DEFAULT_MIX)
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    return mix
+
+
+async def _main(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        fixtures = await prepare_fixtures(client, users=args.users)
+        report = await run_load(
+            client, fixtures, mix=_parse_mix(args.mix) if args.mix else None,
+            duration=args.duration, rps=args.rps, concurrency=args.concurrency, seed=args.seed,
+        )
+    report.print_table()
+    if args.hgrm_dir:
+        report.write_hgrm(args.hgrm_dir)
+        print(f"Wrote .hgrm files to {args.hgrm_dir}")
+    return report.summary()
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--spawn", action="store_true",
+                        help="Start the API and provider stubs locally instead of using --base-url")
+    parser.add_argument("--port", type=int, default=8011, help="API port when spawning")
+    parser.add_argument("--stub-port", type=int, default=8090)
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when spawning")
+    parser.add_argument("--rps", type=float, default=None, help="Target request rate (open loop)")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Workers (closed loop) or max in-flight requests (open loop)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of traffic")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--mix", default=None, help="Weight overrides, e.g. leaderboard=50,log_hike=5")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hgrm-dir", type=Path, default=None)
+    parser.add_argument("--json", type=Path, default=None, help="Write the summary as JSON")
+    args = parser.parse_args(argv)
+
+    if args.spawn:
+        with spawn_servers(args.port, args.stub_port, args.workers, args.stub_latency_ms) as base_url:
+            args.base_url = base_url
+            summary = asyncio.run(_main(args))
+    else:
+        summary = asyncio.run(_main(args))
+
+    if args.json:
+        args.json.write_text(json.dumps(summary, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Rank/percentile lookup and update latency at millions of users.
+
+Builds the per-metric rank trees over N synthetic users (no database) and
+times rank lookups and score updates for random users.
+
+Usage:
+    python -m benchmarks.ranking --users 1000000
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from app.ranking import RESOLUTION, ScoreRanking
+
+
+def synthetic_scores(users: int, seed: int = 13) -> dict:
+    rng = random.Random(seed)
+    return {
+        "points": {u: int(rng.paretovariate(1.5) * 100) for u in range(1, users + 1)},
+        "miles": {u: round(rng.expovariate(1 / 120), 1) for u in range(1, users + 1)},
+        "parks": {u: min(63, int(rng.expovariate(1 / 6))) for u in range(1, users + 1)},
+    }
+
+
+def _timed(fn, calls: list) -> list:
+    samples = []
+    for args in calls:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return samples
+
+
+def run(users: int = 1000000, operations: int = 20000) -> dict:
+    scores = synthetic_scores(users)
+    rng = random.Random(2)
+    results = {"users": users, "metrics": {}}
+    for metric, by_user in scores.items():
+        start = time.perf_counter()
+        ranking = ScoreRanking(by_user, RESOLUTION[metric])
+        build_seconds = time.perf_counter() - start
+        lookups = _timed(ranking.rank, [(rng.randint(1, users),) for _ in range(operations)])
+        updates = _timed(ranking.add, [(rng.randint(1, users), rng.randint(1, 50)) for _ in range(operations)])
+        results["metrics"][metric] = {
+            "build_seconds": build_seconds,
+            "buckets": len(ranking.counts),
+            "rank_p50_us": statistics.median(lookups),
+            "rank_p99_us": lookups[int(len(lookups) * 0.99) - 1],
+            "update_p50_us": statistics.median(updates),
+            "update_p99_us": updates[int(len(updates) * 0.99) - 1],
+        }
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--operations", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    r = run(args.users, args.operations)
+    print(f"{r['users']} users")
+    for metric, m in r["metrics"].items():
+        print(f"  {metric:<7} built in {m['build_seconds']:.2f}s ({m['buckets']} buckets)   "
+              f"rank p50 {m['rank_p50_us']:.1f} us  p99 {m['rank_p99_us']:.1f} us   "
+              f"update p50 {m['update_p50_us']:.1f} us  p99 {m['update_p99_us']:.1f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
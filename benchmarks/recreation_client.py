@@ -0,0 +1,142 @@
+"""Recreation.gov call throughput: pooled client vs a client per call.
+
+Starts the provider stubs (benchmarks/stubs.py) under uvicorn and fetches
+campground months through `RecreationGovService` four ways:
+
+    per-call async   a new httpx.AsyncClient per request (the old service)
+    pooled async     one shared client with keep-alive connections
+    per-call sync    a new event loop and client per request (the old
+                     RecreationGovSync)
+    pooled sync      RecreationGovSync's persistent loop thread
+
+Async modes run `--concurrency` requests at a time; sync modes run them
+one after another.
+
+Usage:
+    python -m benchmarks.recreation_client --requests 500 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+import httpx
+from app.metrics import MetricsRegistry
+from app.recreation_service import RecreationGovService, RecreationGovSync
+from app.resilience import OutboundGuard
+
+
+@contextmanager
+def spawn_stub(port: int = 8091, latency_ms: float = 0.0):
+    """Run the provider stubs under uvicorn; yields the Recreation.gov base URL."""
+    env = dict(os.environ, STUB_LATENCY_MS=str(latency_ms))
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port", str(port),
+                             "--log-level", "warning", "benchmarks.stubs:app"], env=env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                if httpx.get(f"{base}/docs", timeout=1.0).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        else:
+            raise RuntimeError(f"Stub server at {base} did not become ready")
+        yield f"{base}/recreation"
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def stub_service(api: str) -> RecreationGovService:
+    # Unthrottled, so the numbers measure connection handling rather than the rate limit
+    guard = OutboundGuard("recreation_gov", rate=0, shared=None, registry=MetricsRegistry())
+    service = RecreationGovService(guard=guard)
+    service.BASE_URL = f"{api}/availability/campgrounds"
+    service.SEARCH_URL = f"{api}/search"
+    return service
+
+
+async def per_call_fetch(service: RecreationGovService, campground_id: int, month: str):
+    """The service before pooling: a fresh client, and so a fresh connection, per call."""
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f"{service.BASE_URL}/{campground_id}/month/{month}", timeout=10.0)
+        return response.json() if response.status_code == 200 else None
+
+
+async def _drive(fetch, requests: int, concurrency: int):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(n: int):
+        async with limit:
+            assert await fetch(100000 + n % 50, "2024-07-01")
+
+    await asyncio.gather(*(one(n) for n in range(requests)))
+
+
+def run(requests: int = 500, concurrency: int = 16, latency_ms: float = 0.0, port: int = 8091) -> dict:
+    results = {}
+
+    def timed(mode: str, fn, calls: int):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        results[mode] = {"requests": calls, "seconds": elapsed, "rps": calls / elapsed}
+
+    with spawn_stub(port, latency_ms) as api:
+        service = stub_service(api)
+
+        async def pooled():
+            try:
+                await _drive(service.get_campground_availability, requests, concurrency)
+            finally:
+                await service.aclose()
+
+        timed("per-call async", lambda: asyncio.run(
+            _drive(lambda *a: per_call_fetch(service, *a), requests, concurrency)), requests)
+        timed("pooled async", lambda: asyncio.run(pooled()), requests)
+
+        sync_calls = max(1, requests // 4)
+
+        def per_call_sync():
+            for n in range(sync_calls):
+                loop = asyncio.new_event_loop()
+                try:
+                    assert loop.run_until_complete(per_call_fetch(service, 100000 + n % 50, "2024-07-01"))
+                finally:
+                    loop.close()
+
+        sync = RecreationGovSync(stub_service(api))
+
+        def pooled_sync():
+            for n in range(sync_calls):
+                assert sync.get_availability(100000 + n % 50, "2024-07-01")
+
+        timed("per-call sync", per_call_sync, sync_calls)
+        try:
+            timed("pooled sync", pooled_sync, sync_calls)
+        finally:
+            sync.close()
+    return {"concurrency": concurrency, "latency_ms": latency_ms, "modes": results}
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Artificial stub latency per response")
+    parser.add_argument("--port", type=int, default=8091)
+    args = parser.parse_args(argv)
+
+    r = run(args.requests, args.concurrency, args.latency_ms, args.port)
+    print(f"Concurrency {r['concurrency']}, stub latency {r['latency_ms']:.0f} ms")
+    for mode, m in r["modes"].items():
+        print(f"  {mode:<15} {m['requests']:>6} requests in {m['seconds']:.2f}s   {m['rps']:.0f} req/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""Endpoint benchmark suite with JSON baselines and regression gating.
+
+Each dataset size gets its own throwaway SQLite database. For every hot
+endpoint the runner records latency (p50/p95/mean), SQL statements per
+request and peak traced memory, then compares the numbers against the saved
+baseline for that size.
+
+Usage:
+    python -m benchmarks.run_endpoints --sizes small,medium
+    python -m benchmarks.run_endpoints --sizes small --save-baseline
+    python -m benchmarks.run_endpoints --sizes large --threshold 0.5
+
+Exits with status 1 when any metric regresses beyond the threshold.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+# Keep the app's default engine away from the working directory; each
+# dataset gets its own database below.
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='npt-bench-')}/app.db"
+)
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from benchmarks.datasets import SIZES, build_dataset
+from benchmarks.stubs import synthetic_track
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+
+DEFAULT_ITERATIONS = {"small": 30, "medium": 15, "large": 5}
+
+# Regressions smaller than these absolute amounts are treated as noise.
+MIN_LATENCY_DELTA_MS = 1.0
+MIN_MEMORY_DELTA_KB = 64.0
+
+ENDPOINTS = {
+    "leaderboard_points": ("GET", "/api/v1/leaderboard?sort_by=points&limit=100"),
+    "leaderboard_miles": ("GET", "/api/v1/leaderboard?sort_by=miles&limit=100"),
+    "leaderboard_week": ("GET", "/api/v1/leaderboard?window=week&sort_by=miles&limit=100"),
+    "user_stats": ("GET", "/api/v1/users/{user_id}/stats"),
+    "user_challenges": ("GET", "/api/v1/users/{user_id}/challenges"),
+    "wishlist": ("GET", "/api/v1/users/{user_id}/wishlist"),
+    "public_profile": ("GET", "/api/v1/users/{user_id}/public-profile"),
+    "log_hike": ("POST", "/api/v1/users/{user_id}/hikes"),
+    "garmin_import": ("POST", "/api/v1/users/{user_id}/garmin/import?limit=20"),
+    "park_wildlife": ("GET", "/api/v1/parks/{park_id}/wildlife?months=12"),
+    "user_timeseries": ("GET", "/api/v1/users/{user_id}/timeseries?bucket=week&periods=52"),
+}
+
+
+class MockGarminActivities:
+    """Stands in for GarminConnectService.get_activities.
+
+    Every call returns fresh activity ids so the import path inserts rows
+    instead of only exercising the duplicate check.
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    async def __call__(self, access_token: str, limit: int = 50, start: int = 0) -> list:
+        activities = []
+        for i in range(limit):
+            activity_id = next(self._ids)
+            activities.append({
+                "id": f"bench-{activity_id}",
+                "activityName": f"Bench Hike {activity_id}",
+                "activityType": {"typeKey": "hiking" if i % 4 else "cycling"},
+                "startTimeInSeconds": 1_700_000_000_000 + activity_id * 3_600_000,
+                "duration": 5400,
+                "distance": 8046.7,
+                "elevationGain": 350,
+                "calories": 640,
+            })
+        return activities
+
+
+class QueryCounter:
+    """Counts SQL statements executed on an engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+async def mock_activity_details(activity_id: str, access_token: str) -> dict:
+    """Stands in for GarminConnectService.get_activity_details with a stub track."""
+    number = int(str(activity_id).rpartition("-")[2])
+    return {"id": activity_id, "geoPolylineDTO": {"polyline": synthetic_track(number, 200)}}
+
+
+@contextmanager
+def _patched_garmin():
+    from app.garmin_service import garmin_service
+    original = garmin_service.get_activities, garmin_service.get_activity_details
+    garmin_service.get_activities = MockGarminActivities()
+    garmin_service.get_activity_details = mock_activity_details
+    try:
+        yield
+    finally:
+        garmin_service.get_activities, garmin_service.get_activity_details = original
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def _request_body(name: str, ids: dict) -> dict:
+    if name == "log_hike":
+        return {
+            "trail_id": ids["trail_id"],
+            "hike_date": "2024-06-01T08:00:00",
+            "duration_minutes": 95,
+            "distance_miles": 4.2,
+            "elevation_gain": 800,
+            "difficulty_experienced": "Moderate",
+            "fitness_tracker_source": "manual",
+        }
+    return None
+
+
+def measure_endpoint(client, counter: QueryCounter, method: str, url: str,
+                     body: dict = None, iterations: int = 10, warmup: int = 2) -> dict:
+    """Benchmark a single endpoint and return its summary metrics."""
+    def call():
+        response = client.request(method, url, json=body)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}: {response.text}")
+
+    for _ in range(warmup):
+        call()
+
+    latencies = []
+    counter.count = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    queries = counter.count / iterations
+
+    # Memory is traced in a separate call so tracemalloc overhead does not
+    # leak into the latency numbers.
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "queries": round(queries, 2),
+        "peak_kb": round(peak / 1024, 1),
+        "iterations": iterations,
+    }
+
+
+def run_size(size: str, iterations: int = None, seed: int = 42, endpoints: list = None) -> dict:
+    """Build a dataset of the given size and benchmark every hot endpoint."""
+    from fastapi.testclient import TestClient
+    from app.database import Base, get_db
+    from app.main import app
+
+    iterations = iterations or DEFAULT_ITERATIONS[size]
+    names = endpoints or list(ENDPOINTS)
+
+    with tempfile.TemporaryDirectory(prefix="npt-bench-") as tmpdir:
+        engine = create_engine(
+            f"sqlite:///{tmpdir}/bench.db", connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(bind=engine)
+        BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        db = BenchSession()
+        try:
+            ids = build_dataset(db, size, seed)
+        finally:
+            db.close()
+
+        def override_get_db():
+            db = BenchSession()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = override_get_db
+        results = {}
+        try:
+            with _patched_garmin(), QueryCounter(engine) as counter:
+                client = TestClient(app)
+                for name in names:
+                    method, path = ENDPOINTS[name]
+                    url = path.format(user_id=ids["hot_user_id"], park_id=ids["park_id"])
+                    results[name] = measure_endpoint(
+                        client, counter, method, url, _request_body(name, ids), iterations
+                    )
+        finally:
+            app.dependency_overrides.pop(get_db, None)
+            engine.dispose()
+
+    return {
+        "size": size,
+        "dataset": {"users": ids["users"], "hikes": ids["hikes"]},
+        "endpoints": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.25) -> list:
+    """Return human-readable regressions of `current` against `baseline`."""
+    regressions = []
+    for name, metrics in current["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base:
+            continue
+        limit = 1 + threshold
+        if (metrics["p50_ms"] > base["p50_ms"] * limit
+                and metrics["p50_ms"] - base["p50_ms"] > MIN_LATENCY_DELTA_MS):
+            regressions.append(
+                f"{name}: p50 {metrics['p50_ms']}ms vs baseline {base['p50_ms']}ms"
+            )
+        if metrics["queries"] > math.ceil(base["queries"] * limit):
+            regressions.append(
+                f"{name}: {metrics['queries']} queries vs baseline {base['queries']}"
+            )
+        if (metrics["peak_kb"] > base["peak_kb"] * limit
+                and metrics["peak_kb"] - base["peak_kb"] > MIN_MEMORY_DELTA_KB):
+            regressions.append(
+                f"{name}: peak {metrics['peak_kb']}KB vs baseline {base['peak_kb']}KB"
+            )
+    return regressions
+
+
+def _print_results(result: dict):
+    print(f"\n== {result['size']} ({result['dataset']['users']} users, "
+          f"{result['dataset']['hikes']} hikes)")
+    print(f"{'endpoint':<22}{'p50 ms':>10}{'p95 ms':>10}{'queries':>10}{'peak KB':>10}")
+    for name, m in result["endpoints"].items():
+        print(f"{name:<22}{m['p50_ms']:>10.2f}{m['p95_ms']:>10.2f}"
+              f"{m['queries']:>10.1f}{m['peak_kb']:>10.1f}")
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="small", help="Comma-separated: " + ",".join(SIZES))
+    parser.add_argument("--iterations", type=int, default=None)
+    parser.add_argument("--endpoints", default=None, help="Comma-separated subset of endpoints")
+    parser.add_argument("--baseline-dir", type=Path, default=BASELINE_DIR)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Overwrite the baselines with this run instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative regression (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    endpoints = args.endpoints.split(",") if args.endpoints else None
+    failed = False
+    for size in args.sizes.split(","):
+        result = run_size(size, args.iterations, endpoints=endpoints)
+        _print_results(result)
+
+        baseline_file = args.baseline_dir / f"{size}.json"
+        if args.save_baseline:
+            args.baseline_dir.mkdir(parents=True, exist_ok=True)
+            baseline_file.write_text(json.dumps(result, indent=2) + "\n")
+            print(f"Saved baseline to {baseline_file}")
+            continue
+
+        if not baseline_file.exists():
+            print(f"No baseline at {baseline_file}; run with --save-baseline first")
+            continue
+
+        regressions = compare(result, json.loads(baseline_file.read_text()), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
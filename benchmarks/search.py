@@ -0,0 +1,114 @@
+"""Full-text search latency over a large synthetic notes corpus.
+
+Bulk-loads hikes with generated notes spread over many users, rebuilds the
+search index and times representative queries: a rare term, a common term,
+a two-term AND, a prefix and a type-filtered search, each for one user's
+notes plus the public park/trail/campsite documents.
+
+Usage:
+    python -m benchmarks.search --notes 2000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.database import Base
+from app.search import search_index
+
+WORDS = (
+    "trail ridge summit meadow creek canyon forest granite switchbacks lake river "
+    "sunrise sunset wind rain snow mud steep easy crowded quiet views wildflowers "
+    "elk deer marmot eagle hawk squirrel chipmunk pika bighorn moose coyote "
+    "bridge boulder scramble loop spur junction trailhead parking shuttle ranger "
+    "camp picnic lunch water filter blister boots poles map compass"
+).split()
+RARE_WORDS = ["waterfall", "bison", "avalanche", "aurora", "wolverine"]
+
+QUERIES = {
+    "rare term": ("bison", None),
+    "common term": ("trail", None),
+    "two terms": ("steep switchbacks", None),
+    "prefix": ("wildfl*", None),
+    "hikes only": ("waterfall", ["hike"]),
+}
+
+
+def _note(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(6, 24))
+    if rng.random() < 0.01:
+        words.insert(rng.randrange(len(words)), rng.choice(RARE_WORDS))
+    return " ".join(words).capitalize() + "."
+
+
+def load_corpus(db, notes: int, users: int, seed: int = 11, batch: int = 50000):
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    for offset in range(0, notes, batch):
+        db.execute(insert(models.TrailHike), [
+            {
+                "user_id": rng.randint(1, users),
+                "trail_id": None,
+                "hike_date": start + timedelta(hours=i),
+                "duration_minutes": 60,
+                "notes": _note(rng),
+                "difficulty_experienced": "Moderate",
+                "fitness_tracker_source": "manual",
+            }
+            for i in range(offset, min(notes, offset + batch))
+        ])
+    db.commit()
+
+
+def run(notes: int = 200000, users: int = 2000, repeat: int = 50) -> dict:
+    with tempfile.TemporaryDirectory(prefix="npt-search-") as tmpdir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'search.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+
+        load_corpus(db, notes, users)
+        start = time.perf_counter()
+        search_index.rebuild(db)
+        rebuild_seconds = time.perf_counter() - start
+
+        rng = random.Random(3)
+        results = {"notes": notes, "users": users, "rebuild_seconds": rebuild_seconds, "queries": {}}
+        for name, (query, types) in QUERIES.items():
+            samples = []
+            for _ in range(repeat):
+                user_id = rng.randint(1, users)
+                t0 = time.perf_counter()
+                search_index.search(db, query, user_id=user_id, types=types, limit=20)
+                samples.append((time.perf_counter() - t0) * 1000)
+            samples.sort()
+            results["queries"][name] = {
+                "p50_ms": statistics.median(samples),
+                "p95_ms": samples[int(len(samples) * 0.95) - 1],
+            }
+        db.close()
+        engine.dispose()
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    r = run(args.notes, args.users, args.repeat)
+    print(f"{r['notes']} notes across {r['users']} users; index rebuilt in {r['rebuild_seconds']:.1f}s")
+    for name, q in r["queries"].items():
+        print(f"  {name:<12} p50 {q['p50_ms']:6.2f} ms   p95 {q['p95_ms']:6.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Compare the ORM + response_model path with the fast JSON path.
+
+Serializes the same 10k-row result set both ways:
+
+- orm: hydrate mapped instances, validate them against the response model
+  with from_attributes and dump JSON (what FastAPI does for a route that
+  returns ORM objects),
+- fast: select only the schema's columns, zip row tuples into dicts and
+  encode with orjson (app.serialization.RowSerializer).
+
+Also compares building LeaderboardEntry objects that FastAPI re-validates
+against returning the already-shaped dicts.
+
+Usage:
+    python -m benchmarks.serialization --rows 10000
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app import models, schemas
+from app.database import Base
+from app.serialization import FastJSONResponse, RowSerializer
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def _seed(db, rows: int):
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    db.execute(insert(models.TrailHike), [
+        {
+            "user_id": 1,
+            "trail_id": rng.randint(1, 500),
+            "hike_date": now - timedelta(minutes=i * 37),
+            "duration_minutes": rng.randint(30, 480),
+            "distance_miles": round(rng.uniform(0.5, 15), 2),
+            "elevation_gain": rng.randint(0, 4000),
+            "calories": rng.randint(100, 2000),
+            "avg_pace": "18.0 min/mi",
+            "notes": "Benchmark hike",
+            "difficulty_experienced": "Moderate",
+            "fitness_tracker_source": "manual",
+            "created_at": now,
+        }
+        for i in range(rows)
+    ])
+    db.commit()
+
+
+def run(rows: int = 10000, repeat: int = 5) -> dict:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    _seed(db, rows)
+
+    adapter = TypeAdapter(list[schemas.TrailHikeOut])
+    serializer = RowSerializer(models.TrailHike, schemas.TrailHikeOut)
+
+    def orm_path():
+        db.expunge_all()
+        hikes = db.query(models.TrailHike).filter(models.TrailHike.user_id == 1).all()
+        return adapter.dump_json(adapter.validate_python(hikes, from_attributes=True))
+
+    def fast_path():
+        rows_ = serializer.query(db).filter(models.TrailHike.user_id == 1).all()
+        return serializer.response(rows_).body
+
+    assert len(orm_path()) > 0 and len(fast_path()) > 0
+
+    entries = [
+        {"rank": i + 1, "user_id": i, "user_name": f"Hiker {i}", "profile_pic_url": None,
+         "total_points": 100000 - i, "parks_visited": i % 63, "miles_hiked": i * 1.5}
+        for i in range(rows)
+    ]
+    leaderboard_adapter = TypeAdapter(list[schemas.LeaderboardEntry])
+
+    def leaderboard_models():
+        built = [schemas.LeaderboardEntry(**entry) for entry in entries]
+        return leaderboard_adapter.dump_json(leaderboard_adapter.validate_python(built))
+
+    def leaderboard_fast():
+        return FastJSONResponse(entries).body
+
+    results = {
+        "rows": rows,
+        "hikes_orm_ms": _best_of(orm_path, repeat),
+        "hikes_fast_ms": _best_of(fast_path, repeat),
+        "leaderboard_models_ms": _best_of(leaderboard_models, repeat),
+        "leaderboard_fast_ms": _best_of(leaderboard_fast, repeat),
+    }
+    db.close()
+    engine.dispose()
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    r = run(args.rows, args.repeat)
+    print(f"{r['rows']} rows (best of {args.repeat})")
+    print(f"  hikes list   orm+validate {r['hikes_orm_ms']:8.1f} ms   fast {r['hikes_fast_ms']:8.1f} ms   "
+          f"x{r['hikes_orm_ms'] / r['hikes_fast_ms']:.1f}")
+    print(f"  leaderboard  models       {r['leaderboard_models_ms']:8.1f} ms   fast {r['leaderboard_fast_ms']:8.1f} ms   "
+          f"x{r['leaderboard_models_ms'] / r['leaderboard_fast_ms']:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
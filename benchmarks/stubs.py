@@ -0,0 +1,153 @@
+"""Local stand-ins for the Garmin Connect and Recreation.gov APIs.
+
+The stub app serves both providers under separate prefixes so a locally
+running API can be pointed at it instead of the real services:
+
+    GARMIN_API_BASE=http://127.0.0.1:8090/garmin
+    GARMIN_TOKEN_URL=http://127.0.0.1:8090/garmin/oauth/token
+    RECREATION_GOV_API=http://127.0.0.1:8090/recreation
+
+Run it directly with:
+    python -m uvicorn benchmarks.stubs:app --port 8090
+
+Responses are deterministic for a given request. Set STUB_LATENCY_MS to add
+an artificial delay to every response.
+
+The Garmin stand-in can also push activity pings, as Garmin does, to the
+API's webhook:
+
+    curl -X POST 'http://127.0.0.1:8090/garmin/push?callback=http://127.0.0.1:8001/api/v1/webhooks/garmin/activities&user_id=stub-user-1&activity_ids=3&activity_ids=4'
+"""
+import asyncio
+import calendar
+import itertools
+import math
+import os
+import random
+import zlib
+from datetime import datetime
+import httpx
+from fastapi import FastAPI, Query
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+
+STATUSES = ["Available", "Reserved", "Reserved", "Walk-up Available", "Not Available"]
+
+app = FastAPI(title="Provider stubs")
+
+_token_ids = itertools.count(1)
+
+
+async def _delay():
+    if STUB_LATENCY_MS:
+        await asyncio.sleep(STUB_LATENCY_MS / 1000)
+
+
+def stable_id(text: str) -> int:
+    """Deterministic numeric id for a string (campground names, users)."""
+    return 100000 + zlib.crc32(text.lower().encode()) % 900000
+
+
+def synthetic_activity(activity_id: int) -> dict:
+    """A Garmin-style activity summary for the given id."""
+    rng = random.Random(activity_id)
+    return {
+        "id": str(activity_id),
+        "activityName": f"Stub Hike {activity_id}",
+        "activityType": {"typeKey": rng.choice(["hiking", "hiking", "trail_running", "cycling"])},
+        "startTimeInSeconds": 1_700_000_000_000 + activity_id * 3_600_000,
+        "duration": rng.randint(1800, 14400),
+        "distance": round(rng.uniform(1500, 25000), 1),
+        "elevationGain": rng.randint(0, 1500),
+        "calories": rng.randint(150, 2500),
+    }
+
+
+def activity_ping(garmin_user_id: str, activity_ids: list) -> dict:
+    """A Garmin-style push payload announcing activities of one user."""
+    return {"activities": [
+        {"userId": garmin_user_id, "summaryId": str(activity_id), "activityId": str(activity_id),
+         "callbackURL": f"/garmin/activities/{activity_id}/details"}
+        for activity_id in activity_ids
+    ]}
+
+
+def synthetic_track(activity_id: int, points: int = 500) -> list:
+    """A wandering GPS track in Garmin's polyline format."""
+    rng = random.Random(activity_id)
+    lat, lon, alt = 37.7 + rng.random(), -119.6 + rng.random(), 1200.0
+    start = 1_700_000_000_000 + activity_id * 3_600_000
+    heading = rng.uniform(0, 2 * math.pi)
+    track = []
+    for i in range(points):
+        heading += rng.uniform(-0.3, 0.3)
+        lat += 0.00008 * math.cos(heading)
+        lon += 0.0001 * math.sin(heading)
+        alt += rng.uniform(-2.0, 2.5)
+        track.append({"lat": round(lat, 7), "lon": round(lon, 7),
+                      "altitude": round(alt, 1), "time": start + i * 5000})
+    return track
+
+
+# ============ Garmin Connect ============
+
+@app.post("/garmin/oauth/token")
+async def garmin_token():
+    await _delay()
+    token_id = next(_token_ids)
+    return {
+        "access_token": f"stub-access-{token_id}",
+        "refresh_token": f"stub-refresh-{token_id}",
+        "expires_in": 3600,
+        "user_id": f"stub-user-{token_id}",
+    }
+
+
+@app.get("/garmin/userprofile-service/userprofile/dist/activities")
+async def garmin_activities(limit: int = 50, start: int = 0):
+    await _delay()
+    return {"activities": [synthetic_activity(i) for i in range(start + 1, start + limit + 1)]}
+
+
+@app.get("/garmin/activities/{activity_id}/details")
+async def garmin_activity_details(activity_id: int, points: int = 500):
+    await _delay()
+    summary = synthetic_activity(activity_id)
+    return dict(summary, geoPolylineDTO={"polyline": synthetic_track(activity_id, points)})
+
+
+@app.post("/garmin/push")
+async def garmin_push(callback: str, user_id: str, activity_ids: list[int] = Query(...)):
+    """Push an activity ping for `user_id` to `callback`, as Garmin does when activities sync."""
+    async with httpx.AsyncClient(timeout=10) as client:
+        response = await client.post(callback, json=activity_ping(user_id, activity_ids))
+    return {"status": response.status_code, "response": response.json()}
+
+
+# ============ Recreation.gov ============
+
+@app.get("/recreation/search")
+async def recreation_search(query: str):
+    await _delay()
+    return {"data": [{"facility_id": stable_id(query), "name": query}]}
+
+
+@app.get("/recreation/availability/campgrounds/{campground_id}/month/{month}")
+async def recreation_availability(campground_id: int, month: str, sites: int = 40):
+    await _delay()
+    month_start = datetime.strptime(month[:10], "%Y-%m-%d")
+    days = calendar.monthrange(month_start.year, month_start.month)[1]
+    campsites = {}
+    for n in range(sites):
+        site_id = str(campground_id * 1000 + n)
+        rng = random.Random(f"{site_id}-{month[:7]}")
+        campsites[site_id] = {
+            "site_name": f"{n + 1:03d}",
+            "loop": f"Loop {'ABC'[n % 3]}",
+            "site_type": "STANDARD NONELECTRIC",
+            "availabilities": {
+                f"{month[:7]}-{day:02d}T00:00:00Z": rng.choice(STATUSES)
+                for day in range(1, days + 1)
+            },
+        }
+    return {"campsites": campsites}
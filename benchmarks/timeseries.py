@@ -0,0 +1,101 @@
+"""Activity time series latency for a user with a long hike history.
+
+Bulk-loads one user's hikes and visits spread over ten years, builds the
+daily rollup and times `user_timeseries` for the weekly, monthly and yearly
+charts the frontend draws.
+
+Usage:
+    python -m benchmarks.timeseries --hikes 10000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.database import Base
+from app.activity import ActivityRollupService
+from app.timeseries import METRICS, user_timeseries
+
+END = date(2026, 6, 30)
+CHARTS = {
+    "52 weeks": ("week", 52),
+    "24 months": ("month", 24),
+    "10 years": ("year", 10),
+}
+
+
+def load_history(db, hikes: int, user_id: int = 1, seed: int = 21):
+    rng = random.Random(seed)
+    end = datetime.combine(END, datetime.min.time())
+    db.execute(insert(models.TrailHike), [
+        {
+            "user_id": user_id,
+            "trail_id": None,
+            "hike_date": end - timedelta(days=rng.randint(0, 3650), minutes=rng.randint(0, 1440)),
+            "duration_minutes": rng.randint(30, 480),
+            "distance_miles": round(rng.uniform(0.5, 15.0), 2),
+            "elevation_gain": rng.randint(0, 4000),
+            "difficulty_experienced": "Moderate",
+            "fitness_tracker_source": "garmin",
+        }
+        for _ in range(hikes)
+    ])
+    db.execute(insert(models.Visit), [
+        {
+            "user_id": user_id,
+            "park_id": rng.randint(1, 63),
+            "visit_date": end - timedelta(days=rng.randint(0, 3650)),
+            "duration_days": 1,
+            "visited": True,
+        }
+        for _ in range(hikes // 20)
+    ])
+    db.commit()
+    ActivityRollupService.rebuild(db)
+
+
+def run(hikes: int = 10000, repeat: int = 50) -> dict:
+    with tempfile.TemporaryDirectory(prefix="npt-timeseries-") as tmpdir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'timeseries.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        load_history(db, hikes)
+
+        results = {"hikes": hikes, "charts": {}}
+        for name, (bucket, periods) in CHARTS.items():
+            samples = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                user_timeseries(1, db, bucket, periods, METRICS, end=END)
+                samples.append((time.perf_counter() - t0) * 1000)
+            samples.sort()
+            results["charts"][name] = {
+                "p50_ms": statistics.median(samples),
+                "p95_ms": samples[int(len(samples) * 0.95) - 1],
+            }
+        db.close()
+        engine.dispose()
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hikes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    r = run(args.hikes, args.repeat)
+    print(f"{r['hikes']} hikes over 10 years, all metrics")
+    for name, c in r["charts"].items():
+        print(f"  {name:<10} p50 {c['p50_ms']:6.2f} ms   p95 {c['p95_ms']:6.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""GPS track storage and analytics on long tracks.
+
+Builds a wandering synthetic track (benchmarks/stubs.py) and times the
+steps an imported track goes through: parsing Garmin's polyline (or the
+same track as an uploaded GPX file), encoding for storage, decoding, and computing distance, smoothed elevation gain,
+moving time and mile splits. The same stats computed point by point in
+pure Python are timed for comparison, and the stored size is compared
+with the polyline JSON.
+
+Usage:
+    python -m benchmarks.tracks --points 50000
+"""
+import argparse
+import io
+import json
+import math
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from app.track_files import parse_gpx
+from app.tracks import EARTH_RADIUS_M, LOD_TOLERANCES_M, decode, detail_levels, encode, garmin_points, track_stats
+from benchmarks.stubs import synthetic_track
+
+
+def python_stats(points: list) -> tuple:
+    """Distance (m) and unsmoothed gain (m), one point at a time."""
+    distance = gain = 0.0
+    for a, b in zip(points, points[1:]):
+        phi1, phi2 = math.radians(a["lat"]), math.radians(b["lat"])
+        h = (math.sin((phi2 - phi1) / 2) ** 2
+             + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(b["lon"] - a["lon"]) / 2) ** 2)
+        distance += 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+        gain += max(0.0, b["altitude"] - a["altitude"])
+    return distance, gain
+
+
+def gpx_file(points: list) -> bytes:
+    rows = "".join(
+        f'<trkpt lat="{p["lat"]}" lon="{p["lon"]}"><ele>{p["altitude"]}</ele>'
+        f'<time>{datetime.fromtimestamp(p["time"] / 1000, tz=timezone.utc):%Y-%m-%dT%H:%M:%SZ}</time></trkpt>'
+        for p in points
+    )
+    return (f'<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>{rows}'
+            f"</trkseg></trk></gpx>").encode()
+
+
+def _time(fn, repeat: int) -> tuple:
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def run(points: int = 50000, repeat: int = 20) -> dict:
+    polyline = synthetic_track(7, points)
+    details = {"geoPolylineDTO": {"polyline": polyline}}
+    timings = {}
+    timings["parse"], parsed = _time(lambda: garmin_points(details), repeat)
+    lat, lon, elevation, seconds, _ = parsed
+    gpx = gpx_file(polyline)
+    timings["parse gpx"], _ = _time(lambda: parse_gpx(io.BytesIO(gpx)), max(1, repeat // 4))
+    timings["encode"], blob = _time(lambda: encode(lat, lon, elevation, seconds), repeat)
+    timings["decode"], _ = _time(lambda: decode(blob, points), repeat)
+    timings["levels"], levels = _time(lambda: detail_levels(lat, lon), repeat)
+    timings["stats"], stats = _time(lambda: track_stats(lat, lon, elevation, seconds), repeat)
+    timings["python stats"], _ = _time(lambda: python_stats(polyline), max(1, repeat // 4))
+    return {
+        "points": points,
+        "timings_ms": timings,
+        "stored_kb": len(blob) / 1024,
+        "json_kb": len(json.dumps(polyline)) / 1024,
+        "gpx_kb": len(gpx) / 1024,
+        "distance_miles": stats["distance_miles"],
+        "splits": len(stats["splits"]),
+        # Points kept at each level of detail, full track first
+        "level_points": [int((levels >= level).sum()) for level in range(len(LOD_TOLERANCES_M) + 1)],
+    }
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    r = run(args.points, args.repeat)
+    print(f"{r['points']} points, {r['distance_miles']} miles, {r['splits']} splits")
+    for step, ms in r["timings_ms"].items():
+        print(f"  {step:<13} p50 {ms:.2f} ms")
+    print(f"  levels of detail keep {' / '.join(map(str, r['level_points']))} points")
+    print(f"  stored {r['stored_kb']:.0f} KB vs {r['json_kb']:.0f} KB of polyline JSON, {r['gpx_kb']:.0f} KB of GPX")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,3 +10,77 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./park_tracker.db")
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 API_TITLE = "National Park Tracker"
 API_VERSION = "1.0.0"
+
+# Query profiling
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))  # identical statements per request
+
+# Faceted catalog filtering
+FACET_MAX_AGE_SECONDS = float(os.getenv("FACET_MAX_AGE_SECONDS", "300"))  # rebuild even without invalidation
+
+# Activity rollup (app/activity.py): days kept at daily resolution before compaction into months
+ACTIVITY_DAILY_RETENTION_DAYS = int(os.getenv("ACTIVITY_DAILY_RETENTION_DAYS", "400"))
+
+# Rank lookup (app/ranking.py): max seconds a worker serves its in-memory ranks before reloading
+RANKING_MAX_AGE_SECONDS = float(os.getenv("RANKING_MAX_AGE_SECONDS", "600"))
+
+# Booking-window alerts (app/notifications.py)
+NOTIFICATION_POLL_SECONDS = float(os.getenv("NOTIFICATION_POLL_SECONDS", "60"))  # Max sleep between dispatches; 0 disables
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "100"))
+NOTIFICATION_LEASE_SECONDS = float(os.getenv("NOTIFICATION_LEASE_SECONDS", "300"))  # Retry delay after a failed send
+NOTIFICATION_LOG_PATH = os.getenv("NOTIFICATION_LOG_PATH", "")  # JSON-lines sink; empty logs alerts instead
+
+# Campsite availability polling (app/availability.py)
+AVAILABILITY_POLL_SECONDS = float(os.getenv("AVAILABILITY_POLL_SECONDS", "900"))  # 0 disables
+AVAILABILITY_MONTHS = int(os.getenv("AVAILABILITY_MONTHS", "3"))  # Months ahead fetched per campground
+AVAILABILITY_CACHE_SECONDS = float(os.getenv("AVAILABILITY_CACHE_SECONDS", "300"))  # Reuse of fetched months by searches
+
+# Featured campsites feed (app/featured.py)
+FEATURED_PARKS = [name.strip() for name in os.getenv("FEATURED_PARKS", "").split(",") if name.strip()]  # Empty: most popular
+FEATURED_PARK_COUNT = int(os.getenv("FEATURED_PARK_COUNT", "4"))
+FEATURED_REFRESH_SECONDS = float(os.getenv("FEATURED_REFRESH_SECONDS", "900"))  # 0 disables
+FEATURED_TIMEOUT_SECONDS = float(os.getenv("FEATURED_TIMEOUT_SECONDS", "20"))  # Per park
+
+# Recreation.gov client pool (app/recreation_service.py)
+RECREATION_GOV_MAX_CONNECTIONS = int(os.getenv("RECREATION_GOV_MAX_CONNECTIONS", "20"))
+RECREATION_GOV_KEEPALIVE_CONNECTIONS = int(os.getenv("RECREATION_GOV_KEEPALIVE_CONNECTIONS", "10"))
+RECREATION_GOV_KEEPALIVE_SECONDS = float(os.getenv("RECREATION_GOV_KEEPALIVE_SECONDS", "30"))  # Idle connection lifetime
+RECREATION_GOV_TIMEOUT_SECONDS = float(os.getenv("RECREATION_GOV_TIMEOUT_SECONDS", "10"))
+
+# Garmin token refresh (app/garmin_tokens.py)
+GARMIN_REFRESH_INTERVAL_SECONDS = float(os.getenv("GARMIN_REFRESH_INTERVAL_SECONDS", "300"))  # 0 disables
+GARMIN_REFRESH_AHEAD_SECONDS = float(os.getenv("GARMIN_REFRESH_AHEAD_SECONDS", "900"))  # Refresh tokens expiring this soon
+GARMIN_TOKEN_MIN_VALIDITY_SECONDS = float(os.getenv("GARMIN_TOKEN_MIN_VALIDITY_SECONDS", "60"))  # Else refresh on use
+GARMIN_REFRESH_RETRY_SECONDS = float(os.getenv("GARMIN_REFRESH_RETRY_SECONDS", "900"))  # Wait after a failed refresh
+GARMIN_REFRESH_BATCH_SIZE = int(os.getenv("GARMIN_REFRESH_BATCH_SIZE", "50"))
+GARMIN_REFRESH_CONCURRENCY = int(os.getenv("GARMIN_REFRESH_CONCURRENCY", "8"))
+
+# Outbound rate limits and circuit breakers (app/resilience.py); a rate of 0 disables that limit
+OUTBOUND_RATE_PER_SECOND = float(os.getenv("OUTBOUND_RATE_PER_SECOND", "50"))  # All providers, per process
+OUTBOUND_BURST = float(os.getenv("OUTBOUND_BURST", "100"))
+GARMIN_RATE_PER_SECOND = float(os.getenv("GARMIN_RATE_PER_SECOND", "10"))
+GARMIN_BURST = float(os.getenv("GARMIN_BURST", "20"))
+RECREATION_GOV_RATE_PER_SECOND = float(os.getenv("RECREATION_GOV_RATE_PER_SECOND", "10"))
+RECREATION_GOV_BURST = float(os.getenv("RECREATION_GOV_BURST", "20"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "database" shares provider budgets across workers
+OUTBOUND_MAX_WAIT_SECONDS = float(os.getenv("OUTBOUND_MAX_WAIT_SECONDS", "10"))  # Longer waits fail instead
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))  # Consecutive failures to open
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))  # Open time before a trial call
+GARMIN_TIMEOUT_SECONDS = float(os.getenv("GARMIN_TIMEOUT_SECONDS", "10"))
+
+# GPX/FIT uploads (POST /users/{id}/hikes/upload); several files are parsed in a process pool of this size
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "20"))
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "50"))  # Per file
+UPLOAD_PARSE_WORKERS = int(os.getenv("UPLOAD_PARSE_WORKERS", "2"))  # 0 parses in threads instead
+
+# Overview map of a user's tracks (GET /users/{id}/map): default and largest allowed JSON size
+MAP_MAX_BYTES = int(os.getenv("MAP_MAX_BYTES", "300000"))
+MAP_MAX_BYTES_LIMIT = int(os.getenv("MAP_MAX_BYTES_LIMIT", "2000000"))
+
+# Push ingest of provider activities (app/ingest.py)
+GARMIN_WEBHOOK_SECRET = os.getenv("GARMIN_WEBHOOK_SECRET", "")  # Required in X-Webhook-Secret when set
+INGEST_COALESCE_SECONDS = float(os.getenv("INGEST_COALESCE_SECONDS", "10"))  # Wait for more pushes per user
+INGEST_LEASE_SECONDS = float(os.getenv("INGEST_LEASE_SECONDS", "300"))  # Claimed work retried after this
+INGEST_POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "60"))  # 0 disables the worker
+INGEST_BATCH_USERS = int(os.getenv("INGEST_BATCH_USERS", "20"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
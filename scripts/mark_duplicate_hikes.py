@@ -0,0 +1,48 @@
+"""Mark hikes that repeat another source's hike and rebuild the aggregates.
+
+New hikes are checked as they are logged or imported; run this once for
+hikes stored before that, or after changing the matching tolerances.
+`init_db` adds the `duplicate_of` column to older databases first.
+
+Running servers keep their in-memory rankings and scoped leaderboards
+until those expire (RANKING_MAX_AGE_SECONDS); restart them to see the
+corrected ranks at once.
+"""
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.activity import ActivityRollupService
+from app.database import SessionLocal, init_db
+from app.duplicates import DuplicateHikeService
+from app.popularity import PopularityService
+from app.scoped_leaderboards import ScopeStatsService
+from config import RANKING_MAX_AGE_SECONDS
+
+def mark_duplicate_hikes():
+    """Re-detect duplicates over every user's hikes; rebuild the aggregates if any mark changed."""
+    init_db()
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        counts = DuplicateHikeService.backfill(db)
+        if counts["changed"]:
+            ActivityRollupService.rebuild(db)
+            ScopeStatsService.rebuild(db)
+            PopularityService.rebuild(db)
+        elapsed = time.perf_counter() - start
+    finally:
+        db.close()
+    print(f"  hikes      {counts['hikes']}")
+    print(f"  duplicates {counts['duplicates']}")
+    print(f"  changed    {counts['changed']} hikes of {counts['users']} users")
+    if counts["changed"]:
+        print("Rebuilt passport miles and the activity, scope and popularity aggregates")
+        print(f"⚠️  Running servers show stale ranks for up to {RANKING_MAX_AGE_SECONDS:.0f}s; restart them to refresh now")
+    print(f"✅ Checked {counts['hikes']} hikes in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    mark_duplicate_hikes()
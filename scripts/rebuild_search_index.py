@@ -0,0 +1,31 @@
+"""Rebuild the full-text search index from the source tables.
+
+Run after bulk loads that bypass the ORM (they do not fire the index's
+flush hook) or after changing what gets indexed.
+"""
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal, init_db
+from app.search import search_index
+
+def rebuild_search_index():
+    """Drop and re-create every search document."""
+    init_db()
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        counts = search_index.rebuild(db)
+        elapsed = time.perf_counter() - start
+    finally:
+        db.close()
+    for doc_type, count in counts.items():
+        print(f"  {doc_type:<9} {count}")
+    print(f"✅ Indexed {sum(counts.values())} documents in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    rebuild_search_index()
@@ -11,6 +11,7 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.models import Base, Park, Trail, Badge, Campsite
+import app.search  # keeps the search index in sync with seeded rows
 from config import DATABASE_URL
 
 def seed_parks():
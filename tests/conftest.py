@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before any app module is imported.
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='npt-tests-')}/test.db"
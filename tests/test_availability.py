@@ -0,0 +1,161 @@
+import asyncio
+import json
+from datetime import date, datetime, timedelta
+import numpy as np
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.availability import AVAILABLE, RESERVED, UNKNOWN, AvailabilityPoller, align, diff, encode_month
+from app.database import Base
+from benchmarks.stubs import app as stub_app
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, messages):
+        self.sent.extend(messages)
+
+
+def test_encode_align_and_diff():
+    month = date(2024, 2, 1)
+    data = {"campsites": {
+        "20": {"site_name": "B", "availabilities": {"2024-02-01T00:00:00Z": "Reserved",
+                                                    "2024-02-29T00:00:00Z": "Available"}},
+        "10": {"site_name": "A", "availabilities": {"2024-02-02T00:00:00Z": "Walk-up Available"}},
+    }}
+    sites, statuses = encode_month(data, month)
+    assert sites == [("10", "A"), ("20", "B")] and statuses.shape == (2, 29)
+    assert statuses[1, 0] == RESERVED and statuses[1, 28] == AVAILABLE
+
+    # Site 15 is new, site 10 vanished: rows are re-indexed before comparing
+    later = [("15", "C"), ("20", "B")]
+    previous = align(sites, statuses, later)
+    assert previous[0, 0] == UNKNOWN and np.array_equal(previous[1], statuses[1])
+    current = previous.copy()
+    current[0] = AVAILABLE
+    current[1, 0] = AVAILABLE
+    rows, days, opened = diff(previous, current)
+    assert list(zip(rows[opened].tolist(), days[opened].tolist())) == [(1, 0)]
+
+
+def test_poller_reports_sites_freed_at_wishlisted_campgrounds():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([models.User(id=1, name="watcher", email="watcher@avail.test"),
+                models.Campsite(id=1, park_id=None, name="Upper Pines"),
+                models.Campsite(id=2, park_id=None, name="Unwatched")])
+    db.add(models.Wishlist(user_id=1, campsite_id=1, notification_hours_before=1))
+    db.commit()
+
+    freed = {}
+
+    async def poll():
+        async with AsyncClient(transport=ASGITransport(app=stub_app), base_url="http://stub") as client:
+            async def resolve(name):
+                return (await client.get("/recreation/search", params={"query": name})).json()["data"][0]
+
+            async def fetch(facility_id, month):
+                data = (await client.get(
+                    f"/recreation/availability/campgrounds/{facility_id}/month/{month}?sites=5")).json()
+                for site_id, site in data["campsites"].items():
+                    for night, status in site["availabilities"].items():
+                        if (site_id, night) in freed:
+                            site["availabilities"][night] = "Available"
+                return data
+
+            poller = AvailabilityPoller(fetch=fetch, resolve=resolve, notifier=recorder, months=2)
+            return await poller.poll(db, today=date(2024, 7, 10))
+
+    recorder = Recorder()
+    first = asyncio.run(poll())
+    assert (first["campgrounds"], first["months"], first["events"]) == (1, 2, 0)
+    assert db.query(models.AvailabilitySnapshot).count() == 2
+
+    # Free one past and one future reserved night; only the future one is worth an alert
+    snapshot = db.query(models.AvailabilitySnapshot).filter_by(month="2024-07").one()
+    statuses = np.frombuffer(snapshot.statuses, dtype=np.uint8).reshape(5, 31)
+    site_ids = [site_id for site_id, _ in json.loads(snapshot.sites)]
+    reserved = np.argwhere(statuses == RESERVED)
+    past = next((row, day) for row, day in reserved if day < 9)
+    future = next((row, day) for row, day in reserved if day >= 9)
+    for row, day in (past, future):
+        freed[(site_ids[row], f"2024-07-{day + 1:02d}T00:00:00Z")] = True
+
+    second = asyncio.run(poll())
+    assert (second["openings"], second["events"]) == (1, 1)
+    event = recorder.sent[0]
+    assert (event["kind"], event["user_id"], event["campsite_id"], event["attempt"]) == ("availability", 1, 1, 1)
+    assert event["openings"] == [{"site_id": site_ids[future[0]], "site_name": f"{future[0] + 1:03d}",
+                                  "night": f"2024-07-{future[1] + 1:02d}"}]
+    changes = db.query(models.AvailabilityChange).all()
+    assert len(changes) == 2 and {c.new_status for c in changes} == {AVAILABLE}
+
+
+def test_availability_events_survive_a_failed_send():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([models.User(id=1, name="watcher", email="watcher@avail.test"),
+                models.Campsite(id=1, park_id=None, name="Upper Pines")])
+    db.add(models.Wishlist(id=1, user_id=1, campsite_id=1, notification_hours_before=1))
+    db.commit()
+
+    class FlakyNotifier(Recorder):
+        down = True
+
+        def send(self, messages):
+            if self.down:
+                self.down = False
+                raise ConnectionError("notifier down")
+            super().send(messages)
+
+    poller = AvailabilityPoller(notifier=FlakyNotifier(), lease_seconds=60)
+    event = {"kind": "availability", "wishlist_id": 1, "user_id": 1, "facility_id": 7, "openings": []}
+    db.add(models.AvailabilityAlert(wishlist_id=1, payload=json.dumps(event), due_at=datetime(2024, 7, 10),
+                                    attempts=0))
+    db.commit()
+    now = datetime(2024, 7, 10, 12)
+    assert poller.dispatch_due(db, now) == 0  # Send failed; the alert stays queued under its lease
+    assert poller.dispatch_due(db, now + timedelta(seconds=30)) == 0
+    assert poller.dispatch_due(db, now + timedelta(seconds=61)) == 1
+    [sent] = poller.notifier.sent
+    assert (sent["wishlist_id"], sent["attempt"]) == (1, 2) and sent["alert_id"] == 1
+    assert poller.dispatch_due(db, now + timedelta(hours=1)) == 0
+
+
+def test_failed_campground_searches_are_retried():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([models.User(id=1, name="watcher", email="watcher@avail.test"),
+                models.Campsite(id=1, park_id=None, name="Upper Pines"),
+                models.Campsite(id=2, park_id=None, name="Nowhere")])
+    db.add_all([models.Wishlist(user_id=1, campsite_id=1, notification_hours_before=1),
+                models.Wishlist(user_id=1, campsite_id=2, notification_hours_before=1)])
+    db.commit()
+    searches = []
+    down = True
+
+    async def resolve(name):
+        searches.append(name)
+        if name == "Nowhere":
+            return None
+        if down:
+            raise RuntimeError("circuit open")
+        return {"facility_id": "232447"}
+
+    poller = AvailabilityPoller(resolve=resolve, notifier=Recorder())
+    assert asyncio.run(poller.watch_new(db)) == 2
+    # Only the real no-match is stored; the failed search is not
+    assert db.query(models.WatchedCampground.campsite_id, models.WatchedCampground.facility_id).all() == [(2, None)]
+
+    down = False
+    searches.clear()
+    assert asyncio.run(poller.watch_new(db)) == 1
+    assert searches == ["Upper Pines"]
+    watched = dict(db.query(models.WatchedCampground.campsite_id, models.WatchedCampground.facility_id))
+    assert watched == {1: 232447, 2: None}
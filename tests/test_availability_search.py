@@ -0,0 +1,88 @@
+from datetime import date
+import numpy as np
+from fastapi.testclient import TestClient
+from httpx import AsyncClient, ASGITransport
+from app.availability import AVAILABLE, RESERVED
+from app.availability_search import find_windows, stitch
+from app.main import app
+from app.recreation_service import recreation_gov
+from benchmarks.stubs import app as stub_app
+
+
+def test_find_windows_matches_brute_force():
+    rng = np.random.default_rng(3)
+    available = rng.random((40, 60)) < 0.6
+    for min_nights in (1, 3, 7):
+        counts, runs = find_windows(available, min_nights)
+        for row in range(len(available)):
+            nights = available[row].tolist()
+            fits = sum(all(nights[i:i + min_nights]) for i in range(len(nights) - min_nights + 1))
+            assert counts[row] == fits
+            mine = [(first, length) for r, first, length in runs if r == row]
+            expected, first = [], None
+            for i, free in enumerate(nights + [False]):
+                if free and first is None:
+                    first = i
+                elif not free and first is not None:
+                    if i - first >= min_nights:
+                        expected.append((first, i - first))
+                    first = None
+            assert mine == expected
+
+
+def test_stitch_spans_months_and_sites():
+    june, july = date(2024, 6, 1), date(2024, 7, 1)
+    june_statuses = np.full((1, 30), RESERVED, dtype=np.uint8)
+    june_statuses[0, 28:] = AVAILABLE  # June 29-30
+    july_statuses = np.full((2, 31), RESERVED, dtype=np.uint8)
+    july_statuses[:, :2] = AVAILABLE  # July 1-2, and a site new in July
+    encoded = {june: ([("1", "001")], june_statuses), july: ([("1", "001"), ("2", "002")], july_statuses)}
+    sites, available = stitch([june, july], encoded, date(2024, 6, 28), date(2024, 7, 4))
+    assert sites == [("1", "001"), ("2", "002")]
+    assert available.astype(int).tolist() == [[0, 1, 1, 1, 1, 0], [0, 0, 0, 1, 1, 0]]
+    counts, runs = find_windows(available, 3)
+    assert counts.tolist() == [2, 0] and runs == [(0, 1, 4)]
+
+
+def test_park_search_ranks_sites_across_campgrounds(monkeypatch):
+    stub = AsyncClient(transport=ASGITransport(app=stub_app), base_url="http://stub")
+    fetched = []
+
+    async def find_campground(name):
+        return (await stub.get("/recreation/search", params={"query": name})).json()["data"][0]
+
+    async def get_campground_availability(facility_id, month):
+        fetched.append((facility_id, month))
+        return (await stub.get(f"/recreation/availability/campgrounds/{facility_id}/month/{month}?sites=8")).json()
+
+    monkeypatch.setattr(recreation_gov, "find_campground", find_campground)
+    monkeypatch.setattr(recreation_gov, "get_campground_availability", get_campground_availability)
+
+    client = TestClient(app)
+    park = client.post("/api/v1/parks", json={
+        "name": "Search Test Park", "state": "CA", "region": "Pacific", "established": "1890",
+        "area_sq_miles": 404.0, "description": "Sequoias", "latitude": 36.5, "longitude": -118.6,
+    }).json()
+    for name in ("Lodgepole", "Dorst Creek"):
+        client.post(f"/api/v1/parks/{park['id']}/campsites", json={
+            "park_id": park["id"], "name": name, "elevation": 9000, "has_water": True, "has_toilets": True,
+            "max_occupancy": 6, "description": "",
+        })
+
+    url = f"/api/v1/parks/{park['id']}/campsites/search?start_date=2024-07-25&end_date=2024-08-10&min_nights=2"
+    body = client.get(url).json()
+    assert len(body["campgrounds"]) == 2 and all(c["facility_id"] for c in body["campgrounds"])
+    assert len(fetched) == 4  # Two campgrounds x July and August
+    results = body["results"]
+    assert results and [r["rank"] for r in results] == list(range(1, len(results) + 1))
+    keys = [(-r["check_in_options"], -r["longest_nights"]) for r in results]
+    assert keys == sorted(keys)
+    for result in results:
+        assert all(w["nights"] >= 2 and "2024-07-25" <= w["check_in"] < w["check_out"] <= "2024-08-10"
+                   for w in result["windows"])
+
+    # Repeat searches are served from the cache
+    assert client.get(url).json() == body and len(fetched) == 4
+    assert client.get(url.replace("min_nights=2", "min_nights=30")).status_code == 400
+    assert client.get(f"/api/v1/parks/999999/campsites/search?start_date=2024-07-01&end_date=2024-07-03"
+                      ).status_code == 404
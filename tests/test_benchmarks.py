@@ -0,0 +1,22 @@
+import copy
+from benchmarks.run_endpoints import ENDPOINTS, compare, run_size
+
+
+def test_benchmark_suite_small_dataset():
+    result = run_size("small", iterations=2)
+    assert set(result["endpoints"]) == set(ENDPOINTS)
+    for metrics in result["endpoints"].values():
+        assert metrics["p50_ms"] > 0
+        assert metrics["queries"] >= 1
+        assert metrics["peak_kb"] > 0
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = {"endpoints": {"leaderboard_points": {"p50_ms": 10.0, "queries": 1, "peak_kb": 100.0}}}
+    current = copy.deepcopy(baseline)
+    assert compare(current, baseline) == []
+
+    current["endpoints"]["leaderboard_points"].update(p50_ms=20.0, queries=5)
+    regressions = compare(current, baseline, threshold=0.25)
+    assert len(regressions) == 2
+    assert compare(current, baseline, threshold=5.0) == []
@@ -0,0 +1,97 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, inspect
+from fastapi.testclient import TestClient
+from app import models
+from app.database import SessionLocal, add_missing_columns
+from app.duplicates import DuplicateHikeService, candidate, find_duplicates
+from app.main import app
+from app.track_files import upload_parser
+from tests.test_track_upload import gpx
+
+
+def test_sweep_groups_overlapping_hikes_from_different_sources():
+    day = datetime(2024, 6, 1)
+    hikes = [
+        candidate(1, day, None, None, 5.0, 1000),  # Manual, date only: the whole day
+        candidate(2, day.replace(hour=9), 150, "garmin", 5.2, 1080),
+        candidate(3, day.replace(hour=9, minute=5), 145, "strava", 5.1, None),
+        candidate(4, day.replace(hour=15), 60, "garmin", 2.0, 300),  # Same day, different outing
+        candidate(5, day.replace(hour=9), 150, "garmin", 5.0, 1000),  # Same source as 2
+        candidate(6, datetime(2024, 6, 2, 9), 150, "strava", 5.0, 1000),  # Next day
+        candidate(7, day.replace(hour=12), 30, "manual", None, None),  # Nothing to compare
+    ]
+    assert find_duplicates(hikes) == {2: 1, 3: 1, 5: 1}
+    assert find_duplicates(hikes[3:]) == {}
+    # A timed manual hike only covers its own window
+    assert find_duplicates([candidate(1, day.replace(hour=6), 60, None, 5.0, 1000), hikes[1]]) == {}
+
+
+def test_logged_and_uploaded_copies_count_once(monkeypatch):
+    monkeypatch.setattr(upload_parser, "workers", 1)
+    client = TestClient(app)
+    park = client.post("/api/v1/parks", json={
+        "name": "Duplicate Test Park", "state": "CO", "region": "Mountain", "established": "1915",
+        "area_sq_miles": 415.0, "description": "Peaks", "latitude": 40.3, "longitude": -105.7,
+    }).json()
+    trail = client.post(f"/api/v1/parks/{park['id']}/trails", json={
+        "park_id": park["id"], "name": "Sky Pond", "difficulty": "Moderate", "distance_miles": 2.8,
+        "elevation_gain_ft": 1300, "description": "Lakes", "best_season": "Summer",
+    }).json()
+    user = client.post("/api/v1/users", json={"name": "twice", "email": "twice@duplicates.test"}).json()
+    manual = client.post(f"/api/v1/users/{user['id']}/hikes", json={
+        "trail_id": trail["id"], "hike_date": "2023-11-14T00:00:00", "duration_minutes": 35, "distance_miles": 2.8,
+        "elevation_gain": 1300, "difficulty_experienced": "Moderate"}).json()
+    assert manual["duplicate_of"] is None
+
+    body = client.post(f"/api/v1/users/{user['id']}/hikes/upload",
+                       files=[("files", ("morning.gpx", gpx(400), "application/gpx+xml"))],
+                       data={"source": "strava", "trail_id": trail["id"]}).json()
+    assert body["imported_hikes"] == 1 and body["duplicate_hikes"] == 1
+    assert body["hikes"][0]["duplicate_of"] == manual["id"]
+
+    stats = client.get(f"/api/v1/users/{user['id']}/stats").json()
+    assert stats["passport"]["total_miles_hiked"] == pytest.approx(2.8)
+    assert client.get(f"/api/v1/parks/{park['id']}").json()["stats"]["hike_count"] == 1
+    series = client.get(f"/api/v1/users/{user['id']}/timeseries?bucket=year&periods=5&end=2023-12-31").json()
+    assert sum(series["series"]["hikes"]) == 1
+
+
+def test_backfill_marks_hikes_stored_before_detection():
+    db = SessionLocal()
+    user = models.User(name="backfill", email="backfill@duplicates.test")
+    db.add(user)
+    db.flush()
+    day = datetime(2022, 8, 20)
+    hikes = [models.TrailHike(user_id=user.id, hike_date=day, distance_miles=6.0, elevation_gain=1500),
+             models.TrailHike(user_id=user.id, hike_date=day.replace(hour=7), duration_minutes=200,
+                              distance_miles=6.3, elevation_gain=1580, fitness_tracker_source="garmin"),
+             models.TrailHike(user_id=user.id, hike_date=day.replace(hour=7), duration_minutes=200,
+                              distance_miles=12.0, elevation_gain=3000, fitness_tracker_source="strava")]
+    db.add_all(hikes)
+    db.add(models.ParkPassport(user_id=user.id, total_miles_hiked=24.3))  # Counted the copy
+    db.commit()
+
+    counts = DuplicateHikeService.backfill(db)
+    assert counts["changed"] >= 1
+    db.expire_all()
+    assert [h.duplicate_of for h in hikes] == [None, hikes[0].id, None]
+    passport = db.query(models.ParkPassport).filter(models.ParkPassport.user_id == user.id).one()
+    assert passport.total_miles_hiked == pytest.approx(18.0)
+    assert DuplicateHikeService.backfill(db)["changed"] == 0
+    db.close()
+
+
+def test_older_databases_get_the_column(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE trail_hikes (id INTEGER PRIMARY KEY, user_id INTEGER, hike_date DATETIME)")
+        conn.exec_driver_sql("INSERT INTO trail_hikes (user_id, hike_date) VALUES (1, '2024-06-01 08:00:00')")
+    add_missing_columns(engine)
+    add_missing_columns(engine)  # Nothing left to add
+    columns = {column["name"] for column in inspect(engine).get_columns("trail_hikes")}
+    assert {"duplicate_of", "distance_miles", "fitness_tracker_source"} <= columns
+    assert "ix_trail_hikes_duplicate_of" in {index["name"] for index in inspect(engine).get_indexes("trail_hikes")}
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT duplicate_of FROM trail_hikes").all() == [(None,)]
+    engine.dispose()
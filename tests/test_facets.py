@@ -0,0 +1,69 @@
+import random
+from fastapi.testclient import TestClient
+from app.facets import FacetIndex, campsite_facets, positions
+from app.main import app
+from benchmarks.facets import random_filter, synthetic_catalog
+
+
+def _brute_force(rows, facets, selections, ranges):
+    def keep(row, skip=None):
+        for name, values in selections.items():
+            if name != skip and values and facets[name](row) not in values:
+                return False
+        for name, (low, high) in ranges.items():
+            value = facets[name](row)
+            if name != skip and ((low is not None and value < low) or (high is not None and value > high)):
+                return False
+        return True
+    return [r["id"] for r in rows if keep(r)], keep
+
+
+def test_bitmap_filters_and_counts_match_brute_force():
+    rows, records = synthetic_catalog(1500)
+    facets = campsite_facets.facets
+    index = FacetIndex(lambda db: (rows, records), facets, max_age=float("inf"))
+    rng = random.Random(1)
+    for _ in range(50):
+        selections, ranges = random_filter(rng)
+        result = index.query(None, selections, ranges, limit=10000)
+        expected, keep = _brute_force(rows, facets, selections, ranges)
+        assert [r["id"] for r in result["results"]] == expected
+        assert result["total"] == len(expected)
+        region_counts = {}
+        for r in rows:
+            if keep(r, skip="region"):
+                region_counts[r["region"]] = region_counts.get(r["region"], 0) + 1
+        assert {k: v for k, v in result["facets"]["region"].items() if v} == region_counts
+
+
+def test_positions_paging():
+    bitmap = sum(1 << p for p in (0, 3, 8, 9, 64, 700))
+    assert positions(bitmap) == [0, 3, 8, 9, 64, 700]
+    assert positions(bitmap, skip=2, limit=3) == [8, 9, 64]
+    assert positions(0) == []
+
+
+def test_campsite_facets_invalidated_by_add_campsite():
+    client = TestClient(app)
+    park = client.post("/api/v1/parks", json={
+        "name": "Facet Test Park", "state": "NV", "region": "Great Basin", "established": "1986",
+        "area_sq_miles": 120.0, "description": "Bristlecone pines", "latitude": 39.0, "longitude": -114.3,
+    }).json()
+    params = {"region": "Great Basin", "has_water": "true"}
+    assert client.get("/api/v1/facets/campsites", params=params).json()["total"] == 0
+
+    campsite = client.post(f"/api/v1/parks/{park['id']}/campsites", json={
+        "park_id": park["id"], "name": "Wheeler Peak", "elevation": 9886, "has_water": True,
+        "has_toilets": True, "max_occupancy": 8, "description": "High alpine sites",
+    }).json()
+    body = client.get("/api/v1/facets/campsites", params=params).json()
+    assert [c["name"] for c in body["results"]] == ["Wheeler Peak"]
+    assert body["facets"]["elevation"] == {"8000+": 1}
+    assert body["results"][0]["booking_opens"] is None
+
+    client.put(f"/api/v1/campsites/{campsite['id']}/booking-opens?booking_opens=2030-05-01T08:00:00")
+    body = client.get("/api/v1/facets/campsites", params=params).json()
+    assert body["results"][0]["booking_opens"].startswith("2030-05-01T08:00:00")
+
+    parks = client.get("/api/v1/facets/parks", params={"region": "Great Basin", "decade": "1980s"}).json()
+    assert [p["name"] for p in parks["results"]] == ["Facet Test Park"]
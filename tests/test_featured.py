@@ -0,0 +1,73 @@
+import asyncio
+from fastapi.testclient import TestClient
+from httpx import AsyncClient, ASGITransport
+from app import models
+from app.availability import availability_cache
+from app.database import SessionLocal
+from app.featured import FeaturedCampsites
+from app.main import app
+from benchmarks.stubs import app as stub_app
+
+
+def test_featured_feed_is_built_in_the_background_and_served_from_the_snapshot():
+    client = TestClient(app)
+    parks = []
+    for name in ("Featured Fast", "Featured Slow"):
+        park = client.post("/api/v1/parks", json={
+            "name": name, "state": "UT", "region": "Southwest", "established": "1964",
+            "area_sq_miles": 527.0, "description": "Arches", "latitude": 38.2, "longitude": -109.9,
+        }).json()
+        client.post(f"/api/v1/parks/{park['id']}/campsites", json={
+            "park_id": park["id"], "name": f"{name} Camp", "elevation": 9000, "has_water": False,
+            "has_toilets": True, "max_occupancy": 6, "description": "",
+        })
+        parks.append(park)
+
+    slow = {"on": False}
+
+    async def build():
+        async with AsyncClient(transport=ASGITransport(app=stub_app), base_url="http://stub") as stub:
+            async def resolve(name):
+                if slow["on"] and name.startswith("Featured Slow"):
+                    await asyncio.sleep(5)
+                return (await stub.get("/recreation/search", params={"query": name})).json()["data"][0]
+
+            async def fetch(facility_id, month):
+                return (await stub.get(f"/recreation/availability/campgrounds/{facility_id}/month/{month}")).json()
+
+            return await feed.refresh(SessionLocal, fetch=fetch, resolve=resolve)
+
+    feed = FeaturedCampsites(names=["Featured Fast", "Featured Slow", "No Such Park"], timeout=0.5)
+    assert feed.snapshot() == {"generated_at": None, "age_seconds": None, "parks": []}
+    assert asyncio.run(build()) == {"refreshed": 2, "failed": 0, "kept": 0}
+    first = feed.snapshot()
+    assert [p["park_name"] for p in first["parks"]] == ["Featured Fast", "Featured Slow"]
+    assert all(len(p["campsites"]) <= 3 for p in first["parks"]) and first["age_seconds"] >= 0
+
+    # A park that times out keeps its previous entry; the others are refreshed
+    slow["on"] = True
+    with SessionLocal() as db:  # Forget the slow park's campground match so it is searched again
+        db.query(models.WatchedCampground).filter(models.WatchedCampground.campsite_id.in_(
+            db.query(models.Campsite.id).filter(models.Campsite.park_id == parks[1]["id"]))
+        ).delete(synchronize_session=False)
+        db.commit()
+    assert asyncio.run(build()) == {"refreshed": 1, "failed": 1, "kept": 1}
+    assert feed.snapshot()["parks"][1] == first["parks"][1]
+
+    body = client.get("/api/v1/campsites/featured").json()
+    assert set(body) == {"generated_at", "age_seconds", "parks"}
+
+    # An outage that fails every month fetch keeps the previous entries instead of empty ones
+    async def outage():
+        async def resolve(name):
+            raise RuntimeError("search unavailable")
+
+        async def fetch(facility_id, month):
+            return None
+
+        return await feed.refresh(SessionLocal, fetch=fetch, resolve=resolve)
+
+    availability_cache._entries.clear()
+    previous = feed.snapshot()["parks"]
+    assert asyncio.run(outage()) == {"refreshed": 0, "failed": 2, "kept": 2}
+    assert feed.snapshot()["parks"] == previous
@@ -0,0 +1,143 @@
+import asyncio
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from app import models
+from app.database import SessionLocal
+from app.garmin_tokens import GarminTokenManager
+from app.main import app
+
+
+class FakeGarmin:
+    def __init__(self, fail_for=(), expires_in=3600):
+        self.calls = []
+        self.fail_for = set(fail_for)
+        self.expires_in = expires_in
+
+    async def refresh_access_token(self, refresh_token):
+        self.calls.append(refresh_token)
+        await asyncio.sleep(0.01)
+        if refresh_token in self.fail_for:
+            return None
+        return {"access_token": f"new-{refresh_token}", "refresh_token": f"next-{refresh_token}",
+                "expires_in": self.expires_in}
+
+
+def _connect(db, name, expires_at, connected=True):
+    client = TestClient(app)
+    user = client.post("/api/v1/users", json={"name": name, "email": f"{name}@tokens.test"}).json()
+    db.add(models.GarminAuth(user_id=user["id"], access_token=f"old-{name}", refresh_token=name,
+                             token_expires_at=expires_at, connected=connected))
+    db.commit()
+    return user["id"]
+
+
+def test_concurrent_uses_share_one_refresh_and_then_hit_the_cache():
+    now = datetime.utcnow()
+    garmin = FakeGarmin()
+    tokens = GarminTokenManager(service=garmin)
+    with SessionLocal() as db:
+        user_id = _connect(db, "stampede", now + timedelta(seconds=30))
+
+    async def import_concurrently():
+        sessions = [SessionLocal() for _ in range(5)]
+        try:
+            return await asyncio.gather(*(tokens.access_token(db, user_id, now) for db in sessions))
+        finally:
+            for db in sessions:
+                db.close()
+
+    assert asyncio.run(import_concurrently()) == ["new-stampede"] * 5
+    assert garmin.calls == ["stampede"] and not tokens._locks
+    with SessionLocal() as db:
+        auth = db.query(models.GarminAuth).filter(models.GarminAuth.user_id == user_id).one()
+        assert (auth.access_token, auth.refresh_token) == ("new-stampede", "next-stampede")
+        auth.access_token = "changed-behind-the-cache"
+        db.commit()
+        # Served from memory without reading the row
+        assert asyncio.run(tokens.access_token(db, user_id, now)) == "new-stampede"
+        tokens.forget(user_id)
+        assert asyncio.run(tokens.access_token(db, user_id, now)) == "changed-behind-the-cache"
+
+
+def test_workers_claim_the_row_before_exchanging_a_refresh_token():
+    now = datetime.utcnow()
+    garmin = FakeGarmin()
+    workers = [GarminTokenManager(service=garmin, claim_wait=2) for _ in range(2)]  # Separate processes
+    with SessionLocal() as db:
+        user_id = _connect(db, "rotating", now + timedelta(seconds=30))
+
+    async def import_on_both():
+        sessions = [SessionLocal() for _ in workers]
+        try:
+            return await asyncio.gather(*(tokens.access_token(db, user_id, now)
+                                          for tokens, db in zip(workers, sessions)))
+        finally:
+            for db in sessions:
+                db.close()
+
+    assert asyncio.run(import_on_both()) == ["new-rotating"] * 2
+    assert garmin.calls == ["rotating"]  # The rotating refresh token was exchanged once
+    with SessionLocal() as db:
+        auth = db.query(models.GarminAuth).filter(models.GarminAuth.user_id == user_id).one()
+        assert auth.refresh_claimed_at is None
+
+        # Stamping last_sync (which bumps updated_at) does not hide the row from the background pass
+        auth.token_expires_at, auth.last_sync = now + timedelta(minutes=5), now
+        db.commit()
+        tokens = GarminTokenManager(service=garmin, ahead_seconds=900)
+        db.query(models.GarminAuth).filter(models.GarminAuth.user_id != user_id).update(
+            {models.GarminAuth.connected: False})
+        db.commit()
+        assert asyncio.run(tokens.refresh_due(db, now))["refreshed"] == 1
+
+
+def test_background_pass_refreshes_expiring_tokens_and_logs_failures():
+    now = datetime.utcnow()
+    garmin = FakeGarmin(fail_for={"revoked"})
+    tokens = GarminTokenManager(service=garmin, ahead_seconds=900, retry_seconds=600, batch_size=2)
+    with SessionLocal() as db:
+        db.query(models.GarminAuth).update({models.GarminAuth.connected: False})  # Other tests' users
+        db.commit()
+        due = [_connect(db, name, now + timedelta(minutes=5)) for name in ("soon", "sooner", "revoked")]
+        later = _connect(db, "later", now + timedelta(hours=2))
+        gone = _connect(db, "gone", now + timedelta(minutes=1), connected=False)
+
+        assert asyncio.run(tokens.refresh_due(db, now)) == {"refreshed": 2, "failed": 1}
+        assert sorted(garmin.calls) == ["revoked", "soon", "sooner"]
+        rows = {auth.user_id: auth for auth in db.query(models.GarminAuth).filter(
+            models.GarminAuth.user_id.in_(due + [later, gone]))}
+        assert rows[due[0]].access_token == "new-soon" and rows[due[0]].token_expires_at > now + timedelta(minutes=30)
+        assert rows[later].access_token == "old-later" and rows[gone].access_token == "old-gone"
+        failure = db.query(models.SyncLog).filter(models.SyncLog.user_id == due[2]).one()
+        assert not failure.success and failure.tracker_type == "garmin" and failure.error_message
+
+        # The failed refresh waits out the retry delay; refreshed tokens are no longer due
+        assert asyncio.run(tokens.refresh_due(db, now + timedelta(minutes=1))) == {"refreshed": 0, "failed": 0}
+        assert asyncio.run(tokens.refresh_due(db, now + timedelta(minutes=11))) == {"refreshed": 0, "failed": 1}
+        assert len(garmin.calls) == 4
+
+
+def test_import_reports_expired_authorization():
+    client = TestClient(app)
+    with SessionLocal() as db:
+        user_id = _connect(db, "lapsed", datetime.utcnow() - timedelta(days=1))
+        db.query(models.GarminAuth).filter(models.GarminAuth.user_id == user_id).update(
+            {models.GarminAuth.refresh_token: None})
+        db.commit()
+    response = client.post(f"/api/v1/users/{user_id}/garmin/import")
+    assert response.status_code == 401
+    assert client.post("/api/v1/users/999999/garmin/import").status_code == 404
+
+
+def test_short_lived_tokens_are_refreshed_once_per_pass():
+    now = datetime.utcnow()
+    garmin = FakeGarmin(expires_in=600)  # Shorter than the look-ahead: due again right after a refresh
+    tokens = GarminTokenManager(service=garmin, ahead_seconds=900, batch_size=1)
+    with SessionLocal() as db:
+        db.query(models.GarminAuth).update({models.GarminAuth.connected: False})  # Other tests' users
+        db.commit()
+        for name in ("brief", "briefer"):
+            _connect(db, name, now + timedelta(minutes=5))
+        assert asyncio.run(tokens.refresh_due(db, now)) == {"refreshed": 2, "failed": 0}
+        assert sorted(garmin.calls) == ["brief", "briefer"]
+        assert asyncio.run(tokens.refresh_due(db, now + timedelta(minutes=6)))["refreshed"] == 2
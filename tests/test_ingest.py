@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from app import models
+from app.database import SessionLocal
+from app.garmin_service import garmin_service
+from app.garmin_tokens import garmin_tokens
+from app.ingest import activity_ingest
+from app.main import app
+from benchmarks.stubs import activity_ping, garmin_activity_details, synthetic_activity
+
+
+def _ids(kinds: set, count: int) -> list:
+    return [i for i in range(500, 600) if synthetic_activity(i)["activityType"]["typeKey"] in kinds][:count]
+
+
+def test_pushed_activities_are_queued_and_imported_per_user(monkeypatch):
+    client = TestClient(app)
+    user = client.post("/api/v1/users", json={"name": "pushed", "email": "pushed@ingest.test"}).json()
+    db = SessionLocal()
+    db.add(models.GarminAuth(user_id=user["id"], access_token="token", garmin_user_id="g-push",
+                             token_expires_at=datetime.utcnow() + timedelta(hours=1)))
+    db.commit()
+
+    fetched = []
+    unavailable = set()
+
+    async def access_token(db, user_id, now=None):
+        return "token"
+
+    async def get_activity_details(activity_id, access_token):
+        fetched.append(activity_id)
+        if activity_id in unavailable:
+            return None
+        return await garmin_activity_details(int(activity_id), points=200)
+
+    monkeypatch.setattr(garmin_tokens, "access_token", access_token)
+    monkeypatch.setattr(garmin_service, "get_activity_details", get_activity_details)
+    hikes, rides = _ids({"hiking", "trail_running"}, 3), _ids({"cycling"}, 1)
+    url = "/api/v1/webhooks/garmin/activities"
+
+    # A burst of pushes, one repeated, plus a ping for a user nobody connected
+    assert client.post(url, json=activity_ping("g-push", hikes[:2])).json() == \
+        {"accepted": 2, "duplicates": 0, "ignored": 0}
+    assert client.post(url, json=activity_ping("g-push", hikes[1:] + rides)).json() == \
+        {"accepted": 2, "duplicates": 1, "ignored": 0}
+    assert client.post(url, json=activity_ping("g-nobody", [1])).json()["ignored"] == 1
+    unavailable.add(str(hikes[2]))
+
+    now = datetime.utcnow()
+    assert asyncio.run(activity_ingest.process_due(db, now))["users"] == 0  # Still coalescing
+    counts = asyncio.run(activity_ingest.process_due(db, now + timedelta(minutes=1)))
+    assert counts == {"users": 1, "imported": 2, "skipped": 1, "retrying": 1, "failed": 0}
+    assert sorted(fetched) == sorted(str(i) for i in hikes + rides)  # Only the pushed activities
+
+    imported = client.get(f"/api/v1/users/{user['id']}/hikes?days=100000").json()
+    assert len(imported) == 2 and all(h["fitness_tracker_source"] == "garmin" for h in imported)
+    track = client.get(f"/api/v1/users/{user['id']}/hikes/{imported[0]['id']}/track").json()
+    assert len(track["points"]) == 200
+
+    # The failed fetch is retried once its lease runs out, then given up after the last attempt
+    assert asyncio.run(activity_ingest.process_due(db, now + timedelta(minutes=2)))["users"] == 0
+    later = now + timedelta(hours=1)
+    for _ in range(activity_ingest.max_attempts - 1):
+        counts = asyncio.run(activity_ingest.process_due(db, later))
+        later += activity_ingest.queue.lease
+    assert counts["failed"] == 1
+    statuses = dict(db.query(models.ActivityNotification.activity_id, models.ActivityNotification.status).filter(
+        models.ActivityNotification.user_id == user["id"]))
+    assert statuses == {str(hikes[0]): "imported", str(hikes[1]): "imported", str(hikes[2]): "failed",
+                        str(rides[0]): "skipped"}
+    assert activity_ingest.next_due(db) is None
+    db.close()
+
+
+def test_webhook_secret(monkeypatch):
+    monkeypatch.setattr("app.routes.GARMIN_WEBHOOK_SECRET", "s3cret")
+    client = TestClient(app)
+    url = "/api/v1/webhooks/garmin/activities"
+    assert client.post(url, json=activity_ping("g-x", [1])).status_code == 401
+    assert client.post(url, json=activity_ping("g-x", [1]), headers={"X-Webhook-Secret": "s3cret"}).status_code == 200
+
+
+def test_token_outages_and_failing_imports_are_retried_then_given_up(monkeypatch):
+    client = TestClient(app)
+    user = client.post("/api/v1/users", json={"name": "outage", "email": "outage@ingest.test"}).json()
+    db = SessionLocal()
+    db.add(models.GarminAuth(user_id=user["id"], access_token="token", garmin_user_id="g-outage",
+                             token_expires_at=datetime.utcnow() - timedelta(hours=1)))
+    db.commit()
+    url = "/api/v1/webhooks/garmin/activities"
+    first, second = _ids({"hiking"}, 2)
+
+    async def no_token(db, user_id, now=None):
+        return None  # Garmin is down and the refresh failed
+
+    monkeypatch.setattr(garmin_tokens, "access_token", no_token)
+    client.post(url, json=activity_ping("g-outage", [first]))
+    now = datetime.utcnow() + timedelta(minutes=1)
+    counts = asyncio.run(activity_ingest.process_due(db, now))
+    assert (counts["retrying"], counts["failed"]) == (1, 0)
+
+    async def access_token(db, user_id, now=None):
+        return "token"
+
+    async def broken_details(activity_id, access_token):
+        return {"activityType": "not a dict"}  # More than parse_activity_to_hike can handle
+
+    monkeypatch.setattr(garmin_tokens, "access_token", access_token)
+    monkeypatch.setattr(garmin_service, "get_activity_details", broken_details)
+    for _ in range(activity_ingest.max_attempts - 1):
+        now += activity_ingest.queue.lease
+        counts = asyncio.run(activity_ingest.process_due(db, now))
+    assert counts["failed"] == 1
+
+    # The user's later pushes are no longer held back by the failed one
+    async def get_activity_details(activity_id, access_token):
+        return await garmin_activity_details(int(activity_id), points=50)
+
+    monkeypatch.setattr(garmin_service, "get_activity_details", get_activity_details)
+    client.post(url, json=activity_ping("g-outage", [second]))
+    assert asyncio.run(activity_ingest.process_due(db, now + timedelta(minutes=1)))["imported"] == 1
+    statuses = dict(db.query(models.ActivityNotification.activity_id, models.ActivityNotification.status).filter(
+        models.ActivityNotification.user_id == user["id"]))
+    assert statuses == {str(first): "failed", str(second): "imported"}
+    db.close()
@@ -0,0 +1,79 @@
+from datetime import date, datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.activity import ActivityRollupService, epoch_day
+from app.database import Base
+from app.leaderboards import season_bounds, window_bounds
+from app.main import app
+
+
+def test_window_bounds():
+    assert window_bounds("week", date(2024, 6, 5)) == (date(2024, 6, 3), date(2024, 6, 10))
+    assert window_bounds("month", date(2024, 2, 29)) == (date(2024, 2, 1), date(2024, 3, 1))
+    assert season_bounds(date(2024, 7, 4)) == (date(2024, 6, 1), date(2024, 9, 1), "Summer")
+    assert season_bounds(date(2024, 1, 15)) == (date(2023, 12, 1), date(2024, 3, 1), "Winter")
+    assert season_bounds(date(2024, 12, 1)) == (date(2024, 12, 1), date(2025, 3, 1), "Winter")
+
+
+def test_compaction_folds_old_days_into_months():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    days = [date(2022, 3, 1), date(2022, 3, 15), date(2022, 3, 31), date(2022, 4, 2), date(2024, 6, 1)]
+    for day in days:
+        db.add(models.UserActivityDay(user_id=1, day=epoch_day(day), hikes=1, miles=2.5, elevation=100,
+                                      minutes=60, points=0, parks=0))
+    db.commit()
+
+    assert ActivityRollupService.compact(db, today=date(2024, 6, 15)) == 4
+    rows = {(r.day, r.span_days): r.hikes for r in db.query(models.UserActivityDay)}
+    assert rows == {(epoch_day(date(2022, 3, 1)), 31): 3, (epoch_day(date(2022, 4, 1)), 30): 1,
+                    (epoch_day(date(2024, 6, 1)), 1): 1}
+
+    # A late write into a compacted month is folded on the next run
+    ActivityRollupService.record_points(1, 50, db, when=datetime(2022, 3, 20))
+    db.commit()
+    assert ActivityRollupService.compact(db, today=date(2024, 6, 15)) == 1
+    march = db.query(models.UserActivityDay).filter(models.UserActivityDay.day == epoch_day(date(2022, 3, 1))).one()
+    assert (march.hikes, march.points, march.miles) == (3, 50, 7.5)
+
+
+def test_weekly_leaderboard_ranks_this_weeks_activity():
+    client = TestClient(app)
+    park = client.post("/api/v1/parks", json={
+        "name": "Leaderboard Test Park", "state": "CA", "region": "Pacific", "established": "1890",
+        "area_sq_miles": 1169.0, "description": "Granite", "latitude": 37.8, "longitude": -119.5,
+    }).json()
+    trail = client.post(f"/api/v1/parks/{park['id']}/trails", json={
+        "park_id": park["id"], "name": "Mist Trail", "difficulty": "Hard", "distance_miles": 6.0,
+        "elevation_gain_ft": 2000, "description": "", "best_season": "Spring",
+    }).json()
+    week_start, _ = window_bounds("week")
+    this_week = datetime.combine(week_start, datetime.min.time()) + timedelta(hours=9)
+    last_month = this_week - timedelta(days=40)
+    users = []
+    for name, hikes in [("Steady", [(this_week, 8.0)]), ("Past Glory", [(last_month, 50.0), (this_week, 1.0)])]:
+        user = client.post("/api/v1/users", json={"name": name, "email": f"{name.replace(' ', '')}@lb.test"}).json()
+        users.append(user["id"])
+        for when, miles in hikes:
+            client.post(f"/api/v1/users/{user['id']}/hikes", json={
+                "trail_id": trail["id"], "hike_date": when.isoformat(), "duration_minutes": 120,
+                "distance_miles": miles, "elevation_gain": 1000, "difficulty_experienced": "Hard",
+            })
+    client.post(f"/api/v1/users/{users[0]}/visits", json={
+        "park_id": park["id"], "visit_date": this_week.isoformat(), "duration_days": 1, "rating": 5,
+        "highlights": "", "visited": True,
+    })
+
+    board = client.get("/api/v1/leaderboard?window=week&sort_by=miles&limit=1000").json()
+    mine = [entry for entry in board if entry["user_id"] in users]
+    assert [(e["user_id"], e["miles_hiked"], e["parks_visited"]) for e in mine] == [
+        (users[0], 8.0, 1), (users[1], 1.0, 0)]
+    assert mine[0]["rank"] < mine[1]["rank"]
+
+    custom = client.get(f"/api/v1/leaderboard?sort_by=miles&limit=1000&start={last_month.date()}"
+                        f"&end={this_week.date()}").json()
+    assert [e["user_id"] for e in custom if e["user_id"] in users] == [users[1], users[0]]
+    assert client.get("/api/v1/leaderboard?window=decade").status_code == 400
@@ -0,0 +1,34 @@
+import io
+import pytest
+from httpx import AsyncClient, ASGITransport
+from app.main import app
+from benchmarks.histogram import LatencyHistogram
+from benchmarks.loadgen import prepare_fixtures, run_load
+
+
+def test_histogram_percentiles_within_precision():
+    h = LatencyHistogram()
+    for value in range(1, 100001):
+        h.record(value)
+    assert h.total == 100000
+    assert h.percentile(50) == pytest.approx(50000, rel=0.001)
+    assert h.percentile(99) == pytest.approx(99000, rel=0.001)
+    assert h.percentile(100) == 100000
+
+    out = io.StringIO()
+    h.write_hgrm(out)
+    assert "#[Max     =      100.000, Total count    =       100000]" in out.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_load_run_reports_each_route():
+    mix = {"leaderboard": 3, "user_stats": 2, "log_hike": 2, "wishlist_add": 1, "wishlist_get": 1}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        fixtures = await prepare_fixtures(client, users=3, campsites=2)
+        report = await run_load(client, fixtures, mix=mix, duration=0.5, rps=40, concurrency=4)
+
+    summary = report.summary()
+    assert summary["overall"]["requests"] >= 10
+    assert summary["overall"]["error_rate"] == 0
+    assert "GET /leaderboard" in summary["routes"]
+    assert summary["routes"]["GET /leaderboard"]["p99_ms"] > 0
@@ -0,0 +1,33 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from app.main import app
+from app.metrics import MetricsRegistry, observe_outbound
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_route_and_db_series():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        await ac.get("/api/v1/leaderboard")
+        await ac.get("/api/v1/users/999999")
+        r = await ac.get("/metrics")
+    assert r.status_code == 200
+    body = r.text
+    assert 'npt_http_requests_total{method="GET",route="/api/v1/leaderboard",status="200"}' in body
+    assert 'npt_http_requests_total{method="GET",route="/api/v1/users/{user_id}",status="404"}' in body
+    assert 'npt_http_request_duration_seconds_bucket{method="GET",route="/api/v1/leaderboard",le="+Inf"}' in body
+    assert 'npt_db_statements_total{method="GET",route="/api/v1/leaderboard"}' in body
+    assert "npt_http_requests_in_flight" in body
+
+
+def test_outbound_calls_recorded_with_status_or_error():
+    registry = MetricsRegistry()
+    with observe_outbound("garmin", "activities", registry=registry) as call:
+        call.status = 200
+    with pytest.raises(RuntimeError):
+        with observe_outbound("garmin", "activities", registry=registry):
+            raise RuntimeError("boom")
+
+    body = registry.render()
+    assert 'npt_outbound_requests_total{provider="garmin",operation="activities",status="200"} 1' in body
+    assert 'npt_outbound_requests_total{provider="garmin",operation="activities",status="error"} 1' in body
+    assert 'npt_outbound_request_duration_seconds_count{provider="garmin",operation="activities"} 2' in body
@@ -0,0 +1,92 @@
+import json
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.database import Base
+from app.main import app
+from app.notifications import BookingAlertScheduler, FileNotifier
+
+
+class FlakyNotifier:
+    def __init__(self):
+        self.failures, self.sent = 1, []
+
+    def send(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("sink down")
+        self.sent.extend(messages)
+
+
+def _wishlist_db(opens: datetime):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([models.User(id=1, name="camper", email="camper@alerts.test"),
+                models.Park(id=1, name="Alert Park"),
+                models.Campsite(id=1, park_id=1, name="Loop A", booking_opens=opens)])
+    items = [models.Wishlist(user_id=1, campsite_id=1, notification_hours_before=hours) for hours in (1, 24, 48)]
+    db.add_all(items)
+    db.commit()
+    return db, items
+
+
+def test_due_alerts_are_batched_and_retried_after_a_failed_send():
+    now = datetime(2024, 3, 1, 12, 0)
+    db, items = _wishlist_db(opens=now + timedelta(hours=30))
+    notifier = FlakyNotifier()
+    scheduler = BookingAlertScheduler(notifier, batch_size=1, lease_seconds=600)
+    scheduler.schedule(db, items, now=now)
+    db.commit()
+    assert scheduler.next_due(db) == now + timedelta(hours=-18)
+
+    assert scheduler.dispatch_due(db, now=now) == 0  # The sink fails; the 48h alert is leased
+    assert scheduler.dispatch_due(db, now=now) == 0
+    assert scheduler.dispatch_due(db, now=now + timedelta(minutes=11)) == 1  # Lease expired: resent
+    assert notifier.sent[0]["attempt"] == 2
+    assert scheduler.dispatch_due(db, now=now + timedelta(hours=29)) == 2  # 24h and 1h, one per batch
+    assert [m["notify_at"] for m in notifier.sent] == [
+        "2024-02-29T18:00:00", "2024-03-01T18:00:00", "2024-03-02T17:00:00"]
+    assert scheduler.next_due(db) is None
+
+    # Moving the opening re-arms every alert for the campsite; an unchanged one stays sent
+    db.get(models.Campsite, 1).booking_opens = now + timedelta(days=10)
+    scheduler.schedule_campsite(db, 1, now=now)
+    db.commit()
+    assert scheduler.next_due(db) == now + timedelta(days=8)
+    scheduler.schedule(db, items[:1], now=now)
+    assert db.query(models.BookingAlert).filter(models.BookingAlert.due_at.isnot(None)).count() == 3
+
+
+def test_wishlist_routes_schedule_alerts(tmp_path):
+    client = TestClient(app)
+    user = client.post("/api/v1/users", json={"name": "planner", "email": "planner@alerts.test"}).json()
+    park = client.post("/api/v1/parks", json={
+        "name": "Alert Route Park", "state": "WY", "region": "Rockies", "established": "1872",
+        "area_sq_miles": 3468.0, "description": "Geysers", "latitude": 44.4, "longitude": -110.6,
+    }).json()
+    opens = datetime.utcnow() + timedelta(days=3)
+    campsite = client.post(f"/api/v1/parks/{park['id']}/campsites", json={
+        "park_id": park["id"], "name": "Madison", "elevation": 6800, "has_water": True, "has_toilets": True,
+        "max_occupancy": 6, "description": "", "booking_opens": opens.isoformat(),
+    }).json()
+    client.post(f"/api/v1/users/{user['id']}/wishlist", json={
+        "campsite_id": campsite["id"], "notification_hours_before": 24})
+    moved = client.put(f"/api/v1/campsites/{campsite['id']}/booking-opens?booking_opens="
+               f"{(opens - timedelta(days=2, hours=12)).isoformat()}")
+    assert moved.status_code == 200, moved.text
+
+    from app.database import SessionLocal
+    sink = tmp_path / "alerts.jsonl"
+    db = SessionLocal()
+    try:
+        sent = BookingAlertScheduler(FileNotifier(str(sink))).dispatch_due(db)
+    finally:
+        db.close()
+    mine = [json.loads(line) for line in sink.read_text().splitlines()]
+    mine = [message for message in mine if message["user_id"] == user["id"]]
+    assert sent >= 1 and [m["campsite_name"] for m in mine] == ["Madison"]
+
+    assert client.delete(f"/api/v1/users/{user['id']}/wishlist/{campsite['id']}").status_code == 200
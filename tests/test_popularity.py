@@ -0,0 +1,61 @@
+import random
+from fastapi.testclient import TestClient
+from app.database import SessionLocal
+from app.main import app
+from app.popularity import PopularityService
+from app.sketch import QuantileSketch
+
+
+def test_sketch_quantiles_within_relative_accuracy():
+    rng = random.Random(4)
+    values = [rng.lognormvariate(4.5, 0.6) for _ in range(20000)]
+    sketch = QuantileSketch(relative_accuracy=0.02)
+    for v in values:
+        sketch.add(v)
+    sketch = QuantileSketch.from_json(sketch.to_json())
+    values.sort()
+    for q in (0.1, 0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) / exact <= 0.021
+
+
+def test_park_and_trail_aggregates_follow_writes():
+    client = TestClient(app)
+    park = client.post("/api/v1/parks", json={
+        "name": "Aggregate Test Park", "state": "UT", "region": "Southwest", "established": "1919",
+        "area_sq_miles": 229.0, "description": "Slot canyons", "latitude": 37.3, "longitude": -113.0,
+    }).json()
+    trail = client.post(f"/api/v1/parks/{park['id']}/trails", json={
+        "park_id": park["id"], "name": "Angels Landing", "difficulty": "Hard", "distance_miles": 5.4,
+        "elevation_gain_ft": 1488, "description": "Chains", "best_season": "Spring",
+    }).json()
+    user = client.post("/api/v1/users", json={"name": "Agg", "email": "agg@example.com"}).json()
+
+    for rating, month in [(5, 4), (4, 4), (5, 10)]:
+        client.post(f"/api/v1/users/{user['id']}/visits", json={
+            "park_id": park["id"], "visit_date": f"2024-{month:02d}-10T09:00:00", "duration_days": 1,
+            "rating": rating, "highlights": "", "visited": True,
+        })
+    for minutes in (180, 240, 300):
+        client.post(f"/api/v1/users/{user['id']}/hikes", json={
+            "trail_id": trail["id"], "hike_date": "2024-05-01T07:00:00", "duration_minutes": minutes,
+            "difficulty_experienced": "Hard",
+        })
+
+    stats = client.get(f"/api/v1/parks/{park['id']}").json()["stats"]
+    assert stats["visit_count"] == 3 and stats["hike_count"] == 3
+    assert stats["average_rating"] == 4.67
+    assert stats["rating_histogram"] == {"1": 0, "2": 0, "3": 0, "4": 1, "5": 2}
+    assert stats["visits_by_month"][3] == 2 and stats["visits_by_month"][9] == 1
+    assert abs(stats["median_hike_minutes"] - 240) / 240 <= 0.02
+
+    trails = client.get(f"/api/v1/parks/{park['id']}/trails").json()
+    assert trails[0]["stats"]["hike_count"] == 3
+    assert trails[0]["stats"]["hikes_by_month"][4] == 3
+
+    db = SessionLocal()
+    try:
+        PopularityService.rebuild(db)
+    finally:
+        db.close()
+    assert client.get(f"/api/v1/parks/{park['id']}").json()["stats"] == stats
@@ -0,0 +1,111 @@
+import logging
+import tempfile
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.database import Base, get_db
+from app.main import app
+from app.profiling import QueryBudgetExceeded, QueryProfiler, profiler
+from benchmarks.datasets import build_dataset
+from benchmarks.run_endpoints import _patched_garmin
+
+# Maximum SQL statements per request. Tighten these when a route gets
+# cheaper; a route exceeding its budget fails the test.
+ROUTE_BUDGETS = {
+    "GET /api/v1/leaderboard": 1,
+    "GET /api/v1/users/{user_id}/stats": 12,
+    "GET /api/v1/users/{user_id}/challenges": 13,
+    "GET /api/v1/users/{user_id}/wishlist": 1,
+    "GET /api/v1/users/{user_id}/public-profile": 4,
+    "POST /api/v1/users/{user_id}/hikes": 19,  # Includes the duplicate check against nearby hikes
+    "POST /api/v1/users/{user_id}/garmin/import": 25,
+    "GET /api/v1/users/{user_id}/timeseries": 2,
+    "GET /api/v1/parks/{park_id}/wildlife": 2,
+    "GET /api/v1/parks/{park_id}": 1,
+    "GET /api/v1/parks/{park_id}/trails": 1,
+    "POST /api/v1/users/{user_id}/sightings": 5,
+}
+
+
+@pytest.fixture(scope="module")
+def budget_client():
+    with tempfile.TemporaryDirectory(prefix="npt-budgets-") as tmpdir:
+        engine = create_engine(f"sqlite:///{tmpdir}/budgets.db", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        TestSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = TestSession()
+        ids = build_dataset(db, "small")
+        db.close()
+
+        def override_get_db():
+            db = TestSession()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        profiler.instrument(engine)
+        app.dependency_overrides[get_db] = override_get_db
+        profiler.budgets, profiler.enforce_budgets = ROUTE_BUDGETS, True
+        try:
+            with _patched_garmin():
+                yield TestClient(app), ids["hot_user_id"], ids["trail_id"], ids["park_id"]
+        finally:
+            profiler.budgets, profiler.enforce_budgets = {}, False
+            app.dependency_overrides.pop(get_db, None)
+            engine.dispose()
+
+
+def test_hot_routes_stay_within_statement_budgets(budget_client):
+    client, user_id, trail_id, park_id = budget_client
+    hike = {"trail_id": trail_id, "hike_date": "2024-06-01T08:00:00", "duration_minutes": 60,
+            "difficulty_experienced": "Easy"}
+    sighting = {"park_id": park_id, "wildlife": "Elk", "sighting_date": "2024-06-01T08:00:00",
+                "location": "North Meadow", "notes": ""}
+    assert client.get("/api/v1/leaderboard").status_code == 200
+    assert client.get(f"/api/v1/users/{user_id}/stats").status_code == 200
+    assert client.get(f"/api/v1/users/{user_id}/challenges").status_code == 200
+    assert client.get(f"/api/v1/users/{user_id}/wishlist").status_code == 200
+    assert client.get(f"/api/v1/users/{user_id}/public-profile").status_code == 200
+    assert client.post(f"/api/v1/users/{user_id}/hikes", json=hike).status_code == 201
+    assert client.post(f"/api/v1/users/{user_id}/garmin/import?limit=20").status_code == 200
+    assert client.post(f"/api/v1/users/{user_id}/sightings", json=sighting).status_code == 201
+    assert client.get(f"/api/v1/parks/{park_id}/wildlife").status_code == 200
+    assert client.get(f"/api/v1/parks/{park_id}").json()["stats"]["hike_count"] > 0
+    assert client.get(f"/api/v1/parks/{park_id}/trails").status_code == 200
+    assert client.get(f"/api/v1/users/{user_id}/timeseries?bucket=week&periods=52").status_code == 200
+
+    wishlist = profiler.last_profiles["GET /api/v1/users/{user_id}/wishlist"]
+    assert wishlist.repeated(2) == []
+
+
+def test_route_over_budget_fails(budget_client):
+    client, user_id, _, _ = budget_client
+    profiler.budgets = dict(ROUTE_BUDGETS, **{"GET /api/v1/users/{user_id}/stats": 2})
+    try:
+        with pytest.raises(QueryBudgetExceeded):
+            client.get(f"/api/v1/users/{user_id}/stats")
+    finally:
+        profiler.budgets = ROUTE_BUDGETS
+
+
+def test_repeated_statement_shapes_flagged(caplog):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    local = QueryProfiler(slow_query_ms=0, repeat_threshold=3)
+    local.instrument(engine)
+    db = sessionmaker(bind=engine)()
+
+    profile, token = local.start()
+    for badge_id in range(5):
+        db.query(models.Badge).filter(models.Badge.id == badge_id).first()
+    with caplog.at_level(logging.WARNING, logger="app.profiling"):
+        local.finish(profile, token, "GET /example")
+
+    assert profile.count == 5
+    [(shape, n)] = profile.repeated(3)
+    assert n == 5 and "FROM badges" in shape
+    assert "Possible N+1 on GET /example" in caplog.text
+    assert "Slow query" in caplog.text and "SEARCH badges" in caplog.text
@@ -0,0 +1,70 @@
+import random
+from fastapi.testclient import TestClient
+from app.main import app
+from app.ranking import MAX_BUCKETS, ScoreRanking
+
+
+def test_score_ranking_matches_brute_force():
+    rng = random.Random(8)
+    ranking = ScoreRanking({}, resolution=0.1)
+    scores = {}
+    for _ in range(3000):
+        user_id = rng.randint(1, 300)
+        op = rng.random()
+        if op < 0.1:
+            ranking.remove(user_id)
+            scores.pop(user_id, None)
+        elif op < 0.5:
+            score = round(rng.uniform(0, 500), 1)
+            ranking.set(user_id, score)
+            scores[user_id] = score
+        else:
+            delta = round(rng.uniform(0, 40), 1)
+            ranking.add(user_id, delta)
+            scores[user_id] = round(scores.get(user_id, 0) + delta, 1)
+
+    for user_id, score in scores.items():
+        ahead = sum(1 for other in scores.values() if round(other * 10) > round(score * 10))
+        assert ranking.rank(user_id)["rank"] == ahead + 1
+    assert ranking.rank(10_000) is None
+
+
+def test_score_ranking_caps_its_buckets():
+    ranking = ScoreRanking({1: 3.0, 2: 1e12}, resolution=0.1)  # A stored absurd distance
+    ranking.add(3, 1e9)
+    assert len(ranking.counts) == MAX_BUCKETS
+    assert ranking.rank(1)["rank"] == 3 and ranking.rank(2)["rank"] == ranking.rank(3)["rank"] == 1
+
+
+def test_rank_follows_hikes_and_privacy():
+    client = TestClient(app)
+    park = client.post("/api/v1/parks", json={
+        "name": "Rank Test Park", "state": "AK", "region": "Alaska", "established": "1917",
+        "area_sq_miles": 7500.0, "description": "Tundra", "latitude": 63.1, "longitude": -151.0,
+    }).json()
+    trail = client.post(f"/api/v1/parks/{park['id']}/trails", json={
+        "park_id": park["id"], "name": "Endless Ridge", "difficulty": "Hard", "distance_miles": 20.0,
+        "elevation_gain_ft": 5000, "description": "", "best_season": "Summer",
+    }).json()
+    rival, user = [client.post("/api/v1/users", json={"name": name, "email": f"{name}@rank.test"}).json()
+                   for name in ("rival", "ranker")]
+    url = f"/api/v1/users/{user['id']}/rank?sort_by=miles"
+
+    def hike(user_id, miles):
+        return client.post(f"/api/v1/users/{user_id}/hikes", json={
+            "trail_id": trail["id"], "hike_date": "2024-07-01T08:00:00", "duration_minutes": 600,
+            "distance_miles": miles, "difficulty_experienced": "Hard",
+        })
+
+    hike(rival["id"], 12.5)
+    before = client.get(url).json()
+    assert before["score"] == 0 and before["rank"] > 1
+    assert hike(user["id"], 1e9).status_code == 422
+    hike(user["id"], 4000.0)
+    after = client.get(url).json()
+    assert (after["score"], after["rank"], after["percentile"]) == (4000.0, 1, 100.0)
+    assert after["total"] == before["total"]
+
+    client.put(f"/api/v1/users/{user['id']}/profile?is_public=false")
+    assert client.get(url).status_code == 404
+    assert client.get(f"/api/v1/users/{user['id']}/rank?sort_by=steps").status_code == 400
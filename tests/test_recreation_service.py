@@ -0,0 +1,36 @@
+import asyncio
+import threading
+from app.recreation_service import RecreationGovService, RecreationGovSync
+
+
+def test_service_shares_one_client_per_event_loop():
+    service = RecreationGovService(max_connections=4)
+
+    async def use():
+        client = service.open()
+        assert service.open() is client and not client.is_closed
+        return client
+
+    first = asyncio.run(use())
+    second = asyncio.run(use())  # A new loop gets its own client
+    assert second is not first
+    asyncio.run(service.aclose())
+    assert second.is_closed and service.client is None
+
+
+def test_sync_facade_runs_calls_on_one_background_loop():
+    service = RecreationGovService()
+    seen = []
+
+    async def get_campground_availability(campground_id, month=None):
+        seen.append((threading.current_thread(), asyncio.get_running_loop()))
+        return {"campground_id": campground_id, "month": month}
+
+    service.get_campground_availability = get_campground_availability
+    sync = RecreationGovSync(service)
+    assert sync.get_availability(1, "2024-07-01") == {"campground_id": 1, "month": "2024-07-01"}
+    sync.get_availability(2)
+    (thread, loop), again = seen
+    assert again == (thread, loop) and thread is not threading.current_thread()
+    sync.close()
+    assert not thread.is_alive() and loop.is_closed()
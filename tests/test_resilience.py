@@ -0,0 +1,74 @@
+import asyncio
+import httpx
+import pytest
+from app.database import SessionLocal, init_db
+from app.metrics import MetricsRegistry
+from app.resilience import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, DatabaseBucketStore,
+                            MemoryBucketStore, OutboundGuard, RateLimitedError, TokenBucket)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize("store", [MemoryBucketStore(), DatabaseBucketStore(SessionLocal)], ids=["memory", "database"])
+def test_token_bucket_reserves_in_order_and_refuses_long_waits(store):
+    init_db()
+    clock = Clock()
+    bucket = TokenBucket(f"test-{type(store).__name__}", rate=2, burst=2, store=store, max_wait=1.2, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]  # Burst, then one token every 0.5s
+    with pytest.raises(RateLimitedError):
+        bucket.reserve()
+    clock.now += 1.0  # Two tokens refilled, paying off the debt
+    assert bucket.available() == pytest.approx(0.0) and bucket.reserve() == 0.5
+    clock.now += 60
+    assert bucket.available() == 2
+
+
+def test_circuit_opens_after_failures_and_closes_after_a_good_trial():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30, clock=clock)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()  # Only consecutive failures count
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()  # One trial at a time
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow() and breaker.times_opened == 2
+
+
+def test_guard_fails_fast_while_open_and_exports_state():
+    registry = MetricsRegistry()
+    guard = OutboundGuard("flaky", rate=1000, shared=None, registry=registry,
+                          breaker=CircuitBreaker(failure_threshold=2, reset_seconds=60))
+
+    async def calls():
+        async with guard.call("ping") as call:
+            call.status = 503
+        with pytest.raises(httpx.ConnectTimeout):
+            async with guard.call("ping"):
+                raise httpx.ConnectTimeout("slow")
+        with pytest.raises(CircuitOpenError):
+            async with guard.call("ping"):
+                raise AssertionError("not called while the circuit is open")
+
+    asyncio.run(calls())
+    body = registry.render()
+    assert 'npt_outbound_circuit_state{provider="flaky"} 2' in body
+    assert 'npt_outbound_rejected_total{provider="flaky",reason="circuit_open"} 1' in body
+    assert 'npt_outbound_requests_total{provider="flaky",operation="ping",status="error"} 1' in body
+    assert 'npt_outbound_rate_limit_tokens{bucket="flaky"}' in body
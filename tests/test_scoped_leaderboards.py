@@ -0,0 +1,67 @@
+import random
+from fastapi.testclient import TestClient
+from app.main import app
+from app.scoped_leaderboards import TopK
+
+
+def test_top_k_stays_exact_as_scores_grow():
+    rng = random.Random(5)
+    scores = {user_id: rng.randint(1, 50) for user_id in range(1, 101)}
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    top = TopK(10, ranked[:10], complete=False)
+    for _ in range(2000):
+        user_id = rng.randint(1, 120)
+        scores[user_id] = scores.get(user_id, 0) + rng.randint(1, 5)
+        top.offer(user_id, scores[user_id])
+        expected = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:10]
+        assert top.top(10) == expected
+
+
+def test_park_region_and_friend_boards():
+    client = TestClient(app)
+    park = client.post("/api/v1/parks", json={
+        "name": "Scope Test Park", "state": "UT", "region": "Scopeland", "established": "1919",
+        "area_sq_miles": 229.0, "description": "Canyon", "latitude": 37.3, "longitude": -113.0,
+    }).json()
+    trail = client.post(f"/api/v1/parks/{park['id']}/trails", json={
+        "park_id": park["id"], "name": "Angels Landing", "difficulty": "Hard", "distance_miles": 5.4,
+        "elevation_gain_ft": 1500, "description": "", "best_season": "Spring",
+    }).json()
+    users = [client.post("/api/v1/users", json={"name": name, "email": f"{name}@scope.test"}).json()["id"]
+             for name in ("scout", "climber", "stranger")]
+    for user_id, miles in zip(users, (3.0, 9.0, 6.0)):
+        client.post(f"/api/v1/users/{user_id}/hikes", json={
+            "trail_id": trail["id"], "hike_date": "2024-05-01T08:00:00", "duration_minutes": 240,
+            "distance_miles": miles, "difficulty_experienced": "Hard",
+        })
+    park_url = f"/api/v1/leaderboards/park/{park['id']}?sort_by=miles"
+    assert [e["user_id"] for e in client.get(park_url).json()] == [users[1], users[2], users[0]]
+
+    # Served from the loaded list, which follows new hikes
+    client.post(f"/api/v1/users/{users[0]}/hikes", json={
+        "trail_id": trail["id"], "hike_date": "2024-05-02T08:00:00", "duration_minutes": 240,
+        "distance_miles": 10.0, "difficulty_experienced": "Hard",
+    })
+    board = client.get(park_url).json()
+    assert [(e["user_id"], e["miles_hiked"], e["hikes"]) for e in board] == [
+        (users[0], 13.0, 2), (users[1], 9.0, 1), (users[2], 6.0, 1)]
+
+    client.post(f"/api/v1/users/{users[1]}/visits", json={
+        "park_id": park["id"], "visit_date": "2024-05-01T08:00:00", "duration_days": 1, "rating": 5,
+        "highlights": "", "visited": True,
+    })
+    region = client.get("/api/v1/leaderboards/region/scopeland?sort_by=parks").json()
+    assert [(e["user_id"], e["parks_visited"]) for e in region] == [(users[1], 1)]
+
+    client.put(f"/api/v1/users/{users[2]}/profile?is_public=false")
+    assert users[2] not in [e["user_id"] for e in client.get(park_url).json()]
+
+    assert client.post(f"/api/v1/users/{users[0]}/friends/{users[1]}").status_code == 201
+    assert [f["user_id"] for f in client.get(f"/api/v1/users/{users[1]}/friends").json()] == [users[0]]
+    friends = client.get(f"/api/v1/users/{users[1]}/friends/leaderboard?sort_by=miles").json()
+    assert [(e["user_id"], e["rank"]) for e in friends] == [(users[0], 1), (users[1], 2)]
+    assert client.delete(f"/api/v1/users/{users[1]}/friends/{users[0]}").status_code == 200
+    assert client.get(f"/api/v1/users/{users[0]}/friends").json() == []
+
+    assert client.get(f"/api/v1/leaderboards/park/{park['id']}?sort_by=parks").status_code == 400
+    assert client.get("/api/v1/leaderboards/country/us").status_code == 400
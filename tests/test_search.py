@@ -0,0 +1,79 @@
+from datetime import datetime
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.database import Base
+from app.main import app
+from app.search import search_index
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_index_follows_orm_writes_and_scopes_private_notes():
+    db = _session()
+    park = models.Park(name="Cascade Falls", state="WA", region="Pacific", established="1900",
+                       area_sq_miles=10.0, description="Towering waterfall above old-growth forest",
+                       latitude=0.0, longitude=0.0)
+    db.add(park)
+    db.commit()
+    sighting = models.Sighting(user_id=1, park_id=park.id, wildlife="Bison", location="Meadow",
+                               notes="Herd grazing below the waterfall", sighting_date=datetime(2024, 6, 1))
+    db.add(sighting)
+    db.commit()
+
+    public = search_index.search(db, "waterfall")
+    assert [(r["type"], r["id"]) for r in public["results"]] == [("park", park.id)]
+    assert "<mark>waterfall</mark>" in public["results"][0]["snippet"]
+
+    own = search_index.search(db, "waterfalls", user_id=1)
+    assert {r["type"] for r in own["results"]} == {"park", "sighting"}
+    assert search_index.search(db, "bison", user_id=2)["results"] == []
+    assert search_index.search(db, "waterfall", user_id=1, types=["sighting"])["results"][0]["title"] == "Bison"
+
+    sighting.notes = "Herd grazing by the river"
+    db.commit()
+    assert [r["type"] for r in search_index.search(db, "waterfall", user_id=1)["results"]] == ["park"]
+    assert search_index.search(db, "riv*", user_id=1)["results"][0]["id"] == sighting.id
+
+    db.delete(sighting)
+    db.commit()
+    assert search_index.search(db, "bison", user_id=1)["results"] == []
+    db.close()
+
+
+def test_rebuild_indexes_bulk_loaded_rows_and_paginates():
+    db = _session()
+    db.execute(insert(models.TrailHike), [
+        {"user_id": 5, "hike_date": datetime(2024, 1, 1), "duration_minutes": 60,
+         "difficulty_experienced": "Easy", "notes": f"Switchbacks near mile {i}"}
+        for i in range(25)
+    ])
+    db.commit()
+    assert search_index.search(db, "switchbacks", user_id=5)["results"] == []
+
+    counts = search_index.rebuild(db)
+    assert counts["hike"] == 25
+    first = search_index.search(db, "switchbacks", user_id=5, limit=10)
+    last = search_index.search(db, "switchbacks", user_id=5, limit=10, offset=20)
+    assert len(first["results"]) == 10 and first["has_more"]
+    assert len(last["results"]) == 5 and not last["has_more"]
+    assert not {r["id"] for r in first["results"]} & {r["id"] for r in last["results"]}
+    db.close()
+
+
+def test_search_endpoint():
+    client = TestClient(app)
+    park = {"name": "Petrified Dunes", "state": "AZ", "region": "Southwest", "established": "1962",
+            "area_sq_miles": 346.0, "description": "Fossilized logs among badlands", "latitude": 35.0,
+            "longitude": -109.8}
+    assert client.post("/api/v1/parks", json=park).status_code == 201
+
+    r = client.get("/api/v1/search", params={"q": "fossilized badlands", "types": "park"})
+    assert r.status_code == 200
+    assert [res["title"] for res in r.json()["results"]] == ["Petrified Dunes"]
+    assert client.get("/api/v1/search", params={"q": '"" AND OR *'}).json()["results"] == []
@@ -0,0 +1,36 @@
+import json
+from datetime import datetime
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models, schemas
+from app.database import Base
+from app.serialization import RowSerializer
+
+
+def test_fast_path_matches_response_model_output():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([
+        models.TrailHike(user_id=1, trail_id=3, hike_date=datetime(2024, 6, 1, 8, 30, 15, 250000),
+                         duration_minutes=95, distance_miles=4.25, elevation_gain=1200,
+                         difficulty_experienced="Hard", notes="Windy", created_at=datetime(2024, 6, 2)),
+        models.TrailHike(user_id=1, trail_id=None, hike_date=datetime(2024, 6, 3),
+                         duration_minutes=30, difficulty_experienced="Moderate",
+                         notes="Imported from Garmin: Walk [garmin:1]",
+                         fitness_tracker_source="garmin", created_at=datetime(2024, 6, 3)),
+    ])
+    db.commit()
+
+    adapter = TypeAdapter(list[schemas.TrailHikeOut])
+    orm_rows = db.query(models.TrailHike).order_by(models.TrailHike.id).all()
+    expected = json.loads(adapter.dump_json(adapter.validate_python(orm_rows, from_attributes=True)))
+
+    serializer = RowSerializer(models.TrailHike, schemas.TrailHikeOut)
+    fast = serializer.response(serializer.query(db).order_by(models.TrailHike.id).all())
+
+    assert fast.media_type == "application/json"
+    assert json.loads(fast.body) == expected
+    db.close()
+    engine.dispose()
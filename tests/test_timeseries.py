@@ -0,0 +1,65 @@
+from datetime import date
+from fastapi.testclient import TestClient
+from app.database import SessionLocal
+from app.main import app
+from app.activity import ActivityRollupService, epoch_day
+from app.timeseries import bucket_index, bucket_start_days
+
+
+def test_bucket_arithmetic():
+    # 2024-06-03 is a Monday: it and the following Sunday share a week
+    monday, sunday = epoch_day(date(2024, 6, 3)), epoch_day(date(2024, 6, 9))
+    weeks = bucket_index([monday - 1, monday, sunday, sunday + 1], "week")
+    assert weeks[1] == weeks[2] == weeks[0] + 1 == weeks[3] - 1
+    assert bucket_start_days(weeks[1:2], "week")[0] == monday
+    months = bucket_index([epoch_day(date(2024, 1, 31)), epoch_day(date(2024, 2, 1))], "month")
+    assert months[1] - months[0] == 1
+    assert bucket_start_days(months[1:], "month")[0] == epoch_day(date(2024, 2, 1))
+
+
+def test_user_timeseries_endpoint():
+    client = TestClient(app)
+    user = client.post("/api/v1/users", json={"name": "Charter", "email": "charter@example.com"}).json()
+    park = client.post("/api/v1/parks", json={
+        "name": "Timeseries Test Park", "state": "UT", "region": "Southwest", "established": "1919",
+        "area_sq_miles": 229.0, "description": "Canyon", "latitude": 37.3, "longitude": -113.0,
+    }).json()
+    trail = client.post(f"/api/v1/parks/{park['id']}/trails", json={
+        "park_id": park["id"], "name": "Chart Loop", "difficulty": "Easy", "distance_miles": 3.0,
+        "elevation_gain_ft": 200, "description": "", "best_season": "Spring",
+    }).json()
+    for hike_date, miles, gain in [("2024-05-02T08:00:00", 3.5, 300), ("2024-05-20T08:00:00", 6.25, 900),
+                                   ("2024-05-20T15:00:00", 2.0, 100), ("2024-07-04T08:00:00", 10.0, 2500)]:
+        r = client.post(f"/api/v1/users/{user['id']}/hikes", json={
+            "trail_id": trail["id"], "hike_date": hike_date, "duration_minutes": 90,
+            "distance_miles": miles, "elevation_gain": gain, "difficulty_experienced": "Easy",
+        })
+        assert r.status_code == 201
+    for visit_date in ("2024-05-02T08:00:00", "2024-05-20T08:00:00"):
+        client.post(f"/api/v1/users/{user['id']}/visits", json={
+            "park_id": park["id"], "visit_date": visit_date, "duration_days": 1, "rating": 5,
+            "highlights": "", "visited": True,
+        })
+
+    url = f"/api/v1/users/{user['id']}/timeseries?bucket=month&periods=4&end=2024-07-15"
+    body = client.get(url).json()
+    assert body["buckets"] == ["2024-04-01", "2024-05-01", "2024-06-01", "2024-07-01"]
+    assert body["series"] == {
+        "hikes": [0, 3, 0, 1],
+        "miles": [0, 11.75, 0, 10.0],
+        "elevation": [0, 1300, 0, 2500],
+        "parks": [0, 1, 0, 0],
+    }
+    weekly = client.get(f"/api/v1/users/{user['id']}/timeseries?bucket=week&periods=3&end=2024-05-20"
+                        "&metrics=hikes,minutes").json()
+    assert weekly["buckets"] == ["2024-05-06", "2024-05-13", "2024-05-20"]
+    assert weekly["series"] == {"hikes": [0, 0, 2], "minutes": [0, 0, 180]}
+    assert client.get(f"/api/v1/users/{user['id']}/timeseries?metrics=steps").status_code == 400
+
+    # A rebuild from trail_hikes reproduces the incremental rollup
+    db = SessionLocal()
+    try:
+        ActivityRollupService.rebuild(db)
+    finally:
+        db.close()
+    assert client.get(url).json() == body
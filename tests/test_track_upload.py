@@ -0,0 +1,116 @@
+import io
+import struct
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.track_files import FIT_EPOCH, TrackFileError, parse_fit, parse_gpx, upload_parser
+
+START = 1_700_000_000  # 2023-11-14T22:13:20Z
+
+
+def gpx(points: int, name: str = "Morning hike", start: int = START) -> bytes:
+    # Due north from (40, -105), 0.0001 degrees (11.1 m) every 5 s, climbing 1 m per point
+    rows = "".join(
+        f'<trkpt lat="{40 + i * 0.0001:.4f}" lon="-105.0"><ele>{2000 + i}</ele>'
+        f"<time>{_iso(start + i * 5)}</time></trkpt>"
+        for i in range(points)
+    )
+    return (f'<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+            f"<trk><name>{name}</name><trkseg>{rows}</trkseg></trk></gpx>").encode()
+
+
+def _iso(seconds: int) -> str:
+    from datetime import datetime, timezone
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def fit(points: int, start: int = START, developer: bool = False) -> bytes:
+    """A FIT file: a file_id message, then records; every other record uses a compressed timestamp header.
+
+    With `developer`, records also carry a 2-byte developer field (heart rate from a Connect IQ app, say).
+    """
+    dev_flag, dev_definition, dev_data = (0x20, bytes([1, 0, 2, 0]), b"\x48\x00") if developer else (0, b"", b"")
+    body = bytearray()
+    body += struct.pack("<BBBHB", 0x41, 0, 0, 0, 1) + bytes([4, 4, 0x86])  # file_id, local 1: time_created
+    body += struct.pack("<BI", 0x01, start - FIT_EPOCH)
+    body += struct.pack("<BBBHB", 0x40 | dev_flag, 0, 0, 20, 4)
+    body += bytes([253, 4, 0x86, 0, 4, 0x85, 1, 4, 0x85, 2, 2, 0x84]) + dev_definition
+    body += struct.pack("<BBBHB", 0x42 | dev_flag, 0, 0, 20, 3)  # No timestamp
+    body += bytes([0, 4, 0x85, 1, 4, 0x85, 2, 2, 0x84]) + dev_definition
+    for i in range(points):
+        lat, lon = round((40 + i * 0.0001) * 2 ** 31 / 180), round(-105 * 2 ** 31 / 180)
+        altitude = (2000 + i + 500) * 5
+        if i % 2:
+            offset = (start - FIT_EPOCH + i * 5) & 0x1F
+            body += struct.pack("<BiiH", 0x80 | (2 << 5) | offset, lat, lon, altitude)
+        else:
+            body += struct.pack("<BIiiH", 0x00, start - FIT_EPOCH + i * 5, lat, lon, altitude)
+        body += dev_data
+    header = struct.pack("<BBHI4sH", 14, 0x20, 2132, len(body), b".FIT", 0)
+    return header + bytes(body) + b"\x00\x00"
+
+
+def test_gpx_and_fit_parse_to_the_same_track():
+    (lat, lon, elevation, seconds, started_at), name = parse_gpx(io.BytesIO(gpx(200)))
+    assert name == "Morning hike" and len(lat) == 200 and started_at.timestamp() == pytest.approx(START, abs=86400)
+    assert seconds[-1] == 199 * 5 and elevation[-1] == 2199
+
+    (f_lat, f_lon, f_elevation, f_seconds, f_started), f_name = parse_fit(io.BytesIO(fit(200)))
+    assert f_name is None and f_started == started_at
+    assert abs(f_lat - lat).max() < 1e-7 and abs(f_lon - lon).max() < 1e-7
+    assert list(f_seconds) == list(seconds) and abs(f_elevation - elevation).max() < 0.2
+
+    (d_lat, _, d_elevation, d_seconds, _), _ = parse_fit(io.BytesIO(fit(200, developer=True)))
+    assert list(d_lat) == list(f_lat) and list(d_seconds) == list(f_seconds)
+    assert list(d_elevation) == list(f_elevation)
+
+    with pytest.raises(TrackFileError):
+        parse_fit(io.BytesIO(fit(50)[:300]))
+    with pytest.raises(TrackFileError):
+        parse_gpx(io.BytesIO(b"<gpx><trk><trkseg><trkpt lat='1' lon='2'></trkpt></trkseg></trk></gpx>"))
+
+
+def test_upload_creates_hikes_with_tracks(monkeypatch):
+    monkeypatch.setattr(upload_parser, "workers", 1)
+    client = TestClient(app)
+    user = client.post("/api/v1/users", json={"name": "uploader", "email": "uploader@tracks.test"}).json()
+    url = f"/api/v1/users/{user['id']}/hikes/upload"
+    files = [("files", ("morning.gpx", gpx(400), "application/gpx+xml")),
+             ("files", ("evening.fit", fit(300, START + 86400), "application/octet-stream")),
+             ("files", ("broken.gpx", b"<gpx><trk>", "application/gpx+xml"))]
+    try:
+        body = client.post(url, files=files, data={"source": "strava"}).json()
+    finally:
+        upload_parser.close()
+    assert body["imported_hikes"] == 2 and body["skipped_duplicates"] == []
+    assert [e["filename"] for e in body["errors"]] == ["broken.gpx"]
+    morning, evening = body["hikes"]
+    assert morning["fitness_tracker_source"] == "strava" and "Morning hike" in morning["notes"]
+    assert morning["distance_miles"] == pytest.approx(399 * 11.12 / 1609.344, rel=0.01)
+    assert morning["duration_minutes"] == round(399 * 5 / 60) and morning["elevation_gain"] > 1200
+    assert evening["hike_date"].startswith("2023-11-15")
+
+    track = client.get(f"/api/v1/users/{user['id']}/hikes/{evening['id']}/track").json()
+    assert track["source"] == "strava" and len(track["points"]) == 300
+
+    # The same file again is skipped; a single file is parsed without the process pool
+    again = client.post(url, files=[files[0]]).json()
+    assert again["imported_hikes"] == 0 and again["skipped_duplicates"] == ["morning.gpx"]
+    assert client.post(url, files=[files[0]], data={"source": "myspace"}).status_code == 400
+    assert client.post("/api/v1/users/999999/hikes/upload", files=[files[0]]).status_code == 404
+
+
+def test_unexpected_parse_failure_only_fails_that_file(monkeypatch):
+    def broken_fit(stream):
+        raise struct.error("unpack requires a buffer of 12 bytes")
+
+    monkeypatch.setattr(upload_parser, "workers", 0)  # Threads, so the patched parser is used
+    monkeypatch.setattr("app.track_files.parse_fit", broken_fit)
+    client = TestClient(app)
+    user = client.post("/api/v1/users", json={"name": "partial", "email": "partial@tracks.test"}).json()
+    body = client.post(f"/api/v1/users/{user['id']}/hikes/upload", files=[
+        ("files", ("ok.gpx", gpx(50, start=START + 7 * 86400), "application/gpx+xml")),
+        ("files", ("odd.fit", fit(50), "application/octet-stream")),
+    ]).json()
+    assert body["imported_hikes"] == 1
+    assert [e["filename"] for e in body["errors"]] == ["odd.fit"] and "Unreadable FIT" in body["errors"][0]["error"]
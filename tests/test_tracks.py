@@ -0,0 +1,174 @@
+import asyncio
+import threading
+from datetime import datetime
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.garmin_service import garmin_service
+from app.garmin_tokens import garmin_tokens
+from app import models
+from app.database import SessionLocal
+from app.main import app
+from app.tracks import (LOD_TOLERANCES_M, METERS_PER_MILE, TrackService, decode, detail_levels, encode,
+                        garmin_points, level_for_zoom, segment_distances, significance, track_stats)
+from benchmarks.stubs import synthetic_track
+
+
+def test_encoding_round_trips_to_centimeters():
+    lat, lon, elevation, seconds, _ = garmin_points({"geoPolylineDTO": {"polyline": synthetic_track(3, 2000)}})
+    blob = encode(lat, lon, elevation, seconds)
+    assert len(blob) < 2000 * 16 / 2  # Well under the raw int32 columns
+    back = decode(blob, 2000)
+    assert np.abs(back[0] - lat).max() < 1e-7 and np.abs(back[1] - lon).max() < 1e-7
+    assert np.abs(back[2] - elevation).max() <= 0.05 and np.array_equal(back[3], seconds)
+
+
+def test_stats_of_a_known_track():
+    # Due north along a meridian: 0.01 degrees is 1111.95 m; 2 m/s walking, then a 10 minute stop
+    lat = np.concatenate([np.linspace(0, 0.03, 301), np.full(10, 0.03)])
+    lon = np.zeros_like(lat)
+    seconds = np.concatenate([np.arange(301) * 5.5596, 301 * 5.5596 + np.arange(1, 11) * 60])
+    elevation = np.concatenate([np.linspace(100, 400, 301), np.full(10, 400)])
+    elevation[::2] += 3  # Altitude jitter that smoothing should not count as climbing
+
+    assert segment_distances(np.array([0.0, 1.0]), np.array([0.0, 0.0]))[0] == pytest.approx(111195, rel=1e-4)
+    stats = track_stats(lat, lon, elevation, seconds)
+    assert stats["distance_miles"] == pytest.approx(3335.85 / METERS_PER_MILE, abs=0.01)
+    assert stats["elevation_gain_ft"] == pytest.approx(300 * 3.28084, rel=0.05)
+    assert stats["moving_minutes"] == pytest.approx(300 * 5.5596 / 60, abs=0.1)
+    assert stats["elapsed_minutes"] == pytest.approx(stats["moving_minutes"] + 10, abs=0.2)
+    splits = stats["splits"]
+    assert [s["mile"] for s in splits] == [1, 2, 3] and splits[-1]["miles"] == pytest.approx(0.07, abs=0.01)
+    assert all(s["pace_min_per_mile"] == pytest.approx(METERS_PER_MILE / 2 / 60, rel=0.01) for s in splits)
+    assert sum(s["elevation_change_ft"] for s in splits) == pytest.approx(300 * 3.28084, abs=15)
+
+
+def _douglas_peucker(x, y, tolerance):
+    """Textbook recursive Douglas-Peucker on planar points (distance to the segment)."""
+    def offset(p, a, b):
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        t = 0.0 if dx == dy == 0 else min(1.0, max(0.0, ((x[p] - x[a]) * dx + (y[p] - y[a]) * dy) / (dx * dx + dy * dy)))
+        return float(np.hypot(x[p] - x[a] - t * dx, y[p] - y[a] - t * dy))
+
+    def keep(a, b):
+        if b - a < 2:
+            return []
+        far = max(range(a + 1, b), key=lambda p: offset(p, a, b))
+        if offset(far, a, b) <= tolerance:
+            return []
+        return keep(a, far) + [far] + keep(far, b)
+
+    return [0] + keep(0, len(x) - 1) + [len(x) - 1]
+
+
+def test_levels_of_detail_match_douglas_peucker():
+    lat, lon, *_ = garmin_points({"geoPolylineDTO": {"polyline": synthetic_track(5, 1500)}})
+    y = np.radians(lat) * 6371008.8
+    x = np.radians(lon) * 6371008.8 * np.cos(np.radians(lat.mean()))
+    levels = detail_levels(lat, lon)
+    for level, tolerance in enumerate(LOD_TOLERANCES_M, start=1):
+        assert list(np.flatnonzero(levels >= level)) == _douglas_peucker(x, y, tolerance)
+    assert (significance(lat, lon)[[0, -1]] == np.inf).all() and levels[0] == len(LOD_TOLERANCES_M)
+    assert level_for_zoom(18, 45) == 0 and level_for_zoom(3, 45) == len(LOD_TOLERANCES_M)
+    assert level_for_zoom(1100, 45) == 0 and level_for_zoom(-2000, 45) == len(LOD_TOLERANCES_M)
+
+
+def test_garmin_import_stores_tracks(monkeypatch):
+    client = TestClient(app)
+    user = client.post("/api/v1/users", json={"name": "tracker", "email": "tracker@tracks.test"}).json()
+
+    async def access_token(db, user_id, now=None):
+        return "token"
+
+    async def get_activities(access_token, limit=50, start=0):
+        return [{"id": str(n), "activityName": f"Walk {n}", "activityType": {"typeKey": "hiking"},
+                 "startTimeInSeconds": 1_700_000_000_000 + n * 3_600_000, "duration": 3600,
+                 "distance": 5000.0, "elevationGain": 120} for n in (41, 42)]
+
+    loop_threads = set()
+
+    async def get_activity_details(activity_id, access_token):
+        loop_threads.add(threading.get_ident())
+        if activity_id == "42":
+            return None  # Details unavailable: the hike is still imported
+        return {"geoPolylineDTO": {"polyline": synthetic_track(int(activity_id), 300)}}
+
+    built_on = []
+    row = TrackService.row
+
+    def recording_row(*args):
+        built_on.append(threading.get_ident())
+        return row(*args)
+
+    monkeypatch.setattr(garmin_tokens, "access_token", access_token)
+    monkeypatch.setattr(garmin_service, "get_activities", get_activities)
+    monkeypatch.setattr(garmin_service, "get_activity_details", get_activity_details)
+    monkeypatch.setattr(TrackService, "row", staticmethod(recording_row))
+    body = client.post(f"/api/v1/users/{user['id']}/garmin/import").json()
+    assert body["imported_hikes"] == 2 and body["tracks_stored"] == 1
+    assert len(built_on) == 1 and built_on[0] not in loop_threads  # Not on the event loop
+
+    hikes = client.get(f"/api/v1/users/{user['id']}/hikes?days=100000").json()
+    by_activity = {h["notes"].rpartition("[garmin:")[2].rstrip("]"): h["id"] for h in hikes}
+    track = client.get(f"/api/v1/users/{user['id']}/hikes/{by_activity['41']}/track").json()
+    assert track["source"] == "garmin" and track["activity_id"] == "41" and len(track["points"]) == 300
+    assert track["stats"]["distance_miles"] > 0 and track["stats"]["splits"]
+    assert track["summary"]["distance_miles"] == pytest.approx(5000 / 1609.34)
+    assert client.get(f"/api/v1/users/{user['id']}/hikes/{by_activity['42']}/track").status_code == 404
+    assert client.get(f"/api/v1/users/999999/hikes/{by_activity['41']}/track").status_code == 404
+
+
+def test_map_overview_fits_the_byte_budget():
+    client = TestClient(app)
+    user = client.post("/api/v1/users", json={"name": "mapper", "email": "mapper@tracks.test"}).json()
+    db = SessionLocal()
+    rows = []
+    for n in range(6):
+        hike = models.TrailHike(user_id=user["id"], hike_date=datetime(2024, 5, 1 + n), duration_minutes=60)
+        db.add(hike)
+        db.flush()
+        lat, lon, elevation, seconds, started = garmin_points(
+            {"geoPolylineDTO": {"polyline": synthetic_track(100 + n, 3000)}})
+        rows.append(TrackService.row(hike.id, user["id"], "garmin", str(n), lat, lon, elevation, seconds, started))
+    rows[0]["lod"] = None  # Stored before levels of detail existed: computed when read
+    TrackService.store(db, rows)
+    db.commit()
+    db.close()
+
+    url = f"/api/v1/users/{user['id']}/map"
+    full = client.get(url, params={"max_bytes": 2_000_000}).json()
+    assert full["level"] == 0 and full["points"] == 18000 and not full["truncated"]
+    assert [line["hike_id"] for line in full["lines"]] == [r["hike_id"] for r in reversed(rows)]
+
+    response = client.get(url, params={"max_bytes": 60_000})
+    small = response.json()
+    assert len(response.content) <= 60_000 and 0 < small["level"] and small["tracks"] == 6
+    assert small["points"] < full["points"] and small["bounds"] == full["bounds"]
+    zoomed_out = client.get(url, params={"zoom": 5}).json()
+    assert zoomed_out["level"] == len(LOD_TOLERANCES_M)
+    assert client.get(url, params={"zoom": 1100}).status_code == 422
+    assert client.get(url, params={"zoom": -2000}).status_code == 422
+
+    response = client.get(url, params={"max_bytes": 1500})
+    tiny = response.json()
+    assert len(response.content) <= 1500 and tiny["truncated"] and tiny["tracks"] < 6
+    assert tiny["lines"][0]["hike_id"] == rows[-1]["hike_id"]  # Newest first
+
+    track = client.get(f"/api/v1/users/{user['id']}/hikes/{rows[1]['hike_id']}/track", params={"zoom": 12}).json()
+    assert track["level"] > 0 and len(track["points"]) < 3000 and track["stats"]["points"] == 3000
+    assert client.get(f"/api/v1/users/{user['id']}/hikes/{rows[1]['hike_id']}/track",
+                      params={"zoom": 1100}).status_code == 422
+
+
+def test_map_overview_is_built_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def user_map(db, user_id, max_bytes, zoom=None):
+        threads.append(threading.current_thread())
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()  # Not on the event loop's thread
+        return b'{"lines": []}'
+
+    monkeypatch.setattr(TrackService, "user_map", user_map)
+    assert TestClient(app).get("/api/v1/users/1/map").json() == {"lines": []}
+    assert len(threads) == 1
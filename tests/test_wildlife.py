@@ -0,0 +1,47 @@
+from datetime import datetime
+from fastapi.testclient import TestClient
+from app.database import SessionLocal
+from app.main import app
+from app.wildlife import WildlifeRollupService, normalize_location, normalize_species, recent_months
+
+
+def test_species_and_location_normalization():
+    assert normalize_species("buffalo") == "Bison"
+    assert normalize_species("  Bisons ") == "Bison"
+    assert normalize_species("Grey Wolves") == "Gray Wolf"
+    assert normalize_species("cougar!") == "Mountain Lion"
+    assert normalize_species("pine marten") == "Pine Marten"
+    assert normalize_species("   ") is None
+    assert normalize_location(" lamar   VALLEY ") == "Lamar Valley"
+    assert recent_months(3, datetime(2024, 2, 10)) == ["2024-02", "2024-01", "2023-12"]
+
+
+def test_log_sighting_updates_park_rollup():
+    client = TestClient(app)
+    park = client.post("/api/v1/parks", json={
+        "name": "Rollup Test Park", "state": "WY", "region": "Rockies", "established": "1872",
+        "area_sq_miles": 3468.0, "description": "Geysers", "latitude": 44.4, "longitude": -110.6,
+    }).json()
+    user = client.post("/api/v1/users", json={"name": "Spotter", "email": "spotter@example.com"}).json()
+    now = datetime.utcnow()
+    for wildlife, location in [("Bison", "Lamar Valley"), ("buffalo", "lamar valley"),
+                               ("Wolf", "Lamar Valley"), ("Elk", "Mammoth")]:
+        r = client.post(f"/api/v1/users/{user['id']}/sightings", json={
+            "park_id": park["id"], "wildlife": wildlife, "sighting_date": now.isoformat(),
+            "location": location, "notes": "",
+        })
+        assert r.status_code == 201
+
+    body = client.get(f"/api/v1/parks/{park['id']}/wildlife").json()
+    assert body["total_sightings"] == 4
+    assert body["top_species"][0] == {"species": "Bison", "count": 2}
+    assert body["by_month"][0]["month"] == now.strftime("%Y-%m")
+    assert body["hotspots"][0] == {"location": "Lamar Valley", "count": 3}
+
+    # A rebuild from the sightings table reproduces the incremental counts
+    db = SessionLocal()
+    try:
+        WildlifeRollupService.rebuild(db)
+    finally:
+        db.close()
+    assert client.get(f"/api/v1/parks/{park['id']}/wildlife").json() == body